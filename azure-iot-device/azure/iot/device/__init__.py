@@ -3,15 +3,57 @@
 This library provides clients and associated models for communicating with Azure IoT services
 from an IoT device.
 """
+import importlib
+from typing import Any, Dict, List, TYPE_CHECKING
 
-from .iothub_session import IoTHubSession  # noqa: F401
-from .iot_exceptions import IoTHubError  # noqa: F401
-from .provisioning_session import ProvisioningSession  # noqa: F401
-from .provisioning_exceptions import ProvisioningServiceError  # noqa: F401
+# NOTE: The contents of the library are imported upon first access (PEP 562) rather than upon
+# import of the package, so that a process only pays the import cost (e.g. of the MQTT
+# transport) of what it actually uses.
+_lazy_attributes: Dict[str, str] = {
+    "IoTHubSession": ".iothub_session",
+    "DirectMethodDispatcher": ".direct_method_dispatcher",
+    "SessionHost": ".session_host",
+    "IoTHubError": ".iot_exceptions",
+    "ProvisioningSession": ".provisioning_session",
+    "ProvisioningServiceError": ".provisioning_exceptions",
+    # TODO: Consider not exposing these
+    "MQTTError": ".mqtt_client",
+    "MQTTConnectionFailedError": ".mqtt_client",
+    # TODO: directly here, or via the models module?
+    "Message": ".models",
+    "DirectMethodRequest": ".models",
+    "DirectMethodResponse": ".models",
+}
 
-# TODO: Consider not exposing these
-from .mqtt_client import MQTTError, MQTTConnectionFailedError  # noqa: F401
+__all__ = list(_lazy_attributes) + ["models"]
 
-# TODO: directly here, or via the models module?
-from .models import Message, DirectMethodRequest, DirectMethodResponse  # noqa: F401
-from . import models  # noqa: F401
+if TYPE_CHECKING:
+    from .iothub_session import IoTHubSession  # noqa: F401
+    from .direct_method_dispatcher import DirectMethodDispatcher  # noqa: F401
+    from .session_host import SessionHost  # noqa: F401
+    from .iot_exceptions import IoTHubError  # noqa: F401
+    from .provisioning_session import ProvisioningSession  # noqa: F401
+    from .provisioning_exceptions import ProvisioningServiceError  # noqa: F401
+    from .mqtt_client import MQTTError, MQTTConnectionFailedError  # noqa: F401
+    from .models import Message, DirectMethodRequest, DirectMethodResponse  # noqa: F401
+    from . import models  # noqa: F401
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module_name = _lazy_attributes[name]
+    except KeyError:
+        if name == "models":
+            return importlib.import_module(".models", __name__)
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name)) from None
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    # Cache the value so that this function is not invoked again for it
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    # NOTE: Only the public API is listed (along with the module's dunders), not the internals
+    # of this module, nor the submodules and attributes cached in it upon access
+    dunders = [name for name in globals() if name.startswith("__") and name.endswith("__")]
+    return sorted(set(__all__ + dunders))
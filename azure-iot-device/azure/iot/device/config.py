@@ -4,12 +4,17 @@
 # license information.
 # --------------------------------------------------------------------------
 
+import concurrent.futures
 import logging
-import socks
 import ssl
-from typing import Optional, Any
+from typing import Optional, Any, TYPE_CHECKING
 from .sastoken import SasTokenProvider
 
+if TYPE_CHECKING:
+    from .iothub_http_client import HTTPConnectionPool
+    from .metrics import MetricsProvider
+    from .network_loop import SharedNetworkLoop
+
 # TODO: add typings for imports
 # TODO: update docs to ensure types are correct
 # TODO: can these just be TypeDicts?
@@ -21,10 +26,6 @@ logger = logging.getLogger(__name__)
 MAX_KEEP_ALIVE_SECS = 1740
 
 
-string_to_socks_constant_map = {"HTTP": socks.HTTP, "SOCKS4": socks.SOCKS4, "SOCKS5": socks.SOCKS5}
-socks_constant_to_string_map = {socks.HTTP: "HTTP", socks.SOCKS4: "SOCKS4", socks.SOCKS5: "SOCKS5"}
-
-
 class ProxyOptions:
     """
     A class containing various options to send traffic through proxy servers by enabling
@@ -76,6 +77,9 @@ class ClientConfig:
         keep_alive: int = 60,
         auto_reconnect: bool = True,
         websockets: bool = False,
+        network_loop: Optional["SharedNetworkLoop"] = None,
+        executor: Optional[concurrent.futures.Executor] = None,
+        metrics_provider: Optional["MetricsProvider"] = None,
     ) -> None:
         """Initializer for ClientConfig
 
@@ -92,6 +96,15 @@ class ClientConfig:
             re-establish it
         :param bool websockets: Enabling/disabling websockets in MQTT. This feature is relevant
             if a firewall blocks port 8883 from use.
+        :param network_loop: Network loop shared with other clients. If not provided, the
+            client will run a network loop of its own.
+        :type network_loop: :class:`azure.iot.device.network_loop.SharedNetworkLoop`
+        :param executor: Executor to run blocking network operations in. If not provided, the
+            default executor of the event loop will be used.
+        :type executor: :class:`concurrent.futures.Executor`
+        :param metrics_provider: MetricsProvider to record round trip times with. If not
+            provided, they are not recorded.
+        :type metrics_provider: :class:`azure.iot.device.metrics.MetricsProvider`
         """
         # Network
         self.hostname = hostname
@@ -106,6 +119,13 @@ class ClientConfig:
         self.auto_reconnect = auto_reconnect
         self.websockets = websockets
 
+        # Resources
+        self.network_loop = network_loop
+        self.executor = executor
+
+        # Metrics
+        self.metrics_provider = metrics_provider
+
 
 class IoTHubClientConfig(ClientConfig):
     def __init__(
@@ -114,6 +134,7 @@ class IoTHubClientConfig(ClientConfig):
         device_id: str,
         module_id: Optional[str] = None,
         product_info: str = "",
+        http_connection_pool: Optional["HTTPConnectionPool"] = None,
         **kwargs: Any,
     ) -> None:
         """
@@ -122,12 +143,16 @@ class IoTHubClientConfig(ClientConfig):
         :param str device_id: The device identity being used with the IoTHub
         :param str module_id: The module identity being used with the IoTHub
         :param str product_info: A custom identification string.
+        :param http_connection_pool: Pool of HTTP connections shared with other clients. If not
+            provided, the client will create a pool of its own.
+        :type http_connection_pool: :class:`azure.iot.device.iothub_http_client.HTTPConnectionPool`
 
         Additional parameters found in the docstring of the parent class
         """
         self.device_id = device_id
         self.module_id = module_id
         self.product_info = product_info
+        self.http_connection_pool = http_connection_pool
         super().__init__(**kwargs)
 
 
@@ -149,6 +174,20 @@ class ProvisioningClientConfig(ClientConfig):
 
 def _format_proxy_type(proxy_type):
     """Returns a tuple of formats for proxy type (string, socks library constant)"""
+    # NOTE: The socks library is only needed when a proxy is used, so it is not imported until
+    # one is configured, in order to keep it out of the import time of the package.
+    import socks
+
+    string_to_socks_constant_map = {
+        "HTTP": socks.HTTP,
+        "SOCKS4": socks.SOCKS4,
+        "SOCKS5": socks.SOCKS5,
+    }
+    socks_constant_to_string_map = {
+        socks.HTTP: "HTTP",
+        socks.SOCKS4: "SOCKS4",
+        socks.SOCKS5: "SOCKS5",
+    }
     try:
         return (proxy_type, string_to_socks_constant_map[proxy_type])
     except KeyError:
@@ -0,0 +1,205 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""Infrastructure for concurrently handling direct method requests"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Union
+from . import models
+from .custom_typing import JSONSerializable
+from .iothub_session import IoTHubSession
+
+logger = logging.getLogger(__name__)
+
+# NOTE: IoT Hub does not tell the device how long the invoker will wait for a response, so the
+# handler timeout cannot be derived from the request. The default response timeout used by
+# IoT Hub is 30 seconds - leave a margin so the timeout response arrives before then.
+DEFAULT_HANDLER_TIMEOUT: float = 25.0
+DEFAULT_MAX_CONCURRENCY: int = 10
+
+STATUS_NOT_FOUND = 404
+STATUS_HANDLER_ERROR = 500
+STATUS_TIMEOUT = 504
+
+DirectMethodHandler = Callable[
+    [models.DirectMethodRequest],
+    Awaitable[Union[models.DirectMethodResponse, JSONSerializable]],
+]
+
+
+class DirectMethodDispatcher:
+    def __init__(
+        self,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        handler_timeout: Optional[float] = DEFAULT_HANDLER_TIMEOUT,
+    ) -> None:
+        """Object that receives direct method requests from an IoTHubSession, invokes the handler
+        registered for each method concurrently, and sends the responses.
+
+        - If a handler returns a DirectMethodResponse, it is sent as-is. Any other return value
+            is sent as the payload of a response with status 200.
+        - If no handler is registered for a method, a response with status 404 is sent.
+        - If a handler raises an exception, a response with status 500 is sent.
+        - If a handler does not finish within the handler timeout, it is cancelled, and a
+            response with status 504 is sent.
+
+        :param int max_concurrency: Maximum number of handlers that can run at the same time.
+            Further requests wait to be dispatched until a running handler finishes.
+        :param float handler_timeout: Time (in seconds) a handler can run before it is cancelled.
+            This should be less than the response timeout used by the invoker of the method.
+            If None, handlers can run indefinitely.
+
+        :raises: ValueError if an invalid 'max_concurrency' or 'handler_timeout' is provided
+        """
+        if max_concurrency < 1:
+            raise ValueError("'max_concurrency' must be at least 1")
+        if handler_timeout is not None and handler_timeout <= 0:
+            raise ValueError("'handler_timeout' must be greater than 0")
+        self._max_concurrency = max_concurrency
+        self._handler_timeout = handler_timeout
+        self._handlers: Dict[str, DirectMethodHandler] = {}
+        self._in_flight: Set[asyncio.Task[None]] = set()
+
+    def register(self, method_name: str, handler: DirectMethodHandler) -> None:
+        """Register a handler for a direct method, replacing any existing handler
+
+        :param str method_name: The name of the direct method
+        :param handler: A coroutine function that takes a DirectMethodRequest, and returns
+            either a DirectMethodResponse, or a JSON payload to respond with (status 200)
+        """
+        self._handlers[method_name] = handler
+
+    def unregister(self, method_name: str) -> None:
+        """Remove the handler for a direct method
+
+        :param str method_name: The name of the direct method
+
+        :raises: KeyError if no handler is registered for the method
+        """
+        del self._handlers[method_name]
+
+    @property
+    def in_flight(self) -> int:
+        """The number of requests currently being handled"""
+        return len(self._in_flight)
+
+    async def run(self, session: IoTHubSession) -> None:
+        """Receive and dispatch direct method requests until cancelled or disconnected.
+
+        Any handlers still running upon exit are cancelled.
+
+        :param session: A connected IoTHubSession
+        :type session: :class:`IoTHubSession`
+
+        :raises: MQTTError if the session is disconnected due to an error
+        :raises: CancelledError if the session is disconnected by the user
+        """
+        # NOTE: The semaphore is acquired before receiving the next request so that requests
+        # that cannot yet be handled remain queued in the client instead of piling up as Tasks.
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+        try:
+            async with session.direct_method_requests() as method_requests:
+                while True:
+                    await semaphore.acquire()
+                    try:
+                        request = await method_requests.__anext__()
+                    except BaseException:
+                        semaphore.release()
+                        raise
+                    task = asyncio.create_task(self._dispatch(session, request))
+                    self._in_flight.add(task)
+                    task.add_done_callback(self._in_flight.discard)
+                    task.add_done_callback(lambda _: semaphore.release())
+        finally:
+            in_flight = list(self._in_flight)
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+    async def _dispatch(self, session: IoTHubSession, request: models.DirectMethodRequest) -> None:
+        """Invoke the handler for a request and send the response"""
+        handler = self._handlers.get(request.name)
+        if handler is None:
+            logger.warning(
+                "No handler registered for direct method '{}' (rid: {})".format(
+                    request.name, request.request_id
+                )
+            )
+            response = models.DirectMethodResponse.create_from_method_request(
+                request,
+                STATUS_NOT_FOUND,
+                {"message": "Method '{}' is not supported".format(request.name)},
+            )
+        else:
+            response = await self._invoke_handler(handler, request)
+
+        try:
+            await session.send_direct_method_response(response)
+        except asyncio.CancelledError:
+            # NOTE: In Python 3.7 this isn't a BaseException, so we must catch and re-raise
+            raise
+        except Exception as e:
+            logger.error(
+                "Sending direct method response failed ({}). Dropping response (rid: {})".format(
+                    e, request.request_id
+                )
+            )
+
+    async def _invoke_handler(
+        self, handler: DirectMethodHandler, request: models.DirectMethodRequest
+    ) -> models.DirectMethodResponse:
+        """Run a handler, converting its outcome into a DirectMethodResponse"""
+        # NOTE: Cancel the current Task with a timer rather than using asyncio.wait_for(), which
+        # would create a second Task for every request.
+        timed_out = False
+        timeout_timer = None
+        task = asyncio.current_task()
+        if self._handler_timeout is not None and task is not None:
+            handler_task: asyncio.Task[Any] = task
+
+            def on_timeout() -> None:
+                nonlocal timed_out
+                timed_out = True
+                handler_task.cancel()
+
+            timeout_timer = asyncio.get_running_loop().call_later(self._handler_timeout, on_timeout)
+
+        try:
+            result = await handler(request)
+        except asyncio.CancelledError:
+            if not timed_out:
+                raise
+            if hasattr(task, "uncancel"):
+                # NOTE: Python 3.11+ tracks pending cancellation requests, which must be undone
+                # since this cancellation has been handled
+                task.uncancel()  # type: ignore
+            logger.warning(
+                "Handler for direct method '{}' timed out (rid: {})".format(
+                    request.name, request.request_id
+                )
+            )
+            return models.DirectMethodResponse.create_from_method_request(
+                request,
+                STATUS_TIMEOUT,
+                {"message": "Method '{}' timed out".format(request.name)},
+            )
+        except Exception as e:
+            logger.error(
+                "Handler for direct method '{}' raised an exception ({}) (rid: {})".format(
+                    request.name, e, request.request_id
+                )
+            )
+            return models.DirectMethodResponse.create_from_method_request(
+                request,
+                STATUS_HANDLER_ERROR,
+                {"message": "Method '{}' failed".format(request.name)},
+            )
+        finally:
+            if timeout_timer:
+                timeout_timer.cancel()
+
+        if isinstance(result, models.DirectMethodResponse):
+            return result
+        return models.DirectMethodResponse.create_from_method_request(request, 200, result)
@@ -3,20 +3,23 @@
 # Licensed under the MIT License. See License.txt in the project root for
 # license information.
 # --------------------------------------------------------------------------
+import aiohttp
+import asyncio
 import base64
 import logging
-import json
-import requests  # type: ignore
-import requests_unixsocket  # type: ignore
 import urllib.parse
-from typing import Union
+from typing import Any, Dict, Optional, Tuple, Union
 from . import user_agent
 from .iot_exceptions import IoTEdgeError
 from .signing_mechanism import SigningMechanism
 
-requests_unixsocket.monkeypatch()
 logger = logging.getLogger(__name__)
 
+HTTP_TIMEOUT = 10
+# NOTE: Requests over a Unix domain socket still need a URL. The host is never resolved, but is
+# sent in the Host header.
+UNIX_SOCKET_BASE_URL = "http://localhost/"
+
 
 class IoTEdgeHsm(SigningMechanism):
     """
@@ -29,6 +32,10 @@ class IoTEdgeHsm(SigningMechanism):
        to authenticate the SSL connection between the IoE Edge module and IoT Edge
     2. A signing function, which can be used to create the sig field for a
        SharedAccessSignature string which can be used to authenticate with Iot Edge
+
+    Requests to the IoT Edge workload API are made without blocking the event loop, over a pool
+    of connections that are kept open between requests. Invoke .shutdown() when finished with
+    the object to close them.
     """
 
     def __init__(
@@ -45,42 +52,83 @@ class IoTEdgeHsm(SigningMechanism):
         self.module_id = urllib.parse.quote(module_id, safe="")
         self.api_version = api_version
         self.generation_id = generation_id
-        self.workload_uri = _format_socket_uri(workload_uri)
+        self.socket_path, self.workload_uri = _parse_workload_uri(workload_uri)
+        # NOTE: The ClientSession is not created until the first request, as it must be created
+        # on the event loop it is used on, and this object may be created before it is running.
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._certificate: Optional[str] = None
+
+    async def shutdown(self) -> None:
+        """Close the connections to IoT Edge.
+
+        Invoke only when completely finished with the object for graceful exit.
+        """
+        if self._session is not None:
+            session = self._session
+            self._session = None
+            await asyncio.shield(session.close())
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector: aiohttp.BaseConnector
+            if self.socket_path:
+                connector = aiohttp.UnixConnector(path=self.socket_path)
+            else:
+                connector = aiohttp.TCPConnector()
+            timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+            logger.debug("Creating HTTP Session for IoT Edge at {}".format(self.workload_uri))
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def _request(
+        self, method: str, path: str, headers: Dict[str, str], json: Any = None
+    ) -> Any:
+        """Make a request to the IoT Edge workload API and return the decoded JSON response.
+
+        :raises: :class:`aiohttp.ClientError` if the request fails (including error statuses)
+        :raises: :class:`asyncio.TimeoutError` if the request times out
+        :raises: ValueError if the response cannot be decoded
+        """
+        async with self._get_session().request(
+            method,
+            self.workload_uri + path,
+            params={"api-version": self.api_version},
+            headers=headers,
+            json=json,
+        ) as response:
+            response.raise_for_status()
+            # NOTE: The Content-Type of the response is not checked
+            return await response.json(content_type=None)
 
-    # TODO: Use async http to make use of this being a coroutine
     async def get_certificate(self) -> str:
         """
         Return the server verification certificate from the trust bundle that can be used to
         validate the server-side SSL TLS connection that we use to talk to Edge
 
+        The certificate is retrieved from Edge once, and then cached for subsequent invocations.
+
         :return: The server verification certificate to use for connections to the Azure IoT Edge
         instance, as a PEM certificate in string form.
 
         :raises: IoTEdgeError if unable to retrieve the certificate.
         """
-        r = requests.get(
-            self.workload_uri + "trust-bundle",
-            params={"api-version": self.api_version},
-            headers={"User-Agent": urllib.parse.quote_plus(user_agent.get_iothub_user_agent())},
-        )
-        # Validate that the request was successful
+        if self._certificate is not None:
+            return self._certificate
+        headers = {"User-Agent": urllib.parse.quote_plus(user_agent.get_iothub_user_agent())}
         try:
-            r.raise_for_status()
-        except requests.exceptions.HTTPError as e:
+            bundle = await self._request("GET", "trust-bundle", headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             raise IoTEdgeError("Unable to get trust bundle from Edge") from e
-        # Decode the trust bundle
-        try:
-            bundle = r.json()
         except ValueError as e:
             raise IoTEdgeError("Unable to decode trust bundle") from e
         # Retrieve the certificate
         try:
             cert = bundle["certificate"]
-        except KeyError as e:
+        except (KeyError, TypeError) as e:
             raise IoTEdgeError("No certificate in trust bundle") from e
+        self._certificate = cert
         return cert
 
-    # TODO: Use async http to make use of this being a coroutine
     async def sign(self, data_str: Union[str, bytes]) -> str:
         """
         Use the IoTEdge HSM to sign a piece of string data.  The caller should then insert the
@@ -101,67 +149,51 @@ class IoTEdgeHsm(SigningMechanism):
 
         encoded_data_str = base64.b64encode(data_bytes).decode()
 
-        path = "{workload_uri}modules/{module_id}/genid/{gen_id}/sign".format(
-            workload_uri=self.workload_uri, module_id=self.module_id, gen_id=self.generation_id
+        path = "modules/{module_id}/genid/{gen_id}/sign".format(
+            module_id=self.module_id, gen_id=self.generation_id
         )
+        headers = {"User-Agent": urllib.parse.quote(user_agent.get_iothub_user_agent(), safe="")}
         sign_request = {"keyId": "primary", "algo": "HMACSHA256", "data": encoded_data_str}
 
-        r = requests.post(  # can we use json field instead of data?
-            url=path,
-            params={"api-version": self.api_version},
-            headers={"User-Agent": urllib.parse.quote(user_agent.get_iothub_user_agent(), safe="")},
-            data=json.dumps(sign_request),
-        )
         try:
-            r.raise_for_status()
-        except requests.exceptions.HTTPError as e:
+            sign_response = await self._request("POST", path, headers, json=sign_request)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             raise IoTEdgeError("Unable to sign data") from e
-        try:
-            sign_response = r.json()
         except ValueError as e:
             raise IoTEdgeError("Unable to decode signed data") from e
         try:
             signed_data_str = sign_response["digest"]
-        except KeyError as e:
+        except (KeyError, TypeError) as e:
             raise IoTEdgeError("No signed data received") from e
 
         return signed_data_str  # what format is this? string? bytes?
 
 
-def _format_socket_uri(old_uri: str) -> str:
+def _parse_workload_uri(uri: str) -> Tuple[Optional[str], str]:
     """
-    This function takes a socket URI in one form and converts it into another form.
+    This function takes a workload URI, as received inside the IOTEDGE_WORKLOADURI environment
+    variable, and returns the path of the Unix domain socket it refers to (if any), along with
+    the base URL to make requests to.
 
-    The source form is based on what we receive inside the IOTEDGE_WORKLOADURI
-    environment variable, and it looks like this:
+    A Unix domain socket URI looks like this:
     "unix:///var/run/iotedge/workload.sock"
+    and is returned as ("/var/run/iotedge/workload.sock", "http://localhost/")
 
-    The destination form is based on what the requests_unixsocket library expects
-    and it looks like this:
-    "http+unix://%2Fvar%2Frun%2Fiotedge%2Fworkload.sock/"
-
-    The function changes the prefix, uri-encodes the path, and adds a slash
-    at the end.
+    Any other URI (e.g. "http://127.0.0.1:15580") is returned as (None, URI), with a slash added
+    at the end if there is not one already.
 
-    If the socket URI does not start with unix:// this function only adds
-    a slash at the end.
+    :param uri: The URI in IOTEDGE_WORKLOADURI form
 
-    :param old_uri: The URI in IOTEDGE_WORKLOADURI form
-
-    :return: The URI in requests_unixsocket form
+    :return: The socket path (or None) and the base URL
     """
-    old_prefix = "unix://"
-    new_prefix = "http+unix://"
-
-    if old_uri.startswith(old_prefix):
-        stripped_uri = old_uri[len(old_prefix) :]
-        if stripped_uri.endswith("/"):
-            stripped_uri = stripped_uri[:-1]
-        new_uri = new_prefix + urllib.parse.quote(stripped_uri, safe="")
-    else:
-        new_uri = old_uri
+    prefix = "unix://"
 
-    if not new_uri.endswith("/"):
-        new_uri += "/"
+    if uri.startswith(prefix):
+        socket_path = uri[len(prefix) :]
+        if socket_path.endswith("/"):
+            socket_path = socket_path[:-1]
+        return socket_path, UNIX_SOCKET_BASE_URL
 
-    return new_uri
+    if not uri.endswith("/"):
+        uri += "/"
+    return None, uri
@@ -43,3 +43,13 @@ def get_notify_blob_upload_status_path(device_id: str):
     /devices/uri_encode($device_id)/files/notifications
     """
     return "/devices/{}/files/notifications".format(urllib.parse.quote_plus(device_id))
+
+
+def get_telemetry_path(device_id: str):
+    """
+    This does not take a module_id since get_telemetry_path should only ever be invoked on device clients.
+
+    :return: The relative path for sending telemetry messages to IoT Hub. It is of the format
+    /devices/uri_encode($device_id)/messages/events
+    """
+    return "/devices/{}/messages/events".format(urllib.parse.quote_plus(device_id))
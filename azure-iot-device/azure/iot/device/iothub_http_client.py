@@ -5,12 +5,29 @@
 # --------------------------------------------------------------------------
 import aiohttp
 import asyncio
+import base64
+import functools
+import json
 import logging
+import mmap
+import os
 import urllib.parse
-from typing import Optional, cast
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
 from .custom_typing import DirectMethodParameters, DirectMethodResult, StorageInfo
 from .iot_exceptions import IoTHubClientError, IoTHubError, IoTEdgeError
-from . import config, constant, user_agent
+from . import config, constant, models, user_agent
 from . import http_path_iothub as http_path
 
 logger = logging.getLogger(__name__)
@@ -19,6 +36,17 @@ logger = logging.getLogger(__name__)
 HEADER_AUTHORIZATION = "Authorization"
 HEADER_EDGE_MODULE_ID = "x-ms-edge-moduleId"
 HEADER_USER_AGENT = "User-Agent"
+HEADER_CONTENT_TYPE = "Content-Type"
+
+# Message property definitions (sent as HTTP headers, or as the properties of a batch entry)
+PROPERTY_MESSAGE_ID = "iothub-messageid"
+PROPERTY_CORRELATION_ID = "iothub-correlationid"
+PROPERTY_CONTENT_TYPE = "iothub-contenttype"
+PROPERTY_CONTENT_ENCODING = "iothub-contentencoding"
+PROPERTY_APP_PREFIX = "iothub-app-"
+
+# Content type of a batch of telemetry messages in the IoTHub batch JSON format
+BATCH_CONTENT_TYPE = "application/vnd.microsoft.iothub.json"
 
 # Query parameter definitions
 PARAM_API_VERISON = "api-version"
@@ -26,6 +54,46 @@ PARAM_API_VERISON = "api-version"
 # Other definitions
 HTTP_TIMEOUT = 10
 
+# Connection pool defaults (see HTTPConnectionPool)
+DEFAULT_POOL_LIMIT = 100
+DEFAULT_POOL_LIMIT_PER_HOST = 0
+DEFAULT_KEEPALIVE_TIMEOUT = 15.0
+DEFAULT_DNS_CACHE_TTL = 10
+# Time allowed for SSL connections to shut down gracefully after a pool is closed
+# See: https://docs.aiohttp.org/en/stable/client_advanced.html#graceful-shutdown
+SSL_SHUTDOWN_GRACE_PERIOD = 0.25
+
+# Default number of direct method invocations in flight at once for .invoke_direct_method_many()
+DEFAULT_FAN_OUT_CONCURRENCY = 20
+
+# Blob upload defaults (see .upload_file())
+DEFAULT_UPLOAD_BLOCK_SIZE = 4 * 1024 * 1024
+DEFAULT_UPLOAD_CONCURRENCY = 4
+DEFAULT_UPLOAD_RETRIES = 3
+# Delay before the first retry of a failed Azure Storage request, doubled on each further retry
+UPLOAD_RETRY_BACKOFF = 0.5
+# Size of the pieces a block is read from the memory-mapped file and written to the socket in
+UPLOAD_WRITE_SIZE = 64 * 1024
+# Limits of Azure Storage block blobs
+MAX_BLOCK_SIZE = 4000 * 1024 * 1024
+MAX_BLOCK_COUNT = 50000
+# Azure Storage REST API version used for blob uploads
+STORAGE_API_VERSION = "2021-08-06"
+HEADER_STORAGE_VERSION = "x-ms-version"
+
+# Statistics kept by a HTTPConnectionPool
+POOL_STATS: Dict[str, str] = {
+    "requests_sent": "Requests started",
+    "requests_failed": "Requests that raised an exception (not including error statuses)",
+    "requests_in_flight": "Requests started but not yet completed",
+    "requests_queued": "Requests that had to wait for a connection to become available",
+    "queue_wait_seconds": "Total time requests spent waiting for a connection",
+    "connections_created": "Connections opened",
+    "connections_reused": "Requests sent on an already open connection",
+    "dns_cache_hits": "Host resolutions served from the DNS cache",
+    "dns_cache_misses": "Host resolutions that required a DNS lookup",
+}
+
 # NOTE: Outstanding items in this module:
 # TODO: document aiohttp exceptions that can be raised
 # TODO: URL Encoding logic
@@ -54,10 +122,132 @@ HTTP_TIMEOUT = 10
 # for more details.
 
 
+class DirectMethodInvocation(NamedTuple):
+    """The outcome of invoking a direct method on one target of .invoke_direct_method_many().
+    Exactly one of `result` and `error` is set."""
+
+    device_id: str
+    module_id: Optional[str]
+    result: Optional[DirectMethodResult]
+    error: Optional[Exception]
+
+
+DirectMethodTarget = Union[str, Tuple[str, Optional[str]]]
+
+
+class HTTPConnectionPool:
+    def __init__(
+        self,
+        *,
+        limit: int = DEFAULT_POOL_LIMIT,
+        limit_per_host: int = DEFAULT_POOL_LIMIT_PER_HOST,
+        keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+        dns_cache_ttl: Optional[int] = DEFAULT_DNS_CACHE_TTL,
+    ) -> None:
+        """Pool of HTTP connections that are kept open between requests, which can be shared by
+        many IoTHubHTTPClients (by providing it in their IoTHubClientConfig).
+
+        A pool shared by clients is not closed when they shut down. Invoke .close() once all of
+        them have.
+
+        :param int limit: Maximum number of connections open at once, across all hosts. Requests
+            beyond this wait for a connection to become available. 0 for no limit.
+        :param int limit_per_host: Maximum number of connections open at once to a single host.
+            0 for no limit.
+        :param float keepalive_timeout: Number of seconds an idle connection is kept open for
+            reuse
+        :param int dns_cache_ttl: Number of seconds host resolutions are cached for. None to cache
+            them forever, 0 to not cache them.
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        # NOTE: The connector is not created until first used, as it must be created on the
+        # event loop it is used on
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._stats: Dict[str, float] = {name: 0 for name in POOL_STATS}
+        self.trace_config = self._create_trace_config()
+
+    @property
+    def connector(self) -> aiohttp.TCPConnector:
+        """The aiohttp connector holding the connections of the pool"""
+        if self._connector is None:
+            logger.debug(
+                "Creating HTTP connection pool (limit: {limit}, limit per host: {per_host}, keepalive: {keepalive}s)".format(
+                    limit=self.limit, per_host=self.limit_per_host, keepalive=self.keepalive_timeout
+                )
+            )
+            self._connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=(self.dns_cache_ttl != 0),
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+        return self._connector
+
+    @property
+    def closed(self) -> bool:
+        return self._connector is not None and self._connector.closed
+
+    def get_stats(self) -> Dict[str, float]:
+        """Return the statistics of the pool (see POOL_STATS)"""
+        return dict(self._stats)
+
+    async def close(self) -> None:
+        """Close all connections of the pool"""
+        if self._connector is None or self._connector.closed:
+            return
+        await asyncio.shield(self._connector.close())
+        # NOTE: Closing the connector does not wait for SSL connections to finish shutting down
+        # (in all versions of aiohttp), so allow them a grace period, if any were opened
+        if self._stats["connections_created"]:
+            await asyncio.sleep(SSL_SHUTDOWN_GRACE_PERIOD)
+
+    def _create_trace_config(self) -> aiohttp.TraceConfig:
+        """Create a TraceConfig that keeps the statistics of the pool, for the ClientSessions
+        using it"""
+        stats = self._stats
+        trace_config = aiohttp.TraceConfig()
+
+        def count(name: str, delta: int = 1) -> Any:
+            async def callback(session: Any, context: Any, params: Any) -> None:
+                stats[name] += delta
+
+            return callback
+
+        async def on_queued_start(session: Any, context: Any, params: Any) -> None:
+            stats["requests_queued"] += 1
+            context.queued_at = asyncio.get_running_loop().time()
+
+        async def on_queued_end(session: Any, context: Any, params: Any) -> None:
+            stats["queue_wait_seconds"] += asyncio.get_running_loop().time() - context.queued_at
+
+        # NOTE: The callbacks are cast to Any, as the signal annotations of aiohttp do not match
+        # the (session, context, params) signature that callbacks are invoked with
+        trace_config.on_request_start.append(count("requests_sent"))
+        trace_config.on_request_start.append(count("requests_in_flight"))
+        trace_config.on_request_end.append(count("requests_in_flight", -1))
+        trace_config.on_request_exception.append(count("requests_in_flight", -1))
+        trace_config.on_request_exception.append(count("requests_failed"))
+        trace_config.on_connection_queued_start.append(cast(Any, on_queued_start))
+        trace_config.on_connection_queued_end.append(cast(Any, on_queued_end))
+        trace_config.on_connection_create_end.append(count("connections_created"))
+        trace_config.on_connection_reuseconn.append(count("connections_reused"))
+        trace_config.on_dns_cache_hit.append(count("dns_cache_hits"))
+        trace_config.on_dns_cache_miss.append(count("dns_cache_misses"))
+        trace_config.freeze()
+        return trace_config
+
+
 class IoTHubHTTPClient:
     def __init__(self, client_config: config.IoTHubClientConfig) -> None:
         """Instantiate the client
 
+        Requests are made over the HTTPConnectionPool in the IoTHubClientConfig, if there is one.
+        Otherwise, the client creates a HTTPConnectionPool of its own, with default settings.
+
         :param client_config: The config object for the client
         :type client_config: :class:`IoTHubClientConfig`
         """
@@ -76,27 +266,41 @@ class IoTHubHTTPClient:
             logger.warning("Proxy use with .invoke_direct_method() not supported")
             logger.warning("Proxy use with .get_storage_info_for_blob() not supported")
             logger.warning("Proxy use with .notify_blob_upload_status() not supported")
-
-        self._session = _create_client_session(client_config.hostname)
+            logger.warning("Proxy use with .upload_file() not supported")
+            logger.warning("Proxy use with .send_message() not supported")
+            logger.warning("Proxy use with .send_message_batch() not supported")
+
+        if client_config.http_connection_pool:
+            self._connection_pool = client_config.http_connection_pool
+            self._owns_connection_pool = False
+        else:
+            self._connection_pool = HTTPConnectionPool()
+            self._owns_connection_pool = True
+        self._session = _create_client_session(client_config.hostname, self._connection_pool)
+        # NOTE: Blobs are uploaded to Azure Storage, not IoTHub, so a separate ClientSession is
+        # used, created upon first upload. It makes requests over the same connection pool.
+        self._storage_session: Optional[aiohttp.ClientSession] = None
         self._ssl_context = client_config.ssl_context
         self._sastoken_provider = client_config.sastoken_provider
 
     async def shutdown(self):
         """Shut down the client
 
-        Invoke only when complete finished with the client for graceful exit.
+        Invoke only when complete finished with the client for graceful exit. The connection pool
+        is closed only if it was created by the client (i.e. it is not shared).
         """
         await asyncio.shield(self._session.close())
-        # Wait 250ms for the underlying SSL connections to close
-        # See: https://docs.aiohttp.org/en/stable/client_advanced.html#graceful-shutdown
-        await asyncio.sleep(0.25)
+        if self._storage_session:
+            await asyncio.shield(self._storage_session.close())
+        if self._owns_connection_pool:
+            await self._connection_pool.close()
 
     async def invoke_direct_method(
         self,
         *,
         device_id: str,
         module_id: Optional[str] = None,
-        method_params: DirectMethodParameters
+        method_params: DirectMethodParameters,
     ) -> DirectMethodResult:
         """Send a request to invoke a direct method on a target device or module
 
@@ -116,16 +320,133 @@ class IoTHubHTTPClient:
             # if it is an Edge Module or not. There's no way to tell, unfortunately.
             raise IoTHubClientError(".invoke_direct_method() only available for Edge Modules")
 
-        path = http_path.get_direct_method_invoke_path(device_id, module_id)
-        query_params = {PARAM_API_VERISON: constant.IOTHUB_API_VERSION}
+        headers = self._get_direct_method_headers()
+        return await self._invoke_direct_method(device_id, module_id, method_params, headers)
+
+    def invoke_direct_method_many(
+        self,
+        *,
+        targets: Iterable[DirectMethodTarget],
+        method_params: DirectMethodParameters,
+        concurrency: int = DEFAULT_FAN_OUT_CONCURRENCY,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[DirectMethodInvocation]:
+        """Invoke the same direct method on many target devices and/or modules concurrently,
+        yielding the outcome of each invocation as it completes (i.e. not in the order of the
+        targets).
+
+        A failed invocation does not stop the others. Its exception is in the `error` of its
+        outcome instead.
+
+        Breaking out of the iteration cancels any invocations still in progress.
+
+        :param targets: The targets to invoke the direct method on. Each is either a device ID,
+            or a tuple of a device ID and a module ID (or None).
+        :type targets: iterable of str or tuple
+        :param dict method_params: The parameters for the direct method invocations
+        :param int concurrency: Maximum number of invocations in progress at once
+        :param float timeout: Number of seconds each invocation may take before it fails with
+            :class:`asyncio.TimeoutError`. If not provided, each invocation is only subject to
+            the timeout of the HTTP request.
+
+        :returns: An asynchronous iterator of the outcome of each invocation
+        :rtype: AsyncIterator[:class:`DirectMethodInvocation`]
+
+        :raises: :class:`IoTHubClientError` if not using an IoT Edge Module
+        :raises: ValueError if a target or the concurrency is invalid
+        """
+        if not self._edge_module_id:
+            raise IoTHubClientError(".invoke_direct_method_many() only available for Edge Modules")
+        if concurrency < 1:
+            raise ValueError("concurrency must be a positive integer")
+        normalized_targets = [_normalize_direct_method_target(target) for target in targets]
+        # NOTE: Returning an async generator from a regular function, rather than making this an
+        # async generator itself, means that invalid arguments are raised upon invocation, rather
+        # than upon iteration.
+        return self._fan_out_direct_method(normalized_targets, method_params, concurrency, timeout)
+
+    async def _fan_out_direct_method(
+        self,
+        targets: List[Tuple[str, Optional[str]]],
+        method_params: DirectMethodParameters,
+        concurrency: int,
+        timeout: Optional[float],
+    ) -> AsyncIterator[DirectMethodInvocation]:
+        pending_targets = iter(targets)
+        # NOTE: Each worker puts its own Task on the queue once it is done, after the outcomes of
+        # all the targets it took
+        outcomes: "asyncio.Queue[Union[DirectMethodInvocation, asyncio.Task[None]]]" = (
+            asyncio.Queue()
+        )
+
+        async def invoke(device_id: str, module_id: Optional[str]) -> DirectMethodResult:
+            # NOTE: The headers are derived for each invocation, as a fan-out over many targets
+            # can outlive the SAS token that was current when it began
+            headers = self._get_direct_method_headers()
+            coro = self._invoke_direct_method(device_id, module_id, method_params, headers)
+            if timeout is None:
+                return await coro
+            return await asyncio.wait_for(coro, timeout)
+
+        async def worker() -> None:
+            # NOTE: Each worker takes the next target once it is free, so that a slow target only
+            # holds up one worker, rather than a whole batch of targets
+            for device_id, module_id in pending_targets:
+                try:
+                    result = await invoke(device_id, module_id)
+                except Exception as e:
+                    outcome = DirectMethodInvocation(device_id, module_id, None, e)
+                else:
+                    outcome = DirectMethodInvocation(device_id, module_id, result, None)
+                outcomes.put_nowait(outcome)
+
+        logger.debug(
+            "Invoking direct method on {count} targets, {concurrency} at a time".format(
+                count=len(targets), concurrency=concurrency
+            )
+        )
+        workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(targets)))]
+        for worker_task in workers:
+            worker_task.add_done_callback(outcomes.put_nowait)
+        try:
+            remaining_workers = len(workers)
+            while remaining_workers:
+                item = await outcomes.get()
+                if isinstance(item, asyncio.Task):
+                    # NOTE: A worker that ended without taking care of all of its targets (e.g.
+                    # it was cancelled) raises here, rather than the iteration waiting forever
+                    # for outcomes that will never arrive
+                    item.result()
+                    remaining_workers -= 1
+                else:
+                    yield item
+        finally:
+            for worker_task in workers:
+                worker_task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def _get_direct_method_headers(self) -> Dict[str, str]:
         # NOTE: Other headers are auto-generated by aiohttp
         headers = {
             HEADER_USER_AGENT: urllib.parse.quote_plus(self._user_agent_string),
-            HEADER_EDGE_MODULE_ID: self._edge_module_id,  # TODO: I assume this isn't supposed to be URI encoded just like in MQTT?
+            HEADER_EDGE_MODULE_ID: cast(
+                str, self._edge_module_id
+            ),  # TODO: I assume this isn't supposed to be URI encoded just like in MQTT?
         }
         # If using SAS auth, pass the auth header
         if self._sastoken_provider:
             headers[HEADER_AUTHORIZATION] = str(self._sastoken_provider.get_current_sastoken())
+        return headers
+
+    async def _invoke_direct_method(
+        self,
+        device_id: str,
+        module_id: Optional[str],
+        method_params: DirectMethodParameters,
+        headers: Dict[str, str],
+    ) -> DirectMethodResult:
+        path = http_path.get_direct_method_invoke_path(device_id, module_id)
+        query_params = {PARAM_API_VERISON: constant.IOTHUB_API_VERSION}
 
         logger.debug(
             "Sending direct method invocation request to {device_id}/{module_id}".format(
@@ -155,6 +476,91 @@ class IoTHubHTTPClient:
 
         return dm_result
 
+    async def send_message(self, message: models.Message) -> None:
+        """Send a telemetry message to IoTHub over HTTPS.
+
+        The properties of the Message are sent as HTTP headers.
+
+        :param message: The Message to be sent
+        :type message: :class:`models.Message`
+
+        :raises: :class:`IoTHubClientError` if not using a Device
+        :raises: :class:`IoTHubError` if IoTHub responds with failure
+        :raises: ValueError if the size of the Message payload is too large
+        :raises: ValueError if the Message is a security message
+        """
+        if self._module_id:
+            raise IoTHubClientError(".send_message() only available for Devices")
+
+        payload = _encode_message_payload(message)
+        if len(payload) > constant.TELEMETRY_MESSAGE_SIZE_LIMIT:
+            raise ValueError("Size of telemetry message can not exceed 256 KB.")
+        headers = self._get_telemetry_headers()
+        headers.update(_get_message_properties(message))
+
+        logger.debug("Sending telemetry message to IoTHub...")
+        await self._send_telemetry(payload, headers)
+        logger.debug("Successfully sent telemetry message to IoTHub")
+
+    async def send_message_batch(self, messages: Iterable[models.Message]) -> None:
+        """Send many telemetry messages to IoTHub over HTTPS, in as few requests as possible.
+
+        The Messages are sent, in order, in the IoTHub batch JSON format. Each request carries
+        as many Messages as fit in the 256 KB limit of IoTHub, so a batch is usually sent in a
+        single request.
+
+        :param messages: The Messages to be sent
+        :type messages: iterable of :class:`models.Message`
+
+        :raises: :class:`IoTHubClientError` if not using a Device
+        :raises: :class:`IoTHubError` if IoTHub responds with failure. The Messages of earlier
+            requests of the batch will already have been sent.
+        :raises: ValueError if any Message is too large to be sent in a batch, or is a security
+            message. No Messages are sent.
+        """
+        if self._module_id:
+            raise IoTHubClientError(".send_message_batch() only available for Devices")
+
+        bodies = _create_batch_bodies(messages)
+        headers = self._get_telemetry_headers()
+        headers[HEADER_CONTENT_TYPE] = BATCH_CONTENT_TYPE
+
+        for i, body in enumerate(bodies):
+            logger.debug(
+                "Sending telemetry batch to IoTHub (request {} of {})...".format(i + 1, len(bodies))
+            )
+            await self._send_telemetry(body, headers)
+        logger.debug("Successfully sent telemetry batch to IoTHub")
+
+    def _get_telemetry_headers(self) -> Dict[str, str]:
+        """Returns the headers common to all telemetry requests"""
+        # NOTE: Other headers are auto-generated by aiohttp
+        headers = {HEADER_USER_AGENT: urllib.parse.quote_plus(self._user_agent_string)}
+        # If using SAS auth, pass the auth header
+        if self._sastoken_provider:
+            headers[HEADER_AUTHORIZATION] = str(self._sastoken_provider.get_current_sastoken())
+        return headers
+
+    async def _send_telemetry(self, data: bytes, headers: Dict[str, str]) -> None:
+        """Send a telemetry request (of a single message, or a batch) to IoTHub"""
+        path = http_path.get_telemetry_path(self._device_id)
+        query_params = {PARAM_API_VERISON: constant.IOTHUB_API_VERSION}
+        async with self._session.post(
+            url=path,
+            data=data,
+            params=query_params,
+            headers=headers,
+            ssl=self._ssl_context,
+        ) as response:
+
+            if response.status >= 300:
+                logger.error("Received failure response from IoTHub for telemetry")
+                raise IoTHubError(
+                    "IoTHub responded to telemetry with a failed status ({status}) - {reason}".format(
+                        status=response.status, reason=response.reason
+                    )
+                )
+
     async def get_storage_info_for_blob(self, *, blob_name: str) -> StorageInfo:
         """Request information for uploading blob file via the Azure Storage SDK
 
@@ -255,6 +661,272 @@ class IoTHubHTTPClient:
 
         return None
 
+    async def upload_file(
+        self,
+        *,
+        file_path: str,
+        blob_name: Optional[str] = None,
+        block_size: int = DEFAULT_UPLOAD_BLOCK_SIZE,
+        concurrency: int = DEFAULT_UPLOAD_CONCURRENCY,
+        max_retries: int = DEFAULT_UPLOAD_RETRIES,
+    ) -> None:
+        """Upload a file to the Azure Storage account associated with IoTHub, and notify IoTHub
+        of the result.
+
+        The file is memory-mapped and streamed to Azure Storage as the blocks of a block blob,
+        without ever being read into memory in full. Up to `concurrency` blocks are uploaded at
+        once, and a failed request to Azure Storage is retried up to `max_retries` times (with
+        exponential backoff) before the upload fails.
+
+        :param str file_path: Path of the file to upload
+        :param str blob_name: The name of the blob to upload to. Defaults to the name of the file.
+        :param int block_size: The size (in bytes) of each block of the blob
+        :param int concurrency: The maximum number of blocks to upload at once
+        :param int max_retries: The maximum number of times to retry a failed request to Azure
+            Storage
+
+        :raises: :class:`IoTHubClientError` if not using a Device
+        :raises: :class:`IoTHubError` if IoTHub responds with failure
+        :raises: :class:`IoTHubError` if Azure Storage responds with failure
+        :raises: ValueError if the block size, concurrency or max retries are invalid, or if the
+            file is too large for the block size
+        :raises: OSError if the file cannot be opened
+        """
+        if self._module_id:
+            raise IoTHubClientError(".upload_file() only available for Devices")
+        if not 0 < block_size <= MAX_BLOCK_SIZE:
+            raise ValueError("block_size must be between 1 and {}".format(MAX_BLOCK_SIZE))
+        if concurrency < 1:
+            raise ValueError("concurrency must be a positive integer")
+        if max_retries < 0:
+            raise ValueError("max_retries cannot be negative")
+        if blob_name is None:
+            blob_name = os.path.basename(file_path)
+
+        with open(file_path, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            if -(-file_size // block_size) > MAX_BLOCK_COUNT:
+                raise ValueError(
+                    "File is too large to upload in blocks of {} bytes".format(block_size)
+                )
+            storage_info = await self.get_storage_info_for_blob(blob_name=blob_name)
+            try:
+                await self._upload_blob(
+                    storage_info, f, file_size, block_size, concurrency, max_retries
+                )
+            except Exception as e:
+                logger.error("Blob upload failed: {}".format(e))
+                try:
+                    await self.notify_blob_upload_status(
+                        correlation_id=storage_info["correlationId"],
+                        is_success=False,
+                        status_code=500,
+                        status_description=str(e),
+                    )
+                except Exception as notify_error:
+                    logger.error(
+                        "Failed to notify IoTHub of failed blob upload: {}".format(notify_error)
+                    )
+                raise
+
+        await self.notify_blob_upload_status(
+            correlation_id=storage_info["correlationId"],
+            is_success=True,
+            status_code=200,
+            status_description="Uploaded {} bytes".format(file_size),
+        )
+
+    async def _upload_blob(
+        self,
+        storage_info: StorageInfo,
+        f: Any,
+        file_size: int,
+        block_size: int,
+        concurrency: int,
+        max_retries: int,
+    ) -> None:
+        """Upload the contents of a file to the blob described by the storage info, as blocks
+        which are then committed"""
+        blob_url = _get_blob_url(storage_info)
+        headers = {
+            HEADER_USER_AGENT: urllib.parse.quote_plus(self._user_agent_string),
+            HEADER_STORAGE_VERSION: STORAGE_API_VERSION,
+        }
+        offsets = range(0, file_size, block_size)
+        # NOTE: All block IDs of a blob must be the same length
+        block_ids = [
+            base64.b64encode("{:08d}".format(i).encode()).decode() for i in range(len(offsets))
+        ]
+
+        # NOTE: An empty file cannot be memory-mapped. It has no blocks to upload anyway.
+        if file_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                pending = iter(zip(block_ids, offsets))
+
+                async def worker() -> None:
+                    for block_id, offset in pending:
+                        end = min(offset + block_size, file_size)
+                        url = "{}&comp=block&blockid={}".format(
+                            blob_url, urllib.parse.quote(block_id, safe="")
+                        )
+                        block_headers = dict(headers, **{"Content-Length": str(end - offset)})
+                        await self._put_to_storage(
+                            url,
+                            functools.partial(_read_mapped_file, mapped_file, offset, end),
+                            block_headers,
+                            max_retries,
+                        )
+
+                logger.debug("Uploading {} blocks to Azure Storage...".format(len(block_ids)))
+                workers = [
+                    asyncio.ensure_future(worker()) for _ in range(min(concurrency, len(block_ids)))
+                ]
+                try:
+                    await asyncio.gather(*workers)
+                finally:
+                    # If any block failed, stop uploading the others
+                    for task in workers:
+                        task.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+
+        logger.debug("Committing block list to Azure Storage...")
+        block_list = "".join("<Latest>{}</Latest>".format(block_id) for block_id in block_ids)
+        body = '<?xml version="1.0" encoding="utf-8"?><BlockList>{}</BlockList>'.format(
+            block_list
+        ).encode()
+        await self._put_to_storage(
+            blob_url + "&comp=blocklist",
+            lambda: body,
+            dict(headers, **{"Content-Type": "application/xml"}),
+            max_retries,
+        )
+        logger.debug("Successfully uploaded blob to Azure Storage")
+
+    async def _put_to_storage(
+        self, url: str, get_data: Callable[[], Any], headers: Dict[str, str], max_retries: int
+    ) -> None:
+        """Send a PUT request to Azure Storage, retrying upon connection failures, timeouts and
+        transient failure statuses. The data to send is produced anew for each attempt."""
+        if self._storage_session is None:
+            self._storage_session = _create_storage_session(self._connection_pool)
+        retries = 0
+        while True:
+            try:
+                async with self._storage_session.put(
+                    url, data=get_data(), headers=headers, ssl=self._ssl_context
+                ) as response:
+                    if response.status < 300:
+                        return
+                    error: Exception = IoTHubError(
+                        "Azure Storage responded to blob upload with a failed status ({status}) - {reason}".format(
+                            status=response.status, reason=response.reason
+                        )
+                    )
+                    retryable = response.status >= 500 or response.status in (408, 429)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+                retryable = True
+            if not retryable or retries >= max_retries:
+                raise error
+            delay = UPLOAD_RETRY_BACKOFF * 2**retries
+            retries += 1
+            logger.warning(
+                "Azure Storage request failed ({error}), retrying in {delay}s ({retries}/{max_retries})".format(
+                    error=error, delay=delay, retries=retries, max_retries=max_retries
+                )
+            )
+            await asyncio.sleep(delay)
+
+
+def _normalize_direct_method_target(target: DirectMethodTarget) -> Tuple[str, Optional[str]]:
+    """Returns the (device_id, module_id) of a direct method target"""
+    if isinstance(target, str):
+        return (target, None)
+    try:
+        device_id, module_id = target
+    except (TypeError, ValueError):
+        raise ValueError("Invalid direct method target: {}".format(target))
+    if not isinstance(device_id, str) or not (module_id is None or isinstance(module_id, str)):
+        raise ValueError("Invalid direct method target: {}".format(target))
+    return (device_id, module_id)
+
+
+def _encode_message_payload(message: models.Message) -> bytes:
+    """Returns the payload of the Message, formatted based on its content configuration"""
+    if message.content_type == "application/json":
+        str_payload = json.dumps(message.payload)
+    else:
+        str_payload = str(message.payload)
+    return str_payload.encode(message.content_encoding)
+
+
+def _get_message_properties(message: models.Message) -> Dict[str, str]:
+    """Returns the system and custom properties of the Message, named as HTTP headers"""
+    # NOTE: The interface ID that marks a security message has no HTTP equivalent, so rather than
+    # send a security message as ordinary telemetry, refuse to send it at all.
+    if message.iothub_interface_id:
+        raise ValueError("Security messages cannot be sent over HTTPS")
+    properties = {
+        PROPERTY_APP_PREFIX + name: value for name, value in message.custom_properties.items()
+    }
+    if message.message_id:
+        properties[PROPERTY_MESSAGE_ID] = message.message_id
+    if message.correlation_id:
+        properties[PROPERTY_CORRELATION_ID] = message.correlation_id
+    if message.content_type:
+        properties[PROPERTY_CONTENT_TYPE] = message.content_type
+    if message.content_encoding:
+        properties[PROPERTY_CONTENT_ENCODING] = message.content_encoding
+    return properties
+
+
+def _create_batch_bodies(messages: Iterable[models.Message]) -> List[bytes]:
+    """Returns the request bodies (in the IoTHub batch JSON format) to send the Messages in,
+    each as large as possible without exceeding the telemetry size limit"""
+    bodies: List[bytes] = []
+    entries: List[bytes] = []
+    # The enclosing "[" and "]"
+    size = 2
+    for message in messages:
+        entry = json.dumps(
+            {
+                "body": base64.b64encode(_encode_message_payload(message)).decode(),
+                "base64Encoded": True,
+                "properties": _get_message_properties(message),
+            }
+        ).encode()
+        if len(entry) + 2 > constant.TELEMETRY_MESSAGE_SIZE_LIMIT:
+            raise ValueError("Size of telemetry message in a batch can not exceed 256 KB.")
+        # Each entry after the first is preceded by a ","
+        entry_size = len(entry) + 1 if entries else len(entry)
+        if size + entry_size > constant.TELEMETRY_MESSAGE_SIZE_LIMIT:
+            bodies.append(b"[" + b",".join(entries) + b"]")
+            entries = []
+            size = 2
+            entry_size = len(entry)
+        entries.append(entry)
+        size += entry_size
+    if entries:
+        bodies.append(b"[" + b",".join(entries) + b"]")
+    return bodies
+
+
+def _get_blob_url(storage_info: StorageInfo) -> str:
+    """Returns the URL of the blob described by the storage info, including the SAS token"""
+    return "https://{hostname}/{container}/{blob}{sastoken}".format(
+        hostname=storage_info["hostName"],
+        container=storage_info["containerName"],
+        blob=urllib.parse.quote(storage_info["blobName"]),
+        sastoken=storage_info["sasToken"],
+    )
+
+
+async def _read_mapped_file(mapped_file: mmap.mmap, start: int, end: int) -> AsyncIterator[bytes]:
+    """Yields the given range of a memory-mapped file in pieces, so that a block is streamed to
+    the socket as it is read, rather than held in memory in full"""
+    for offset in range(start, end, UPLOAD_WRITE_SIZE):
+        yield mapped_file[offset : min(offset + UPLOAD_WRITE_SIZE, end)]
+
 
 def _format_edge_module_id(device_id: str, module_id: Optional[str]) -> Optional[str]:
     """Returns the edge module identifier"""
@@ -264,14 +936,36 @@ def _format_edge_module_id(device_id: str, module_id: Optional[str]) -> Optional
         return None
 
 
-def _create_client_session(hostname: str) -> aiohttp.ClientSession:
-    """Create and return a aiohttp ClientSession object"""
+def _create_client_session(hostname: str, pool: HTTPConnectionPool) -> aiohttp.ClientSession:
+    """Create and return a aiohttp ClientSession object, making requests over the given pool"""
     base_url = "https://{hostname}".format(hostname=hostname)
     timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
-    session = aiohttp.ClientSession(base_url=base_url, timeout=timeout)
+    # NOTE: The ClientSession does not own the connector, so closing the ClientSession does not
+    # close the connections of the pool, which may be shared with other ClientSessions.
+    session = aiohttp.ClientSession(
+        base_url=base_url,
+        timeout=timeout,
+        connector=pool.connector,
+        connector_owner=False,
+        trace_configs=[pool.trace_config],
+    )
     logger.debug(
         "Creating HTTP Session for {url} with timeout of {timeout}".format(
             url=base_url, timeout=timeout.total
         )
     )
     return session
+
+
+def _create_storage_session(pool: HTTPConnectionPool) -> aiohttp.ClientSession:
+    """Create and return a aiohttp ClientSession object for Azure Storage requests, making
+    requests over the given pool"""
+    # NOTE: There is no total timeout, as uploading a large block over a slow connection can take
+    # a long time. Connecting, and each read of the response, are still limited.
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=HTTP_TIMEOUT, sock_read=HTTP_TIMEOUT)
+    return aiohttp.ClientSession(
+        timeout=timeout,
+        connector=pool.connector,
+        connector_owner=False,
+        trace_configs=[pool.trace_config],
+    )
@@ -5,31 +5,38 @@
 # --------------------------------------------------------------------------
 
 import asyncio
+import collections
 import json
 import logging
+import time
 import urllib.parse
-from typing import Callable, Optional, AsyncGenerator, TypeVar
+from typing import Callable, Dict, List, Optional, AsyncGenerator, Set, Tuple, TypeVar, Union
 from .custom_typing import TwinPatch, Twin
 from .iot_exceptions import IoTHubError, IoTHubClientError
 from .mqtt_client import (  # noqa: F401 (Importing directly to re-export)
     MQTTError,
     MQTTConnectionFailedError,
+    IncomingMessageInterrupt,
+    INCOMING_MESSAGE_INTERRUPT,
 )
-from . import config, constant, user_agent, models
+from . import config, constant, tracing, user_agent, models
 from . import request_response as rr
 from . import mqtt_client as mqtt
 from . import mqtt_topic_iothub as mqtt_topic
 
 # TODO: update docstrings with correct class paths once repo structured better
-# TODO: If we're truly done with keeping SAS credentials fresh, we don't need to use SasTokenProvider,
-# and we could just simply use a single token or generator instead.
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_RECONNECT_INTERVAL: int = 10
+# The longest time IoT Hub will wait for a response to a direct method request
+MAX_DIRECT_METHOD_RESPONSE_TIMEOUT: int = 300
 
 _T = TypeVar("_T")
 
+# Incoming data generators yield INCOMING_MESSAGE_INTERRUPT (see .interrupt_incoming_data())
+Incoming = Union[_T, mqtt.IncomingMessageInterrupt]
+
 
 class IoTHubMQTTClient:
     def __init__(
@@ -58,54 +65,99 @@ class IoTHubMQTTClient:
         self._mqtt_client = _create_mqtt_client(self._client_id, client_config)
         # NOTE: credentials are set upon `.start()`
 
+        # Metrics
+        self._metrics_provider = client_config.metrics_provider
+        self._metrics_attributes = {"device_id": self._device_id}
+        if self._module_id:
+            self._metrics_attributes["module_id"] = self._module_id
+        self.message_count = 0
+        self.message_ack_count = 0
+        self.message_failure_count = 0
+        # Names of the (received count, queue depth) metrics of each receive topic, and the
+        # number of items received on each
+        self._receive_metric_names: Dict[str, Tuple[str, str]] = {}
+        self._receive_counts: Dict[str, int] = {}
+        # Time each direct method request was received (in order of receipt), by request id,
+        # until it is responded to (or IoT Hub would no longer accept a response)
+        self._direct_method_receive_times: "collections.OrderedDict[str, float]" = (
+            collections.OrderedDict()
+        )
+
         # Add filters for receive topics delivering data used internally
         twin_response_topic = mqtt_topic.get_twin_response_topic_for_subscribe()
         self._mqtt_client.add_incoming_message_filter(twin_response_topic)
 
         # Create generators for receive topics delivering data used externally
         # (Implicitly adding filters for these topics as well)
-        self._incoming_input_messages: Optional[AsyncGenerator[models.Message, None]] = None
-        self._incoming_c2d_messages: Optional[AsyncGenerator[models.Message, None]] = None
-        self._incoming_direct_method_requests: AsyncGenerator[models.DirectMethodRequest, None]
-        self._incoming_twin_patches: AsyncGenerator[TwinPatch, None]
+        self._external_data_topics: List[str] = []
+        self._incoming_input_messages: Optional[
+            AsyncGenerator[Incoming[models.Message], None]
+        ] = None
+        self._incoming_c2d_messages: Optional[AsyncGenerator[Incoming[models.Message], None]] = None
+        self._incoming_direct_method_requests: AsyncGenerator[
+            Incoming[models.DirectMethodRequest], None
+        ]
+        self._incoming_twin_patches: AsyncGenerator[Incoming[TwinPatch], None]
         if self._module_id:
             self._incoming_input_messages = self._create_incoming_data_generator(
                 topic=mqtt_topic.get_input_topic_for_subscribe(self._device_id, self._module_id),
                 transform_fn=_create_iothub_message_from_mqtt_message,
+                metric_names=("messages_received", "message_queue_depth"),
             )
         else:
             self._incoming_c2d_messages = self._create_incoming_data_generator(
                 topic=mqtt_topic.get_c2d_topic_for_subscribe(self._device_id),
                 transform_fn=_create_iothub_message_from_mqtt_message,
+                metric_names=("messages_received", "message_queue_depth"),
             )
         self._incoming_direct_method_requests = self._create_incoming_data_generator(
             topic=mqtt_topic.get_direct_method_request_topic_for_subscribe(),
-            transform_fn=_create_direct_method_request_from_mqtt_message,
+            transform_fn=self._create_direct_method_request,
+            metric_names=("direct_method_requests_received", "direct_method_queue_depth"),
         )
         self._incoming_twin_patches = self._create_incoming_data_generator(
             topic=mqtt_topic.get_twin_patch_topic_for_subscribe(),
             transform_fn=_create_twin_patch_from_mqtt_message,
+            metric_names=("twin_patches_received", "twin_patch_queue_depth"),
         )
 
         # Internal request/response infrastructure
         self._request_ledger = rr.RequestLedger()
         self._twin_responses_enabled = False
 
+        # Topics subscribed to, so that they can be subscribed to again upon reconnecting with new
+        # credentials. The lock prevents subscribes and unsubscribes during such a reconnect.
+        self._subscribed_topics: Set[str] = set()
+        self._subscription_lock = asyncio.Lock()
+
         # Background Tasks (Will be set upon `.start()`)
         self._process_twin_responses_bg_task: Optional[asyncio.Task[None]] = None
+        self._keep_credentials_fresh_bg_task: Optional[asyncio.Task[None]] = None
 
     def _create_incoming_data_generator(
-        self, topic: str, transform_fn: Callable[[mqtt.MQTTMessage], _T]
-    ) -> AsyncGenerator[_T, None]:
+        self,
+        topic: str,
+        transform_fn: Callable[[mqtt.MQTTMessage], _T],
+        metric_names: Tuple[str, str],
+    ) -> AsyncGenerator[Incoming[_T], None]:
         """Return a generator for incoming MQTT data on a given topic, yielding a transformation
         of that data via the given transform function"""
         self._mqtt_client.add_incoming_message_filter(topic)
+        self._external_data_topics.append(topic)
+        self._receive_metric_names[topic] = metric_names
+        self._receive_counts[topic] = 0
         incoming_mqtt_messages = self._mqtt_client.get_incoming_message_generator(topic)
 
-        async def generator() -> AsyncGenerator[_T, None]:
+        async def generator() -> AsyncGenerator[Incoming[_T], None]:
             async for mqtt_message in incoming_mqtt_messages:
+                if isinstance(mqtt_message, mqtt.IncomingMessageInterrupt):
+                    # Interrupts are passed through untransformed
+                    yield mqtt_message
+                    continue
                 try:
-                    yield transform_fn(mqtt_message)
+                    item = transform_fn(mqtt_message)
+                    self._receive_counts[topic] += 1
+                    yield item
                     mqtt_message = None
                 except asyncio.CancelledError:
                     # NOTE: In Python 3.7 this isn't a BaseException, so we must catch and re-raise
@@ -119,11 +171,89 @@ class IoTHubMQTTClient:
 
         return generator()
 
-    async def _enable_twin_responses(self) -> None:
-        """Enable receiving of twin responses (for twin requests, or twin patches) from IoTHub"""
+    def _create_direct_method_request(
+        self, mqtt_message: mqtt.MQTTMessage
+    ) -> models.DirectMethodRequest:
+        """Create a DirectMethodRequest, noting the time of receipt if recording round trips"""
+        method_request = _create_direct_method_request_from_mqtt_message(mqtt_message)
+        if self._metrics_provider:
+            now = time.monotonic()
+            receive_times = self._direct_method_receive_times
+            # Forget requests that can no longer be responded to, so that requests that are never
+            # responded to do not accumulate
+            while receive_times:
+                request_id, receive_time = next(iter(receive_times.items()))
+                if now - receive_time < MAX_DIRECT_METHOD_RESPONSE_TIMEOUT:
+                    break
+                del receive_times[request_id]
+            receive_times[method_request.request_id] = now
+        return method_request
+
+    def _record_round_trip_time(self, operation: str, start: float) -> None:
+        if self._metrics_provider:
+            self._metrics_provider.record_round_trip_time(
+                operation, time.monotonic() - start, self._metrics_attributes
+            )
+
+    async def _subscribe(self, topic: str) -> None:
+        """Subscribe to a topic, and track the subscription"""
+        async with self._subscription_lock:
+            await self._mqtt_client.subscribe(topic)
+            self._subscribed_topics.add(topic)
+
+    async def _unsubscribe(self, topic: str) -> None:
+        """Unsubscribe from a topic, and stop tracking the subscription"""
+        async with self._subscription_lock:
+            self._subscribed_topics.discard(topic)
+            await self._mqtt_client.unsubscribe(topic)
+
+    async def _keep_credentials_fresh(self) -> None:
+        """Run indefinitely, updating the MQTTClient credentials each time a new SasToken is
+        available, and reconnecting (if connected) so that they are in use before the previous
+        SasToken expires"""
+        # NOTE: This is only ever started if there is a SasTokenProvider
+        assert self._sastoken_provider is not None
+        logger.debug("Starting 'keep_credentials_fresh' background task")
+        while True:
+            new_sastoken = await self._sastoken_provider.wait_for_new_sastoken()
+            logger.debug("New SasToken received. Updating MQTTClient credentials...")
+            self._mqtt_client.set_credentials(self._username, str(new_sastoken))
+            if not self.connected:
+                logger.debug("Not connected - new credentials will be used upon next connect")
+                continue
+            async with self._subscription_lock:
+                logger.debug("Reconnecting with new credentials...")
+                try:
+                    await self._mqtt_client.reconnect()
+                except MQTTConnectionFailedError as e:
+                    # NOTE: The disconnection has been reported to anything waiting on it
+                    logger.error("Reconnect with new credentials failed: {}".format(e))
+                    continue
+                logger.debug("Reconnect succeeded. Resubscribing...")
+                # NOTE: Subscribes cancelled by a disconnect are returned as CancelledErrors,
+                # whereas cancellation of this task is raised
+                results = await asyncio.gather(
+                    *[self._mqtt_client.subscribe(topic) for topic in self._subscribed_topics],
+                    return_exceptions=True,
+                )
+                for result in results:
+                    if isinstance(result, (Exception, asyncio.CancelledError)):
+                        logger.error("Resubscribe after reconnect failed: {}".format(repr(result)))
+
+    async def _enable_twin_responses(self, timeout: Optional[float] = None) -> None:
+        """Enable receiving of twin responses (for twin requests, or twin patches) from IoTHub
+
+        :param float timeout: Time (in seconds) to wait for the subscription to be acknowledged.
+            If not provided, waits indefinitely.
+
+        :raises: asyncio.TimeoutError if the subscription is not acknowledged within the timeout
+        """
         logger.debug("Enabling receive of twin responses...")
         topic = mqtt_topic.get_twin_response_topic_for_subscribe()
-        await self._mqtt_client.subscribe(topic)
+        if timeout is None:
+            await self._subscribe(topic)
+        else:
+            await asyncio.wait_for(self._subscribe(topic), timeout)
         self._twin_responses_enabled = True
         logger.debug("Twin responses receive enabled")
 
@@ -134,6 +264,8 @@ class IoTHubMQTTClient:
         twin_responses = self._mqtt_client.get_incoming_message_generator(twin_response_topic)
 
         async for mqtt_message in twin_responses:
+            if isinstance(mqtt_message, mqtt.IncomingMessageInterrupt):
+                continue
             try:
                 request_id = mqtt_topic.extract_request_id_from_twin_response_topic(
                     mqtt_message.topic
@@ -154,7 +286,8 @@ class IoTHubMQTTClient:
                     "Unexpected error ({}) while translating Twin response. Dropping.".format(e)
                 )
                 # NOTE: In this situation the operation waiting for the response that we failed to
-                # receive will hang. This isn't the end of the world, since it can be cancelled,
+                # receive will hang until its request expires in the ledger (if it was created
+                # with a timeout). This isn't the end of the world, since it can also be cancelled,
                 # but if we really wanted to smooth this out, we could cancel the pending operation
                 # based on the request id (assuming getting the request id is not what failed).
                 # But for now, that's probably overkill, especially since this path ideally should
@@ -197,6 +330,10 @@ class IoTHubMQTTClient:
             self._process_twin_responses_bg_task = asyncio.create_task(
                 self._process_twin_responses()
             )
+        if self._sastoken_provider and not self._keep_credentials_fresh_bg_task:
+            self._keep_credentials_fresh_bg_task = asyncio.create_task(
+                self._keep_credentials_fresh()
+            )
 
     async def stop(self) -> None:
         """Stop the client.
@@ -215,6 +352,12 @@ class IoTHubMQTTClient:
             cancelled_tasks.append(self._process_twin_responses_bg_task)
             self._process_twin_responses_bg_task = None
 
+        if self._keep_credentials_fresh_bg_task:
+            logger.debug("Cancelling 'keep_credentials_fresh' background task")
+            self._keep_credentials_fresh_bg_task.cancel()
+            cancelled_tasks.append(self._keep_credentials_fresh_bg_task)
+            self._keep_credentials_fresh_bg_task = None
+
         results = await asyncio.gather(
             *cancelled_tasks, asyncio.shield(self.disconnect()), return_exceptions=True
         )
@@ -251,15 +394,25 @@ class IoTHubMQTTClient:
             await self._mqtt_client.disconnected_cond.wait_for(lambda: not self.connected)
             return self._mqtt_client.previous_disconnection_cause()
 
-    async def send_message(self, message: models.Message) -> None:
+    async def send_message(self, message: models.Message, timeout: Optional[float] = None) -> None:
         """Send a telemetry message to IoTHub.
 
         :param message: The Message to be sent
         :type message: :class:`models.Message`
+        :param float timeout: Time (in seconds) to wait for the Message to be acknowledged. If not
+            provided, waits indefinitely.
 
         :raises: MQTTError if there is an error sending the Message
         :raises: ValueError if the size of the Message payload is too large
+        :raises: asyncio.TimeoutError if the Message is not acknowledged within the timeout
         """
+        custom_properties = message.custom_properties
+        span = tracing.current_span()
+        if span:
+            span.set_attribute(tracing.ATTRIBUTE_TOPIC_CLASS, tracing.TOPIC_CLASS_TELEMETRY)
+            # Propagate the trace context to the receivers of the Message (without modifying it)
+            custom_properties = dict(custom_properties)
+            span.inject(custom_properties)
         # Format topic with message properties
         telemetry_topic = mqtt_topic.get_telemetry_topic_for_publish(
             self._device_id, self._module_id
@@ -267,7 +420,7 @@ class IoTHubMQTTClient:
         topic = mqtt_topic.insert_message_properties_in_topic(
             topic=telemetry_topic,
             system_properties=message.get_system_properties_dict(),
-            custom_properties=message.custom_properties,
+            custom_properties=custom_properties,
         )
         # Format payload based on content configuration
         if message.content_type == "application/json":
@@ -277,56 +430,85 @@ class IoTHubMQTTClient:
         byte_payload = str_payload.encode(message.content_encoding)
         # Send
         logger.debug("Sending telemetry message to IoTHub...")
-        await self._mqtt_client.publish(topic, byte_payload)
+        self.message_count += 1
+        try:
+            await self._mqtt_client.publish(topic, byte_payload, timeout=timeout)
+        except (Exception, asyncio.CancelledError):
+            self.message_failure_count += 1
+            raise
+        self.message_ack_count += 1
         logger.debug("Sending telemetry message succeeded")
 
     async def send_direct_method_response(
-        self, method_response: models.DirectMethodResponse
+        self, method_response: models.DirectMethodResponse, timeout: Optional[float] = None
     ) -> None:
         """Send a direct method response to IoTHub.
 
         :param method_response: The DirectMethodResponse to be sent
         :type method_response: :class:`models.DirectMethodResponse`
+        :param float timeout: Time (in seconds) to wait for the DirectMethodResponse to be
+            acknowledged. If not provided, waits indefinitely.
 
         :raises: MQTTError if there is an error sending the DirectMethodResponse
         :raises: ValueError if the size of the DirectMethodResponse payload is too large
+        :raises: asyncio.TimeoutError if the DirectMethodResponse is not acknowledged within the
+            timeout
         """
         topic = mqtt_topic.get_direct_method_response_topic_for_publish(
             method_response.request_id, method_response.status
         )
         payload = json.dumps(method_response.payload)
+        span = tracing.current_span()
+        if span:
+            span.set_attribute(
+                tracing.ATTRIBUTE_TOPIC_CLASS, tracing.TOPIC_CLASS_DIRECT_METHOD_RESPONSE
+            )
+            span.set_attribute(tracing.ATTRIBUTE_REQUEST_ID, method_response.request_id)
         logger.debug(
             "Sending direct method response to IoTHub... (rid: {})".format(
                 method_response.request_id
             )
         )
-        await self._mqtt_client.publish(topic, payload)
+        await self._mqtt_client.publish(topic, payload, timeout=timeout)
         logger.debug(
             "Sending direct method response succeeded (rid: {})".format(method_response.request_id)
         )
+        receive_time = self._direct_method_receive_times.pop(method_response.request_id, None)
+        if receive_time is not None:
+            self._record_round_trip_time("direct_method", receive_time)
 
-    async def send_twin_patch(self, patch: TwinPatch) -> None:
+    async def send_twin_patch(self, patch: TwinPatch, timeout: Optional[float] = None) -> None:
         """Send a twin patch to IoTHub
 
         :param patch: The JSON patch to send
         :type patch: dict, list, tuple, str, int, float, bool, None
+        :param float timeout: Time (in seconds) to wait for IoTHub to respond to the twin patch.
+            If not provided, waits indefinitely.
 
         :raises: IoTHubError if an error response is received from IoT Hub
         :raises: MQTTError if there is an error sending the twin patch
         :raises: ValueError if the size of the the twin patch is too large
         :raises: CancelledError if enabling twin responses is cancelled by network failure
+        :raises: asyncio.TimeoutError if no response is received within the timeout
         """
+        deadline = _get_deadline(timeout)
         if not self._twin_responses_enabled:
-            await self._enable_twin_responses()
+            await self._enable_twin_responses(timeout=_get_remaining(deadline))
 
-        request = await self._request_ledger.create_request()
+        request = await self._request_ledger.create_request(timeout=_get_remaining(deadline))
         try:
             topic = mqtt_topic.get_twin_patch_topic_for_publish(request.request_id)
+            span = tracing.current_span()
+            if span:
+                span.set_attribute(tracing.ATTRIBUTE_TOPIC_CLASS, tracing.TOPIC_CLASS_TWIN_PATCH)
+            start = time.monotonic()
 
             # Send the patch to IoTHub
             try:
                 logger.debug("Sending twin patch to IoTHub... (rid: {})".format(request.request_id))
-                await self._mqtt_client.publish(topic, json.dumps(patch))
+                await self._mqtt_client.publish(
+                    topic, json.dumps(patch), timeout=_get_remaining(deadline)
+                )
             except asyncio.CancelledError:
                 logger.warning(
                     "Attempt to send twin patch to IoTHub was cancelled while in flight. It may or may not have been received (rid: {})".format(
@@ -355,8 +537,16 @@ class IoTHubMQTTClient:
                     )
                 )
                 raise
+            except asyncio.TimeoutError:
+                logger.debug(
+                    "Timed out waiting for response to the twin patch. If the response arrives, it will be discarded (rid: {})".format(
+                        request.request_id
+                    )
+                )
+                raise
 
             # Interpret response
+            self._record_round_trip_time("twin_patch", start)
             logger.debug(
                 "Received twin patch response with status {} (rid: {})".format(
                     response.status, request.request_id
@@ -375,29 +565,38 @@ class IoTHubMQTTClient:
             if request.request_id in self._request_ledger:
                 await self._request_ledger.delete_request(request.request_id)
 
-    async def get_twin(self) -> Twin:
+    async def get_twin(self, timeout: Optional[float] = None) -> Twin:
         """Request a full twin from IoTHub
 
+        :param float timeout: Time (in seconds) to wait for IoTHub to respond with the twin.
+            If not provided, waits indefinitely.
+
         :returns: The full twin as a JSON object
         :rtype: dict
 
         :raises: IoTHubError if an error response is received from IoT Hub
         :raises: MQTTError if there is an error sending the twin request
         :raises: CancelledError if enabling twin responses is cancelled by network failure
+        :raises: asyncio.TimeoutError if no response is received within the timeout
         """
+        deadline = _get_deadline(timeout)
         if not self._twin_responses_enabled:
-            await self._enable_twin_responses()
+            await self._enable_twin_responses(timeout=_get_remaining(deadline))
 
-        request = await self._request_ledger.create_request()
+        request = await self._request_ledger.create_request(timeout=_get_remaining(deadline))
         try:
             topic = mqtt_topic.get_twin_request_topic_for_publish(request_id=request.request_id)
+            span = tracing.current_span()
+            if span:
+                span.set_attribute(tracing.ATTRIBUTE_TOPIC_CLASS, tracing.TOPIC_CLASS_TWIN_REQUEST)
+            start = time.monotonic()
 
             # Send the twin request to IoTHub
             try:
                 logger.debug(
                     "Sending get twin request to IoTHub... (rid: {})".format(request.request_id)
                 )
-                await self._mqtt_client.publish(topic, " ")
+                await self._mqtt_client.publish(topic, " ", timeout=_get_remaining(deadline))
             except asyncio.CancelledError:
                 logger.warning(
                     "Attempt to send get twin request to IoTHub was cancelled while in flight. It may or may not have been received (rid: {})".format(
@@ -424,6 +623,13 @@ class IoTHubMQTTClient:
                     )
                 )
                 raise
+            except asyncio.TimeoutError:
+                logger.debug(
+                    "Timed out waiting for twin from IoTHub. If the response arrives, it will be discarded (rid: {})".format(
+                        request.request_id
+                    )
+                )
+                raise
         finally:
             # If an exception caused exit before a pending request could be matched with a response
             # then manually delete to prevent leaks.
@@ -431,6 +637,7 @@ class IoTHubMQTTClient:
                 await self._request_ledger.delete_request(request.request_id)
 
         # Interpret response
+        self._record_round_trip_time("twin_get", start)
         if response.status >= 300:
             raise IoTHubError(
                 "IoTHub responded to get twin request with a failed status - {}".format(
@@ -453,7 +660,7 @@ class IoTHubMQTTClient:
             raise IoTHubClientError("C2D messages not available on Modules")
         logger.debug("Enabling receive for C2D messages...")
         topic = mqtt_topic.get_c2d_topic_for_subscribe(self._device_id)
-        await self._mqtt_client.subscribe(topic)
+        await self._subscribe(topic)
         logger.debug("C2D message receive enabled")
 
     async def disable_c2d_message_receive(self) -> None:
@@ -467,7 +674,7 @@ class IoTHubMQTTClient:
             raise IoTHubClientError("C2D messages not available on Modules")
         logger.debug("Disabling receive for C2D messages...")
         topic = mqtt_topic.get_c2d_topic_for_subscribe(self._device_id)
-        await self._mqtt_client.unsubscribe(topic)
+        await self._unsubscribe(topic)
         logger.debug("C2D message receive disabled")
 
     async def enable_input_message_receive(self) -> None:
@@ -481,7 +688,7 @@ class IoTHubMQTTClient:
             raise IoTHubClientError("Input messages not available on Devices")
         logger.debug("Enabling receive for input messages...")
         topic = mqtt_topic.get_input_topic_for_subscribe(self._device_id, self._module_id)
-        await self._mqtt_client.subscribe(topic)
+        await self._subscribe(topic)
         logger.debug("Input message receive enabled")
 
     async def disable_input_message_receive(self) -> None:
@@ -495,7 +702,7 @@ class IoTHubMQTTClient:
             raise IoTHubClientError("Input messages not available on Devices")
         logger.debug("Disabling receive for input messages...")
         topic = mqtt_topic.get_input_topic_for_subscribe(self._device_id, self._module_id)
-        await self._mqtt_client.unsubscribe(topic)
+        await self._unsubscribe(topic)
         logger.debug("Input message receive disabled")
 
     async def enable_direct_method_request_receive(self) -> None:
@@ -507,7 +714,7 @@ class IoTHubMQTTClient:
         """
         logger.debug("Enabling receive for direct method requests...")
         topic = mqtt_topic.get_direct_method_request_topic_for_subscribe()
-        await self._mqtt_client.subscribe(topic)
+        await self._subscribe(topic)
         logger.debug("Direct method request receive enabled")
 
     async def disable_direct_method_request_receive(self) -> None:
@@ -519,7 +726,7 @@ class IoTHubMQTTClient:
         """
         logger.debug("Disabling receive for direct method requests...")
         topic = mqtt_topic.get_direct_method_request_topic_for_subscribe()
-        await self._mqtt_client.unsubscribe(topic)
+        await self._unsubscribe(topic)
         logger.debug("Direct method request receive disabled")
 
     async def enable_twin_patch_receive(self) -> None:
@@ -530,7 +737,7 @@ class IoTHubMQTTClient:
         """
         logger.debug("Enabling receive for twin patches...")
         topic = mqtt_topic.get_twin_patch_topic_for_subscribe()
-        await self._mqtt_client.subscribe(topic)
+        await self._subscribe(topic)
         logger.debug("Twin patch receive enabled")
 
     async def disable_twin_patch_receive(self) -> None:
@@ -541,11 +748,21 @@ class IoTHubMQTTClient:
         """
         logger.debug("Disabling receive for twin patches...")
         topic = mqtt_topic.get_twin_patch_topic_for_subscribe()
-        await self._mqtt_client.unsubscribe(topic)
+        await self._unsubscribe(topic)
         logger.debug("Twin patch receive disabled")
 
+    def interrupt_incoming_data(self) -> None:
+        """Cause each generator of incoming data (C2D/input Messages, DirectMethodRequests and
+        TwinPatches) to yield INCOMING_MESSAGE_INTERRUPT once all data already received has been
+        yielded, waking up anything waiting on it.
+
+        Must be invoked from the event loop.
+        """
+        for topic in self._external_data_topics:
+            self._mqtt_client.interrupt_incoming_message_generator(topic)
+
     @property
-    def incoming_c2d_messages(self) -> AsyncGenerator[models.Message, None]:
+    def incoming_c2d_messages(self) -> AsyncGenerator[Incoming[models.Message], None]:
         """Generator that yields incoming C2D Messages"""
         if not self._incoming_c2d_messages:
             raise IoTHubClientError("C2D Messages not available for Module")
@@ -553,7 +770,7 @@ class IoTHubMQTTClient:
             return self._incoming_c2d_messages
 
     @property
-    def incoming_input_messages(self) -> AsyncGenerator[models.Message, None]:
+    def incoming_input_messages(self) -> AsyncGenerator[Incoming[models.Message], None]:
         """Generator that yields incoming input Messages"""
         if not self._incoming_input_messages:
             raise IoTHubClientError("Input Messages not available for Device")
@@ -563,19 +780,47 @@ class IoTHubMQTTClient:
     @property
     def incoming_direct_method_requests(
         self,
-    ) -> AsyncGenerator[models.DirectMethodRequest, None]:
+    ) -> AsyncGenerator[Incoming[models.DirectMethodRequest], None]:
         """Generator that yields incoming DirectMethodRequests"""
         return self._incoming_direct_method_requests
 
     @property
-    def incoming_twin_patches(self) -> AsyncGenerator[TwinPatch, None]:
+    def incoming_twin_patches(self) -> AsyncGenerator[Incoming[TwinPatch], None]:
         """Generator that yields incoming TwinPatches"""
         return self._incoming_twin_patches
 
     @property
     def connected(self) -> bool:
-        """Boolean indicating connection status"""
-        return self._mqtt_client.is_connected()
+        """Boolean indicating connection status (which remains True while reconnecting with new
+        credentials)"""
+        return self._mqtt_client.is_connected() or self._mqtt_client.is_reconnecting()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of the client metrics (including those of the underlying MQTTClient)"""
+        stats = self._mqtt_client.stats
+        stats["messages_sent"] = self.message_count
+        stats["messages_acked"] = self.message_ack_count
+        stats["messages_failed"] = self.message_failure_count
+        stats["pending_requests"] = len(self._request_ledger)
+        for topic, (received_name, queue_depth_name) in self._receive_metric_names.items():
+            stats[received_name] = self._receive_counts[topic]
+            stats[queue_depth_name] = self._mqtt_client.incoming_message_queue_depth(topic)
+        return stats
+
+
+def _get_deadline(timeout: Optional[float]) -> Optional[float]:
+    """Convert a timeout into a deadline on the running event loop's clock"""
+    if timeout is None:
+        return None
+    return asyncio.get_running_loop().time() + timeout
+
+
+def _get_remaining(deadline: Optional[float]) -> Optional[float]:
+    """Return the time remaining until a deadline (None if there is no deadline)"""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - asyncio.get_running_loop().time())
 
 
 def _format_client_id(device_id: str, module_id: Optional[str] = None) -> str:
@@ -620,6 +865,8 @@ def _create_mqtt_client(
         ssl_context=client_config.ssl_context,
         websockets_path=websockets_path,
         proxy_options=client_config.proxy_options,
+        network_loop=client_config.network_loop,
+        executor=client_config.executor,
     )
 
     return client
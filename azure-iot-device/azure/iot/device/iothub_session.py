@@ -5,8 +5,21 @@
 # --------------------------------------------------------------------------
 import asyncio
 import contextlib
+import logging
 import ssl
-from typing import Optional, Union, AsyncGenerator, Type, TypeVar, Awaitable
+from typing import (
+    Optional,
+    Union,
+    AsyncGenerator,
+    Type,
+    TypeVar,
+    Awaitable,
+    NoReturn,
+    Set,
+    Any,
+    Dict,
+    TYPE_CHECKING,
+)
 from types import TracebackType
 
 from . import signing_mechanism as sm
@@ -14,6 +27,13 @@ from . import connection_string as cs
 from . import sastoken as st
 from . import config, models, custom_typing
 from . import iothub_mqtt_client as mqtt
+from . import metrics, tracing
+from . import twin
+
+if TYPE_CHECKING:
+    from .session_host import SessionHost
+
+logger = logging.getLogger(__name__)
 
 _T = TypeVar("_T")
 
@@ -31,6 +51,13 @@ class IoTHubSession:
         shared_access_key: Optional[str] = None,
         sastoken_fn: Optional[custom_typing.FunctionOrCoroutine] = None,
         sastoken_ttl: int = 3600,
+        sastoken_cache_dir: Optional[str] = None,
+        twin_cache: bool = False,
+        reported_properties_linger: Optional[float] = None,
+        reported_properties_batch_size: int = twin.DEFAULT_COALESCE_MAX_SIZE,
+        host: Optional["SessionHost"] = None,
+        metrics_provider: Optional[metrics.MetricsProvider] = None,
+        tracer: Optional[tracing.Tracer] = None,
         **kwargs,
     ) -> None:
         """
@@ -46,8 +73,35 @@ class IoTHubSession:
             a SAS token string when invoked
         :param sastoken_ttl: Time-to-live (in seconds) for SAS tokens generated when using
             'shared_access_key' authentication.
-            If using this auth type, a new Session will need to be created once this time expires.
+            A new SAS token is generated shortly before this time expires, and the Session
+            reconnects with it without interrupting any operations.
             Default is 3600 seconds (1 hour).
+        :param str sastoken_cache_dir: Directory to cache the current SAS token in, when using
+            'shared_access_key' or 'sastoken_fn' authentication. A cached SAS token that remains
+            valid is used upon connecting (e.g. after a restart of the process), rather than
+            generating a new one. The token is stored in a file accessible only by the current
+            user. If not provided, SAS tokens are not cached.
+        :param bool twin_cache: Set to 'True' to maintain a local copy of the Twin for the
+            duration of the Session. The Twin is retrieved once upon connection and kept up to
+            date with desired property patches, and '.get_twin()' is served from the local copy.
+            Default is 'False'
+        :param float reported_properties_linger: Time (in seconds) to wait for further reported
+            property updates after an update is requested. All updates requested within this time
+            are merged and sent to IoT Hub as a single patch. If not provided, each update is
+            sent individually.
+        :param int reported_properties_batch_size: Approximate size (in bytes) at which merged
+            reported property updates are sent immediately, without waiting for the
+            'reported_properties_linger' time to expire. Default is 8192 bytes.
+        :param host: A SessionHost whose resources (network I/O thread, executor, default
+            SSLContext and SAS Token update scheduling) will be used, rather than resources
+            dedicated to this Session. Prefer `SessionHost.create_session()` to providing this.
+        :type host: :class:`SessionHost`
+        :param metrics_provider: A MetricsProvider to export the metrics of the Session (see
+            `.get_metrics()`) to while it is connected. If not provided, metrics are not exported.
+        :type metrics_provider: :class:`azure.iot.device.metrics.MetricsProvider`
+        :param tracer: A Tracer to create a span for each operation (e.g. sending a Message) with.
+            If not provided, operations are not traced.
+        :type tracer: :class:`azure.iot.device.tracing.Tracer`
 
         :keyword int keep_alive: Maximum period in seconds between MQTT communications. If no
             communications are exchanged for this period, a ping exchange will occur.
@@ -59,6 +113,8 @@ class IoTHubSession:
         :keyword bool websockets: Set to 'True' to use WebSockets over MQTT. Default is 'False'
 
         :raises: ValueError if an invalid combination of parameters are provided
+        :raises: ValueError if an invalid 'reported_properties_linger' or
+            'reported_properties_batch_size' is provided
         :raises: ValueError if an invalid 'symmetric_key' is provided
         :raises: TypeError if an invalid keyword argument is provided
         """
@@ -75,24 +131,31 @@ class IoTHubSession:
 
         # Set up SAS auth (if using)
         generator: Optional[st.SasTokenGenerator]
+        refresh_scheduler = host.refresh_scheduler if host else None
         # NOTE: Need to keep a reference to the SasTokenProvider so we can stop it during cleanup
         self._sastoken_provider: Optional[st.SasTokenProvider]
+        uri = _format_sas_uri(hostname=hostname, device_id=device_id, module_id=module_id)
+        cache: Optional[st.SasTokenCache] = None
         if shared_access_key:
-            uri = _format_sas_uri(hostname=hostname, device_id=device_id, module_id=module_id)
             signing_mechanism = sm.SymmetricKeySigningMechanism(shared_access_key)
             generator = st.InternalSasTokenGenerator(
                 signing_mechanism=signing_mechanism, uri=uri, ttl=sastoken_ttl
             )
-            self._sastoken_provider = st.SasTokenProvider(generator)
+            if sastoken_cache_dir:
+                # NOTE: A SAS token generated with a previous key is not valid with a new one
+                cache = st.SasTokenCache(sastoken_cache_dir, uri, identity=shared_access_key)
+            self._sastoken_provider = st.SasTokenProvider(generator, refresh_scheduler, cache)
         elif sastoken_fn:
             generator = st.ExternalSasTokenGenerator(sastoken_fn)
-            self._sastoken_provider = st.SasTokenProvider(generator)
+            if sastoken_cache_dir:
+                cache = st.SasTokenCache(sastoken_cache_dir, uri)
+            self._sastoken_provider = st.SasTokenProvider(generator, refresh_scheduler, cache)
         else:
             self._sastoken_provider = None
 
         # Create a default SSLContext if not provided
         if not ssl_context:
-            ssl_context = _default_ssl_context()
+            ssl_context = host.default_ssl_context() if host else _default_ssl_context()
 
         # Instantiate the MQTTClient
         client_config = config.IoTHubClientConfig(
@@ -102,9 +165,41 @@ class IoTHubSession:
             sastoken_provider=self._sastoken_provider,
             ssl_context=ssl_context,
             auto_reconnect=False,  # We do not reconnect in a Session
+            network_loop=host.network_loop if host else None,
+            executor=host.executor if host else None,
+            metrics_provider=metrics_provider,
             **kwargs,
         )
         self._mqtt_client = mqtt.IoTHubMQTTClient(client_config)
+        self._metrics_provider = metrics_provider
+        self._metrics_attributes = {"device_id": device_id}
+        if module_id:
+            self._metrics_attributes["module_id"] = module_id
+        self._tracer = tracer
+        self._tracing_attributes: tracing.Attributes = {tracing.ATTRIBUTE_DEVICE_ID: device_id}
+        if module_id:
+            self._tracing_attributes[tracing.ATTRIBUTE_MODULE_ID] = module_id
+
+        # Set up the Twin cache (if using)
+        # NOTE: When using the Twin cache, incoming desired property patches are consumed by the
+        # background task that applies them to the cache. Once applied, they are forwarded to the
+        # queue for the `.desired_property_updates()` generator (if it is in use).
+        self._twin_cache: Optional[twin.TwinCache] = None
+        if twin_cache:
+            self._twin_cache = twin.TwinCache(self._mqtt_client.get_twin)
+        self._twin_cache_bg_task: Optional[asyncio.Task[None]] = None
+        self._twin_cache_patches: Optional[
+            asyncio.Queue[Union[custom_typing.TwinPatch, mqtt.IncomingMessageInterrupt]]
+        ] = None
+
+        # Set up reported property coalescing (if using)
+        self._reported_properties_coalescer: Optional[twin.ReportedPropertiesCoalescer] = None
+        if reported_properties_linger is not None:
+            self._reported_properties_coalescer = twin.ReportedPropertiesCoalescer(
+                send_patch_fn=self._mqtt_client.send_twin_patch,
+                linger=reported_properties_linger,
+                max_size=reported_properties_batch_size,
+            )
 
         # This task is used to propagate dropped connections through receiver generators
         # It will be set upon context manager entry and cleared upon exit
@@ -113,6 +208,12 @@ class IoTHubSession:
         # up here so we can be more implementation-generic down the stack.
         self._wait_for_disconnect_task: Optional[asyncio.Task[Optional[mqtt.MQTTError]]] = None
 
+        # Tasks currently awaiting an operation (e.g. sending a Message), which will be cancelled
+        # in the event of disconnect, and the subset of them that have been cancelled for that
+        # reason, and have not yet handled it.
+        self._pending_operations: Set[asyncio.Task[Any]] = set()
+        self._interrupted_operations: Set[asyncio.Task[Any]] = set()
+
     async def __aenter__(self) -> "IoTHubSession":
         # First, if using SAS auth, start up the provider
         if self._sastoken_provider:
@@ -122,8 +223,17 @@ class IoTHubSession:
 
         # Start/connect
         try:
+            if self._metrics_provider:
+                self._metrics_provider.add_source(self._metrics_attributes, self.get_metrics)
             await self._mqtt_client.start()
             await self._mqtt_client.connect()
+            # If using the Twin cache, populate it before returning so that it is ready for use.
+            # Patch receive is enabled first so that no patch newer than the retrieved Twin
+            # can be missed.
+            if self._twin_cache:
+                await self._mqtt_client.enable_twin_patch_receive()
+                await self._twin_cache.refresh()
+                self._twin_cache_bg_task = asyncio.create_task(self._keep_twin_cache_updated())
         except (Exception, asyncio.CancelledError):
             # Stop/cleanup if something goes wrong
             await self._stop_all()
@@ -132,6 +242,8 @@ class IoTHubSession:
         self._wait_for_disconnect_task = asyncio.create_task(
             self._mqtt_client.wait_for_disconnect()
         )
+        self._wait_for_disconnect_task.add_done_callback(self._interrupt_receivers)
+        self._wait_for_disconnect_task.add_done_callback(self._interrupt_pending_operations)
 
         return self
 
@@ -151,12 +263,53 @@ class IoTHubSession:
             await self._stop_all()
 
     async def _stop_all(self) -> None:
+        if self._twin_cache_bg_task:
+            self._twin_cache_bg_task.cancel()
+            await asyncio.gather(self._twin_cache_bg_task, return_exceptions=True)
+            self._twin_cache_bg_task = None
+        if self._reported_properties_coalescer:
+            await self._reported_properties_coalescer.stop()
         try:
             await self._mqtt_client.stop()
         finally:
+            if self._metrics_provider:
+                self._metrics_provider.remove_source(self.get_metrics)
             if self._sastoken_provider:
                 await self._sastoken_provider.stop()
 
+    def _interrupt_receivers(self, _: "asyncio.Future[Optional[mqtt.MQTTError]]") -> None:
+        """Wake up anything waiting on the incoming data generators, so that they can raise the
+        error corresponding to the disconnect (or exit)"""
+        self._mqtt_client.interrupt_incoming_data()
+        if self._twin_cache_patches is not None:
+            self._twin_cache_patches.put_nowait(mqtt.INCOMING_MESSAGE_INTERRUPT)
+
+    def _interrupt_pending_operations(self, _: "asyncio.Future[Optional[mqtt.MQTTError]]") -> None:
+        """Cancel every Task awaiting an operation, so that they can raise the error corresponding
+        to the disconnect (or exit)"""
+        for task in self._pending_operations:
+            task.cancel()
+        self._interrupted_operations.update(self._pending_operations)
+        self._pending_operations.clear()
+
+    async def _keep_twin_cache_updated(self) -> None:
+        """Run indefinitely, applying incoming desired property patches to the Twin cache"""
+        # NOTE: This is only ever run when a Twin cache is in use. The assert helps the type checker.
+        assert self._twin_cache is not None
+        async for patch in self._mqtt_client.incoming_twin_patches:
+            if isinstance(patch, mqtt.IncomingMessageInterrupt):
+                continue
+            try:
+                await self._twin_cache.apply_desired_patch(patch)
+            except asyncio.CancelledError:
+                # NOTE: In Python 3.7 this isn't a BaseException, so we must catch and re-raise
+                raise
+            except Exception as e:
+                # TODO: background exception logging improvements (e.g. stacktrace)
+                logger.error("Failure applying desired property patch to Twin cache: {}".format(e))
+            if self._twin_cache_patches is not None:
+                self._twin_cache_patches.put_nowait(patch)
+
     @classmethod
     def from_connection_string(
         cls,
@@ -175,9 +328,28 @@ class IoTHubSession:
             If not provided, a default one will be used
         :type ssl_context: :class:`ssl.SSLContext`
         :param sastoken_ttl: Time-to-live (in seconds) for SAS tokens used for authentication.
-            A new Session will need to be created once this time expires.
+            A new SAS token is generated shortly before this time expires, and the Session
+            reconnects with it without interrupting any operations.
             Default is 3600 seconds (1 hour).
 
+        :keyword str sastoken_cache_dir: Directory to cache the current SAS token in, so that it
+            can be reused after a restart of the process. If not provided, SAS tokens are not
+            cached.
+        :keyword bool twin_cache: Set to 'True' to maintain a local copy of the Twin for the
+            duration of the Session. Default is 'False'
+        :keyword float reported_properties_linger: Time (in seconds) to wait for further reported
+            property updates to merge into a single patch. If not provided, each update is sent
+            individually.
+        :keyword int reported_properties_batch_size: Approximate size (in bytes) at which merged
+            reported property updates are sent immediately. Default is 8192 bytes.
+        :keyword host: A SessionHost whose resources will be used, rather than resources
+            dedicated to this Session.
+        :type host: :class:`SessionHost`
+        :keyword metrics_provider: A MetricsProvider to export the metrics of the Session to.
+        :type metrics_provider: :class:`azure.iot.device.metrics.MetricsProvider`
+        :keyword tracer: A Tracer to create a span for each operation with.
+        :type tracer: :class:`azure.iot.device.tracing.Tracer`
+
         :keyword int keep_alive: Maximum period in seconds between MQTT communications. If no
             communications are exchanged for this period, a ping exchange will occur.
             Default is 60 seconds
@@ -209,72 +381,114 @@ class IoTHubSession:
             **kwargs,
         )
 
-    async def send_message(self, message: Union[str, models.Message]) -> None:
+    async def send_message(
+        self, message: Union[str, models.Message], timeout: Optional[float] = None
+    ) -> None:
         """Send a telemetry message to IoT Hub
 
         :param message: Message to send. If not a Message object, will be used as the payload of
             a new Message object.
         :type message: str or :class:`Message`
+        :param float timeout: Time (in seconds) to wait for IoT Hub to acknowledge the Message.
+            If not provided, waits indefinitely.
 
         :raises: MQTTError if there is an error sending the Message
         :raises: ValueError if the size of the Message payload is too large
         :raises: RuntimeError if not connected when invoked
+        :raises: asyncio.TimeoutError if the Message is not acknowledged within the timeout
         """
         if not self._mqtt_client.connected:
             # See NOTE 1 at the bottom of this file for why this occurs
             raise mqtt.MQTTError(rc=4)
         if not isinstance(message, models.Message):
             message = models.Message(message)
-        await self._add_disconnect_interrupt_to_coroutine(self._mqtt_client.send_message(message))
+        coro = self._mqtt_client.send_message(message, timeout=timeout)
+        if self._tracer:
+            coro = self._add_span_to_coroutine(coro, "IoTHubSession.send_message")
+        await self._add_disconnect_interrupt_to_coroutine(coro)
 
     async def send_direct_method_response(
-        self, method_response: models.DirectMethodResponse
+        self, method_response: models.DirectMethodResponse, timeout: Optional[float] = None
     ) -> None:
         """Send a response to a direct method request
 
         :param method_response: The response object containing information regarding the result of
             the direct method invocation
         :type method_response: :class:`DirectMethodResponse`
+        :param float timeout: Time (in seconds) to wait for IoT Hub to acknowledge the
+            DirectMethodResponse. If not provided, waits indefinitely.
 
         :raises: MQTTError if there is an error sending the DirectMethodResponse
         :raises: ValueError if the size of the DirectMethodResponse payload is too large
+        :raises: asyncio.TimeoutError if the DirectMethodResponse is not acknowledged within the
+            timeout
         """
         if not self._mqtt_client.connected:
             # See NOTE 1 at the bottom of this file for why this occurs
             raise mqtt.MQTTError(rc=4)
-        await self._add_disconnect_interrupt_to_coroutine(
-            self._mqtt_client.send_direct_method_response(method_response)
-        )
+        coro = self._mqtt_client.send_direct_method_response(method_response, timeout=timeout)
+        if self._tracer:
+            coro = self._add_span_to_coroutine(coro, "IoTHubSession.send_direct_method_response")
+        await self._add_disconnect_interrupt_to_coroutine(coro)
 
-    async def update_reported_properties(self, patch: custom_typing.TwinPatch) -> None:
+    async def update_reported_properties(
+        self, patch: custom_typing.TwinPatch, timeout: Optional[float] = None
+    ) -> None:
         """Update the reported properties of the Twin
 
+        If reported property coalescing is in use, the update will be merged with any other
+        updates requested within the linger time, and this method returns once the merged patch
+        has been accepted by IoT Hub.
+
         :param dict patch: JSON object containing the updates to the Twin reported properties
+        :param float timeout: Time (in seconds) to wait for IoT Hub to accept the update. If not
+            provided, waits indefinitely.
 
         :raises: IoTHubError if an error response is received from IoT Hub
         :raises: MQTTError if there is an error sending the updated reported properties
         :raises: ValueError if the size of the the reported properties patch too large
         :raises: CancelledError if enabling responses from IoT Hub is cancelled by network failure
+        :raises: asyncio.TimeoutError if IoT Hub does not accept the update within the timeout
         """
         if not self._mqtt_client.connected:
             # See NOTE 1 at the bottom of this file for why this occurs
             raise mqtt.MQTTError(rc=4)
-        await self._add_disconnect_interrupt_to_coroutine(self._mqtt_client.send_twin_patch(patch))
-
-    async def get_twin(self) -> custom_typing.Twin:
+        if self._reported_properties_coalescer:
+            coro = self._reported_properties_coalescer.send_patch(patch, timeout=timeout)
+        else:
+            coro = self._mqtt_client.send_twin_patch(patch, timeout=timeout)
+        if self._tracer:
+            coro = self._add_span_to_coroutine(coro, "IoTHubSession.update_reported_properties")
+        await self._add_disconnect_interrupt_to_coroutine(coro)
+        if self._twin_cache:
+            self._twin_cache.apply_reported_patch(patch)
+
+    async def get_twin(self, timeout: Optional[float] = None) -> custom_typing.Twin:
         """Retrieve the full Twin data
 
+        If the Twin cache is in use, the Twin is returned from the cache instead of being
+        requested from IoT Hub.
+
+        :param float timeout: Time (in seconds) to wait for IoT Hub to respond with the Twin.
+            If not provided, waits indefinitely.
+
         :returns: Twin as a JSON object
         :rtype: dict
 
         :raises: IoTHubError if a error response is received from IoTHub
         :raises: MQTTError if there is an error sending the request
         :raises: CancelledError if enabling responses from IoT Hub is cancelled by network failure
+        :raises: asyncio.TimeoutError if no Twin is received within the timeout
         """
         if not self._mqtt_client.connected:
             # See NOTE 1 at the bottom of this file for why this occurs
             raise mqtt.MQTTError(rc=4)
-        return await self._add_disconnect_interrupt_to_coroutine(self._mqtt_client.get_twin())
+        if self._twin_cache:
+            return self._twin_cache.get_twin()
+        coro = self._mqtt_client.get_twin(timeout=timeout)
+        if self._tracer:
+            coro = self._add_span_to_coroutine(coro, "IoTHubSession.get_twin")
+        return await self._add_disconnect_interrupt_to_coroutine(coro)
 
     @contextlib.asynccontextmanager
     async def messages(self) -> AsyncGenerator[AsyncGenerator[models.Message, None], None]:
@@ -317,6 +531,18 @@ class IoTHubSession:
         self,
     ) -> AsyncGenerator[AsyncGenerator[custom_typing.TwinPatch, None], None]:
         """Returns an async generator of incoming twin desired property patches"""
+        if self._twin_cache:
+            # Twin patch receive is already enabled for the Twin cache, which will forward
+            # patches once they have been applied to the cache.
+            self._twin_cache_patches = asyncio.Queue()
+            try:
+                yield self._add_disconnect_interrupt_to_generator(
+                    _queue_generator(self._twin_cache_patches)
+                )
+            finally:
+                self._twin_cache_patches = None
+            return
+
         await self._mqtt_client.enable_twin_patch_receive()
         try:
             yield self._add_disconnect_interrupt_to_generator(
@@ -332,55 +558,87 @@ class IoTHubSession:
                 pass
 
     def _add_disconnect_interrupt_to_generator(
-        self, generator: AsyncGenerator[_T, None]
+        self, generator: AsyncGenerator[Union[_T, mqtt.IncomingMessageInterrupt], None]
     ) -> AsyncGenerator[_T, None]:
         """Wrap a generator in another generator that will either return the next item yielded by
         the original generator, or raise error in the event of disconnect
+
+        NOTE: Upon disconnect, the original generator is woken up by an INCOMING_MESSAGE_INTERRUPT
+        (see `._interrupt_receivers()`), so receiving an item does not require any additional
+        Tasks. Interrupts left over from a previous connection are ignored.
         """
+        wait_for_disconnect_task = self._wait_for_disconnect_task
 
         async def wrapping_generator():
             while True:
-                new_item_t = asyncio.create_task(generator.__anext__())
-                done, _ = await asyncio.wait(
-                    [new_item_t, self._wait_for_disconnect_task],
-                    return_when=asyncio.FIRST_COMPLETED,
-                )
-                if self._wait_for_disconnect_task in done:
-                    new_item_t.cancel()
-                    cause = self._wait_for_disconnect_task.result()
-                    if cause is not None:
-                        raise cause
-                    else:
-                        # TODO: should this raise MQTTError(rc=4) instead?
-                        raise asyncio.CancelledError("Cancelled by disconnect")
-                else:
-                    yield new_item_t.result()
+                if not wait_for_disconnect_task:
+                    # See NOTE 1 at the bottom of this file
+                    raise mqtt.MQTTError(rc=4)
+                if wait_for_disconnect_task.done():
+                    _raise_disconnect_cause(wait_for_disconnect_task)
+                item = await generator.__anext__()
+                if not isinstance(item, mqtt.IncomingMessageInterrupt):
+                    yield item
 
         return wrapping_generator()
 
-    def _add_disconnect_interrupt_to_coroutine(self, coro: Awaitable[_T]) -> Awaitable[_T]:
-        """Wrap a coroutine in another coroutine that will either return the result of the original
-        coroutine, or raise error in the event of disconnect
-        """
+    async def _add_disconnect_interrupt_to_coroutine(self, coro: Awaitable[_T]) -> _T:
+        """Await a coroutine in the current Task, raising error in the event of disconnect
 
-        async def wrapping_coroutine():
-            original_task = asyncio.create_task(coro)
-            done, _ = await asyncio.wait(
-                [original_task, self._wait_for_disconnect_task],
-                return_when=asyncio.FIRST_COMPLETED,
-            )
-            if self._wait_for_disconnect_task in done:
-                original_task.cancel()
-                cause = self._wait_for_disconnect_task.result()
-                if cause is not None:
-                    raise cause
-                else:
-                    # TODO: should this raise MQTTError(rc=4) instead?
-                    raise asyncio.CancelledError("Cancelled by disconnect")
-            else:
-                return await original_task
-
-        return wrapping_coroutine()
+        NOTE: The current Task is tracked as a pending operation for the duration of the
+        coroutine. Upon disconnect, all pending operations are cancelled in a single pass
+        (see `._interrupt_pending_operations()`), so no additional Tasks are required.
+        """
+        wait_for_disconnect_task = self._wait_for_disconnect_task
+        if not wait_for_disconnect_task or wait_for_disconnect_task.done():
+            # Don't leave the coroutine un-awaited
+            if asyncio.iscoroutine(coro):
+                coro.close()
+            if not wait_for_disconnect_task:
+                # See NOTE 1 at the bottom of this file
+                raise mqtt.MQTTError(rc=4)
+            _raise_disconnect_cause(wait_for_disconnect_task)
+        # NOTE: Operations are always awaited from within a Task. The assert helps the type checker.
+        task = asyncio.current_task()
+        assert task is not None
+        self._pending_operations.add(task)
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            if task not in self._interrupted_operations:
+                raise
+        finally:
+            self._pending_operations.discard(task)
+            if task in self._interrupted_operations:
+                self._interrupted_operations.discard(task)
+                if hasattr(task, "uncancel"):
+                    # NOTE: Python 3.11+ tracks pending cancellation requests, which must be
+                    # undone since this cancellation has been handled
+                    task.uncancel()  # type: ignore
+        _raise_disconnect_cause(wait_for_disconnect_task)
+
+    async def _add_span_to_coroutine(self, coro: Awaitable[_T], name: str) -> _T:
+        """Await a coroutine within a new span, which is current for the duration of the coroutine
+        so that the layers below can annotate it"""
+        # NOTE: Only used when tracing. The assert helps the type checker.
+        assert self._tracer is not None
+        with tracing.use_span(self._tracer.start_span(name, self._tracing_attributes)):
+            return await coro
+
+    def get_metrics(self) -> Dict[str, int]:
+        """Return the current value of each metric of the Session.
+
+        Counters (e.g. 'messages_sent', 'bytes_received', 'token_refreshes') accumulate over the
+        lifetime of the Session, and gauges (e.g. 'pending_publishes', 'message_queue_depth')
+        are as of the time of invocation. See `azure.iot.device.metrics` for the full list.
+
+        :returns: A dictionary of metric names to values
+        :rtype: dict
+        """
+        session_metrics = self._mqtt_client.stats
+        if self._sastoken_provider:
+            session_metrics.update(self._sastoken_provider.stats)
+        return session_metrics
 
     @property
     def connected(self) -> bool:
@@ -395,6 +653,26 @@ class IoTHubSession:
         return self._mqtt_client._module_id
 
 
+async def _queue_generator(queue: "asyncio.Queue[_T]") -> AsyncGenerator[_T, None]:
+    """Return a generator that yields items from a queue"""
+    while True:
+        yield await queue.get()
+
+
+def _raise_disconnect_cause(
+    wait_for_disconnect_task: "asyncio.Task[Optional[mqtt.MQTTError]]",
+) -> NoReturn:
+    """Raise the error corresponding to a completed wait for disconnect"""
+    if wait_for_disconnect_task.cancelled():
+        raise asyncio.CancelledError("Cancelled by session exit")
+    cause = wait_for_disconnect_task.result()
+    if cause is not None:
+        raise cause
+    else:
+        # TODO: should this raise MQTTError(rc=4) instead?
+        raise asyncio.CancelledError("Cancelled by disconnect")
+
+
 def _validate_kwargs(exclude=[], **kwargs) -> None:
     """Helper function to validate user provided kwargs.
     Raises TypeError if an invalid option has been provided"""
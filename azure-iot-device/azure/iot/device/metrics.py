@@ -0,0 +1,301 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""Infrastructure for exporting the metrics of IoTHubSessions and ProvisioningSessions"""
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Tuple
+
+logger = logging.getLogger(__name__)
+
+Attributes = Dict[str, str]
+CollectFunction = Callable[[], Mapping[str, float]]
+
+# Attributes identifying the Session a metric belongs to. Sessions provide the ones relevant to
+# them (IoTHubSessions: device_id and module_id, ProvisioningSessions: registration_id).
+ATTRIBUTE_NAMES: Tuple[str, ...] = ("device_id", "module_id", "registration_id")
+
+# Values that only ever increase over the lifetime of a Session
+COUNTERS: Dict[str, str] = {
+    "messages_sent": "Telemetry messages sent, whether or not they were acknowledged",
+    "messages_acked": "Telemetry messages acknowledged by IoT Hub",
+    "messages_failed": "Telemetry messages that failed to be sent or acknowledged",
+    "messages_received": "C2D or input messages received",
+    "direct_method_requests_received": "Direct method requests received",
+    "twin_patches_received": "Desired property patches received",
+    "publishes_sent": "MQTT publishes sent (telemetry, twin, direct method and registration)",
+    "publishes_acked": "MQTT publishes acknowledged",
+    "publishes_failed": "MQTT publishes that failed to be sent or acknowledged",
+    "bytes_sent": "Bytes of topic and payload published, excluding MQTT and TLS overhead",
+    "bytes_received": "Bytes of topic and payload received, excluding MQTT and TLS overhead",
+    "reconnects": "Connections established after the first",
+    "token_refreshes": "SAS tokens renewed",
+    "token_refresh_failures": "Failed attempts to renew a SAS token",
+}
+
+# Values as of the time they are collected
+GAUGES: Dict[str, str] = {
+    "pending_publishes": "MQTT publishes awaiting acknowledgement",
+    "pending_requests": "Twin or registration requests awaiting a response",
+    "message_queue_depth": "C2D or input messages received but not yet consumed",
+    "direct_method_queue_depth": "Direct method requests received but not yet consumed",
+    "twin_patch_queue_depth": "Desired property patches received but not yet consumed",
+}
+
+# Operations whose round trip times (in seconds) are recorded
+ROUND_TRIP_OPERATIONS: Dict[str, str] = {
+    "twin_get": "Time from sending a twin request until the twin is received",
+    "twin_patch": "Time from sending a reported properties patch until IoT Hub accepts it",
+    "direct_method": "Time from receiving a direct method request until its response is acked",
+    "registration": "Time from sending a registration request until the device is assigned",
+}
+
+
+class MetricsProvider:
+    def __init__(self) -> None:
+        """Object that receives the metrics of IoTHubSessions and ProvisioningSessions, in order
+        to export them to a metrics system.
+
+        This base class discards all metrics, and is used when no provider is given. Subclass it
+        (or use `OpenTelemetryMetricsProvider` or `PrometheusMetricsProvider`) to export metrics.
+
+        Counters and gauges (see COUNTERS and GAUGES) are pulled: a Session adds itself as a
+        source for the duration of its connection, and the provider invokes the source's collect
+        function whenever it needs the current values, so they cost nothing until collected.
+        Round trip times (see ROUND_TRIP_OPERATIONS) are pushed as each operation completes.
+
+        Methods are invoked from the event loop the Session runs on, with the exception of
+        collect functions, which may be invoked from any thread.
+        """
+        pass
+
+    def add_source(self, attributes: Attributes, collect_fn: CollectFunction) -> None:
+        """Start collecting metrics from a Session.
+
+        :param dict attributes: The attributes identifying the Session (see ATTRIBUTE_NAMES)
+        :param collect_fn: A function that returns the current value of each metric
+        """
+        pass
+
+    def remove_source(self, collect_fn: CollectFunction) -> None:
+        """Stop collecting metrics from a Session.
+
+        :param collect_fn: The collect function the Session was added with
+        """
+        pass
+
+    def record_round_trip_time(
+        self, operation: str, seconds: float, attributes: Attributes
+    ) -> None:
+        """Record the round trip time of a completed operation.
+
+        :param str operation: The operation (see ROUND_TRIP_OPERATIONS)
+        :param float seconds: The round trip time of the operation, in seconds
+        :param dict attributes: The attributes identifying the Session
+        """
+        pass
+
+
+class _SourceAggregator:
+    def __init__(self, per_session: bool) -> None:
+        """Combines the metrics of many sources, keyed by their attribute values (or under a
+        single empty key if not per-session).
+
+        The counters of a source are counted from when it is added, as the same source may be
+        added and removed many times (e.g. each time a Session is entered and exited). The
+        counters of removed sources are retained, so that counters never decrease when a
+        Session exits (and continue from where they were if a Session with the same attributes
+        is added later).
+        """
+        self._per_session = per_session
+        # Each source's key, and the values of its counters when it was added
+        self._sources: Dict[CollectFunction, Tuple[Tuple[str, ...], Dict[str, float]]] = {}
+        self._retired: Dict[Tuple[str, ...], Dict[str, float]] = {}
+        # NOTE: Sources are added and removed on the event loop, but collected from the thread
+        # of the metrics system (e.g. a scrape handler)
+        self._lock = threading.Lock()
+
+    def key(self, attributes: Attributes) -> Tuple[str, ...]:
+        if not self._per_session:
+            return ()
+        return tuple(attributes.get(name) or "" for name in ATTRIBUTE_NAMES)
+
+    @property
+    def label_names(self) -> Tuple[str, ...]:
+        return ATTRIBUTE_NAMES if self._per_session else ()
+
+    def add(self, attributes: Attributes, collect_fn: CollectFunction) -> None:
+        baseline = {name: value for name, value in collect_fn().items() if name in COUNTERS}
+        with self._lock:
+            self._sources[collect_fn] = (self.key(attributes), baseline)
+
+    def remove(self, collect_fn: CollectFunction) -> None:
+        with self._lock:
+            source = self._sources.pop(collect_fn, None)
+            if source is None:
+                return
+            key, baseline = source
+            retired = self._retired.setdefault(key, {})
+            for name, value in _since(collect_fn(), baseline).items():
+                if name in COUNTERS:
+                    retired[name] = retired.get(name, 0) + value
+
+    def collect(self) -> Dict[Tuple[str, ...], Dict[str, float]]:
+        """Return the current value of each metric, for each key"""
+        with self._lock:
+            results = {key: dict(values) for key, values in self._retired.items()}
+            sources = list(self._sources.items())
+        for collect_fn, (key, baseline) in sources:
+            values = results.setdefault(key, {})
+            for name, value in _since(collect_fn(), baseline).items():
+                values[name] = values.get(name, 0) + value
+        return results
+
+
+def _since(values: Mapping[str, float], baseline: Mapping[str, float]) -> Dict[str, float]:
+    """Returns the values, with counters relative to their values in the baseline"""
+    return {name: value - baseline.get(name, 0) for name, value in values.items()}
+
+
+class OpenTelemetryMetricsProvider(MetricsProvider):
+    def __init__(self, meter: Any, *, prefix: str = "azure_iot.", per_session: bool = True):
+        """MetricsProvider that reports metrics to OpenTelemetry, as observable counters and
+        gauges, and round trip times as histograms.
+
+        Requires the 'opentelemetry-api' package.
+
+        :param meter: The OpenTelemetry Meter to create instruments with
+        :type meter: :class:`opentelemetry.metrics.Meter`
+        :param str prefix: Prefix for the names of the instruments
+        :param bool per_session: Set to 'False' to report the totals of all Sessions, rather than
+            metrics with the attributes of each Session. Default is 'True'
+        """
+        super().__init__()
+        # NOTE: OpenTelemetry is an optional dependency, so it is not imported until used
+        from opentelemetry.metrics import Observation  # type: ignore[import]
+
+        self._observation = Observation
+        self._sources = _SourceAggregator(per_session)
+        self._per_session = per_session
+        for name, description in COUNTERS.items():
+            meter.create_observable_counter(
+                prefix + name, callbacks=[self._callback(name)], description=description
+            )
+        for name, description in GAUGES.items():
+            meter.create_observable_gauge(
+                prefix + name, callbacks=[self._callback(name)], description=description
+            )
+        self._histograms = {
+            operation: meter.create_histogram(
+                prefix + operation + ".round_trip_time", unit="s", description=description
+            )
+            for operation, description in ROUND_TRIP_OPERATIONS.items()
+        }
+
+    def _callback(self, name: str) -> Callable[[Any], Iterator[Any]]:
+        def callback(options: Any) -> Iterator[Any]:
+            for key, values in self._sources.collect().items():
+                if name in values:
+                    attributes = dict(zip(self._sources.label_names, key))
+                    yield self._observation(values[name], attributes)
+
+        return callback
+
+    def add_source(self, attributes: Attributes, collect_fn: CollectFunction) -> None:
+        self._sources.add(attributes, collect_fn)
+
+    def remove_source(self, collect_fn: CollectFunction) -> None:
+        self._sources.remove(collect_fn)
+
+    def record_round_trip_time(
+        self, operation: str, seconds: float, attributes: Attributes
+    ) -> None:
+        histogram = self._histograms.get(operation)
+        if histogram is not None:
+            histogram.record(seconds, attributes if self._per_session else None)
+
+
+class PrometheusMetricsProvider(MetricsProvider):
+    def __init__(
+        self, registry: Any = None, *, prefix: str = "azure_iot_", per_session: bool = True
+    ):
+        """MetricsProvider that exposes metrics to Prometheus, as counters and gauges collected
+        upon each scrape, and round trip times as histograms.
+
+        Requires the 'prometheus-client' package.
+
+        :param registry: The CollectorRegistry to register the metrics with. If not provided, the
+            default registry is used.
+        :type registry: :class:`prometheus_client.CollectorRegistry`
+        :param str prefix: Prefix for the names of the metrics
+        :param bool per_session: Set to 'False' to expose the totals of all Sessions, rather than
+            metrics labelled with the attributes of each Session. Default is 'True'
+        """
+        super().__init__()
+        # NOTE: prometheus_client is an optional dependency, so it is not imported until used
+        import prometheus_client  # type: ignore[import]
+        from prometheus_client.core import (  # type: ignore[import]
+            CounterMetricFamily,
+            GaugeMetricFamily,
+        )
+
+        if registry is None:
+            registry = prometheus_client.REGISTRY
+        self._counter_family = CounterMetricFamily
+        self._gauge_family = GaugeMetricFamily
+        self._prefix = prefix
+        self._sources = _SourceAggregator(per_session)
+        self._histograms = {
+            operation: prometheus_client.Histogram(
+                prefix + operation + "_round_trip_seconds",
+                description,
+                labelnames=self._sources.label_names,
+                registry=registry,
+            )
+            for operation, description in ROUND_TRIP_OPERATIONS.items()
+        }
+        registry.register(self)
+
+    def describe(self) -> List[Any]:
+        # NOTE: Returning no descriptions prevents the registry from invoking .collect() upon
+        # registration to discover the metric names (which are not known until sources exist)
+        return []
+
+    def collect(self) -> Iterator[Any]:
+        """Invoked by the Prometheus registry upon each scrape"""
+        label_names = self._sources.label_names
+        families: Dict[str, Any] = {}
+        for name, description in COUNTERS.items():
+            families[name] = self._counter_family(
+                self._prefix + name, description, labels=label_names
+            )
+        for name, description in GAUGES.items():
+            families[name] = self._gauge_family(
+                self._prefix + name, description, labels=label_names
+            )
+        for key, values in self._sources.collect().items():
+            for name, value in values.items():
+                if name in families:
+                    families[name].add_metric(list(key), value)
+        for family in families.values():
+            if family.samples:
+                yield family
+
+    def add_source(self, attributes: Attributes, collect_fn: CollectFunction) -> None:
+        self._sources.add(attributes, collect_fn)
+
+    def remove_source(self, collect_fn: CollectFunction) -> None:
+        self._sources.remove(collect_fn)
+
+    def record_round_trip_time(
+        self, operation: str, seconds: float, attributes: Attributes
+    ) -> None:
+        histogram = self._histograms.get(operation)
+        if histogram is None:
+            return
+        key = self._sources.key(attributes)
+        if key:
+            histogram = histogram.labels(*key)
+        histogram.observe(seconds)
@@ -5,13 +5,17 @@
 # --------------------------------------------------------------------------
 
 import asyncio
+import concurrent.futures
 import functools
 import logging
 import paho.mqtt.client as mqtt  # type: ignore
 from paho.mqtt.client import MQTTMessage  # noqa: F401    (Importing directly to re-export)
 import ssl
+import time
 from typing import Any, Dict, AsyncGenerator, Optional, Union
+from . import tracing
 from .config import ProxyOptions
+from .network_loop import SharedNetworkLoop
 
 
 logger = logging.getLogger(__name__)
@@ -42,6 +46,18 @@ expected_on_connect_rc = [
 ]
 
 
+class IncomingMessageInterrupt:
+    """Placed in an incoming message queue to wake up whatever is waiting on it, without
+    providing a message. Use the INCOMING_MESSAGE_INTERRUPT instance."""
+
+    def __repr__(self) -> str:
+        return "INCOMING_MESSAGE_INTERRUPT"
+
+
+INCOMING_MESSAGE_INTERRUPT = IncomingMessageInterrupt()
+IncomingItem = Union[mqtt.MQTTMessage, IncomingMessageInterrupt]
+
+
 class MQTTError(Exception):
     """Represents a failure with a Paho-given error rc code"""
 
@@ -83,6 +99,8 @@ class MQTTClient:
         ssl_context: Optional[ssl.SSLContext] = None,
         websockets_path: Optional[str] = None,
         proxy_options: Optional[ProxyOptions] = None,
+        network_loop: Optional[SharedNetworkLoop] = None,
+        executor: Optional[concurrent.futures.Executor] = None,
     ) -> None:
         """
         Constructor to instantiate client.
@@ -101,6 +119,12 @@ class MQTTClient:
             Starts with '/' and should be the endpoint of the mqtt connection on the remote server.
         :param proxy_options: Options for sending traffic through proxy servers.
         :type proxy_options: :class:`azure.iot.device.common.ProxyOptions`
+        :param network_loop: A network loop to share with other clients. If not provided, a
+            network loop dedicated to this client will be run in the executor.
+        :type network_loop: :class:`azure.iot.device.network_loop.SharedNetworkLoop`
+        :param executor: The executor to run blocking Paho operations in. If not provided, the
+            default executor of the event loop will be used.
+        :type executor: :class:`concurrent.futures.Executor`
         """
         # Configuration
         self._hostname = hostname
@@ -108,6 +132,8 @@ class MQTTClient:
         self._keep_alive = keep_alive
         self._auto_reconnect = auto_reconnect
         self._reconnect_interval = reconnect_interval
+        self._shared_network_loop = network_loop
+        self._executor = executor
 
         # Client
         self._mqtt_client = self._create_mqtt_client(
@@ -123,6 +149,7 @@ class MQTTClient:
         self._connected = False
         self._desire_connection = False
         self._disconnection_cause: Optional[MQTTError] = None
+        self._reconnecting = False
 
         # Synchronization
         self.connected_cond = asyncio.Condition()
@@ -136,13 +163,29 @@ class MQTTClient:
         # NOTE: pending connect is protected by the connection lock
         # Other pending ops are protected by the _mid_tracker_lock
         self._pending_connect: Optional[asyncio.Future] = None
+        # NOTE: Completes upon the disconnect made by a reconnect (also protected by the
+        # connection lock)
+        self._pending_reconnect_disconnect: Optional[asyncio.Future] = None
         self._pending_subs: Dict[int, asyncio.Future] = {}
         self._pending_unsubs: Dict[int, asyncio.Future] = {}
         self._pending_pubs: Dict[int, asyncio.Future] = {}
+        # Spans of pending publishes made during a traced operation (also protected by the
+        # _mid_tracker_lock)
+        self._pending_pub_spans: Dict[int, tracing.Span] = {}
 
         # Incoming Data
-        self._incoming_messages: asyncio.Queue[mqtt.MQTTMessage] = asyncio.Queue()
-        self._incoming_filtered_messages: Dict[str, asyncio.Queue[mqtt.MQTTMessage]] = {}
+        self._incoming_messages: asyncio.Queue[IncomingItem] = asyncio.Queue()
+        self._incoming_filtered_messages: Dict[str, asyncio.Queue[IncomingItem]] = {}
+
+        # Metrics
+        # NOTE: bytes_received is only updated on the network loop thread, and the rest only on
+        # the event loop, so no lock is required.
+        self.connect_count = 0
+        self.publish_count = 0
+        self.puback_count = 0
+        self.publish_failure_count = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
 
     def _create_mqtt_client(
         self,
@@ -198,6 +241,7 @@ class MQTTClient:
                     logger.debug("Client State: CONNECTED")
                     self._connected = True
                     self._desire_connection = True
+                    self.connect_count += 1
                     self._disconnection_cause = None
                     async with self.connected_cond:
                         self.connected_cond.notify_all()
@@ -248,8 +292,16 @@ class MQTTClient:
                     self._connected = False
                     if rc != mqtt.MQTT_ERR_SUCCESS:
                         self._disconnection_cause = MQTTError(rc=rc)
-                    async with self.disconnected_cond:
-                        self.disconnected_cond.notify_all()
+                    if (
+                        self._pending_reconnect_disconnect
+                        and not self._pending_reconnect_disconnect.done()
+                    ):
+                        # Tasks waiting on disconnect are not notified of the disconnect made by
+                        # a reconnect. They will be if the connect that follows it fails.
+                        self._pending_reconnect_disconnect.set_result(None)
+                    else:
+                        async with self.disconnected_cond:
+                            self.disconnected_cond.notify_all()
 
                 f = asyncio.run_coroutine_threadsafe(set_disconnected(), self._event_loop)
                 # Need to wait for this one to finish since we don't want to let another
@@ -312,6 +364,9 @@ class MQTTClient:
 
         def on_publish(client: mqtt.Client, userdata: Any, mid: int) -> None:
             logger.debug("PUBACK received for mid {}".format(mid))
+            # NOTE: The time of receipt is taken here, rather than upon completion on the event
+            # loop, so that traces can distinguish network latency from event loop latency.
+            received_ns = time.time_ns() if self._pending_pub_spans else None
 
             async def complete_pub() -> None:
                 async with self._mid_tracker_lock:
@@ -320,6 +375,10 @@ class MQTTClient:
                         f.set_result(True)
                     except KeyError:
                         logger.warning("Unexpected PUBACK received for mid {}".format(mid))
+                    if self._pending_pub_spans:
+                        span = self._pending_pub_spans.get(mid)
+                        if span:
+                            span.add_event(tracing.EVENT_PUBACK, timestamp=received_ns)
 
             # NOTE: The complete_pub() coroutine cannot finish right away due to the
             # mid_tracker_lock being held by the invocation of .publish(), waiting for a result.
@@ -329,6 +388,7 @@ class MQTTClient:
 
         def on_message(client: mqtt.Client, userdata: Any, message: mqtt.MQTTMessage) -> None:
             logger.debug("Incoming MQTT Message received on {}".format(message.topic))
+            self.bytes_received += len(message.topic) + len(message.payload)
 
             async def add_to_queue() -> None:
                 await self._incoming_messages.put(message)
@@ -390,6 +450,37 @@ class MQTTClient:
         """
         return self._connected
 
+    def is_reconnecting(self) -> bool:
+        """
+        Returns a boolean indicating whether the MQTT client is currently reconnecting (see
+        .reconnect()), in which case it may be briefly disconnected.
+        """
+        return self._reconnecting
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of the client metrics"""
+        return {
+            "publishes_sent": self.publish_count,
+            "publishes_acked": self.puback_count,
+            "publishes_failed": self.publish_failure_count,
+            "pending_publishes": len(self._pending_pubs),
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "reconnects": max(self.connect_count - 1, 0),
+        }
+
+    def incoming_message_queue_depth(self, filter_topic: Optional[str] = None) -> int:
+        """Return the number of incoming messages (and interrupts) that have been received, but
+        not yet yielded by the incoming message generator for a topic
+
+        :param str filter_topic: The topic of the generator.
+            If not provided, will return the depth for non-filtered messages
+
+        :raises: ValueError if a filter is not already applied for the given topic
+        """
+        return self._get_incoming_message_queue(filter_topic).qsize()
+
     def previous_disconnection_cause(self) -> Optional[MQTTError]:
         """
         Returns an MQTTError from the previous disconnection if it was unexpected as a result of
@@ -425,6 +516,7 @@ class MQTTClient:
 
         def callback(client, userdata, message):
             logger.debug("Incoming MQTT Message received on filter {}".format(message.topic))
+            self.bytes_received += len(message.topic) + len(message.payload)
 
             async def add_to_queue():
                 await self._incoming_filtered_messages[topic].put(message)
@@ -453,10 +545,13 @@ class MQTTClient:
 
     def get_incoming_message_generator(
         self, filter_topic: Optional[str] = None
-    ) -> AsyncGenerator[mqtt.MQTTMessage, None]:
+    ) -> AsyncGenerator[IncomingItem, None]:
         """
         Return a generator that yields incoming messages
 
+        In addition to messages, the generator yields INCOMING_MESSAGE_INTERRUPT each time
+        `.interrupt_incoming_message_generator()` is invoked for the same topic.
+
         :param str filter_topic: The topic you wish to receive a generator for.
             If not provided, will return a generator for non-filtered messages
 
@@ -464,19 +559,38 @@ class MQTTClient:
 
         :returns: A generator that yields incoming messages
         """
-        if filter_topic is not None and filter_topic not in self._incoming_filtered_messages:
-            raise ValueError("No filter applied for given topic")
-        elif filter_topic is not None:
-            incoming_messages = self._incoming_filtered_messages[filter_topic]
-        else:
-            incoming_messages = self._incoming_messages
+        incoming_messages = self._get_incoming_message_queue(filter_topic)
 
-        async def message_generator() -> AsyncGenerator[mqtt.MQTTMessage, None]:
+        async def message_generator() -> AsyncGenerator[IncomingItem, None]:
             while True:
                 yield await incoming_messages.get()
 
         return message_generator()
 
+    def interrupt_incoming_message_generator(self, filter_topic: Optional[str] = None) -> None:
+        """
+        Cause the incoming message generator for a topic to yield INCOMING_MESSAGE_INTERRUPT
+        once all messages already received have been yielded, waking up anything waiting on it.
+
+        Must be invoked from the event loop.
+
+        :param str filter_topic: The topic of the generator to interrupt.
+            If not provided, will interrupt the generator for non-filtered messages
+
+        :raises: ValueError if a filter is not already applied for the given topic
+        """
+        self._get_incoming_message_queue(filter_topic).put_nowait(INCOMING_MESSAGE_INTERRUPT)
+
+    def _get_incoming_message_queue(
+        self, filter_topic: Optional[str] = None
+    ) -> "asyncio.Queue[IncomingItem]":
+        if filter_topic is not None and filter_topic not in self._incoming_filtered_messages:
+            raise ValueError("No filter applied for given topic")
+        elif filter_topic is not None:
+            return self._incoming_filtered_messages[filter_topic]
+        else:
+            return self._incoming_messages
+
     async def connect(self) -> None:
         """
         Connect to the MQTT broker using details set at instantiation.
@@ -555,7 +669,7 @@ class MQTTClient:
         )
         try:
             rc = await self._event_loop.run_in_executor(
-                None,
+                self._executor,
                 functools.partial(
                     self._mqtt_client.connect,
                     host=self._hostname,
@@ -604,10 +718,14 @@ class MQTTClient:
         # already established. This is not true of other network loop APIs, but it is true of this
         # one.
         if not self._network_loop_running():
-            logger.debug("Starting Paho network loop")
-            self._network_loop = self._event_loop.run_in_executor(
-                None, self._mqtt_client.loop_forever
-            )
+            if self._shared_network_loop is not None:
+                logger.debug("Adding Paho client to shared network loop")
+                self._network_loop = self._shared_network_loop.run_client(self._mqtt_client)
+            else:
+                logger.debug("Starting Paho network loop")
+                self._network_loop = self._event_loop.run_in_executor(
+                    self._executor, self._mqtt_client.loop_forever
+                )
         else:
             logger.debug(
                 "Paho network loop was already running. Likely due to a previous cancellation."
@@ -654,7 +772,9 @@ class MQTTClient:
                 # Paho Disconnect
                 # NOTE: Paho disconnect shouldn't raise any exceptions
                 logger.debug("Attempting disconnect")
-                rc = await self._event_loop.run_in_executor(None, self._mqtt_client.disconnect)
+                rc = await self._event_loop.run_in_executor(
+                    self._executor, self._mqtt_client.disconnect
+                )
                 rc_msg = mqtt.error_string(rc)
                 logger.debug("Disconnect returned rc {} - {}".format(rc, rc_msg))
 
@@ -690,6 +810,63 @@ class MQTTClient:
             else:
                 logger.debug("Already disconnected!")
 
+    async def reconnect(self) -> None:
+        """
+        Disconnect from the MQTT broker and connect again (e.g. to authenticate with credentials
+        set since connecting), without notifying tasks waiting on disconnect.
+
+        Pending publishes are sent again upon reconnection. Pending subscribes and unsubscribes
+        are cancelled, as with any disconnect. If not connected, does nothing.
+
+        :raises: MQTTConnectionFailedError if there is a failure connecting. Tasks waiting on
+            disconnect are notified of the disconnection in this case (or if cancelled).
+        """
+        # Wait for permission to alter the connection
+        async with self._connection_lock:
+            # NOTE: See .connect() for why it is safe to use .is_connected() here
+            if not self.is_connected():
+                logger.debug("Not connected - nothing to reconnect")
+                return
+
+            self._reconnecting = True
+            self._pending_reconnect_disconnect = self._event_loop.create_future()
+            try:
+                # Paho Disconnect
+                # NOTE: Whether it returns success, or indicates the connection was already lost,
+                # the on_disconnect handler is invoked, since the client is still connected.
+                logger.debug("Attempting disconnect for reconnect")
+                rc = await self._event_loop.run_in_executor(
+                    self._executor, self._mqtt_client.disconnect
+                )
+                rc_msg = mqtt.error_string(rc)
+                logger.debug("Disconnect returned rc {} - {}".format(rc, rc_msg))
+                logger.debug("Waiting for disconnect to complete...")
+                await self._pending_reconnect_disconnect
+                if self._network_loop is not None:
+                    # This block should always execute. This condition is just to help the type
+                    # checker.
+                    logger.debug("Waiting for network loop to exit and clearing task")
+                    await self._network_loop
+                    self._network_loop = None
+
+                logger.debug("Attempting connect for reconnect")
+                await self._do_connect()
+                logger.debug("Reconnect succeeded")
+            except BaseException:
+                # NOTE: This includes cancellation, after which the connection may be in any state
+                self._reconnecting = False
+                if not self.is_connected():
+                    logger.debug("Reconnect failed. Notifying of disconnection")
+                    if not self._disconnection_cause:
+                        self._disconnection_cause = MQTTError(rc=mqtt.MQTT_ERR_CONN_LOST)
+                    async with self.disconnected_cond:
+                        self.disconnected_cond.notify_all()
+                raise
+            finally:
+                self._reconnecting = False
+                self._pending_reconnect_disconnect = None
+                self._pending_connect = None
+
     async def subscribe(self, topic: str) -> None:
         """
         Subscribe to a topic from the MQTT broker.
@@ -708,7 +885,8 @@ class MQTTClient:
             # result cannot be received before we have a Future created for the eventual result.
             async with self._mid_tracker_lock:
                 (rc, mid) = await self._event_loop.run_in_executor(
-                    None, functools.partial(self._mqtt_client.subscribe, topic=topic, qos=1)
+                    self._executor,
+                    functools.partial(self._mqtt_client.subscribe, topic=topic, qos=1),
                 )
                 rc_msg = mqtt.error_string(rc)
                 logger.debug("Subscribe returned rc {} - {}".format(rc, rc_msg))
@@ -753,7 +931,7 @@ class MQTTClient:
             # result cannot be received before we have a Future created for the eventual result.
             async with self._mid_tracker_lock:
                 (rc, mid) = await self._event_loop.run_in_executor(
-                    None, functools.partial(self._mqtt_client.unsubscribe, topic=topic)
+                    self._executor, functools.partial(self._mqtt_client.unsubscribe, topic=topic)
                 )
                 rc_msg = mqtt.error_string(rc)
                 logger.debug("Unsubscribe returned rc {} - {}".format(rc, rc_msg))
@@ -780,21 +958,31 @@ class MQTTClient:
                 if mid and mid in self._pending_unsubs:
                     del self._pending_unsubs[mid]
 
-    async def publish(self, topic: str, payload: Union[str, bytes, int, float, None]) -> None:
+    async def publish(
+        self,
+        topic: str,
+        payload: Union[str, bytes, int, float, None],
+        timeout: Optional[float] = None,
+    ) -> None:
         """
         Send a message via the MQTT broker.
 
         :param str topic: topic: The topic that the message should be published on.
         :param payload: The actual message to send.
         :type payload: str, bytes, int, float or None
-        :param int qos: the desired quality of service level for the subscription. Defaults to 1.
+        :param float timeout: Time (in seconds) to wait for the publish to be acknowledged
+            before giving up. If not provided, waits indefinitely.
 
         :raises: ValueError if topic is None or has zero string length
         :raises: ValueError if topic contains a wildcard ("+")
         :raises: ValueError if the length of the payload is greater than 268435455 bytes
         :raises: TypeError if payload is not a valid type
         :raises: MQTTError if there is an error publishing
+        :raises: asyncio.TimeoutError if the publish is not acknowledged within the timeout
         """
+        deadline = self._event_loop.time() + timeout if timeout is not None else None
+        timeout_timer = None
+        span = tracing.current_span()
         try:
             mid = None
             logger.debug("Attempting publish to topic {}".format(topic))
@@ -803,8 +991,10 @@ class MQTTClient:
             # be invoked on response, as the callback also uses the lock. This ensures that the
             # result cannot be received before we have a Future created for the eventual result.
             async with self._mid_tracker_lock:
+                if span:
+                    span.add_event(tracing.EVENT_PUBLISH)
                 message_info = await self._event_loop.run_in_executor(
-                    None,
+                    self._executor,
                     functools.partial(
                         self._mqtt_client.publish, topic=topic, payload=payload, qos=1
                     ),
@@ -824,6 +1014,19 @@ class MQTTClient:
                 # Establish a pending publish
                 pub_done = self._event_loop.create_future()
                 self._pending_pubs[mid] = pub_done
+                payload_size = _get_payload_size(payload)
+                self.publish_count += 1
+                self.bytes_sent += len(topic) + payload_size
+                if span:
+                    span.set_attribute(tracing.ATTRIBUTE_MID, mid)
+                    span.set_attribute(tracing.ATTRIBUTE_PAYLOAD_SIZE, payload_size)
+                    span.add_event(tracing.EVENT_PUBLISHED)
+                    self._pending_pub_spans[mid] = span
+                if deadline is not None:
+                    # NOTE: Use a timer rather than asyncio.wait_for() to avoid creating a Task
+                    timeout_timer = self._event_loop.call_at(
+                        deadline, _set_timeout, pub_done, "Timed out waiting for PUBACK"
+                    )
 
             logger.debug("Waiting for PUBACK")
             # NOTE: Yes, message_info has a method called 'wait_for_publish' which would simplify
@@ -833,15 +1036,46 @@ class MQTTClient:
             # (even after connection established).
             # So, alas, we do it the messy handler/Future way, same as with sub and unsub.
             await pub_done
+            self.puback_count += 1
         except asyncio.CancelledError:
+            self.publish_failure_count += 1
             if mid:
                 logger.debug("Publish for mid {} was cancelled".format(mid))
                 logger.warning("The cancelled publish may still be delivered if it was in-flight")
             else:
                 logger.debug("Publish was cancelled before mid was assigned")
             raise
+        except asyncio.TimeoutError:
+            self.publish_failure_count += 1
+            logger.debug("Publish for mid {} timed out".format(mid))
+            logger.warning("The timed out publish may still be delivered if it was in-flight")
+            raise
+        except Exception:
+            self.publish_failure_count += 1
+            raise
         finally:
+            if timeout_timer:
+                timeout_timer.cancel()
             # Delete any pending operation (if it exists)
             async with self._mid_tracker_lock:
                 if mid and mid in self._pending_pubs:
                     del self._pending_pubs[mid]
+                if span and mid:
+                    self._pending_pub_spans.pop(mid, None)
+
+
+def _get_payload_size(payload: Union[str, bytes, int, float, None]) -> int:
+    """Return the size (in bytes) of a payload, as it will be published"""
+    if payload is None:
+        return 0
+    elif isinstance(payload, (bytes, bytearray)):
+        return len(payload)
+    else:
+        # NOTE: Paho publishes str (and numbers converted to str) encoded as utf-8
+        return len(str(payload).encode("utf-8"))
+
+
+def _set_timeout(future: "asyncio.Future[Any]", message: str) -> None:
+    """Fail a pending Future with an asyncio.TimeoutError"""
+    if not future.done():
+        future.set_exception(asyncio.TimeoutError(message))
@@ -0,0 +1,335 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""Infrastructure for running the network I/O of many Paho clients on a single thread"""
+import asyncio
+import collections
+import logging
+import selectors
+import socket
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+import paho.mqtt.client as mqtt  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+# Maximum time (in seconds) between keep alive checks for each client
+MISC_INTERVAL: float = 1.0
+
+# Requests made of the network loop thread
+_ADD = "add"
+_UPDATE = "update"
+_STOP = "stop"
+
+# The Future that completes when a client's connection ends, and the event loop it belongs to
+_Completion = Tuple["asyncio.Future[None]", asyncio.AbstractEventLoop]
+
+
+class SharedNetworkLoop:
+    def __init__(self) -> None:
+        """Object that performs the network I/O for many Paho clients using a single selector
+        running on a single thread.
+
+        This replaces running `.loop_forever()` for each client on a thread of its own.
+        Paho invokes its handlers (e.g. `on_connect`, `on_message`) on this thread, so as with
+        `.loop_forever()`, they must not block waiting on anything done by the network loop.
+        """
+        self._selector = selectors.DefaultSelector()
+        # NOTE: Only accessed from the network loop thread
+        self._clients: Dict[mqtt.Client, Tuple[Any, _Completion]] = {}
+        self._requests: Deque[
+            Tuple[str, Optional[mqtt.Client], Optional[_Completion]]
+        ] = collections.deque()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_lock = threading.Lock()
+        self._closed = False
+
+        # Used to wake up the selector when a request is made from another thread
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+
+    def __len__(self) -> int:
+        """The number of clients currently being serviced"""
+        return len(self._clients)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start the network loop thread. Does nothing if already running.
+
+        :raises: RuntimeError if the network loop has been closed
+        """
+        with self._thread_lock:
+            if self._closed:
+                raise RuntimeError("Network loop has been closed")
+            if not self.running:
+                logger.debug("Starting shared network loop")
+                self._thread = threading.Thread(
+                    target=self._run, name="azure-iot-network-loop", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the network loop thread, waiting for it to exit. Does nothing if not running.
+
+        Clients still being serviced will no longer be serviced, and their Futures are cancelled.
+        """
+        with self._thread_lock:
+            if not self._thread:
+                return
+            logger.debug("Stopping shared network loop")
+            self._request(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def close(self) -> None:
+        """Stop the network loop thread, and release the resources used to run it.
+        The network loop cannot be started again once closed. Does nothing if already closed.
+        """
+        self.stop()
+        with self._thread_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._selector.close()
+            self._wakeup_r.close()
+            self._wakeup_w.close()
+
+    def run_client(self, client: mqtt.Client) -> "asyncio.Future[None]":
+        """Begin servicing the network I/O of a Paho client that has just connected.
+
+        This is the equivalent of running `client.loop_forever()` in an executor - the returned
+        Future completes once the client's socket is closed (i.e. upon disconnect, or a
+        connection failure). Starts the network loop thread if it is not already running.
+
+        Must be invoked from an event loop, after invoking `client.connect()`.
+
+        :param client: The Paho client
+        :type client: :class:`paho.mqtt.client.Client`
+
+        :returns: A Future that completes when the connection of the client ends
+        """
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        # NOTE: Once these are set, Paho no longer writes outgoing packets on the thread that
+        # queues them, and instead requests that they be written by the network loop.
+        client.on_socket_register_write = self._on_socket_change
+        client.on_socket_unregister_write = self._on_socket_change
+        client.on_socket_close = self._on_socket_change
+        self.start()
+        self._request(_ADD, client, (done, loop))
+        return done
+
+    def _on_socket_change(self, client: mqtt.Client, userdata: Any, sock: Any) -> None:
+        self._request(_UPDATE, client)
+
+    def _request(
+        self,
+        request: str,
+        client: Optional[mqtt.Client] = None,
+        completion: Optional[_Completion] = None,
+    ) -> None:
+        """Make a request of the network loop thread, waking it up if necessary"""
+        self._requests.append((request, client, completion))
+        # NOTE: If the thread is not running, requests will be processed once it is started
+        thread = self._thread
+        if thread is not None and threading.current_thread() is not thread:
+            try:
+                self._wakeup_w.send(b"\x00")
+            except BlockingIOError:
+                # Buffer is full, so a wakeup is already pending
+                pass
+
+    def _run(self) -> None:
+        """Service all clients until stopped"""
+        try:
+            next_misc = time.monotonic() + MISC_INTERVAL
+            while self._process_requests():
+                timeout = max(0.0, next_misc - time.monotonic())
+                for key, events in self._selector.select(timeout):
+                    if key.fileobj is self._wakeup_r:
+                        self._drain_wakeup()
+                        continue
+                    self._service(key.data, events)
+                if time.monotonic() >= next_misc:
+                    # Keep alive pings and timeouts
+                    for client in list(self._clients):
+                        self._service(client, misc=True)
+                    next_misc = time.monotonic() + MISC_INTERVAL
+        finally:
+            # NOTE: If the thread is exiting unexpectedly, this ensures that nobody is left
+            # waiting on a client that will never again be serviced.
+            self._shutdown()
+
+    def _service(self, client: mqtt.Client, events: int = 0, misc: bool = False) -> None:
+        """Perform the network I/O of a client. If this fails, stop servicing the client, failing
+        its Future, so that the other clients continue to be serviced."""
+        try:
+            if events & selectors.EVENT_READ:
+                rc = client.loop_read()
+                # NOTE: Data may be buffered by the SSL layer without the socket being
+                # readable, so keep reading while the SSL layer has data pending.
+                while rc == mqtt.MQTT_ERR_SUCCESS and _ssl_pending(client.socket()):
+                    rc = client.loop_read()
+            if events & selectors.EVENT_WRITE:
+                client.loop_write()
+            if misc:
+                client.loop_misc()
+            self._update(client)
+        except Exception as e:
+            self._drop(client, e)
+
+    def _process_requests(self) -> bool:
+        """Process requests made of the network loop thread.
+        Returns False if the network loop should stop."""
+        while self._requests:
+            request, client, completion = self._requests.popleft()
+            if request == _STOP:
+                return False
+            # NOTE: The assert helps the type checker - only stop requests have no client
+            assert client is not None
+            try:
+                if request == _ADD:
+                    # NOTE: The assert helps the type checker - add requests have a completion
+                    assert completion is not None
+                    self._add(client, completion)
+                else:
+                    # NOTE: Rather than being specified by the request, whether or not to write
+                    # is determined by Paho's outgoing packet queue at the time the request is
+                    # processed. Paho can queue a packet on another thread after requesting to
+                    # stop writing, without then requesting to write again.
+                    self._update(client)
+            except Exception as e:
+                self._drop(client, e, completion)
+        return True
+
+    def _add(self, client: mqtt.Client, completion: _Completion) -> None:
+        sock = client.socket()
+        if sock is None:
+            logger.debug("Connection ended before client could be serviced")
+            _complete(completion)
+            return
+        self._register(client, sock, completion)
+
+    def _register(self, client: mqtt.Client, sock: Any, completion: _Completion) -> None:
+        events = selectors.EVENT_READ
+        if client.want_write():
+            events |= selectors.EVENT_WRITE
+        try:
+            self._selector.register(sock, events, data=client)
+        except KeyError:
+            # The file descriptor was reused after the socket of another client was closed on
+            # another thread, before that client was removed.
+            self._remove(self._selector.get_key(sock).data)
+            self._selector.register(sock, events, data=client)
+        self._clients[client] = (sock, completion)
+
+    def _update(self, client: mqtt.Client) -> None:
+        """Stop servicing a client if its socket has been closed, completing its Future.
+        Otherwise, make sure the client is only selected for writing if it has data to write.
+        Does nothing if the client is not being serviced."""
+        if client not in self._clients:
+            return
+        registered_sock, completion = self._clients[client]
+        sock = client.socket()
+        if sock is None:
+            self._remove(client)
+            return
+        if sock is not registered_sock:
+            # Paho replaced the socket (i.e. reconnected) on another thread before the closure
+            # of the previous one was processed. Like `.loop_forever()`, continue servicing.
+            self._unregister(registered_sock)
+            self._register(client, sock, completion)
+            return
+        events = selectors.EVENT_READ
+        if client.want_write():
+            events |= selectors.EVENT_WRITE
+        if self._selector.get_key(sock).events != events:
+            self._selector.modify(sock, events, data=client)
+
+    def _remove(self, client: mqtt.Client) -> None:
+        """Stop servicing a client, completing its Future"""
+        sock, completion = self._clients.pop(client)
+        self._unregister(sock)
+        _complete(completion)
+
+    def _drop(
+        self, client: mqtt.Client, error: Exception, completion: Optional[_Completion] = None
+    ) -> None:
+        """Stop servicing a client that could not be serviced, failing its Future with the error"""
+        logger.error("Failure servicing client in shared network loop: {}".format(error))
+        entry = self._clients.pop(client, None)
+        if entry is not None:
+            sock, completion = entry
+            self._unregister(sock)
+        # NOTE: If there is no completion, the Future was already completed by `._remove()`
+        if completion is not None:
+            _fail(completion, error)
+
+    def _unregister(self, sock: Any) -> None:
+        try:
+            self._selector.unregister(sock)
+        except (KeyError, ValueError):
+            # Socket closed in a way the selector cannot look up
+            pass
+
+    def _drain_wakeup(self) -> None:
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _shutdown(self) -> None:
+        """Stop servicing all clients, cancelling their Futures"""
+        for sock, (done, loop) in self._clients.values():
+            self._unregister(sock)
+            _call_soon(loop, done.cancel)
+        self._clients.clear()
+        for _, _, completion in self._requests:
+            if completion:
+                done, loop = completion
+                _call_soon(loop, done.cancel)
+        self._requests.clear()
+
+
+def _ssl_pending(sock: Any) -> bool:
+    """Return a boolean indicating if an SSL socket has buffered data to read"""
+    pending = getattr(sock, "pending", None)
+    return bool(pending and pending())
+
+
+def _complete(completion: _Completion) -> None:
+    done, loop = completion
+
+    def set_done() -> None:
+        if not done.done():
+            done.set_result(None)
+
+    _call_soon(loop, set_done)
+
+
+def _fail(completion: _Completion, error: Exception) -> None:
+    done, loop = completion
+
+    def set_error() -> None:
+        if not done.done():
+            done.set_exception(error)
+
+    _call_soon(loop, set_error)
+
+
+def _call_soon(loop: asyncio.AbstractEventLoop, callback: Callable[[], Any]) -> None:
+    """Schedule a callback on the event loop a Future belongs to, from the network loop thread"""
+    try:
+        loop.call_soon_threadsafe(callback)
+    except RuntimeError:
+        # The event loop is closed, so nothing can be waiting on the Future
+        pass
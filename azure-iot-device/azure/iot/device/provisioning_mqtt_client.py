@@ -7,9 +7,10 @@
 import asyncio
 import json
 import logging
+import time
 import urllib.parse
 import uuid
-from typing import Optional, TypeVar
+from typing import Dict, Optional, TypeVar
 from .custom_typing import (
     RegistrationResult,
     RegistrationState,
@@ -61,6 +62,10 @@ class ProvisioningMQTTClient:
         # MQTT Configuration
         self._mqtt_client = _create_mqtt_client(self._registration_id, client_config)
 
+        # Metrics
+        self._metrics_provider = client_config.metrics_provider
+        self._metrics_attributes = {"registration_id": self._registration_id}
+
         # Add filters for receive topics delivering data used internally
         register_response_topic = mqtt_topic.get_response_topic_for_subscribe()
         self._mqtt_client.add_incoming_message_filter(register_response_topic)
@@ -88,6 +93,8 @@ class ProvisioningMQTTClient:
         dps_responses = self._mqtt_client.get_incoming_message_generator(dps_response_topic)
 
         async for mqtt_message in dps_responses:
+            if isinstance(mqtt_message, mqtt.IncomingMessageInterrupt):
+                continue
             try:
                 extracted_properties = mqtt_topic.extract_properties_from_response_topic(
                     mqtt_message.topic
@@ -115,7 +122,8 @@ class ProvisioningMQTTClient:
                     )
                 )
                 # NOTE: In this situation the operation waiting for the response that we failed to
-                # receive will hang. This isn't the end of the world, since it can be cancelled,
+                # receive will hang until its request expires in the ledger (if it was created
+                # with a timeout). This isn't the end of the world, since it can also be cancelled,
                 # but if we really wanted to smooth this out, we could cancel the pending operation
                 # based on the request id (assuming getting the request id is not what failed).
                 # But for now, that's probably overkill, especially since this path ideally should
@@ -228,6 +236,7 @@ class ProvisioningMQTTClient:
         )
         interval = 0  # Initially set to no sleep
         register_response = None
+        start = time.monotonic()
 
         while True:
             await asyncio.sleep(interval)
@@ -325,7 +334,9 @@ class ProvisioningMQTTClient:
                         logger.debug(
                             "Transitioning to polling request to Device Provisioning Service..."
                         )
-                        return await self.send_polling(operation_id)
+                        result = await self.send_polling(operation_id)
+                        self._record_round_trip_time(start)
+                        return result
                     elif (
                         registration_status == "assigned" or registration_status == "failed"
                     ):  # breaking from while
@@ -346,6 +357,7 @@ class ProvisioningMQTTClient:
                             "status": registration_status,
                             "registrationState": registration_state,
                         }
+                        self._record_round_trip_time(start)
                         return registration_result
                     else:
                         raise ProvisioningServiceError(
@@ -494,11 +506,24 @@ class ProvisioningMQTTClient:
                             )
                         )
 
+    def _record_round_trip_time(self, start: float) -> None:
+        if self._metrics_provider:
+            self._metrics_provider.record_round_trip_time(
+                "registration", time.monotonic() - start, self._metrics_attributes
+            )
+
     @property
     def connected(self) -> bool:
         """Boolean indicating connection status"""
         return self._mqtt_client.is_connected()
 
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of the client metrics (including those of the underlying MQTTClient)"""
+        stats = self._mqtt_client.stats
+        stats["pending_requests"] = len(self._request_ledger)
+        return stats
+
 
 def _create_mqtt_client(
     client_id: str, client_config: config.ProvisioningClientConfig
@@ -530,6 +555,8 @@ def _create_mqtt_client(
         ssl_context=client_config.ssl_context,
         websockets_path=websockets_path,
         proxy_options=client_config.proxy_options,
+        network_loop=client_config.network_loop,
+        executor=client_config.executor,
     )
 
     return client
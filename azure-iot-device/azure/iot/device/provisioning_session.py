@@ -5,13 +5,14 @@
 # --------------------------------------------------------------------------
 import asyncio
 import ssl
-from typing import Optional, Type, Awaitable, TypeVar
+from typing import Any, Dict, Optional, Type, Awaitable, TypeVar, NoReturn, Set
 from types import TracebackType
 
 from . import signing_mechanism as sm
 from . import sastoken as st
 from . import config, custom_typing
 from . import provisioning_mqtt_client as mqtt
+from . import metrics
 from .custom_typing import RegistrationPayload
 
 _T = TypeVar("_T")
@@ -27,6 +28,7 @@ class ProvisioningSession:
         ssl_context: Optional[ssl.SSLContext] = None,
         shared_access_key: Optional[str] = None,
         sastoken_fn: Optional[custom_typing.FunctionOrCoroutine] = None,
+        metrics_provider: Optional[metrics.MetricsProvider] = None,
         **kwargs,
     ) -> None:
         """
@@ -38,6 +40,9 @@ class ProvisioningSession:
         :param str shared_access_key: A key that can be used to generate SAS Tokens
         :param sastoken_fn: A function or coroutine function that takes no arguments and returns
             a SAS token string when invoked
+        :param metrics_provider: A MetricsProvider to export the metrics of the Session (see
+            `.get_metrics()`) to while it is connected. If not provided, metrics are not exported.
+        :type metrics_provider: :class:`azure.iot.device.metrics.MetricsProvider`
 
         :raises: ValueError if none of 'ssl_context', 'symmetric_key' or 'sastoken_fn' are provided
         :raises: ValueError if both 'symmetric_key' and 'sastoken_fn' are provided
@@ -88,11 +93,20 @@ class ProvisioningSession:
             sastoken_provider=self._sastoken_provider,
             ssl_context=ssl_context,
             auto_reconnect=False,  # No reconnect for now
+            metrics_provider=metrics_provider,
             **kwargs,
         )
         self._mqtt_client = mqtt.ProvisioningMQTTClient(client_config)
+        self._metrics_provider = metrics_provider
+        self._metrics_attributes = {"registration_id": registration_id}
         self._wait_for_disconnect_task: Optional[asyncio.Task[Optional[mqtt.MQTTError]]] = None
 
+        # Tasks currently awaiting an operation, which will be cancelled in the event of
+        # disconnect, and the subset of them that have been cancelled for that reason, and have
+        # not yet handled it.
+        self._pending_operations: Set[asyncio.Task[Any]] = set()
+        self._interrupted_operations: Set[asyncio.Task[Any]] = set()
+
     async def __aenter__(self) -> "ProvisioningSession":
         # First, if using SAS auth, start up the provider
         if self._sastoken_provider:
@@ -102,6 +116,8 @@ class ProvisioningSession:
 
         # Start/connect
         try:
+            if self._metrics_provider:
+                self._metrics_provider.add_source(self._metrics_attributes, self.get_metrics)
             await self._mqtt_client.start()
             await self._mqtt_client.connect()
         except (Exception, asyncio.CancelledError):
@@ -111,6 +127,7 @@ class ProvisioningSession:
         self._wait_for_disconnect_task = asyncio.create_task(
             self._mqtt_client.wait_for_disconnect()
         )
+        self._wait_for_disconnect_task.add_done_callback(self._interrupt_pending_operations)
         return self
 
     async def __aexit__(
@@ -132,6 +149,8 @@ class ProvisioningSession:
         try:
             await self._mqtt_client.stop()
         finally:
+            if self._metrics_provider:
+                self._metrics_provider.remove_source(self.get_metrics)
             if self._sastoken_provider:
                 await self._sastoken_provider.stop()
 
@@ -154,29 +173,75 @@ class ProvisioningSession:
             self._mqtt_client.send_register(payload)
         )
 
-    def _add_disconnect_interrupt_to_coroutine(self, coro: Awaitable[_T]) -> Awaitable[_T]:
-        """Wrap a coroutine in another coroutine that will either return the result of the original
-        coroutine, or raise error in the event of disconnect
+    def get_metrics(self) -> Dict[str, int]:
+        """Return the current value of each metric of the Session.
+
+        See `azure.iot.device.metrics` for the list of metrics.
+
+        :returns: A dictionary of metric names to values
+        :rtype: dict
         """
+        session_metrics = self._mqtt_client.stats
+        if self._sastoken_provider:
+            session_metrics.update(self._sastoken_provider.stats)
+        return session_metrics
 
-        async def wrapping_coroutine():
-            original_task = asyncio.create_task(coro)
-            done, _ = await asyncio.wait(
-                [original_task, self._wait_for_disconnect_task],
-                return_when=asyncio.FIRST_COMPLETED,
-            )
-            if self._wait_for_disconnect_task in done:
-                original_task.cancel()
-                cause = self._wait_for_disconnect_task.result()
-                if cause is not None:
-                    raise cause
-                else:
-                    # TODO: should this raise MQTTError(rc=4) instead?
-                    raise asyncio.CancelledError("Cancelled by disconnect")
-            else:
-                return await original_task
-
-        return wrapping_coroutine()
+    def _interrupt_pending_operations(self, _: "asyncio.Future[Optional[mqtt.MQTTError]]") -> None:
+        """Cancel every Task awaiting an operation, so that they can raise the error corresponding
+        to the disconnect (or exit)"""
+        for task in self._pending_operations:
+            task.cancel()
+        self._interrupted_operations.update(self._pending_operations)
+        self._pending_operations.clear()
+
+    async def _add_disconnect_interrupt_to_coroutine(self, coro: Awaitable[_T]) -> _T:
+        """Await a coroutine in the current Task, raising error in the event of disconnect
+
+        NOTE: The current Task is tracked as a pending operation for the duration of the
+        coroutine. Upon disconnect, all pending operations are cancelled in a single pass
+        (see `._interrupt_pending_operations()`), so no additional Tasks are required.
+        """
+        wait_for_disconnect_task = self._wait_for_disconnect_task
+        if not wait_for_disconnect_task or wait_for_disconnect_task.done():
+            # Don't leave the coroutine un-awaited
+            if asyncio.iscoroutine(coro):
+                coro.close()
+            if not wait_for_disconnect_task:
+                # See NOTE 1 at the bottom of iothub_session file
+                raise mqtt.MQTTError(rc=4)
+            _raise_disconnect_cause(wait_for_disconnect_task)
+        # NOTE: Operations are always awaited from within a Task. The assert helps the type checker.
+        task = asyncio.current_task()
+        assert task is not None
+        self._pending_operations.add(task)
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            if task not in self._interrupted_operations:
+                raise
+        finally:
+            self._pending_operations.discard(task)
+            if task in self._interrupted_operations:
+                self._interrupted_operations.discard(task)
+                if hasattr(task, "uncancel"):
+                    # NOTE: Python 3.11+ tracks pending cancellation requests, which must be
+                    # undone since this cancellation has been handled
+                    task.uncancel()  # type: ignore
+        _raise_disconnect_cause(wait_for_disconnect_task)
+
+
+def _raise_disconnect_cause(
+    wait_for_disconnect_task: "asyncio.Task[Optional[mqtt.MQTTError]]",
+) -> NoReturn:
+    """Raise the error corresponding to a completed wait for disconnect"""
+    if wait_for_disconnect_task.cancelled():
+        raise asyncio.CancelledError("Cancelled by session exit")
+    cause = wait_for_disconnect_task.result()
+    if cause is not None:
+        raise cause
+    else:
+        # TODO: should this raise MQTTError(rc=4) instead?
+        raise asyncio.CancelledError("Cancelled by disconnect")
 
 
 def _validate_kwargs(exclude=[], **kwargs) -> None:
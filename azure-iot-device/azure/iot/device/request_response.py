@@ -5,8 +5,16 @@
 # --------------------------------------------------------------------------
 """Infrastructure for use implementing a high-level async request/response paradigm"""
 import asyncio
+import heapq
+import logging
 import uuid
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# Minimum number of stale deadline entries tolerated before the deadline heap is compacted
+_COMPACTION_THRESHOLD = 64
 
 
 class Response:
@@ -33,8 +41,23 @@ class Request:
 
 class RequestLedger:
     def __init__(self) -> None:
-        self.lock = asyncio.Lock()
+        """Tracks pending Requests until a matching Response is received, or they expire.
+
+        NOTE: The ledger is not thread-safe. All methods must be invoked from the event loop the
+        ledger is used on. Since none of the methods suspend, no lock is required.
+        """
         self.pending: Dict[str, asyncio.Future[Response]] = {}
+        # Heap of (deadline, request_id, future) for requests that were created with a timeout.
+        # Entries are not removed when a request completes - they are discarded lazily.
+        self._deadlines: List[Tuple[float, str, asyncio.Future[Response]]] = []
+        self._expiry_timer: Optional[asyncio.TimerHandle] = None
+        # Spans of pending Requests created during a traced operation
+        self._spans: Dict[str, tracing.Span] = {}
+        # Metrics
+        self.created_count = 0
+        self.matched_count = 0
+        self.expired_count = 0
+        self.peak_outstanding = 0
 
     def __len__(self) -> int:
         return len(self.pending)
@@ -42,20 +65,108 @@ class RequestLedger:
     def __contains__(self, request_id):
         return request_id in self.pending
 
-    async def create_request(self, request_id: Optional[str] = None) -> Request:
+    async def create_request(
+        self, request_id: Optional[str] = None, timeout: Optional[float] = None
+    ) -> Request:
+        """Create a new Request and track it in the ledger.
+
+        :param str request_id: The id of the new Request. If not provided, one is generated.
+        :param float timeout: Time (in seconds) after which the Request will be removed from the
+            ledger and its response will raise asyncio.TimeoutError. If not provided, the Request
+            does not expire.
+
+        :raises: ValueError if the request_id is a duplicate
+        """
         request = Request(request_id=request_id)
-        async with self.lock:
-            if request.request_id not in self.pending:
-                self.pending[request.request_id] = request.response_future
-            else:
-                raise ValueError("Provided request_id is a duplicate")
+        if request.request_id in self.pending:
+            raise ValueError("Provided request_id is a duplicate")
+        self.pending[request.request_id] = request.response_future
+        span = tracing.current_span()
+        if span:
+            span.set_attribute(tracing.ATTRIBUTE_REQUEST_ID, request.request_id)
+            self._spans[request.request_id] = span
+        self.created_count += 1
+        if len(self.pending) > self.peak_outstanding:
+            self.peak_outstanding = len(self.pending)
+        if timeout is not None:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            heapq.heappush(self._deadlines, (deadline, request.request_id, request.response_future))
+            self._compact_deadlines()
+            self._schedule_expiry(loop)
         return request
 
     async def delete_request(self, request_id) -> None:
-        async with self.lock:
-            del self.pending[request_id]
+        del self.pending[request_id]
+        if self._spans:
+            self._spans.pop(request_id, None)
 
     async def match_response(self, response: Response) -> None:
-        async with self.lock:
-            self.pending[response.request_id].set_result(response)
-            del self.pending[response.request_id]
+        future = self.pending.pop(response.request_id)
+        future.set_result(response)
+        self.matched_count += 1
+        if self._spans:
+            span = self._spans.pop(response.request_id, None)
+            if span:
+                span.add_event(
+                    tracing.EVENT_RESPONSE,
+                    {tracing.ATTRIBUTE_RESPONSE_STATUS: response.status},
+                )
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of the ledger metrics"""
+        return {
+            "outstanding": len(self.pending),
+            "peak_outstanding": self.peak_outstanding,
+            "created": self.created_count,
+            "matched": self.matched_count,
+            "expired": self.expired_count,
+        }
+
+    def _is_tracked(self, request_id: str, future: "asyncio.Future[Response]") -> bool:
+        # NOTE: Check the future as well as the id, as a request_id may be reused after the
+        # original request has been removed from the ledger
+        return self.pending.get(request_id) is future
+
+    def _compact_deadlines(self) -> None:
+        """Discard heap entries for requests no longer in the ledger, if they dominate the heap"""
+        if len(self._deadlines) > 2 * len(self.pending) + _COMPACTION_THRESHOLD:
+            self._deadlines = [
+                entry for entry in self._deadlines if self._is_tracked(entry[1], entry[2])
+            ]
+            heapq.heapify(self._deadlines)
+
+    def _schedule_expiry(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Make sure the expiry timer will fire at the earliest deadline in the heap"""
+        if not self._deadlines:
+            if self._expiry_timer:
+                self._expiry_timer.cancel()
+                self._expiry_timer = None
+            return
+        next_deadline = self._deadlines[0][0]
+        if self._expiry_timer:
+            if self._expiry_timer.when() <= next_deadline:
+                return
+            self._expiry_timer.cancel()
+        self._expiry_timer = loop.call_at(next_deadline, self._expire_requests)
+
+    def _expire_requests(self) -> None:
+        """Remove all requests whose deadline has passed, failing them with a TimeoutError"""
+        self._expiry_timer = None
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, request_id, future = heapq.heappop(self._deadlines)
+            if self._is_tracked(request_id, future):
+                del self.pending[request_id]
+                self._spans.pop(request_id, None)
+                self.expired_count += 1
+                if not future.done():
+                    future.set_exception(
+                        asyncio.TimeoutError(
+                            "No response received for request (rid: {})".format(request_id)
+                        )
+                    )
+                logger.debug("Request expired (rid: {})".format(request_id))
+        self._schedule_expiry(loop)
@@ -7,10 +7,16 @@
 
 import abc
 import asyncio
+import contextlib
+import hashlib
+import heapq
+import itertools
 import logging
+import os
 import time
 import urllib.parse
-from typing import Dict, List, Optional, Awaitable, Callable, cast
+import weakref
+from typing import Dict, List, Optional, Awaitable, Callable, Tuple, cast
 from .custom_typing import FunctionOrCoroutine
 from .signing_mechanism import SigningMechanism
 
@@ -20,6 +26,13 @@ logger = logging.getLogger(__name__)
 DEFAULT_TOKEN_UPDATE_MARGIN: int = 120
 REQUIRED_SASTOKEN_FIELDS: List[str] = ["sr", "sig", "se"]
 TOKEN_FORMAT: str = "SharedAccessSignature sr={resource}&sig={signature}&se={expiry}"
+# Maximum number of seconds the timer of a SasTokenRefreshScheduler is set for. Update times are
+# wall clock times, but event loop timers run on a monotonic clock, so a change to the wall clock
+# (e.g. a NTP correction, or resuming from suspend) is not noticed until the timer fires.
+MAX_TIMER_DELAY: float = 60
+# Minimum number of seconds between updates of the SasToken of a SasTokenProvider
+MIN_UPDATE_INTERVAL: float = 1
+CACHE_FILE_SUFFIX: str = ".sastoken"
 
 
 class SasTokenError(Exception):
@@ -130,12 +143,97 @@ class ExternalSasTokenGenerator(SasTokenGenerator):
             raise SasTokenError("Unable to generate SasToken") from e
 
 
+class SasTokenCache:
+    def __init__(self, directory: str, resource_uri: str, identity: str = "") -> None:
+        """Cache of the SasToken for a resource, stored on disk so that it can be reused by a
+        later process (e.g. after a restart) rather than generated again.
+
+        The SasToken is stored in a file accessible only by its owner, named after a hash of the
+        resource URI and identity. The directory is created (accessible only by its owner) if it
+        does not exist.
+
+        :param str directory: The directory to store the SasToken in
+        :param str resource_uri: The URI of the resource the SasToken grants access to
+        :param str identity: Identifies the credentials SasTokens are generated from (e.g. a
+            symmetric key), so that a SasToken generated from other credentials is not reused.
+            It is only used as part of the hash, and is never stored.
+        """
+        self.directory = directory
+        self.resource_uri = resource_uri
+        key = hashlib.sha256("{}\n{}".format(resource_uri, identity).encode("utf-8"))
+        self.path = os.path.join(directory, key.hexdigest() + CACHE_FILE_SUFFIX)
+
+    def load(self, min_expiry_time: float) -> Optional[SasToken]:
+        """Return the cached SasToken, or None if there is no cached SasToken that is valid until
+        at least the given time. Failure to load the SasToken is logged, not raised.
+
+        :param float min_expiry_time: The earliest expiry time acceptable (in seconds since the
+            epoch)
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                if not _is_private(os.fstat(f.fileno())):
+                    logger.warning("Ignoring cached SAS Token (file accessible by other users)")
+                    return None
+                sastoken = SasToken(f.read())
+        except FileNotFoundError:
+            logger.debug("No cached SAS Token")
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Unable to load cached SAS Token: {}".format(e))
+            return None
+        if sastoken.resource_uri != self.resource_uri:
+            logger.warning("Ignoring cached SAS Token (different resource URI)")
+            return None
+        if sastoken.expiry_time < min_expiry_time:
+            logger.debug("Ignoring cached SAS Token (expires too soon)")
+            return None
+        return sastoken
+
+    def store(self, sastoken: SasToken) -> None:
+        """Store a SasToken in the cache, replacing any SasToken already cached. Failure to store
+        the SasToken is logged, not raised.
+
+        :param sastoken: The SasToken to store
+        :type sastoken: SasToken
+        """
+        # NOTE: Writing to a temporary file and then replacing the cached one means that a
+        # concurrent load (e.g. by another process) never reads a partially written SasToken
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            # NOTE: A file left behind by a previous process may have other permissions, so
+            # remove it rather than reuse it
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(str(sastoken))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Unable to cache SAS Token: {}".format(e))
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+
+
 class SasTokenProvider:
-    def __init__(self, generator: SasTokenGenerator) -> None:
+    def __init__(
+        self,
+        generator: SasTokenGenerator,
+        refresh_scheduler: Optional["SasTokenRefreshScheduler"] = None,
+        cache: Optional[SasTokenCache] = None,
+    ) -> None:
         """Object responsible for providing a valid SasToken.
 
         :param generator: A SasTokenGenerator to generate SasTokens with
         :type generator: SasTokenGenerator
+        :param refresh_scheduler: A SasTokenRefreshScheduler shared with other
+            SasTokenProviders, to schedule token updates with. If not provided, the default
+            SasTokenRefreshScheduler of the running event loop will be used.
+        :type refresh_scheduler: SasTokenRefreshScheduler
+        :param cache: A SasTokenCache to reuse a SasToken from upon start (if it remains valid
+            for longer than the token update margin), and to store each new SasToken in.
+        :type cache: SasTokenCache
         """
         # NOTE: There is no good way to invoke a coroutine from within the __init__, and since
         # the the generator's .sign() method is a coroutine, that means we can't generate an
@@ -145,43 +243,66 @@ class SasTokenProvider:
         # problem with the generator_fn, so a factory coroutine method has been implemented.
         self._event_loop = asyncio.get_running_loop()
         self._generator = generator
+        if refresh_scheduler is None:
+            refresh_scheduler = _get_default_refresh_scheduler()
+        self._refresh_scheduler = refresh_scheduler
+        self._cache = cache
         self._token_update_margin = DEFAULT_TOKEN_UPDATE_MARGIN
         self._new_sastoken_available = asyncio.Condition()
 
         # Will be set upon `.start()`
         self._current_token: Optional[SasToken] = None
-        self._keep_token_fresh_bg_task: Optional[asyncio.Task[None]] = None
+        self._refresh_scheduled = False
+
+        # Metrics
+        self.refresh_count = 0
+        self.refresh_failure_count = 0
 
-    async def _keep_token_fresh(self):
-        """Runs indefinitely and will generate a SasToken when the current one gets close to
-        expiration (based on the update margin)
+    async def _update_token(self) -> float:
+        """Generate a new SasToken to replace the current one.
+        Returns the time at which the next SasToken should be generated.
         """
-        generate_time = self._current_token.expiry_time - self._token_update_margin
-        while True:
-            await _wait_until(generate_time)
-            try:
-                logger.debug("Updating SAS Token...")
-                self._current_token = await self._generator.generate_sastoken()
-                logger.debug("SAS Token update succeeded")
-                # TODO: validate that this is a valid token?
-                generate_time = self._current_token.expiry_time - self._token_update_margin
-                async with self._new_sastoken_available:
-                    self._new_sastoken_available.notify_all()
-            except Exception:
-                logger.error("SAS Token renewal failed. Trying again in 10 seconds")
-                generate_time = time.time() + 10
+        try:
+            logger.debug("Updating SAS Token...")
+            new_token = await self._generator.generate_sastoken()
+            self._current_token = new_token
+            self.refresh_count += 1
+            logger.debug("SAS Token update succeeded")
+            if self._cache:
+                self._cache.store(new_token)
+            # TODO: validate that this is a valid token?
+            generate_time = new_token.expiry_time - self._token_update_margin
+            async with self._new_sastoken_available:
+                self._new_sastoken_available.notify_all()
+            return generate_time
+        except Exception:
+            self.refresh_failure_count += 1
+            logger.error("SAS Token renewal failed. Trying again in 10 seconds")
+            return time.time() + 10
 
     async def start(self):
         """Begin running the SasTokenProvider, ensuring that the current token is always valid"""
-        if not self._keep_token_fresh_bg_task:
+        if not self._refresh_scheduled:
             logger.debug("Starting SasTokenProvider")
-            initial_token = await self._generator.generate_sastoken()
-            if initial_token.expiry_time < time.time():
-                raise SasTokenError("Newly generated SAS Token has already expired")
+            initial_token = None
+            if self._cache:
+                initial_token = self._cache.load(
+                    min_expiry_time=time.time() + self._token_update_margin
+                )
+            if initial_token:
+                logger.debug("Using cached SAS Token")
+            else:
+                initial_token = await self._generator.generate_sastoken()
+                if initial_token.expiry_time < time.time():
+                    raise SasTokenError("Newly generated SAS Token has already expired")
+                if self._cache:
+                    self._cache.store(initial_token)
             self._current_token = initial_token
             async with self._new_sastoken_available:
                 self._new_sastoken_available.notify_all()
-            self._keep_token_fresh_bg_task = asyncio.create_task(self._keep_token_fresh())
+            generate_time = initial_token.expiry_time - self._token_update_margin
+            self._refresh_scheduler.schedule(self, generate_time)
+            self._refresh_scheduled = True
         else:
             logger.debug("SasTokenProvider already running, no need to start")
 
@@ -189,12 +310,10 @@ class SasTokenProvider:
         """Stop running the SasTokenProvider, clearing the current token.
         Does nothing if already stopped.
         """
-        # Cancel and wait for cancellation to complete
-        if self._keep_token_fresh_bg_task:
+        if self._refresh_scheduled:
             logger.debug("Stopping SasTokenProvider")
-            self._keep_token_fresh_bg_task.cancel()
-            await asyncio.gather(self._keep_token_fresh_bg_task, return_exceptions=True)
-            self._keep_token_fresh_bg_task = None
+            await self._refresh_scheduler.unschedule(self)
+            self._refresh_scheduled = False
             # NOTE: There is an argument to be made that this value shouldn't be cleared,
             # as the SasTokenProvider may be started again while it remains valid, but for
             # now, we clear it for simplicity.
@@ -202,6 +321,14 @@ class SasTokenProvider:
         else:
             logger.debug("SasTokenProvider was not running, no need to stop")
 
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Snapshot of the provider metrics"""
+        return {
+            "token_refreshes": self.refresh_count,
+            "token_refresh_failures": self.refresh_failure_count,
+        }
+
     def get_current_sastoken(self) -> SasToken:
         """Return the current SasToken"""
         if self._current_token:
@@ -216,6 +343,149 @@ class SasTokenProvider:
         return self.get_current_sastoken()
 
 
+class SasTokenRefreshScheduler:
+    def __init__(self) -> None:
+        """Object that updates the SasTokens of many SasTokenProviders from a single event loop
+        timer, set for the earliest scheduled update. No work is done between updates, regardless
+        of how many SasTokenProviders are scheduled.
+
+        Must be created from within an event loop, and used only from within that event loop.
+        """
+        # Heap of (generate time, entry id, provider). Entries are invalidated by removing the
+        # provider from the scheduled entries, rather than by removing them from the heap.
+        self._schedule: List[Tuple[float, int, SasTokenProvider]] = []
+        self._scheduled_entries: Dict[SasTokenProvider, int] = {}
+        self._entry_ids = itertools.count()
+        self._updates: Dict[SasTokenProvider, asyncio.Task[None]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def schedule(self, provider: SasTokenProvider, when: float) -> None:
+        """Schedule an update of the SasToken of a SasTokenProvider. Upon completion of the
+        update, the next update is scheduled automatically.
+
+        :param provider: The SasTokenProvider to update the SasToken of
+        :type provider: SasTokenProvider
+        :param float when: The time to update at, in seconds, since epoch
+        """
+        entry_id = next(self._entry_ids)
+        self._scheduled_entries[provider] = entry_id
+        heapq.heappush(self._schedule, (when, entry_id, provider))
+        self._compact()
+        # Only the earliest update needs a timer
+        if self._schedule[0][1] == entry_id:
+            self._set_timer()
+
+    async def unschedule(self, provider: SasTokenProvider) -> None:
+        """Stop updating the SasToken of a SasTokenProvider, cancelling any update in progress.
+        Does nothing if no update is scheduled.
+
+        :param provider: The SasTokenProvider to stop updating the SasToken of
+        :type provider: SasTokenProvider
+        """
+        if self._scheduled_entries.pop(provider, None) is not None:
+            if self._scheduled_entries:
+                self._compact()
+            else:
+                self._clear_timer()
+                self._schedule.clear()
+        update = self._updates.pop(provider, None)
+        if update:
+            update.cancel()
+            await asyncio.gather(update, return_exceptions=True)
+
+    async def stop(self) -> None:
+        """Stop all scheduled updates, cancelling any in progress"""
+        self._clear_timer()
+        updates = list(self._updates.values())
+        for update in updates:
+            update.cancel()
+        await asyncio.gather(*updates, return_exceptions=True)
+        self._updates.clear()
+        self._scheduled_entries.clear()
+        self._schedule.clear()
+
+    def _compact(self) -> None:
+        """Rebuild the heap without its invalidated entries, once they outnumber the valid ones
+        (e.g. after many SasTokenProviders have been unscheduled)"""
+        if len(self._schedule) > 2 * len(self._scheduled_entries) + 64:
+            self._schedule = [
+                entry
+                for entry in self._schedule
+                if self._scheduled_entries.get(entry[2]) == entry[1]
+            ]
+            heapq.heapify(self._schedule)
+
+    def _clear_timer(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def _set_timer(self) -> None:
+        """Set the timer for the earliest valid entry in the schedule, replacing any existing
+        timer. No timer is set if nothing is scheduled."""
+        self._clear_timer()
+        while self._schedule:
+            when, entry_id, provider = self._schedule[0]
+            if self._scheduled_entries.get(provider) == entry_id:
+                break
+            heapq.heappop(self._schedule)
+        else:
+            return
+        # NOTE: The delay is limited so that a change to the wall clock is noticed within
+        # MAX_TIMER_DELAY. If the timer fires before the update is due (e.g. because the clock was
+        # set back), it is simply set again.
+        delay = min(when - time.time(), MAX_TIMER_DELAY)
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_at(loop.time() + delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        """Start the updates that are due, then set the timer for the next one"""
+        self._timer = None
+        now = time.time()
+        while self._schedule and self._schedule[0][0] <= now:
+            _, entry_id, provider = heapq.heappop(self._schedule)
+            if self._scheduled_entries.get(provider) == entry_id:
+                del self._scheduled_entries[provider]
+                self._updates[provider] = asyncio.create_task(self._update(provider))
+        self._set_timer()
+
+    async def _update(self, provider: SasTokenProvider) -> None:
+        try:
+            generate_time = await provider._update_token()
+        finally:
+            if self._updates.get(provider) is asyncio.current_task():
+                del self._updates[provider]
+        # NOTE: A SasToken may already be due for update when it is generated (e.g. if its TTL is
+        # shorter than the update margin), which would otherwise cause continuous updates
+        self.schedule(provider, max(generate_time, time.time() + MIN_UPDATE_INTERVAL))
+
+
+# NOTE: SasTokenProviders that are not given a SasTokenRefreshScheduler share a default one for
+# their event loop. It needs no cleanup, as it only holds a timer while updates are scheduled, and
+# SasTokenProviders unschedule themselves when stopped.
+_default_refresh_schedulers: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SasTokenRefreshScheduler]"
+) = weakref.WeakKeyDictionary()
+
+
+def _get_default_refresh_scheduler() -> SasTokenRefreshScheduler:
+    """Return the default SasTokenRefreshScheduler of the running event loop"""
+    loop = asyncio.get_running_loop()
+    scheduler = _default_refresh_schedulers.get(loop)
+    if scheduler is None:
+        scheduler = SasTokenRefreshScheduler()
+        _default_refresh_schedulers[loop] = scheduler
+    return scheduler
+
+
+def _is_private(stat: os.stat_result) -> bool:
+    """Return whether a file is owned by the current user, and inaccessible to other users"""
+    if os.name != "posix":
+        # NOTE: Ownership and permission bits are only meaningful on POSIX systems
+        return True
+    return stat.st_uid == os.getuid() and not stat.st_mode & 0o077
+
+
 def _get_sastoken_info_from_string(sastoken_string: str) -> Dict[str, str]:
     """Given a SAS Token string, return a dictionary of it's keys and values"""
     pieces = sastoken_string.split("SharedAccessSignature ")
@@ -238,18 +508,3 @@ def _get_sastoken_info_from_string(sastoken_string: str) -> Dict[str, str]:
         logger.warning("Unexpected fields present in SAS Token")
 
     return sastoken_info
-
-
-# NOTE: Arguably, this doesn't really belong in this module, give it's lack of a specific
-# relationship to SAS Tokens, and the fact that it needs to be unit-tested separately.
-# These things suggest it should be more than just a convention-private helper, however
-# its hard to justify making a separate module just for this function.
-# This would be a candidate for some kind of misc utility module if other similar functions
-# pop up over the course of development. Until then, it lives here.
-async def _wait_until(when: float) -> None:
-    """Wait until a specific time has passed (accurate within 1 second).
-
-    :param float when: The time to wait for, in seconds, since epoch
-    """
-    while time.time() < when:
-        await asyncio.sleep(1)
@@ -0,0 +1,125 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""Infrastructure for running many IoTHubSessions within a single process"""
+import asyncio
+import concurrent.futures
+import logging
+import ssl
+from types import TracebackType
+from typing import Any, Optional, Type
+from . import sastoken as st
+from .iothub_session import IoTHubSession, _default_ssl_context
+from .metrics import MetricsProvider
+from .tracing import Tracer
+from .network_loop import SharedNetworkLoop
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS: int = 16
+
+
+class SessionHost:
+    def __init__(
+        self,
+        *,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        metrics_provider: Optional[MetricsProvider] = None,
+        tracer: Optional[Tracer] = None,
+    ) -> None:
+        """Object that hosts many IoTHubSessions within a single process, sharing the resources
+        they require between them, rather than each IoTHubSession having resources of its own.
+
+        - The network I/O of all IoTHubSessions is performed by a single thread
+        - Blocking operations (e.g. establishing a connection) run in a single bounded executor
+        - A single default SSLContext is used, so default certificates are only loaded once
+        - SAS Token updates for all IoTHubSessions are scheduled from a single event loop timer
+
+        Use as an async context manager, and create IoTHubSessions with `.create_session()` or
+        `.create_session_from_connection_string()`. All IoTHubSessions must be exited before
+        the SessionHost is.
+
+        :param int max_workers: Maximum number of threads used for blocking operations. This
+            limits how many IoTHubSessions can be establishing a connection at the same time.
+        :param metrics_provider: A MetricsProvider to export the metrics of all IoTHubSessions
+            created by the SessionHost to (unless they are given one of their own).
+        :type metrics_provider: :class:`azure.iot.device.metrics.MetricsProvider`
+        :param tracer: A Tracer to trace the operations of all IoTHubSessions created by the
+            SessionHost with (unless they are given one of their own).
+        :type tracer: :class:`azure.iot.device.tracing.Tracer`
+
+        :raises: ValueError if an invalid 'max_workers' is provided
+        """
+        if max_workers < 1:
+            raise ValueError("'max_workers' must be at least 1")
+        self.network_loop = SharedNetworkLoop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="azure-iot-session-host"
+        )
+        self.refresh_scheduler = st.SasTokenRefreshScheduler()
+        self.metrics_provider = metrics_provider
+        self.tracer = tracer
+        # Will be created upon first use
+        self._default_ssl_context: Optional[ssl.SSLContext] = None
+
+    async def __aenter__(self) -> "SessionHost":
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_val: Optional[BaseException],
+        traceback: TracebackType,
+    ) -> None:
+        await self.shutdown()
+
+    async def shutdown(self) -> None:
+        """Stop all background activity, and release the shared resources"""
+        logger.debug("Shutting down SessionHost")
+        await self.refresh_scheduler.stop()
+        # NOTE: Stopping the network loop and the executor waits for their threads to exit, so
+        # do it on another thread to avoid blocking the event loop.
+        await asyncio.get_running_loop().run_in_executor(None, self._stop_threads)
+
+    def _stop_threads(self) -> None:
+        self.network_loop.close()
+        self.executor.shutdown(wait=True)
+
+    def default_ssl_context(self) -> ssl.SSLContext:
+        """Return the default SSLContext shared by IoTHubSessions that were not provided one"""
+        if not self._default_ssl_context:
+            self._default_ssl_context = _default_ssl_context()
+        return self._default_ssl_context
+
+    def create_session(self, **kwargs: Any) -> IoTHubSession:
+        """Create an IoTHubSession that uses the resources of this SessionHost.
+
+        Takes the same arguments as the IoTHubSession constructor.
+
+        :returns: A new instance of IoTHubSession
+        :rtype: IoTHubSession
+        """
+        if self.metrics_provider:
+            kwargs.setdefault("metrics_provider", self.metrics_provider)
+        if self.tracer:
+            kwargs.setdefault("tracer", self.tracer)
+        return IoTHubSession(host=self, **kwargs)
+
+    def create_session_from_connection_string(
+        self, connection_string: str, **kwargs: Any
+    ) -> IoTHubSession:
+        """Create an IoTHubSession that uses the resources of this SessionHost, from an IoT Hub
+        device or module connection string.
+
+        Takes the same arguments as `IoTHubSession.from_connection_string()`.
+
+        :returns: A new instance of IoTHubSession
+        :rtype: IoTHubSession
+        """
+        if self.metrics_provider:
+            kwargs.setdefault("metrics_provider", self.metrics_provider)
+        if self.tracer:
+            kwargs.setdefault("tracer", self.tracer)
+        return IoTHubSession.from_connection_string(connection_string, host=self, **kwargs)
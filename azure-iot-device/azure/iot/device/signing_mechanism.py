@@ -4,14 +4,20 @@
 # license information.
 # --------------------------------------------------------------------------
 import abc
+import asyncio
 import base64
 import binascii
+import concurrent.futures
 import hmac
 import hashlib
-from typing import AnyStr
+import itertools
+from typing import AnyStr, Iterable, List, Optional
 
 # TODO: remove commented signatures
 
+# Number of data strings signed per job when signing across an executor
+DEFAULT_SIGN_MANY_CHUNK_SIZE: int = 1000
+
 
 class SigningMechanism(abc.ABC):
     @abc.abstractmethod
@@ -43,6 +49,9 @@ class SymmetricKeySigningMechanism(SigningMechanism):
             self._signing_key = base64.b64decode(key_bytes)
         except (binascii.Error):
             raise ValueError("Invalid Symmetric Key")
+        # NOTE: Keying an HMAC hashes the key into the inner and outer digest states. Doing it
+        # once here, and copying the keyed HMAC for each signature, avoids repeating that work.
+        self._hmac = hmac.HMAC(key=self._signing_key, digestmod=hashlib.sha256)
 
     async def sign(self, data_str: AnyStr) -> str:
         """
@@ -59,19 +68,73 @@ class SymmetricKeySigningMechanism(SigningMechanism):
         # NOTE: This implementation doesn't take advantage of being a coroutine, but this is by
         # design. See the definition of the abstract base class above.
 
-        # Convert data_str to bytes (if not already)
-        if isinstance(data_str, str):
-            data_bytes = data_str.encode("utf-8")
-        else:
-            data_bytes = data_str
+        return _sign(self._hmac, data_str)
 
-        # Derive signature via HMAC-SHA256 algorithm
-        try:
-            hmac_digest = hmac.HMAC(
-                key=self._signing_key, msg=data_bytes, digestmod=hashlib.sha256
-            ).digest()
-            signed_data = base64.b64encode(hmac_digest)
-        except (TypeError):
-            raise ValueError("Unable to sign string using the provided symmetric key")
-        # Convert from bytes to string
-        return signed_data.decode("utf-8")
+    async def sign_many(
+        self,
+        data_strs: Iterable[AnyStr],
+        executor: Optional[concurrent.futures.Executor] = None,
+        chunk_size: int = DEFAULT_SIGN_MANY_CHUNK_SIZE,
+    ) -> List[str]:
+        """
+        Sign many data strings with symmetric key and the HMAC-SHA256 algorithm.
+
+        Useful for generating SAS tokens for a fleet of devices, or for deriving the device keys
+        of a DPS enrollment group (by signing each registration id with the group key).
+
+        :param data_strs: Data strings to be signed
+        :type data_strs: iterable of str or bytes
+        :param executor: Executor to sign across, in chunks. A ProcessPoolExecutor signs in
+            parallel, whereas a ThreadPoolExecutor only keeps the event loop free, as signing
+            short data strings holds the GIL. If not provided, the data strings are signed on the
+            event loop.
+        :type executor: :class:`concurrent.futures.Executor`
+        :param int chunk_size: Number of data strings signed per job submitted to the executor
+
+        :returns: The signed data, in the same order as the data strings
+        :rtype: list of str
+
+        :raises: ValueError if an invalid data string is provided
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer")
+        if executor is None:
+            return [_sign(self._hmac, data_str) for data_str in data_strs]
+
+        # NOTE: HMAC objects cannot be pickled, so the signing key is sent to the executor
+        # instead, and each job keys its own HMAC.
+        loop = asyncio.get_running_loop()
+        data_iter = iter(data_strs)
+        futures = []
+        while True:
+            chunk = list(itertools.islice(data_iter, chunk_size))
+            if not chunk:
+                break
+            futures.append(loop.run_in_executor(executor, _sign_all, self._signing_key, chunk))
+        results = await asyncio.gather(*futures)
+        return [signature for chunk_signatures in results for signature in chunk_signatures]
+
+
+def _sign(keyed_hmac: "hmac.HMAC", data_str: AnyStr) -> str:
+    """Sign a data string with a copy of a keyed HMAC"""
+    # Convert data_str to bytes (if not already)
+    if isinstance(data_str, str):
+        data_bytes = data_str.encode("utf-8")
+    else:
+        data_bytes = data_str
+
+    # Derive signature via HMAC-SHA256 algorithm
+    try:
+        signer = keyed_hmac.copy()
+        signer.update(data_bytes)
+        signed_data = base64.b64encode(signer.digest())
+    except (TypeError):
+        raise ValueError("Unable to sign string using the provided symmetric key")
+    # Convert from bytes to string
+    return signed_data.decode("utf-8")
+
+
+def _sign_all(signing_key: bytes, data_strs: List[AnyStr]) -> List[str]:
+    """Sign a list of data strings with a signing key. Run in an executor by .sign_many()"""
+    keyed_hmac = hmac.HMAC(key=signing_key, digestmod=hashlib.sha256)
+    return [_sign(keyed_hmac, data_str) for data_str in data_strs]
@@ -0,0 +1,204 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""Infrastructure for tracing the operations of IoTHubSessions"""
+import contextlib
+import contextvars
+import logging
+from typing import Any, Dict, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+AttributeValue = Union[str, int, float, bool]
+Attributes = Dict[str, AttributeValue]
+
+# Attributes set on spans
+ATTRIBUTE_DEVICE_ID = "azure_iot.device_id"
+ATTRIBUTE_MODULE_ID = "azure_iot.module_id"
+ATTRIBUTE_TOPIC_CLASS = "azure_iot.topic_class"
+ATTRIBUTE_REQUEST_ID = "azure_iot.request_id"
+ATTRIBUTE_RESPONSE_STATUS = "azure_iot.response_status"
+ATTRIBUTE_MID = "mqtt.mid"
+ATTRIBUTE_PAYLOAD_SIZE = "messaging.message.body.size"
+
+# Values of ATTRIBUTE_TOPIC_CLASS
+TOPIC_CLASS_TELEMETRY = "telemetry"
+TOPIC_CLASS_DIRECT_METHOD_RESPONSE = "direct_method_response"
+TOPIC_CLASS_TWIN_PATCH = "twin_patch"
+TOPIC_CLASS_TWIN_REQUEST = "twin_request"
+
+# Events added to spans. The time between them shows where latency builds up:
+#   span start -> EVENT_PUBLISH: waiting for the event loop and the publish lock
+#   EVENT_PUBLISH -> EVENT_PUBLISHED: waiting for the executor and Paho
+#   EVENT_PUBLISHED -> EVENT_PUBACK: network and IoT Hub
+#   EVENT_PUBLISHED -> EVENT_RESPONSE: IoT Hub processing a request (twin operations only, and
+#       the response may be received before the PUBACK)
+#   last event -> span end: waiting for the event loop to resume the operation
+EVENT_PUBLISH = "mqtt.publish"
+EVENT_PUBLISHED = "mqtt.published"
+EVENT_PUBACK = "mqtt.puback"
+EVENT_RESPONSE = "azure_iot.response"
+
+# NOTE: The span of the operation in progress is tracked in a context variable so that the layers
+# below the Session can annotate it without it being passed through every call. Tasks copy the
+# context they are created in, so any Task created during an operation inherits its span.
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar(
+    "azure_iot_current_span", default=None
+)
+
+
+class Span:
+    def __init__(self) -> None:
+        """A single traced operation, created by a Tracer.
+
+        This base class discards everything recorded on it. Subclass it in order to record spans
+        with a tracing system.
+        """
+        pass
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        """Set an attribute on the span.
+
+        :param str key: The name of the attribute
+        :param value: The value of the attribute
+        """
+        pass
+
+    def add_event(
+        self, name: str, attributes: Optional[Attributes] = None, timestamp: Optional[int] = None
+    ) -> None:
+        """Record an event that occurred during the span.
+
+        :param str name: The name of the event
+        :param dict attributes: Attributes of the event
+        :param int timestamp: Time the event occurred (in nanoseconds since the epoch). If not
+            provided, the event occurred at the time of invocation.
+        """
+        pass
+
+    def record_exception(self, exception: BaseException) -> None:
+        """Record that the operation failed with an exception.
+
+        :param exception: The exception the operation failed with
+        """
+        pass
+
+    def inject(self, carrier: Dict[str, str]) -> None:
+        """Add the trace context of the span to a carrier, so that the trace can be continued by
+        the receiver of the carrier.
+
+        :param dict carrier: The dictionary to add the trace context to (e.g. the custom
+            properties of a Message)
+        """
+        pass
+
+    def end(self) -> None:
+        """End the span"""
+        pass
+
+
+class Tracer:
+    def __init__(self) -> None:
+        """Object that creates spans for the operations of IoTHubSessions, in order to record them
+        with a tracing system.
+
+        This base class creates spans that discard everything recorded on them. Subclass it (or
+        use `OpenTelemetryTracer`) to record spans.
+
+        A span is started when an operation (e.g. sending a Message) is invoked on the Session,
+        and ended when the operation returns. In between, the layers below annotate it with the
+        MQTT message id, request id, topic class and payload size, as well as events marking the
+        publish, the PUBACK and (for twin operations) the response.
+        """
+        pass
+
+    def start_span(self, name: str, attributes: Attributes) -> Span:
+        """Start a new span.
+
+        :param str name: The name of the operation (e.g. 'IoTHubSession.send_message')
+        :param dict attributes: The attributes identifying the Session
+        :returns: The new span
+        """
+        return Span()
+
+
+class OpenTelemetryTracer(Tracer):
+    def __init__(self, tracer: Any) -> None:
+        """Tracer that records spans with OpenTelemetry, as children of the current OpenTelemetry
+        span (if any) when the operation is invoked.
+
+        The trace context of a span is injected using the globally configured OpenTelemetry
+        propagator (W3C Trace Context by default).
+
+        Requires the 'opentelemetry-api' package.
+
+        :param tracer: The OpenTelemetry Tracer to create spans with
+        :type tracer: :class:`opentelemetry.trace.Tracer`
+        """
+        super().__init__()
+        # NOTE: OpenTelemetry is an optional dependency, so it is not imported until used
+        from opentelemetry import propagate, trace  # type: ignore[import]
+
+        self._tracer = tracer
+        self._propagate = propagate
+        self._trace = trace
+
+    def start_span(self, name: str, attributes: Attributes) -> Span:
+        span = self._tracer.start_span(
+            name, kind=self._trace.SpanKind.CLIENT, attributes=attributes
+        )
+        return _OpenTelemetrySpan(span, self._propagate, self._trace)
+
+
+class _OpenTelemetrySpan(Span):
+    def __init__(self, span: Any, propagate: Any, trace: Any) -> None:
+        super().__init__()
+        self._span = span
+        self._propagate = propagate
+        self._trace = trace
+
+    def set_attribute(self, key: str, value: AttributeValue) -> None:
+        self._span.set_attribute(key, value)
+
+    def add_event(
+        self, name: str, attributes: Optional[Attributes] = None, timestamp: Optional[int] = None
+    ) -> None:
+        self._span.add_event(name, attributes=attributes, timestamp=timestamp)
+
+    def record_exception(self, exception: BaseException) -> None:
+        self._span.record_exception(exception)
+        self._span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, repr(exception)))
+
+    def inject(self, carrier: Dict[str, str]) -> None:
+        self._propagate.inject(carrier, context=self._trace.set_span_in_context(self._span))
+
+    def end(self) -> None:
+        self._span.end()
+
+
+def current_span() -> Optional[Span]:
+    """Return the span of the operation in progress in the current context, if any"""
+    return _current_span.get()
+
+
+@contextlib.contextmanager
+def use_span(span: Span) -> Iterator[Span]:
+    """Make a span current for the duration of the context, and end it upon exit, recording any
+    exception raised within the context"""
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def detach_span() -> None:
+    """Stop the current context from being associated with the span of an operation (e.g. in a
+    Task that outlives the operation it was created during)"""
+    _current_span.set(None)
@@ -0,0 +1,327 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""Infrastructure for maintaining and modifying Twin data locally"""
+import asyncio
+import copy
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set
+from .custom_typing import JSONSerializable, Twin, TwinPatch
+from .mqtt_client import MQTTError
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "$version"
+DEFAULT_COALESCE_MAX_SIZE: int = 8192
+
+
+class TwinCache:
+    def __init__(self, get_twin_fn: Callable[[], Awaitable[Twin]]) -> None:
+        """A local copy of a Twin that is kept up to date by applying desired property patches.
+
+        A full Twin is only retrieved upon `.refresh()`, or when a gap in the desired property
+        versions indicates that a patch was missed.
+
+        :param get_twin_fn: A coroutine function that takes no arguments and returns a full Twin
+            retrieved from IoT Hub
+        """
+        self._get_twin = get_twin_fn
+        self._twin: Optional[Twin] = None
+
+    async def refresh(self) -> None:
+        """Retrieve a full Twin, replacing the cached one"""
+        logger.debug("Retrieving full Twin for cache...")
+        twin = await self._get_twin()
+        self._twin = twin
+        logger.debug("Twin cache refreshed (desired $version: {})".format(self.desired_version))
+
+    async def apply_desired_patch(self, patch: TwinPatch) -> None:
+        """Apply a desired property patch to the cached Twin.
+
+        - Patches that are not newer than the cached desired properties are discarded.
+        - Patches that are the next expected version are merged into the cached desired properties
+        - Patches that are further ahead than the next expected version result in a refresh of
+            the entire Twin, since at least one patch was missed.
+
+        :param patch: The desired property patch received from IoT Hub
+        :type patch: dict
+        """
+        if self._twin is None:
+            await self.refresh()
+            return
+
+        patch_version = patch.get(VERSION_KEY)
+        current_version = self.desired_version
+        if not isinstance(patch_version, int) or current_version is None:
+            logger.warning("Cannot determine desired property version. Refreshing Twin cache")
+            await self.refresh()
+        elif patch_version <= current_version:
+            logger.debug(
+                "Discarding stale desired property patch ($version {}, cached $version {})".format(
+                    patch_version, current_version
+                )
+            )
+        elif patch_version == current_version + 1:
+            merge_patch(self._twin["desired"], patch)
+            logger.debug(
+                "Desired property patch applied to Twin cache ($version {})".format(patch_version)
+            )
+        else:
+            logger.debug(
+                "Gap in desired property versions detected ($version {}, cached $version {}). Refreshing Twin cache".format(
+                    patch_version, current_version
+                )
+            )
+            await self.refresh()
+
+    def apply_reported_patch(self, patch: TwinPatch) -> None:
+        """Apply a reported property patch (that has been accepted by IoT Hub) to the cached Twin.
+
+        NOTE: The reported properties $version is not updated, as it is assigned by IoT Hub.
+
+        :param patch: The reported property patch sent to IoT Hub
+        :type patch: dict
+        """
+        if self._twin is not None:
+            merge_patch(self._twin.setdefault("reported", {}), patch)
+
+    def get_twin(self) -> Twin:
+        """Return a copy of the cached Twin
+
+        :raises: RuntimeError if the cache has not yet been populated
+        """
+        if self._twin is None:
+            raise RuntimeError("Twin cache has not been populated")
+        return copy.deepcopy(self._twin)
+
+    @property
+    def desired_version(self) -> Optional[int]:
+        """The $version of the cached desired properties (None if not yet populated)"""
+        if self._twin is None:
+            return None
+        version = self._twin.get("desired", {}).get(VERSION_KEY)
+        return version if isinstance(version, int) else None
+
+
+class ReportedPropertiesCoalescer:
+    def __init__(
+        self,
+        send_patch_fn: Callable[[TwinPatch], Awaitable[None]],
+        linger: float,
+        max_size: int = DEFAULT_COALESCE_MAX_SIZE,
+    ) -> None:
+        """Object that merges reported property patches sent within a window of time into a
+        single patch, in order to reduce the number of round trips to IoT Hub.
+
+        :param send_patch_fn: A coroutine function that sends a reported property patch to
+            IoT Hub, and returns once it has been acknowledged
+        :param float linger: Time (in seconds) to wait for more patches after the first patch of
+            a batch is received, before sending the batch
+        :param int max_size: Approximate size (in bytes) at which a batch will be sent immediately,
+            without waiting for the linger time to expire
+        """
+        if linger < 0:
+            raise ValueError("'linger' cannot be negative")
+        if max_size <= 0:
+            raise ValueError("'max_size' must be greater than 0")
+        self._send_patch = send_patch_fn
+        self._linger = linger
+        self._max_size = max_size
+
+        # Current batch
+        self._batch_patch: Optional[TwinPatch] = None
+        self._batch_size = 0
+        self._batch_done: Optional[asyncio.Future[None]] = None
+        self._linger_timer: Optional[asyncio.TimerHandle] = None
+
+        # Batches that have been sent, but not yet acknowledged
+        self._in_flight: Set[asyncio.Task[None]] = set()
+
+    async def send_patch(self, patch: TwinPatch, timeout: Optional[float] = None) -> None:
+        """Add a reported property patch to the current batch, and wait for the batch to be
+        acknowledged by IoT Hub.
+
+        Cancelling this coroutine (or it timing out) does not remove the patch from the batch.
+
+        :param patch: The reported property patch to send
+        :type patch: dict
+        :param float timeout: Time (in seconds) to wait for the batch to be acknowledged. If not
+            provided, waits indefinitely.
+
+        :raises: Any error raised while sending the batch the patch was added to
+        :raises: asyncio.TimeoutError if the batch is not acknowledged within the timeout
+        """
+        if self._batch_patch is not None and not _can_coalesce(self._batch_patch, patch):
+            # Merging this patch would change the outcome compared to sending separately
+            self._flush()
+        if self._batch_patch is None or self._batch_done is None:
+            self._start_batch()
+        # NOTE: The asserts help the type checker - `._start_batch()` sets these values
+        assert self._batch_patch is not None
+        assert self._batch_done is not None
+        _coalesce(self._batch_patch, patch)
+        self._batch_size += len(json.dumps(patch))
+        batch_done = self._batch_done
+        if self._batch_size >= self._max_size:
+            self._flush()
+        # Shield the batch so that cancelling one caller does not affect other callers
+        if timeout is None:
+            await asyncio.shield(batch_done)
+        else:
+            await _shield_with_timeout(batch_done, timeout)
+
+    async def stop(self) -> None:
+        """Stop the coalescer, abandoning any batch that is waiting to be sent or waiting to
+        be acknowledged.
+
+        Callers waiting on an abandoned batch receive an MQTTError. They are not cancelled, as
+        it is not their own Task that was cancelled.
+        """
+        if self._linger_timer:
+            self._linger_timer.cancel()
+            self._linger_timer = None
+        if self._batch_done and not self._batch_done.done():
+            self._batch_done.set_exception(_stopped_error())
+        self._batch_patch = None
+        self._batch_done = None
+        self._batch_size = 0
+        in_flight = list(self._in_flight)
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+
+    def _start_batch(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._batch_patch = {}
+        self._batch_size = 0
+        self._batch_done = loop.create_future()
+        self._linger_timer = loop.call_later(self._linger, self._flush)
+
+    def _flush(self) -> None:
+        """Send the current batch"""
+        if self._linger_timer:
+            self._linger_timer.cancel()
+            self._linger_timer = None
+        if self._batch_patch is None or self._batch_done is None:
+            return
+        patch = self._batch_patch
+        batch_done = self._batch_done
+        self._batch_patch = None
+        self._batch_done = None
+        self._batch_size = 0
+        logger.debug("Sending coalesced reported property patch")
+        task = asyncio.create_task(self._send_batch(patch, batch_done))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _send_batch(self, patch: TwinPatch, batch_done: "asyncio.Future[None]") -> None:
+        # NOTE: A batch merges the patches of many operations, and may outlive the operation it
+        # was flushed during, so it must not annotate that operation's span (if traced)
+        tracing.detach_span()
+        try:
+            await self._send_patch(patch)
+        except asyncio.CancelledError:
+            # NOTE: Only this internal Task was cancelled, not the callers waiting on the batch
+            if not batch_done.done():
+                batch_done.set_exception(_stopped_error())
+            raise
+        except Exception as e:
+            if not batch_done.done():
+                batch_done.set_exception(e)
+        else:
+            if not batch_done.done():
+                batch_done.set_result(None)
+
+
+def _stopped_error() -> MQTTError:
+    """Returns the error for callers waiting on a batch abandoned by the coalescer stopping"""
+    # NOTE: rc 4 (no connection) is the same error the Session raises for operations attempted
+    # while it is not connected
+    return MQTTError(rc=4)
+
+
+async def _shield_with_timeout(future: "asyncio.Future[None]", timeout: float) -> None:
+    """Wait for a Future without cancelling it if the wait is cancelled or times out.
+
+    Equivalent to `asyncio.wait_for(asyncio.shield(future), timeout)`, but without creating
+    additional Tasks.
+    """
+    loop = asyncio.get_running_loop()
+    waiter = loop.create_future()
+
+    def on_done(f: "asyncio.Future[None]") -> None:
+        if waiter.done():
+            return
+        if f.cancelled():
+            waiter.cancel()
+            return
+        exception = f.exception()
+        if exception is not None:
+            waiter.set_exception(exception)
+        else:
+            waiter.set_result(None)
+
+    def on_timeout() -> None:
+        if not waiter.done():
+            waiter.set_exception(asyncio.TimeoutError("Timed out waiting for batch to be sent"))
+
+    future.add_done_callback(on_done)
+    timer = loop.call_later(timeout, on_timeout)
+    try:
+        await waiter
+    finally:
+        timer.cancel()
+        future.remove_done_callback(on_done)
+
+
+def merge_patch(target: Dict[str, JSONSerializable], patch: TwinPatch) -> None:
+    """Merge a Twin patch into a target JSON object, in place.
+
+    Follows JSON Merge Patch semantics (RFC 7396), which is how IoT Hub applies Twin patches:
+    a value of None removes the key, nested objects are merged, and all other values replace
+    the existing value.
+    """
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict):
+            existing = target.get(key)
+            if not isinstance(existing, dict):
+                existing = {}
+                target[key] = existing
+            merge_patch(existing, value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+def _coalesce(target: Dict[str, JSONSerializable], patch: TwinPatch) -> None:
+    """Merge a Twin patch into another Twin patch, in place.
+
+    Unlike `merge_patch()`, None values are retained, since they indicate removals that must
+    still be sent.
+    """
+    for key, value in patch.items():
+        existing = target.get(key)
+        if isinstance(value, dict) and isinstance(existing, dict):
+            _coalesce(existing, value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+
+def _can_coalesce(target: Dict[str, JSONSerializable], patch: TwinPatch) -> bool:
+    """Return a boolean indicating if a Twin patch can be merged into another Twin patch without
+    changing the result of applying them in sequence.
+
+    This is not possible when an object in the later patch would replace a value (or removal) in
+    the earlier patch, since the merged object would instead be merged with the original value.
+    """
+    for key, value in patch.items():
+        if isinstance(value, dict) and key in target:
+            existing = target[key]
+            if not isinstance(existing, dict) or not _can_coalesce(existing, value):
+                return False
+    return True
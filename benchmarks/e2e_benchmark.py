@@ -0,0 +1,320 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import logging
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from azure.iot.device import IoTHubSession, ProvisioningSession
+from dev_utils import iothub_emulator, mqtt_broker
+from microbenchmarks import get_metadata
+
+logging.basicConfig(level=logging.WARNING)
+
+"""
+This benchmark measures the end-to-end performance of an IoTHubSession connected over TLS to a
+local IoT Hub emulator (dev_utils.iothub_emulator) on localhost:8883, so no IoTHub is required.
+For each payload size and concurrency level it measures:
+
+    - publish: Sustained send_message() throughput, and the latency of each send (i.e. the time
+        until the PUBACK is received), with `concurrency` sends in flight at a time.
+    - c2d: The rate at which a burst of C2D messages is received through .messages()
+    - twin: get_twin() throughput and round trip latency, with `concurrency` requests in flight
+        at a time.
+    - provision: ProvisioningSession registration throughput and latency (including connecting),
+        with `concurrency` registrations in progress at a time.
+
+The emulator is run in a child process, and sends bursts of C2D messages when instructed to by
+the benchmark, so that none of the service side work is done in the process being measured.
+
+Usage: python e2e_benchmark.py [--payload-sizes N,N...] [--concurrency N,N...]
+    [--duration SECONDS] [--c2d-messages N] [--output FILE] [--compare FILE]
+"""
+
+HOSTNAME = "localhost"
+PORT = 8883
+DEVICE_ID = "e2e-benchmark-device"
+SHARED_ACCESS_KEY = "Zm9vYmFy"
+OPERATION_TIMEOUT = 60
+
+
+def random_payload(size):
+    return "".join(random.choice(string.ascii_letters) for _ in range(size))
+
+
+def percentile(sorted_samples, percent):
+    if not sorted_samples:
+        return None
+    index = min(int(len(sorted_samples) * percent / 100), len(sorted_samples) - 1)
+    return round(sorted_samples[index] * 1000, 3)
+
+
+def summarize(operations, elapsed, latencies, errors):
+    latencies.sort()
+    return {
+        "operations": operations,
+        "per_second": round(operations / elapsed, 1),
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p95": percentile(latencies, 95),
+        "latency_ms_p99": percentile(latencies, 99),
+        "errors": errors,
+    }
+
+
+# Fake Service (runs in the broker process) #
+
+
+async def run_service(args):
+    """Run the IoT Hub emulator, sending C2D messages when a "c2d <device_id> <count> <size>"
+    command is received on stdin"""
+    with open(args.cert, "rb") as f:
+        cert_pem = f.read()
+    with open(args.key, "rb") as f:
+        key_pem = f.read()
+    emulator = iothub_emulator.IoTHubEmulator(
+        hostname=HOSTNAME,
+        port=PORT,
+        ssl_context=mqtt_broker.create_server_ssl_context(cert_pem, key_pem),
+        assign_on_register=True,
+    )
+    emulator.add_device(DEVICE_ID, SHARED_ACCESS_KEY)
+    emulator.set_enrollment_group(SHARED_ACCESS_KEY)
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    async with emulator:
+        print(
+            "IoT Hub emulator listening on {}:{}".format(emulator.host, emulator.port), flush=True
+        )
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            _, device_id, count, size = line.decode("utf-8").split()
+            payload = random_payload(int(size))
+            for i in range(int(count)):
+                emulator.send_c2d_message(device_id, payload, {"$.ce": "utf-8"})
+                # Allow the emulator to write to the socket as the burst is sent
+                if i % 100 == 0:
+                    await asyncio.sleep(0)
+
+
+# Scenarios #
+
+
+async def run_concurrently(operation, concurrency, duration):
+    """Run an operation `concurrency` times at once, repeatedly, for the duration"""
+    latencies = []
+    errors = {}
+    end = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < end:
+            start = time.perf_counter()
+            try:
+                await operation()
+            except Exception as e:
+                name = type(e).__name__
+                errors[name] = errors.get(name, 0) + 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(len(latencies), time.perf_counter() - start, latencies, errors)
+
+
+async def bench_publish(session, payload_size, concurrency, args):
+    payload = random_payload(payload_size)
+    return await run_concurrently(lambda: session.send_message(payload), concurrency, args.duration)
+
+
+async def bench_twin(session, payload_size, concurrency, args):
+    return await run_concurrently(
+        lambda: session.get_twin(timeout=OPERATION_TIMEOUT), concurrency, args.duration
+    )
+
+
+async def bench_provision(payload_size, concurrency, args, ssl_context):
+    registration_ids = ("e2e-benchmark-registration-{}".format(i) for i in itertools.count())
+
+    async def register():
+        registration_id = next(registration_ids)
+        async with ProvisioningSession(
+            provisioning_host=HOSTNAME,
+            id_scope=iothub_emulator.DEFAULT_ID_SCOPE,
+            registration_id=registration_id,
+            shared_access_key=iothub_emulator.derive_device_key(SHARED_ACCESS_KEY, registration_id),
+            ssl_context=ssl_context,
+        ) as session:
+            await session.register()
+
+    # NOTE: Each ProvisioningSession occupies a thread of the default executor with its network
+    # loop, so the executor must fit them all (plus room to connect), or it will be exhausted
+    asyncio.get_running_loop().set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(max_workers=concurrency * 2)
+    )
+    return await run_concurrently(register, concurrency, args.duration)
+
+
+async def bench_c2d(session, payload_size, concurrency, args, service):
+    count = args.c2d_messages
+    received = 0
+
+    async def receive(messages):
+        nonlocal received
+        async for _ in messages:
+            received += 1
+            if received == count:
+                return
+
+    async with session.messages() as messages:
+        start = time.perf_counter()
+        service.stdin.write("c2d {} {} {}\n".format(DEVICE_ID, count, payload_size).encode())
+        service.stdin.flush()
+        try:
+            await asyncio.wait_for(receive(messages), OPERATION_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - start
+    errors = {} if received == count else {"missing": count - received}
+    return summarize(received, elapsed, [], errors)
+
+
+async def run_benchmarks(args, cert_pem, service):
+    results = []
+    ssl_context = mqtt_broker.create_client_ssl_context(cert_pem)
+    async with IoTHubSession(
+        hostname=HOSTNAME,
+        device_id=DEVICE_ID,
+        shared_access_key=SHARED_ACCESS_KEY,
+        ssl_context=ssl_context,
+    ) as session:
+        for payload_size in args.payload_sizes:
+            for concurrency in args.concurrency:
+                for scenario in args.scenarios:
+                    if scenario == "c2d":
+                        # NOTE: Concurrency does not apply to receiving
+                        if concurrency != args.concurrency[0]:
+                            continue
+                        result = await bench_c2d(session, payload_size, concurrency, args, service)
+                        result["concurrency"] = None
+                    elif scenario in ("twin", "provision"):
+                        # NOTE: Payload size does not apply to twin requests or registration
+                        if payload_size != args.payload_sizes[0]:
+                            continue
+                        if scenario == "twin":
+                            result = await bench_twin(session, payload_size, concurrency, args)
+                        else:
+                            result = await bench_provision(
+                                payload_size, concurrency, args, ssl_context
+                            )
+                        result["payload_size"] = None
+                    else:
+                        result = await bench_publish(session, payload_size, concurrency, args)
+                    result = dict({"scenario": scenario, "payload_size": payload_size}, **result)
+                    result.setdefault("concurrency", concurrency)
+                    results.append(result)
+                    print_result(result, args.baseline)
+    return results
+
+
+def result_key(result):
+    return "{scenario}/payload={payload_size}/concurrency={concurrency}".format(**result)
+
+
+def print_result(result, baseline):
+    line = "{:<40} {:>10.1f}/s".format(result_key(result), result["per_second"])
+    if result["latency_ms_p50"] is not None:
+        line += "  p50={latency_ms_p50}ms p95={latency_ms_p95}ms p99={latency_ms_p99}ms".format(
+            **result
+        )
+    previous = baseline.get(result_key(result))
+    if previous and previous["per_second"]:
+        line += "  {:+.1f}% vs baseline".format(
+            (result["per_second"] / previous["per_second"] - 1) * 100
+        )
+    if result["errors"]:
+        line += "  errors={}".format(result["errors"])
+    print(line, flush=True)
+
+
+def main(args):
+    args.baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            args.baseline = {result_key(r): r for r in json.load(f)["results"]}
+
+    cert_pem, key_pem = mqtt_broker.generate_self_signed_certificate(HOSTNAME)
+    with tempfile.TemporaryDirectory() as directory:
+        cert_file = os.path.join(directory, "cert.pem")
+        key_file = os.path.join(directory, "key.pem")
+        with open(cert_file, "wb") as f:
+            f.write(cert_pem)
+        with open(key_file, "wb") as f:
+            f.write(key_pem)
+
+        service = subprocess.Popen(
+            [sys.executable, __file__, "--service", "--cert", cert_file, "--key", key_file],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        try:
+            # Wait for the broker to start listening
+            service.stdout.readline()
+            results = asyncio.run(run_benchmarks(args, cert_pem, service))
+        finally:
+            service.stdin.close()
+            service.terminate()
+            service.wait()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"metadata": get_metadata(), "results": results}, f, indent=2)
+    return not any(result["errors"] for result in results)
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IoTHubSession end-to-end benchmark")
+    parser.add_argument(
+        "--payload-sizes", type=int_list, default=[16, 1024, 16384], help="payload sizes (bytes)"
+    )
+    parser.add_argument(
+        "--concurrency", type=int_list, default=[1, 10, 100], help="operations in flight"
+    )
+    parser.add_argument(
+        "--scenarios",
+        type=lambda value: value.split(","),
+        default=["publish", "c2d", "twin", "provision"],
+        help="scenarios to run",
+    )
+    parser.add_argument("--duration", type=float, default=5, help="seconds per measurement")
+    parser.add_argument("--c2d-messages", type=int, default=5000, help="C2D messages per burst")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    parser.add_argument("--service", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--cert", help=argparse.SUPPRESS)
+    parser.add_argument("--key", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.service:
+        asyncio.run(run_service(args))
+    else:
+        success = main(args)
+        sys.exit(0 if success else 1)
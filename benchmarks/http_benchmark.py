@@ -0,0 +1,189 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from azure.iot.device import config
+from azure.iot.device.iothub_http_client import HTTPConnectionPool, IoTHubHTTPClient
+from dev_utils import iothub_http_emulator, mqtt_broker
+from microbenchmarks import get_metadata
+
+logging.basicConfig(level=logging.WARNING)
+
+"""
+This benchmark measures the throughput (in requests per second) of IoTHubHTTPClient
+.invoke_direct_method() over HTTPS, against a local IoT Hub HTTP emulator
+(dev_utils.iothub_http_emulator), so no IoTHub or IoT Edge is required.
+
+Each of --clients Edge module clients keeps --concurrency invocations in flight for --duration
+seconds, in each of these configurations:
+    - own_pool: every client creates its own HTTPConnectionPool, with default settings
+    - shared_pool: all clients share a single HTTPConnectionPool, with --limit connections
+The statistics of the pools (connections created and reused, requests queued for a connection)
+are reported along with the throughput.
+
+The emulator is run in a child process, so that none of the service side work is done in the
+process being measured.
+
+Usage: python http_benchmark.py [--clients N] [--concurrency N] [--limit N] [--duration SECONDS]
+    [--output FILE]
+"""
+
+DEVICE_ID = "http-benchmark-device"
+TARGET_DEVICE_ID = "http-benchmark-target"
+METHOD_PARAMS = {"methodName": "benchmark", "payload": {"value": 1}, "responseTimeoutInSeconds": 5}
+
+
+# Fake Service (runs in the emulator process) #
+
+
+async def run_service(args):
+    with open(args.cert, "rb") as f:
+        cert_pem = f.read()
+    with open(args.key, "rb") as f:
+        key_pem = f.read()
+    emulator = iothub_http_emulator.IoTHubHTTPEmulator(
+        host="localhost", ssl_context=mqtt_broker.create_server_ssl_context(cert_pem, key_pem)
+    )
+    async with emulator:
+        print(emulator.port, flush=True)
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        # Run until stdin is closed
+        await reader.read()
+
+
+# Scenarios #
+
+
+async def run_scenario(name, args, hostname, ssl_context, pool):
+    """Invoke direct methods from many clients, and return the results"""
+    clients = []
+    for i in range(args.clients):
+        client_config = config.IoTHubClientConfig(
+            device_id=DEVICE_ID,
+            module_id="module{}".format(i),
+            hostname=hostname,
+            ssl_context=ssl_context,
+            http_connection_pool=pool,
+        )
+        clients.append(IoTHubHTTPClient(client_config))
+
+    requests = 0
+    errors = 0
+    end = time.perf_counter() + args.duration
+
+    async def worker(client):
+        nonlocal requests, errors
+        while time.perf_counter() < end:
+            try:
+                await client.invoke_direct_method(
+                    device_id=TARGET_DEVICE_ID, method_params=METHOD_PARAMS
+                )
+                requests += 1
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(client) for client in clients for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+
+    pools = [pool] if pool else [client._connection_pool for client in clients]
+    stats = {}
+    for p in pools:
+        for stat, value in p.get_stats().items():
+            stats[stat] = stats.get(stat, 0) + value
+    for client in clients:
+        await client.shutdown()
+    if pool:
+        await pool.close()
+
+    return {
+        "scenario": name,
+        "requests": requests,
+        "per_second": round(requests / elapsed, 1),
+        "errors": errors,
+        "connections_created": stats["connections_created"],
+        "connections_reused": stats["connections_reused"],
+        "requests_queued": stats["requests_queued"],
+        "queue_wait_seconds": round(stats["queue_wait_seconds"], 3),
+    }
+
+
+async def run_benchmarks(args, cert_pem, port):
+    ssl_context = mqtt_broker.create_client_ssl_context(cert_pem)
+    hostname = "localhost:{}".format(port)
+    results = []
+    scenarios = [
+        ("own_pool", lambda: None),
+        ("shared_pool", lambda: HTTPConnectionPool(limit=args.limit)),
+    ]
+    for name, create_pool in scenarios:
+        result = await run_scenario(name, args, hostname, ssl_context, create_pool())
+        results.append(result)
+        print(
+            "{scenario:<12} {per_second:>10.1f} requests/s  connections={connections_created}"
+            "  reused={connections_reused}  queued={requests_queued}"
+            " ({queue_wait_seconds}s)  errors={errors}".format(**result),
+            flush=True,
+        )
+    return results
+
+
+def main(args):
+    cert_pem, key_pem = mqtt_broker.generate_self_signed_certificate("localhost")
+    with tempfile.TemporaryDirectory() as directory:
+        cert_file = os.path.join(directory, "cert.pem")
+        key_file = os.path.join(directory, "key.pem")
+        with open(cert_file, "wb") as f:
+            f.write(cert_pem)
+        with open(key_file, "wb") as f:
+            f.write(key_pem)
+
+        service = subprocess.Popen(
+            [sys.executable, __file__, "--service", "--cert", cert_file, "--key", key_file],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        try:
+            # Wait for the emulator to start listening, and report its port
+            port = int(service.stdout.readline())
+            results = asyncio.run(run_benchmarks(args, cert_pem, port))
+        finally:
+            service.stdin.close()
+            service.terminate()
+            service.wait()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"metadata": get_metadata(), "results": results}, f, indent=2)
+    return not any(result["errors"] for result in results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IoTHubHTTPClient throughput benchmark")
+    parser.add_argument("--clients", type=int, default=10, help="number of clients")
+    parser.add_argument("--concurrency", type=int, default=10, help="requests in flight per client")
+    parser.add_argument("--limit", type=int, default=20, help="connection limit of the shared pool")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per scenario")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--service", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--cert", help=argparse.SUPPRESS)
+    parser.add_argument("--key", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.service:
+        asyncio.run(run_service(args))
+        sys.exit(0)
+    success = main(args)
+    sys.exit(0 if success else 1)
@@ -0,0 +1,110 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+"""
+This benchmark measures the import time of each entry point of the azure.iot.device package,
+using `python -X importtime` in a fresh interpreter for every sample, so that no module is
+already cached.
+
+The import time of an entry point is the cumulative time of the modules it imported, excluding
+those imported by the interpreter during startup. The median of several samples is reported,
+along with the third party modules that were pulled in, so that an entry point that starts
+importing a transport it does not use is caught even if the import time is noisy.
+
+Usage: python import_time.py [--samples N] [--output FILE] [--compare FILE]
+"""
+
+ENTRY_POINTS = {
+    "package": "import azure.iot.device",
+    "IoTHubSession": "from azure.iot.device import IoTHubSession",
+    "ProvisioningSession": "from azure.iot.device import ProvisioningSession",
+    "SessionHost": "from azure.iot.device import SessionHost",
+    "DirectMethodDispatcher": "from azure.iot.device import DirectMethodDispatcher",
+    "Message": "from azure.iot.device import Message",
+    "exceptions": "from azure.iot.device import IoTHubError, ProvisioningServiceError",
+}
+
+THIRD_PARTY_MODULES = ["paho", "socks", "aiohttp"]
+
+
+def import_time_sample(statement):
+    """Return (import time in microseconds, set of top level modules imported) of a statement"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        stderr=subprocess.PIPE,
+        check=True,
+    ).stderr.decode("utf-8")
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # Only modules imported directly by the statement (i.e. not nested) are counted, as the
+        # cumulative time of those includes all the imports they caused.
+        indent = len(name) - len(name.lstrip(" "))
+        imports.append((name.strip(), int(cumulative), indent == 1))
+    return imports
+
+
+def measure(statement, samples, startup_modules):
+    times = []
+    modules = set()
+    for _ in range(samples):
+        imports = import_time_sample(statement)
+        times.append(
+            sum(
+                cumulative
+                for name, cumulative, top_level in imports
+                if top_level and name not in startup_modules
+            )
+        )
+        modules.update(name for name, _, _ in imports)
+    return {
+        "import_ms": round(statistics.median(times) / 1000, 2),
+        "third_party": sorted(
+            name for name in THIRD_PARTY_MODULES if name in modules and name not in startup_modules
+        ),
+    }
+
+
+def main(args):
+    startup_modules = {name for name, _, _ in import_time_sample("pass")}
+    results = {
+        name: measure(statement, args.samples, startup_modules)
+        for name, statement in ENTRY_POINTS.items()
+    }
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    for name, result in results.items():
+        line = "{:<24} {:>8.2f} ms  {}".format(
+            name, result["import_ms"], ", ".join(result["third_party"]) or "-"
+        )
+        if name in baseline:
+            line += "  (baseline {:.2f} ms)".format(baseline[name]["import_ms"])
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="azure.iot.device import time benchmark")
+    parser.add_argument("--samples", type=int, default=10, help="samples per entry point")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    success = main(parser.parse_args())
+    sys.exit(0 if success else 1)
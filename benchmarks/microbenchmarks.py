@@ -0,0 +1,387 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import datetime
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import paho.mqtt as paho_mqtt
+import paho.mqtt.client as paho
+from azure.iot.device import iothub_mqtt_client
+from azure.iot.device import mqtt_topic_iothub as mqtt_topic
+from azure.iot.device import request_response as rr
+from azure.iot.device import sastoken as st
+from azure.iot.device import signing_mechanism as sm
+from azure.iot.device.models import Message
+
+"""
+This suite of microbenchmarks measures the hot paths of the library that are run for every
+message or request: MQTT topic encoding and decoding, Message property conversion, SAS token
+signing and parsing, request/response matching, and the transformation of incoming MQTT messages.
+
+Every benchmark is run on fixed inputs, with the garbage collector disabled while timing. The
+number of loops is calibrated so that a single run takes at least --min-time seconds, and the
+run is repeated --repeat times. The minimum time per operation is reported (as it is the least
+affected by other activity on the machine), along with the median.
+
+Results can be written as JSON with --output, and compared against the results of a previous
+run (e.g. of another commit) with --compare. When comparing, the run fails if any benchmark is
+slower than its baseline by more than --threshold.
+
+Usage: python microbenchmarks.py [--filter SUBSTRING] [--output FILE] [--compare FILE]
+"""
+
+BENCHMARKS = {}
+
+DEVICE_ID = "benchmark-device"
+MODULE_ID = "benchmark-module"
+REQUEST_ID = "6f7c3b0e-2f5c-4c47-9a4e-6a3f3d2d1c0b"
+SHARED_ACCESS_KEY = "Zm9vYmFyYmF6cXV4Zm9vYmFyYmF6cXV4Zm9vYmFyYmF6cXV4"
+SASTOKEN_STRING = (
+    "SharedAccessSignature sr=fake.azure-devices.net%2Fdevices%2Fbenchmark-device"
+    "&sig=Q3Bq0lUf4sFvT%2F5Vp3J0k9pO1b8zZs1rH9x0mQm0a2Y%3D&se=1900000000"
+)
+C2D_TOPIC = (
+    "devices/benchmark-device/messages/devicebound/"
+    "%24.mid=message-id&%24.to=%2Fdevices%2Fbenchmark-device%2Fmessages%2Fdevicebound"
+    "&%24.ce=utf-8&%24.ct=application%2Fjson&iothub-ack=full&%24.cid=correlation-id"
+    "&custom1=value1&custom%202=value%202"
+)
+INPUT_TOPIC = (
+    "devices/benchmark-device/modules/benchmark-module/inputs/input1/"
+    "%24.mid=message-id&%24.ce=utf-8&%24.ct=text%2Fplain&custom1=value1"
+)
+DIRECT_METHOD_TOPIC = "$iothub/methods/POST/benchmark%20method/?$rid=" + REQUEST_ID
+TWIN_RESPONSE_TOPIC = "$iothub/twin/res/200/?$rid={}&$version=42".format(REQUEST_ID)
+JSON_PAYLOAD = json.dumps({"temperature": 21.5, "humidity": 48, "tags": ["a", "b", "c"]})
+
+
+def benchmark(name):
+    """Register a benchmark function. The function is passed a number of loops to run, and
+    returns the time (in seconds) it took to run them"""
+
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+
+    return register
+
+
+def time_loops(fn, loops):
+    start = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return time.perf_counter() - start
+
+
+def time_async_loops(coro_fn, loops):
+    async def run():
+        start = time.perf_counter()
+        for _ in range(loops):
+            await coro_fn()
+        return time.perf_counter() - start
+
+    return asyncio.run(run())
+
+
+def outgoing_message():
+    message = Message(JSON_PAYLOAD, content_type="application/json")
+    message.message_id = "message-id"
+    message.correlation_id = "correlation-id"
+    message.custom_properties = {"custom1": "value1", "custom 2": "value 2"}
+    return message
+
+
+def mqtt_message(topic, payload):
+    message = paho.MQTTMessage(topic=topic.encode("utf-8"))
+    message.payload = payload.encode("utf-8")
+    return message
+
+
+# MQTT Topics #
+
+
+@benchmark("topic.encode_telemetry")
+def bench_topic_encode_telemetry(loops):
+    message = outgoing_message()
+    system_properties = message.get_system_properties_dict()
+
+    def fn():
+        topic = mqtt_topic.get_telemetry_topic_for_publish(DEVICE_ID, MODULE_ID)
+        mqtt_topic.insert_message_properties_in_topic(
+            topic, system_properties, message.custom_properties
+        )
+
+    return time_loops(fn, loops)
+
+
+@benchmark("topic.encode_direct_method_response")
+def bench_topic_encode_direct_method_response(loops):
+    return time_loops(
+        lambda: mqtt_topic.get_direct_method_response_topic_for_publish(REQUEST_ID, 200), loops
+    )
+
+
+@benchmark("topic.encode_twin_request")
+def bench_topic_encode_twin_request(loops):
+    return time_loops(lambda: mqtt_topic.get_twin_request_topic_for_publish(REQUEST_ID), loops)
+
+
+@benchmark("topic.decode_c2d_properties")
+def bench_topic_decode_c2d_properties(loops):
+    return time_loops(lambda: mqtt_topic.extract_properties_from_message_topic(C2D_TOPIC), loops)
+
+
+@benchmark("topic.decode_input_properties")
+def bench_topic_decode_input_properties(loops):
+    return time_loops(lambda: mqtt_topic.extract_properties_from_message_topic(INPUT_TOPIC), loops)
+
+
+@benchmark("topic.decode_direct_method_request")
+def bench_topic_decode_direct_method_request(loops):
+    def fn():
+        mqtt_topic.extract_name_from_direct_method_request_topic(DIRECT_METHOD_TOPIC)
+        mqtt_topic.extract_request_id_from_direct_method_request_topic(DIRECT_METHOD_TOPIC)
+
+    return time_loops(fn, loops)
+
+
+@benchmark("topic.decode_twin_response")
+def bench_topic_decode_twin_response(loops):
+    def fn():
+        mqtt_topic.extract_status_code_from_twin_response_topic(TWIN_RESPONSE_TOPIC)
+        mqtt_topic.extract_request_id_from_twin_response_topic(TWIN_RESPONSE_TOPIC)
+
+    return time_loops(fn, loops)
+
+
+# Message Properties #
+
+
+@benchmark("message.get_system_properties_dict")
+def bench_message_get_system_properties_dict(loops):
+    return time_loops(outgoing_message().get_system_properties_dict, loops)
+
+
+@benchmark("message.create_from_properties_dict")
+def bench_message_create_from_properties_dict(loops):
+    properties = mqtt_topic.extract_properties_from_message_topic(C2D_TOPIC)
+    return time_loops(
+        lambda: Message.create_from_properties_dict(payload=JSON_PAYLOAD, properties=properties),
+        loops,
+    )
+
+
+# Signing and SAS Tokens #
+
+
+@benchmark("signing.symmetric_key_sign")
+def bench_signing_symmetric_key_sign(loops):
+    signing_mechanism = sm.SymmetricKeySigningMechanism(SHARED_ACCESS_KEY)
+    data = "fake.azure-devices.net%2Fdevices%2Fbenchmark-device\n1900000000"
+    return time_async_loops(lambda: signing_mechanism.sign(data), loops)
+
+
+@benchmark("signing.symmetric_key_sign_many")
+def bench_signing_symmetric_key_sign_many(loops):
+    # NOTE: Each loop is one data string, all signed by a single call
+    signing_mechanism = sm.SymmetricKeySigningMechanism(SHARED_ACCESS_KEY)
+    data = ["benchmark-device-{}".format(i) for i in range(loops)]
+
+    async def run():
+        start = time.perf_counter()
+        await signing_mechanism.sign_many(data)
+        return time.perf_counter() - start
+
+    return asyncio.run(run())
+
+
+@benchmark("sastoken.parse")
+def bench_sastoken_parse(loops):
+    return time_loops(lambda: st.SasToken(SASTOKEN_STRING), loops)
+
+
+@benchmark("sastoken.generate")
+def bench_sastoken_generate(loops):
+    signing_mechanism = sm.SymmetricKeySigningMechanism(SHARED_ACCESS_KEY)
+    generator = st.InternalSasTokenGenerator(
+        signing_mechanism, "fake.azure-devices.net/devices/benchmark-device"
+    )
+    return time_async_loops(generator.generate_sastoken, loops)
+
+
+# Request/Response #
+
+
+@benchmark("request_ledger.create_and_match")
+def bench_request_ledger_create_and_match(loops):
+    ledger = rr.RequestLedger()
+
+    async def fn():
+        request = await ledger.create_request()
+        await ledger.match_response(rr.Response(request.request_id, 200, "{}"))
+        await request.get_response()
+
+    return time_async_loops(fn, loops)
+
+
+@benchmark("request_ledger.create_and_match_with_timeout")
+def bench_request_ledger_create_and_match_with_timeout(loops):
+    ledger = rr.RequestLedger()
+
+    async def fn():
+        request = await ledger.create_request(timeout=60)
+        await ledger.match_response(rr.Response(request.request_id, 200, "{}"))
+        await request.get_response()
+
+    return time_async_loops(fn, loops)
+
+
+# Incoming Message Transforms #
+
+
+@benchmark("transform.c2d_message_json")
+def bench_transform_c2d_message_json(loops):
+    message = mqtt_message(C2D_TOPIC, JSON_PAYLOAD)
+    return time_loops(
+        lambda: iothub_mqtt_client._create_iothub_message_from_mqtt_message(message), loops
+    )
+
+
+@benchmark("transform.input_message_text")
+def bench_transform_input_message_text(loops):
+    message = mqtt_message(INPUT_TOPIC, "benchmark payload")
+    return time_loops(
+        lambda: iothub_mqtt_client._create_iothub_message_from_mqtt_message(message), loops
+    )
+
+
+@benchmark("transform.direct_method_request")
+def bench_transform_direct_method_request(loops):
+    message = mqtt_message(DIRECT_METHOD_TOPIC, JSON_PAYLOAD)
+    return time_loops(
+        lambda: iothub_mqtt_client._create_direct_method_request_from_mqtt_message(message), loops
+    )
+
+
+@benchmark("transform.twin_patch")
+def bench_transform_twin_patch(loops):
+    message = mqtt_message("$iothub/twin/PATCH/properties/desired/?$version=42", JSON_PAYLOAD)
+    return time_loops(
+        lambda: iothub_mqtt_client._create_twin_patch_from_mqtt_message(message), loops
+    )
+
+
+# Runner #
+
+
+def calibrate(fn, min_time):
+    """Return the number of loops needed for a run of the benchmark to take at least min_time"""
+    loops = 1
+    while True:
+        if fn(loops) >= min_time:
+            return loops
+        loops *= 2
+
+
+def run_benchmark(fn, min_time, repeat):
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        loops = calibrate(fn, min_time)
+        timings = [fn(loops) / loops * 1e9 for _ in range(repeat)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        "ns_per_op": round(min(timings), 1),
+        "ns_per_op_median": round(statistics.median(timings), 1),
+        "stdev_percent": round(statistics.stdev(timings) / statistics.mean(timings) * 100, 2),
+        "loops": loops,
+        "repeat": repeat,
+    }
+
+
+def get_metadata():
+    try:
+        commit = (
+            subprocess.run(
+                ["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+            .stdout.decode("utf-8")
+            .strip()
+        )
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "paho": paho_mqtt.__version__,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def main(args):
+    names = [name for name in BENCHMARKS if not args.filter or args.filter in name]
+    results = {}
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    regressions = []
+    for name in names:
+        result = run_benchmark(BENCHMARKS[name], args.min_time, args.repeat)
+        results[name] = result
+        line = "{:<48} {:>10.1f} ns/op  (median {:.1f}, stdev {:.1f}%)".format(
+            name, result["ns_per_op"], result["ns_per_op_median"], result["stdev_percent"]
+        )
+        if name in baseline:
+            change = result["ns_per_op"] / baseline[name]["ns_per_op"] - 1
+            line += "  {:+.1f}% vs baseline".format(change * 100)
+            if change > args.threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line, flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"metadata": get_metadata(), "results": results}, f, indent=2)
+    if regressions:
+        print("{} benchmark(s) regressed: {}".format(len(regressions), ", ".join(regressions)))
+    return not regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="azure.iot.device microbenchmarks")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument(
+        "--min-time", type=float, default=0.1, help="minimum seconds per run of a benchmark"
+    )
+    parser.add_argument("--repeat", type=int, default=7, help="runs of each benchmark")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="slowdown vs the baseline (as a fraction) that counts as a regression",
+    )
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    args = parser.parse_args()
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        sys.exit(0)
+    success = main(args)
+    sys.exit(0 if success else 1)
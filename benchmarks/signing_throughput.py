@@ -0,0 +1,106 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import statistics
+import sys
+import time
+from azure.iot.device import signing_mechanism as sm
+
+"""
+This benchmark measures the throughput (in signatures per second) of symmetric key signing at
+fleet scale, e.g. when generating SAS tokens for many devices, or deriving the device keys of a
+DPS enrollment group from its group key.
+
+Each mode signs --count distinct data strings, and the best and median throughput of --repeat
+runs are reported:
+    sign                one .sign() call per data string
+    sign_many           a single .sign_many() call, on the event loop
+    sign_many_processes a single .sign_many() call across a ProcessPoolExecutor, for each number
+                        of --workers (the pool is started before timing)
+
+Usage: python signing_throughput.py [--count N] [--workers N [N ...]] [--output FILE]
+"""
+
+GROUP_KEY = "Zm9vYmFyYmF6cXV4Zm9vYmFyYmF6cXV4Zm9vYmFyYmF6cXV4"
+
+
+async def run_sign(signing_mechanism, data, executor, chunk_size):
+    for data_str in data:
+        await signing_mechanism.sign(data_str)
+
+
+async def run_sign_many(signing_mechanism, data, executor, chunk_size):
+    await signing_mechanism.sign_many(data, executor, chunk_size)
+
+
+def measure(run_fn, signing_mechanism, data, repeat, executor=None, chunk_size=1000):
+    rates = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        asyncio.run(run_fn(signing_mechanism, data, executor, chunk_size))
+        rates.append(len(data) / (time.perf_counter() - start))
+    return {
+        "signatures_per_second": round(max(rates)),
+        "signatures_per_second_median": round(statistics.median(rates)),
+    }
+
+
+def report(name, result):
+    print(
+        "{:<32} {:>12,} signatures/s  (median {:,})".format(
+            name, result["signatures_per_second"], result["signatures_per_second_median"]
+        ),
+        flush=True,
+    )
+
+
+def main(args):
+    signing_mechanism = sm.SymmetricKeySigningMechanism(GROUP_KEY)
+    data = ["device-{:08d}".format(i) for i in range(args.count)]
+    results = {}
+
+    results["sign"] = measure(run_sign, signing_mechanism, data, args.repeat)
+    report("sign", results["sign"])
+    results["sign_many"] = measure(run_sign_many, signing_mechanism, data, args.repeat)
+    report("sign_many", results["sign_many"])
+    for workers in args.workers:
+        name = "sign_many_processes[{}]".format(workers)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            # Start the worker processes before timing
+            list(executor.map(abs, range(workers)))
+            results[name] = measure(
+                run_sign_many, signing_mechanism, data, args.repeat, executor, args.chunk_size
+            )
+        report(name, results[name])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"count": args.count, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="azure.iot.device signing throughput benchmark")
+    parser.add_argument("--count", type=int, default=100000, help="data strings signed per run")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each mode")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="*",
+        default=[os.cpu_count() or 1],
+        help="numbers of worker processes to sign across (none to skip)",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=1000, help="data strings per job sent to a worker"
+    )
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    args = parser.parse_args()
+    main(args)
+    sys.exit(0)
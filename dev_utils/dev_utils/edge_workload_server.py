@@ -0,0 +1,133 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE file in the project root for
+# full license information.
+"""
+A local stand-in for the IoT Edge workload API, served over a Unix domain socket, for testing
+IoTEdgeHsm without an IoT Edge runtime.
+
+Implemented:
+    - GET /trust-bundle, returning the configured certificate.
+    - POST /modules/{module_id}/genid/{generation_id}/sign, returning the HMAC-SHA256 digest of
+        the data, signed with the configured module key.
+Every request is recorded in .requests, and the number of connections accepted is counted, so
+that tests can check connections are reused.
+
+To make tests more realistic, the server can be configured with:
+    - latency: Delay (in seconds) before every response is sent
+    - status: HTTP status to respond to every request with, instead of succeeding
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CERTIFICATE = "-----BEGIN CERTIFICATE-----\nfake\n-----END CERTIFICATE-----\n"
+DEFAULT_MODULE_KEY = base64.b64encode(b"fake module key").decode()
+
+
+class EdgeWorkloadServer:
+    def __init__(
+        self,
+        socket_path: Optional[str] = None,
+        certificate: str = DEFAULT_CERTIFICATE,
+        module_key: str = DEFAULT_MODULE_KEY,
+    ) -> None:
+        """Stand-in for the IoT Edge workload API.
+
+        :param str socket_path: Path of the Unix domain socket to serve on. If not provided, a
+            socket in a new temporary directory is used (socket paths are limited to ~100
+            characters, so the pytest tmp_path is often too long).
+        :param str certificate: The certificate returned in the trust bundle
+        :param str module_key: The key (base64 encoded) that data is signed with
+        """
+        self._tempdir: Optional[tempfile.TemporaryDirectory] = None
+        if socket_path is None:
+            self._tempdir = tempfile.TemporaryDirectory()
+            socket_path = os.path.join(self._tempdir.name, "workload.sock")
+        self.socket_path = socket_path
+        self.certificate = certificate
+        self.module_key = module_key
+        self.latency = 0.0
+        self.status: Optional[int] = None
+        self.requests: List[Dict[str, Any]] = []
+        self.connection_count = 0
+        self._transports: set = set()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def workload_uri(self) -> str:
+        """The workload URI, in IOTEDGE_WORKLOADURI form"""
+        return "unix://" + self.socket_path
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/trust-bundle", self._handle_trust_bundle)
+        app.router.add_post("/modules/{module_id}/genid/{generation_id}/sign", self._handle_sign)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.UnixSite(self._runner, self.socket_path)
+        await site.start()
+        logger.debug("Edge workload server listening on {}".format(self.socket_path))
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+            self._tempdir = None
+
+    async def __aenter__(self) -> "EdgeWorkloadServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.stop()
+
+    def sign(self, data: bytes) -> str:
+        """Return the digest the server responds with for the given data"""
+        key = base64.b64decode(self.module_key)
+        return base64.b64encode(hmac.HMAC(key, data, hashlib.sha256).digest()).decode()
+
+    async def _record(self, request: web.Request, body: Any = None) -> Optional[web.Response]:
+        """Record a request, and return the error response to send instead of handling it, if
+        the server is configured to fail"""
+        if request.transport not in self._transports:
+            self._transports.add(request.transport)
+            self.connection_count += 1
+        self.requests.append(
+            {
+                "method": request.method,
+                "path": request.path,
+                "query": dict(request.query),
+                "headers": dict(request.headers),
+                "body": body,
+            }
+        )
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.status is not None:
+            return web.json_response({"message": "fake error"}, status=self.status)
+        return None
+
+    async def _handle_trust_bundle(self, request: web.Request) -> web.Response:
+        error = await self._record(request)
+        if error is not None:
+            return error
+        return web.json_response({"certificate": self.certificate})
+
+    async def _handle_sign(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        error = await self._record(request, body)
+        if error is not None:
+            return error
+        if body.get("algo") != "HMACSHA256" or body.get("keyId") != "primary":
+            return web.json_response({"message": "unsupported"}, status=400)
+        return web.json_response({"digest": self.sign(base64.b64decode(body["data"]))})
@@ -0,0 +1,588 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE file in the project root for
+# full license information.
+"""
+A local emulator of the MQTT protocol of IoT Hub and the Device Provisioning Service, built on
+the dev_utils MQTTBroker, for load testing IoTHubSession and ProvisioningSession without network
+access or any cloud resources.
+
+Implemented:
+    - Authentication of the CONNECT username and SAS token password of registered devices,
+        modules and enrollments.
+    - Telemetry (device and module outputs), which is counted and passed to an optional hook.
+    - Twin GET and reported property PATCH requests, and desired property patches sent to the
+        device with .update_desired_properties().
+    - Direct method requests, sent with .invoke_method(), which returns the device response.
+    - C2D and module input messages (with encoded properties), sent with .send_c2d_message()
+        and .send_input_message().
+    - DPS registration, responding "assigning" and then "assigned" to the following poll (or
+        "assigned" right away, with assign_on_register). The device is then registered with the
+        emulated IoT Hub using the same key.
+
+To make tests more realistic, the emulator can be configured with:
+    - latency: Delay (in seconds) before every acknowledgement or response is sent
+    - max_messages_per_second: Per-device telemetry rate. PUBACKs for telemetry beyond this
+        rate are delayed until the rate allows, as IoT Hub does when throttling.
+    - disconnect_after: Drop each connection after it has sent this many PUBLISHes
+    - reject_connections: Reject all connections with "Server unavailable"
+Devices can also be disconnected at any time with .disconnect().
+
+Unlike IoT Hub, C2D messages are not queued for devices that are not connected, X509
+authentication is not supported, and twin tags and metadata are not included.
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import time
+import urllib.parse
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+from .mqtt_broker import (
+    BrokerClient,
+    MQTTBroker,
+    create_server_ssl_context,
+    topic_matches,
+)
+
+logger = logging.getLogger(__name__)
+
+# CONNACK return codes
+CONNACK_ACCEPTED = 0
+CONNACK_SERVER_UNAVAILABLE = 3
+CONNACK_BAD_USERNAME_OR_PASSWORD = 4
+CONNACK_NOT_AUTHORIZED = 5
+
+DEFAULT_HOSTNAME = "localhost"
+DEFAULT_ID_SCOPE = "0ne00000000"
+
+TelemetryHandler = Callable[["EmulatedDevice", Dict[str, str], bytes], None]
+
+
+class EmulatedDevice(object):
+    """A device (or module) identity registered with the emulator"""
+
+    def __init__(self, device_id: str, module_id: Optional[str], shared_access_key: str):
+        self.device_id = device_id
+        self.module_id = module_id
+        self.shared_access_key = shared_access_key
+        self.desired: Dict[str, Any] = {"$version": 1}
+        self.reported: Dict[str, Any] = {"$version": 1}
+        self.telemetry_received = 0
+        self.connection: Optional[BrokerClient] = None
+        # Time after which the next telemetry PUBACK can be sent, when throttling
+        self._next_ack_time = 0.0
+
+    @property
+    def client_id(self) -> str:
+        if self.module_id:
+            return "{}/{}".format(self.device_id, self.module_id)
+        return self.device_id
+
+    @property
+    def topic_base(self) -> str:
+        if self.module_id:
+            return "devices/{}/modules/{}".format(self.device_id, self.module_id)
+        return "devices/{}".format(self.device_id)
+
+    def twin(self) -> Dict[str, Any]:
+        return {"desired": self.desired, "reported": self.reported}
+
+
+class IoTHubEmulator(MQTTBroker):
+    def __init__(
+        self,
+        hostname: str = DEFAULT_HOSTNAME,
+        host: str = "127.0.0.1",
+        port: int = 8883,
+        ssl_context=None,
+        *,
+        id_scope: str = DEFAULT_ID_SCOPE,
+        authenticate: bool = True,
+        latency: float = 0.0,
+        max_messages_per_second: Optional[float] = None,
+        disconnect_after: Optional[int] = None,
+        assign_on_register: bool = False,
+    ):
+        """
+        :param str hostname: Hostname of the emulated IoT Hub (and DPS), as used by clients
+        :param str host: Address to listen on
+        :param int port: Port to listen on. The SDK always connects on 8883.
+        :param ssl_context: Server SSLContext. If not provided, TLS will not be used.
+        :param str id_scope: ID Scope of the emulated DPS
+        :param bool authenticate: If False, credentials are not validated, and any device can
+            connect (and is registered upon connection).
+        :param float latency: Delay (in seconds) before every acknowledgement or response
+        :param float max_messages_per_second: Per-device telemetry rate limit
+        :param int disconnect_after: Drop each connection after this many PUBLISHes
+        :param bool assign_on_register: If True, DPS registrations are assigned in response to
+            the register request, rather than to the first status poll. Clients wait a couple
+            of seconds before polling, so this makes registration faster for load testing.
+        """
+        super().__init__(host=host, port=port, ssl_context=ssl_context)
+        self.hostname = hostname
+        self.id_scope = id_scope
+        self.authentication_enabled = authenticate
+        self.latency = latency
+        self.max_messages_per_second = max_messages_per_second
+        self.disconnect_after = disconnect_after
+        self.assign_on_register = assign_on_register
+        self.reject_connections = False
+        self.devices: Dict[str, EmulatedDevice] = {}
+        self.enrollments: Dict[str, str] = {}
+        self.enrollment_group_key: Optional[str] = None
+        self.registrations_completed = 0
+        # Invoked for every telemetry message received
+        self.on_telemetry: Optional[TelemetryHandler] = None
+        self._pending_methods: Dict[str, "asyncio.Future[Tuple[int, Any]]"] = {}
+        self._operations: Dict[str, Dict[str, Any]] = {}
+        # Identity of each connected client - an EmulatedDevice, or a DPS registration id
+        self._identities: Dict[BrokerClient, Union[EmulatedDevice, str]] = {}
+        self._publish_counts: Dict[BrokerClient, int] = {}
+
+    # Registry #
+
+    def add_device(
+        self, device_id: str, shared_access_key: str, module_id: Optional[str] = None
+    ) -> EmulatedDevice:
+        """Register a device (or module) identity that can connect to the emulated IoT Hub"""
+        device = EmulatedDevice(device_id, module_id, shared_access_key)
+        self.devices[device.client_id] = device
+        return device
+
+    def get_device(self, device_id: str, module_id: Optional[str] = None) -> EmulatedDevice:
+        """Return a registered device (or module).
+
+        :raises: KeyError if it is not registered
+        """
+        if module_id:
+            return self.devices["{}/{}".format(device_id, module_id)]
+        return self.devices[device_id]
+
+    def add_enrollment(self, registration_id: str, shared_access_key: str) -> None:
+        """Add an individual enrollment that can register with the emulated DPS"""
+        self.enrollments[registration_id] = shared_access_key
+
+    def set_enrollment_group(self, group_key: str) -> None:
+        """Allow any registration whose key is derived from the group key to register with the
+        emulated DPS"""
+        self.enrollment_group_key = group_key
+
+    # Service Operations #
+
+    def send_c2d_message(
+        self,
+        device_id: str,
+        payload: Union[str, bytes],
+        properties: Optional[Dict[str, str]] = None,
+    ) -> bool:
+        """Send a C2D message to a device. Returns False if it is not connected and subscribed
+        to receive C2D messages."""
+        device = self.get_device(device_id)
+        # NOTE: As with IoT Hub, the destination is always included in the properties
+        destination = "/devices/{}/messages/devicebound".format(device_id)
+        properties = dict({"$.to": destination}, **(properties or {}))
+        topic = "devices/{}/messages/devicebound/{}".format(
+            device_id, _encode_properties(properties)
+        )
+        return self._send_to_device(device, topic, _to_bytes(payload))
+
+    def send_input_message(
+        self,
+        device_id: str,
+        module_id: str,
+        input_name: str,
+        payload: Union[str, bytes],
+        properties: Optional[Dict[str, str]] = None,
+    ) -> bool:
+        """Send a message to an input of a module. Returns False if it is not connected and
+        subscribed to receive input messages."""
+        device = self.get_device(device_id, module_id)
+        destination = "/{}/inputs/{}".format(device.topic_base, input_name)
+        properties = dict({"$.to": destination}, **(properties or {}))
+        topic = "{}/inputs/{}/{}".format(
+            device.topic_base, input_name, _encode_properties(properties)
+        )
+        return self._send_to_device(device, topic, _to_bytes(payload))
+
+    def update_desired_properties(
+        self, device_id: str, patch: Dict[str, Any], module_id: Optional[str] = None
+    ) -> bool:
+        """Apply a patch to the desired properties of a device (or module), and send it to the
+        device. Returns False if it is not connected and subscribed to receive patches."""
+        device = self.get_device(device_id, module_id)
+        _merge_patch(device.desired, patch)
+        device.desired["$version"] += 1
+        version = device.desired["$version"]
+        topic = "$iothub/twin/PATCH/properties/desired/?$version={}".format(version)
+        payload = json.dumps(dict(patch, **{"$version": version})).encode("utf-8")
+        return self._send_to_device(device, topic, payload)
+
+    async def invoke_method(
+        self,
+        device_id: str,
+        method_name: str,
+        payload: Any = None,
+        module_id: Optional[str] = None,
+        timeout: float = 30,
+    ) -> Tuple[int, Any]:
+        """Invoke a direct method on a device (or module), returning the status and payload of
+        the response.
+
+        :raises: ValueError if the device is not connected and subscribed to direct methods
+        :raises: asyncio.TimeoutError if the device does not respond within the timeout
+        """
+        device = self.get_device(device_id, module_id)
+        request_id = uuid.uuid4().hex
+        topic = "$iothub/methods/POST/{}/?$rid={}".format(
+            urllib.parse.quote(method_name, safe=""), request_id
+        )
+        future = asyncio.get_running_loop().create_future()
+        self._pending_methods[request_id] = future
+        try:
+            if not self._send_to_device(device, topic, json.dumps(payload).encode("utf-8")):
+                raise ValueError("Device is not subscribed to direct methods")
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            del self._pending_methods[request_id]
+
+    def disconnect(self, device_id: str, module_id: Optional[str] = None) -> bool:
+        """Drop the connection of a device (or module). Returns False if it is not connected."""
+        device = self.get_device(device_id, module_id)
+        if not device.connection:
+            return False
+        device.connection.close()
+        return True
+
+    # Protocol #
+
+    def authenticate(self, client: BrokerClient) -> int:
+        if self.reject_connections:
+            return CONNACK_SERVER_UNAVAILABLE
+        username = client.username or ""
+        registration_prefix = "{}/registrations/".format(self.id_scope)
+        if username.startswith(registration_prefix):
+            registration_id = username[len(registration_prefix) :].split("/")[0]
+            return self._authenticate_registration(client, registration_id)
+        return self._authenticate_device(client)
+
+    def _authenticate_device(self, client: BrokerClient) -> int:
+        if not (client.username or "").startswith("{}/{}/".format(self.hostname, client.client_id)):
+            return CONNACK_BAD_USERNAME_OR_PASSWORD
+        device = self.devices.get(client.client_id)
+        if not self.authentication_enabled:
+            if not device:
+                device_id, _, module_id = client.client_id.partition("/")
+                device = self.add_device(device_id, "", module_id or None)
+        elif not device:
+            return CONNACK_NOT_AUTHORIZED
+        else:
+            uri = "{}/{}".format(self.hostname, device.topic_base)
+            if not _validate_sastoken(client.password, uri, device.shared_access_key):
+                return CONNACK_NOT_AUTHORIZED
+        # NOTE: As with IoT Hub, a new connection for a device replaces any existing one
+        if device.connection:
+            device.connection.close()
+        device.connection = client
+        self._identities[client] = device
+        return CONNACK_ACCEPTED
+
+    def _authenticate_registration(self, client: BrokerClient, registration_id: str) -> int:
+        if self.authentication_enabled:
+            key = self._get_enrollment_key(registration_id)
+            uri = "{}/registrations/{}".format(self.id_scope, registration_id)
+            if key is None or not _validate_sastoken(client.password, uri, key):
+                return CONNACK_NOT_AUTHORIZED
+        self._identities[client] = registration_id
+        return CONNACK_ACCEPTED
+
+    def _get_enrollment_key(self, registration_id: str) -> Optional[str]:
+        if registration_id in self.enrollments:
+            return self.enrollments[registration_id]
+        if self.enrollment_group_key:
+            return derive_device_key(self.enrollment_group_key, registration_id)
+        return None
+
+    def handle_disconnect(self, client: BrokerClient) -> None:
+        identity = self._identities.pop(client, None)
+        if isinstance(identity, EmulatedDevice) and identity.connection is client:
+            identity.connection = None
+        self._publish_counts.pop(client, None)
+
+    def handle_publish(
+        self, client: BrokerClient, topic: str, payload: bytes, packet_id: Optional[bytes]
+    ) -> None:
+        identity = self._identities[client]
+        if isinstance(identity, EmulatedDevice):
+            ack_delay = self._handle_device_publish(client, identity, topic, payload)
+        else:
+            ack_delay = self._handle_registration_publish(client, identity, topic, payload)
+        if ack_delay is None:
+            # NOTE: As with IoT Hub, publishing to a topic that is not allowed drops the connection
+            logger.warning("Dropping connection of {} for publish to {}".format(identity, topic))
+            client.close()
+            return
+        if packet_id is not None:
+            self._send_later(ack_delay, client.send_puback, packet_id)
+
+        if self.disconnect_after:
+            count = self._publish_counts.get(client, 0) + 1
+            self._publish_counts[client] = count
+            if count >= self.disconnect_after:
+                # NOTE: Acknowledgements and responses not yet sent are lost with the connection
+                client.close()
+
+    def _handle_device_publish(
+        self, client: BrokerClient, device: EmulatedDevice, topic: str, payload: bytes
+    ) -> Optional[float]:
+        """Handle a PUBLISH from a device, returning the delay before it is acknowledged, or
+        None if the topic is not allowed"""
+        telemetry_prefix = device.topic_base + "/messages/events/"
+        if topic.startswith(telemetry_prefix):
+            device.telemetry_received += 1
+            if self.on_telemetry:
+                properties = _decode_properties(topic[len(telemetry_prefix) :])
+                self.on_telemetry(device, properties, payload)
+            return self._telemetry_ack_delay(device)
+        elif topic.startswith("$iothub/twin/GET/"):
+            request_id = _get_query_param(topic, "$rid")
+            response = json.dumps(device.twin()).encode("utf-8")
+            self._respond(client, "$iothub/twin/res/200/?$rid={}".format(request_id), response)
+        elif topic.startswith("$iothub/twin/PATCH/properties/reported/"):
+            request_id = _get_query_param(topic, "$rid")
+            try:
+                patch = json.loads(payload)
+            except ValueError:
+                self._respond(client, "$iothub/twin/res/400/?$rid={}".format(request_id), b"")
+                return self.latency
+            _merge_patch(device.reported, patch)
+            device.reported["$version"] += 1
+            self._respond(
+                client,
+                "$iothub/twin/res/204/?$rid={}&$version={}".format(
+                    request_id, device.reported["$version"]
+                ),
+                b"",
+            )
+        elif topic.startswith("$iothub/methods/res/"):
+            status = int(topic.split("/")[3])
+            request_id = _get_query_param(topic, "$rid")
+            future = self._pending_methods.get(request_id)
+            if future and not future.done():
+                future.set_result((status, json.loads(payload) if payload else None))
+        else:
+            return None
+        return self.latency
+
+    def _handle_registration_publish(
+        self, client: BrokerClient, registration_id: str, topic: str, payload: bytes
+    ) -> Optional[float]:
+        """Handle a PUBLISH from a DPS registration, returning the delay before it is
+        acknowledged, or None if the topic is not allowed"""
+        if topic.startswith("$dps/registrations/PUT/iotdps-register/"):
+            request_id = _get_query_param(topic, "$rid")
+            operation_id = uuid.uuid4().hex
+            body = json.loads(payload) if payload else {}
+            if self.assign_on_register:
+                response = self._assign(operation_id, registration_id, body.get("payload"))
+                response_topic = "$dps/registrations/res/200/?$rid={}".format(request_id)
+            else:
+                self._operations[operation_id] = {
+                    "registration_id": registration_id,
+                    "payload": body.get("payload"),
+                }
+                response = {"operationId": operation_id, "status": "assigning"}
+                response_topic = "$dps/registrations/res/202/?$rid={}&retry-after=1".format(
+                    request_id
+                )
+            self._respond(client, response_topic, json.dumps(response).encode("utf-8"))
+        elif topic.startswith("$dps/registrations/GET/iotdps-get-operationstatus/"):
+            request_id = _get_query_param(topic, "$rid")
+            operation_id = _get_query_param(topic, "operationId")
+            operation = self._operations.get(operation_id)
+            if not operation or operation["registration_id"] != registration_id:
+                self._respond(client, "$dps/registrations/res/404/?$rid={}".format(request_id), b"")
+                return self.latency
+            del self._operations[operation_id]
+            response = self._assign(operation_id, registration_id, operation["payload"])
+            self._respond(
+                client,
+                "$dps/registrations/res/200/?$rid={}".format(request_id),
+                json.dumps(response).encode("utf-8"),
+            )
+        else:
+            return None
+        return self.latency
+
+    def _assign(self, operation_id: str, registration_id: str, payload: Any) -> Dict[str, Any]:
+        """Register a device with the emulated IoT Hub, returning the registration result"""
+        if registration_id not in self.devices:
+            key = self._get_enrollment_key(registration_id) or ""
+            self.add_device(registration_id, key)
+        self.registrations_completed += 1
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        return {
+            "operationId": operation_id,
+            "status": "assigned",
+            "registrationState": {
+                "registrationId": registration_id,
+                "deviceId": registration_id,
+                "assignedHub": self.hostname,
+                "subStatus": "initialAssignment",
+                "createdDateTimeUtc": now,
+                "lastUpdatedDateTimeUtc": now,
+                "etag": uuid.uuid4().hex,
+                "payload": payload,
+            },
+        }
+
+    def _telemetry_ack_delay(self, device: EmulatedDevice) -> float:
+        """Return the delay before a telemetry PUBACK is sent, including any throttling"""
+        if not self.max_messages_per_second:
+            return self.latency
+        now = time.monotonic()
+        ack_time = max(now, device._next_ack_time)
+        device._next_ack_time = ack_time + 1 / self.max_messages_per_second
+        return ack_time - now + self.latency
+
+    def _respond(self, client: BrokerClient, topic: str, payload: bytes) -> None:
+        self._send_later(self.latency, client.send_publish, topic, payload)
+
+    def _send_later(self, delay: float, send: Callable[..., None], *args: Any) -> None:
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, send, *args)
+        else:
+            send(*args)
+
+    def _send_to_device(self, device: EmulatedDevice, topic: str, payload: bytes) -> bool:
+        client = device.connection
+        if not client or not any(topic_matches(s, topic) for s in client.subscriptions):
+            return False
+        self._respond(client, topic, payload)
+        return True
+
+
+def derive_device_key(group_key: str, registration_id: str) -> str:
+    """Derive the symmetric key of a device from the key of its group enrollment"""
+    signature = hmac.HMAC(
+        base64.b64decode(group_key), registration_id.encode("utf-8"), hashlib.sha256
+    )
+    return base64.b64encode(signature.digest()).decode("utf-8")
+
+
+def _validate_sastoken(token: Optional[str], uri: str, shared_access_key: str) -> bool:
+    """Return a boolean indicating if a SAS token is valid for a resource URI and key"""
+    prefix = "SharedAccessSignature "
+    if not token or not token.startswith(prefix):
+        return False
+    fields = dict(field.partition("=")[::2] for field in token[len(prefix) :].split("&"))
+    try:
+        encoded_uri, signature, expiry = fields["sr"], fields["sig"], fields["se"]
+        expired = int(expiry) < time.time()
+        key = base64.b64decode(shared_access_key)
+    except (KeyError, ValueError):
+        return False
+    if expired or urllib.parse.unquote(encoded_uri) != uri:
+        return False
+    message = "{}\n{}".format(encoded_uri, expiry).encode("utf-8")
+    expected = base64.b64encode(hmac.HMAC(key, message, hashlib.sha256).digest()).decode("utf-8")
+    return hmac.compare_digest(urllib.parse.unquote(signature), expected)
+
+
+def _merge_patch(target: Dict[str, Any], patch: Dict[str, Any]) -> None:
+    """Apply a twin patch, in which null values delete properties"""
+    for key, value in patch.items():
+        if key == "$version":
+            continue
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_patch(target[key], value)
+        else:
+            target[key] = value
+
+
+def _get_query_param(topic: str, name: str) -> str:
+    query = topic.partition("?")[2]
+    return urllib.parse.parse_qs(query).get(name, [""])[0]
+
+
+def _encode_properties(properties: Optional[Dict[str, str]]) -> str:
+    if not properties:
+        return ""
+    return urllib.parse.urlencode(properties, quote_via=urllib.parse.quote)
+
+
+def _decode_properties(properties_string: str) -> Dict[str, str]:
+    return dict(urllib.parse.parse_qsl(properties_string, keep_blank_values=True))
+
+
+def _to_bytes(payload: Union[str, bytes]) -> bytes:
+    return payload.encode("utf-8") if isinstance(payload, str) else payload
+
+
+async def _serve(args) -> None:
+    ssl_context = None
+    if args.cert and args.key:
+        with open(args.cert, "rb") as f:
+            cert_pem = f.read()
+        with open(args.key, "rb") as f:
+            key_pem = f.read()
+        ssl_context = create_server_ssl_context(cert_pem, key_pem)
+    emulator = IoTHubEmulator(
+        hostname=args.hostname,
+        host=args.host,
+        port=args.port,
+        ssl_context=ssl_context,
+        id_scope=args.id_scope,
+        authenticate=not args.no_authenticate,
+        latency=args.latency,
+        max_messages_per_second=args.max_messages_per_second,
+        disconnect_after=args.disconnect_after,
+        assign_on_register=args.assign_on_register,
+    )
+    for device in args.device:
+        device_id, _, key = device.partition("=")
+        emulator.add_device(device_id, key)
+    if args.enrollment_group_key:
+        emulator.set_enrollment_group(args.enrollment_group_key)
+    async with emulator:
+        print(
+            "IoT Hub emulator listening on {}:{}".format(emulator.host, emulator.port), flush=True
+        )
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local IoT Hub and DPS protocol emulator")
+    parser.add_argument("--hostname", default=DEFAULT_HOSTNAME, help="hostname used by clients")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8883, help="port to listen on")
+    parser.add_argument("--cert", help="PEM certificate file (enables TLS)")
+    parser.add_argument("--key", help="PEM private key file (enables TLS)")
+    parser.add_argument("--id-scope", default=DEFAULT_ID_SCOPE, help="ID scope of the DPS")
+    parser.add_argument(
+        "--device", action="append", default=[], help="DEVICE_ID=KEY of a device to register"
+    )
+    parser.add_argument("--enrollment-group-key", help="key of a DPS group enrollment")
+    parser.add_argument(
+        "--no-authenticate", action="store_true", help="accept connections from any device"
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before responses")
+    parser.add_argument(
+        "--max-messages-per-second", type=float, help="per-device telemetry rate limit"
+    )
+    parser.add_argument(
+        "--disconnect-after", type=int, help="drop connections after this many publishes"
+    )
+    parser.add_argument(
+        "--assign-on-register", action="store_true", help="assign DPS registrations immediately"
+    )
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,248 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE file in the project root for
+# full license information.
+"""
+A local emulator of the HTTP API of IoT Hub (and of the IoT Edge module API used to invoke direct
+methods), for testing and benchmarking IoTHubHTTPClient without network access or any cloud
+resources.
+
+Implemented:
+    - Direct method invocations on devices and modules, answered by .method_handler (by default,
+        status 200 with the request payload echoed back).
+    - Storage info requests for blob uploads, returning a fake SAS URI for the requested blob.
+    - Blob upload status notifications.
+    - Telemetry, sent as single messages (with properties as headers) or in the batch JSON
+        format, with received messages stored in .messages (as (payload, properties) tuples).
+    - Azure Storage Put Block and Put Block List requests for the fake SAS URIs, with committed
+        blobs stored in .blobs (by blob name). SAS tokens are not validated.
+Every request is counted in .request_counts (by operation), and the number of connections
+accepted is counted, so that connection reuse can be checked. Authorization headers are not
+validated.
+
+To make tests more realistic, the emulator can be configured with:
+    - latency: Delay (in seconds) before every response is sent
+    - status: HTTP status to respond to every request with, instead of succeeding
+    - block_failures: Number of Put Block requests to fail (with status 503) before succeeding
+"""
+import argparse
+import asyncio
+import base64
+import collections
+import logging
+import ssl
+import uuid
+import xml.etree.ElementTree as ElementTree
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from aiohttp import web
+from .mqtt_broker import create_server_ssl_context, generate_self_signed_certificate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+
+# (device_id, module_id, method_params) -> (status, payload)
+MethodHandler = Callable[[str, Optional[str], Dict[str, Any]], Tuple[int, Any]]
+
+
+def echo_method_handler(
+    device_id: str, module_id: Optional[str], method_params: Dict[str, Any]
+) -> Tuple[int, Any]:
+    """Respond to every direct method with status 200 and the payload of the request"""
+    return 200, method_params.get("payload")
+
+
+class IoTHubHTTPEmulator:
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = 0,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        method_handler: MethodHandler = echo_method_handler,
+    ) -> None:
+        """Emulator of the HTTP API of IoT Hub.
+
+        :param str host: Address to listen on
+        :param int port: Port to listen on (0 for any available port, see .port once started)
+        :param ssl_context: SSLContext to serve HTTPS with. If not provided, plain HTTP is served.
+        :param method_handler: Function returning the status and payload to respond to a direct
+            method invocation with
+        """
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.method_handler = method_handler
+        self.latency = 0.0
+        self.status: Optional[int] = None
+        self.block_failures = 0
+        self.blobs: Dict[str, bytes] = {}
+        self.messages: List[Tuple[bytes, Dict[str, str]]] = []
+        self.max_blocks_in_flight = 0
+        self._blocks_in_flight = 0
+        self._staged_blocks: Dict[str, Dict[str, bytes]] = collections.defaultdict(dict)
+        self.request_counts: Dict[str, int] = collections.Counter()
+        self.connection_count = 0
+        self._transports: set = set()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def hostname(self) -> str:
+        """The hostname (including port) for clients to connect to"""
+        return "{}:{}".format(self.host, self.port)
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post("/twins/{device_id}/methods", self._handle_method)
+        app.router.add_post("/twins/{device_id}/modules/{module_id}/methods", self._handle_method)
+        app.router.add_post("/devices/{device_id}/files", self._handle_storage_info)
+        app.router.add_post(
+            "/devices/{device_id}/files/notifications", self._handle_upload_notification
+        )
+        app.router.add_post("/devices/{device_id}/messages/events", self._handle_telemetry)
+        app.router.add_put("/blob/{container}/{blob_name:.+}", self._handle_blob)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port, ssl_context=self.ssl_context)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        logger.debug("IoT Hub HTTP emulator listening on {}".format(self.hostname))
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "IoTHubHTTPEmulator":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.stop()
+
+    async def _record(self, request: web.Request, operation: str) -> Optional[web.Response]:
+        """Record a request, and return the error response to send instead of handling it, if
+        the emulator is configured to fail"""
+        if request.transport not in self._transports:
+            self._transports.add(request.transport)
+            self.connection_count += 1
+        self.request_counts[operation] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.status is not None:
+            return web.json_response({"Message": "fake error"}, status=self.status)
+        return None
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        error = await self._record(request, "method")
+        if error is not None:
+            return error
+        method_params = await request.json()
+        status, payload = self.method_handler(
+            request.match_info["device_id"], request.match_info.get("module_id"), method_params
+        )
+        return web.json_response({"status": status, "payload": payload})
+
+    async def _handle_storage_info(self, request: web.Request) -> web.Response:
+        error = await self._record(request, "storage_info")
+        if error is not None:
+            return error
+        body = await request.json()
+        device_id = request.match_info["device_id"]
+        return web.json_response(
+            {
+                "correlationId": str(uuid.uuid4()),
+                "hostName": "{}/blob".format(self.hostname),
+                "containerName": "fake-container",
+                "blobName": "{}/{}".format(device_id, body["blobName"]),
+                "sasToken": "?sv=fake&sig=fake",
+            }
+        )
+
+    async def _handle_upload_notification(self, request: web.Request) -> web.Response:
+        error = await self._record(request, "upload_notification")
+        if error is not None:
+            return error
+        await request.json()
+        return web.Response(status=204)
+
+    async def _handle_telemetry(self, request: web.Request) -> web.Response:
+        if request.content_type == "application/vnd.microsoft.iothub.json":
+            error = await self._record(request, "telemetry_batch")
+            if error is not None:
+                return error
+            for entry in await request.json():
+                body = entry["body"]
+                payload = base64.b64decode(body) if entry.get("base64Encoded") else body.encode()
+                self.messages.append((payload, entry.get("properties", {})))
+        else:
+            error = await self._record(request, "telemetry")
+            if error is not None:
+                return error
+            properties = {
+                name.lower(): value
+                for name, value in request.headers.items()
+                if name.lower().startswith("iothub-")
+            }
+            self.messages.append((await request.read(), properties))
+        return web.Response(status=204)
+
+    async def _handle_blob(self, request: web.Request) -> web.Response:
+        comp = request.query.get("comp")
+        if comp == "block":
+            return await self._handle_put_block(request)
+        elif comp == "blocklist":
+            return await self._handle_put_block_list(request)
+        return web.Response(status=400, reason="Unsupported blob operation")
+
+    async def _handle_put_block(self, request: web.Request) -> web.Response:
+        self._blocks_in_flight += 1
+        self.max_blocks_in_flight = max(self.max_blocks_in_flight, self._blocks_in_flight)
+        try:
+            error = await self._record(request, "put_block")
+            data = await request.read()
+        finally:
+            self._blocks_in_flight -= 1
+        if error is not None:
+            return error
+        if self.block_failures:
+            self.block_failures -= 1
+            return web.Response(status=503, reason="Server Busy")
+        self._staged_blocks[request.match_info["blob_name"]][request.query["blockid"]] = data
+        return web.Response(status=201)
+
+    async def _handle_put_block_list(self, request: web.Request) -> web.Response:
+        error = await self._record(request, "put_block_list")
+        if error is not None:
+            return error
+        blob_name = request.match_info["blob_name"]
+        staged = self._staged_blocks.pop(blob_name, {})
+        try:
+            block_ids = [
+                element.text or "" for element in ElementTree.fromstring(await request.read())
+            ]
+            data = b"".join(staged[block_id] for block_id in block_ids)
+        except (ElementTree.ParseError, KeyError):
+            return web.Response(status=400, reason="Invalid Block List")
+        self.blobs[blob_name] = data
+        return web.Response(status=201)
+
+
+async def main(args: argparse.Namespace) -> None:
+    ssl_context = None
+    if args.tls:
+        cert_pem, key_pem = generate_self_signed_certificate("localhost")
+        ssl_context = create_server_ssl_context(cert_pem, key_pem)
+    emulator = IoTHubHTTPEmulator(host=args.host, port=args.port, ssl_context=ssl_context)
+    emulator.latency = args.latency
+    async with emulator:
+        print("IoT Hub HTTP emulator listening on {}".format(emulator.hostname), flush=True)
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IoT Hub HTTP emulator")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--tls", action="store_true", help="serve HTTPS (self-signed)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before responding")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
@@ -1,6 +1,7 @@
 # Copyright (c) Microsoft. All rights reserved.
 # Licensed under the MIT license. See LICENSE file in the project root for
 # full license information.
+import collections
 import gc
 import inspect
 import os
@@ -156,6 +157,25 @@ class LeakTracker(object):
                 all.append(TrackedObject(obj))
         return all
 
+    def get_object_counts(self):
+        """
+        Return a dict mapping the name of each type implemented in a tracked module to the number
+        of objects of that type that currently exist.  Unlike `get_leaks`, this does not record
+        the objects themselves, so it is cheap enough to call periodically during a soak test.
+        """
+        counts = collections.Counter()
+        # Whether or not an object is tracked only depends on its type, so cache it by type
+        tracked_types = {}
+        for obj in gc.get_objects():
+            object_type = type(obj)
+            if object_type not in tracked_types:
+                tracked_types[object_type] = any(
+                    [mod.is_module_object(obj) for mod in self.tracked_modules]
+                )
+            if tracked_types[object_type]:
+                counts["{}.{}".format(object_type.__module__, object_type.__qualname__)] += 1
+        return dict(counts)
+
     def set_initial_object_list(self):
         self.initial_set_of_objects = self._get_all_tracked_objects()
 
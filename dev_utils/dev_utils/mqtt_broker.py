@@ -0,0 +1,419 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE file in the project root for
+# full license information.
+"""
+A minimal MQTT 3.1.1 broker, for running tests and benchmarks against a local stand-in for
+IoT Hub, without requiring network access or any cloud resources.
+
+This is NOT a complete MQTT broker. Only the functionality used by the SDK is implemented:
+    - CONNECT is always accepted. Credentials are not validated (override .authenticate()).
+    - PUBLISH (QoS 0 or 1) is acknowledged, and delivered at QoS 0 to all matching subscribers.
+    - SUBSCRIBE/UNSUBSCRIBE with '+' and '#' wildcards. Subscriptions are granted at QoS 0/1.
+    - PINGREQ and DISCONNECT
+Sessions are not persisted, and retained messages and wills are not supported.
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import ssl
+import struct
+import tempfile
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Packet types (upper 4 bits of the fixed header)
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+PublishHandler = Callable[["BrokerClient", str, bytes], None]
+
+
+class BrokerClient(object):
+    """A client connected to the MQTTBroker"""
+
+    def __init__(self, broker, writer):
+        self.broker = broker
+        self.client_id = None
+        self.username = None
+        self.password = None
+        self.subscriptions: Set[str] = set()
+        self._writer = writer
+
+    def send_publish(self, topic: str, payload: bytes) -> None:
+        """Send a QoS 0 PUBLISH to the client"""
+        encoded_topic = topic.encode("utf-8")
+        body = struct.pack("!H", len(encoded_topic)) + encoded_topic + payload
+        self._send(PUBLISH << 4, body)
+
+    def send_puback(self, packet_id: bytes) -> None:
+        self._send(PUBACK << 4, packet_id)
+
+    def close(self) -> None:
+        self._writer.close()
+
+    def _send(self, header: int, body: bytes = b"") -> None:
+        if not self._writer.is_closing():
+            self._writer.write(bytes([header]) + _encode_remaining_length(len(body)) + body)
+
+
+class SubscriptionTree(object):
+    """Subscriptions of clients, indexed by topic level, so that finding the subscribers of
+    a topic does not require checking every subscription"""
+
+    def __init__(self):
+        self.children: Dict[str, "SubscriptionTree"] = {}
+        self.clients: Set[BrokerClient] = set()
+
+    def add(self, subscription: str, client: BrokerClient) -> None:
+        node = self
+        for level in subscription.split("/"):
+            node = node.children.setdefault(level, SubscriptionTree())
+        node.clients.add(client)
+
+    def remove(self, subscription: str, client: BrokerClient) -> None:
+        node = self
+        for level in subscription.split("/"):
+            node = node.children.get(level)
+            if node is None:
+                return
+        node.clients.discard(client)
+
+    def match(self, topic: str) -> Set[BrokerClient]:
+        """Return the clients with a subscription matching the topic"""
+        matches: Set[BrokerClient] = set()
+        self._match(topic.split("/"), 0, matches)
+        return matches
+
+    def _match(self, levels: List[str], index: int, matches: Set[BrokerClient]) -> None:
+        multi_level = self.children.get("#")
+        if multi_level:
+            matches.update(multi_level.clients)
+        if index == len(levels):
+            matches.update(self.clients)
+            return
+        for key in (levels[index], "+"):
+            child = self.children.get(key)
+            if child:
+                child._match(levels, index + 1, matches)
+
+
+class MQTTBroker(object):
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        reuse_port: bool = False,
+    ):
+        """
+        :param str host: Address to listen on
+        :param int port: Port to listen on. If 0, an ephemeral port will be chosen, which can
+            be retrieved from the .port attribute once started.
+        :param ssl_context: Server SSLContext. If not provided, TLS will not be used.
+        :param bool reuse_port: Allow other processes to listen on the same port, with incoming
+            connections distributed between them. Messages are only delivered to subscribers
+            connected to the same process.
+        """
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.reuse_port = reuse_port
+        self.clients: Set[BrokerClient] = set()
+        self.subscriptions = SubscriptionTree()
+        self.publishes_received = 0
+        # Invoked for every PUBLISH received, before it is delivered to subscribers
+        self.on_publish: Optional[PublishHandler] = None
+        self._server = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle_connection,
+            self.host,
+            self.port,
+            ssl=self.ssl_context,
+            backlog=4096,
+            reuse_port=self.reuse_port or None,
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("MQTT broker listening on {}:{}".format(self.host, self.port))
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            for client in list(self.clients):
+                client.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def publish(self, topic: str, payload: bytes) -> int:
+        """Deliver a message to all clients subscribed to a matching topic.
+        Returns the number of clients it was delivered to."""
+        subscribers = self.subscriptions.match(topic)
+        for client in subscribers:
+            client.send_publish(topic, payload)
+        return len(subscribers)
+
+    def authenticate(self, client: BrokerClient) -> int:
+        """Return the CONNACK return code for a connecting client (0 accepts the connection).
+        Override to validate the client id and credentials."""
+        return 0
+
+    def handle_publish(
+        self, client: BrokerClient, topic: str, payload: bytes, packet_id: Optional[bytes]
+    ) -> None:
+        """Handle a PUBLISH received from a client. The packet id is None for QoS 0.
+        Override to change how messages are acknowledged or delivered."""
+        if packet_id is not None:
+            client.send_puback(packet_id)
+        self.publish(topic, payload)
+
+    def handle_disconnect(self, client: BrokerClient) -> None:
+        """Handle the connection of a client being closed. Override to clean up client state."""
+        pass
+
+    async def _handle_connection(self, reader, writer):
+        client = BrokerClient(self, writer)
+        self.clients.add(client)
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                length = await _read_remaining_length(reader)
+                body = await reader.readexactly(length) if length else b""
+                if not self._handle_packet(client, header[0], body):
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            self.clients.discard(client)
+            for subscription in client.subscriptions:
+                self.subscriptions.remove(subscription, client)
+            writer.close()
+            self.handle_disconnect(client)
+
+    def _handle_packet(self, client: BrokerClient, header: int, body: bytes) -> bool:
+        """Handle a packet from a client. Returns False if the connection should be closed."""
+        packet_type = header >> 4
+        if packet_type == CONNECT:
+            client.client_id, client.username, client.password = _parse_connect(body)
+            return_code = self.authenticate(client)
+            client._send(CONNACK << 4, bytes([0, return_code]))
+            if return_code:
+                return False
+        elif packet_type == PUBLISH:
+            qos = (header >> 1) & 0x03
+            (topic_length,) = struct.unpack_from("!H", body)
+            topic = body[2 : 2 + topic_length].decode("utf-8")
+            index = 2 + topic_length
+            packet_id = None
+            if qos > 0:
+                packet_id = body[index : index + 2]
+                index += 2
+            payload = body[index:]
+            self.publishes_received += 1
+            if self.on_publish:
+                self.on_publish(client, topic, payload)
+            self.handle_publish(client, topic, payload, packet_id)
+        elif packet_type == SUBSCRIBE:
+            packet_id = body[:2]
+            granted = bytearray()
+            for topic, qos in _parse_topic_list(body[2:], with_qos=True):
+                client.subscriptions.add(topic)
+                self.subscriptions.add(topic, client)
+                granted.append(min(qos, 1))
+            client._send(SUBACK << 4, packet_id + bytes(granted))
+        elif packet_type == UNSUBSCRIBE:
+            packet_id = body[:2]
+            for topic, _ in _parse_topic_list(body[2:], with_qos=False):
+                client.subscriptions.discard(topic)
+                self.subscriptions.remove(topic, client)
+            client._send(UNSUBACK << 4, packet_id)
+        elif packet_type == PINGREQ:
+            client._send(PINGRESP << 4)
+        elif packet_type == DISCONNECT:
+            return False
+        else:
+            logger.warning("Unsupported MQTT packet type: {}".format(packet_type))
+            return False
+        return True
+
+
+def topic_matches(subscription: str, topic: str) -> bool:
+    """Return a boolean indicating if a topic matches a subscription (which may use wildcards)"""
+    sub_levels = subscription.split("/")
+    topic_levels = topic.split("/")
+    for i, sub_level in enumerate(sub_levels):
+        if sub_level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if sub_level != "+" and sub_level != topic_levels[i]:
+            return False
+    return len(sub_levels) == len(topic_levels)
+
+
+def generate_self_signed_certificate(hostname: str = "localhost") -> Tuple[bytes, bytes]:
+    """Generate a self-signed certificate for a hostname.
+    Returns a tuple of the certificate and private key, in PEM format"""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostname)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(hostname)]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_pem = cert.public_bytes(serialization.Encoding.PEM)
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    return cert_pem, key_pem
+
+
+def create_server_ssl_context(cert_pem: bytes, key_pem: bytes) -> ssl.SSLContext:
+    """Create an SSLContext for the MQTTBroker from a certificate and key in PEM format"""
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    # NOTE: SSLContext can only load a certificate chain from a file
+    with tempfile.TemporaryDirectory() as directory:
+        cert_file = os.path.join(directory, "cert.pem")
+        key_file = os.path.join(directory, "key.pem")
+        with open(cert_file, "wb") as f:
+            f.write(cert_pem)
+        with open(key_file, "wb") as f:
+            f.write(key_pem)
+        ssl_context.load_cert_chain(cert_file, key_file)
+    return ssl_context
+
+
+def create_client_ssl_context(cert_pem: bytes) -> ssl.SSLContext:
+    """Create an SSLContext for clients of the MQTTBroker, trusting its certificate"""
+    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+    ssl_context.load_verify_locations(cadata=cert_pem.decode("ascii"))
+    return ssl_context
+
+
+def _parse_connect(body: bytes) -> Tuple[str, Optional[str], Optional[str]]:
+    """Return the client id, username and password from the body of a CONNECT packet"""
+    (protocol_name_length,) = struct.unpack_from("!H", body)
+    index = 2 + protocol_name_length
+    flags = body[index + 1]
+    index += 4  # Protocol level, flags, keep alive
+    client_id, index = _read_string(body, index)
+    if flags & 0x04:
+        # Will topic and will message
+        _, index = _read_string(body, index)
+        _, index = _read_string(body, index)
+    username = None
+    if flags & 0x80:
+        username, index = _read_string(body, index)
+    password = None
+    if flags & 0x40:
+        password, index = _read_string(body, index)
+    return client_id, username, password
+
+
+def _parse_topic_list(data: bytes, with_qos: bool) -> List[Tuple[str, int]]:
+    topics = []
+    index = 0
+    while index < len(data):
+        topic, index = _read_string(data, index)
+        qos = 0
+        if with_qos:
+            qos = data[index]
+            index += 1
+        topics.append((topic, qos))
+    return topics
+
+
+def _read_string(data: bytes, index: int) -> Tuple[str, int]:
+    (length,) = struct.unpack_from("!H", data, index)
+    start = index + 2
+    return data[start : start + length].decode("utf-8"), start + length
+
+
+async def _read_remaining_length(reader) -> int:
+    multiplier = 1
+    value = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        value += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            return value
+        multiplier *= 128
+
+
+def _encode_remaining_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        encoded.append(byte)
+        if not length:
+            return bytes(encoded)
+
+
+async def _serve(args) -> None:
+    ssl_context = None
+    if args.cert and args.key:
+        with open(args.cert, "rb") as f:
+            cert_pem = f.read()
+        with open(args.key, "rb") as f:
+            key_pem = f.read()
+        ssl_context = create_server_ssl_context(cert_pem, key_pem)
+    broker = MQTTBroker(
+        host=args.host, port=args.port, ssl_context=ssl_context, reuse_port=args.reuse_port
+    )
+    async with broker:
+        print("MQTT broker listening on {}:{}".format(broker.host, broker.port), flush=True)
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal local MQTT broker")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=1883, help="port to listen on")
+    parser.add_argument("--cert", help="PEM certificate file (enables TLS)")
+    parser.add_argument("--key", help="PEM private key file (enables TLS)")
+    parser.add_argument(
+        "--reuse-port", action="store_true", help="share the port with other broker processes"
+    )
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,67 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+"""This sample demonstrates handling direct method requests concurrently using a
+DirectMethodDispatcher with an IoTHubSession."""
+
+import asyncio
+import os
+from azure.iot.device import (
+    IoTHubSession,
+    DirectMethodDispatcher,
+    MQTTError,
+    MQTTConnectionFailedError,
+)
+
+CONNECTION_STRING = os.getenv("IOTHUB_DEVICE_CONNECTION_STRING")
+
+
+async def handle_foo(method_request):
+    print("Direct Method request received for 'foo'. Invoking.")
+    await asyncio.sleep(1)
+    return {"result": "foo"}
+
+
+async def handle_slow(method_request):
+    # This handler takes a long time, but does not block requests for 'foo'.
+    # If it runs longer than the dispatcher's handler timeout, it will be cancelled and
+    # a timeout response will be sent instead.
+    print("Direct Method request received for 'slow'. Invoking.")
+    await asyncio.sleep(10)
+    return {"result": "slow"}
+
+
+async def main():
+    dispatcher = DirectMethodDispatcher(max_concurrency=4, handler_timeout=20)
+    dispatcher.register("foo", handle_foo)
+    dispatcher.register("slow", handle_slow)
+
+    print("Starting direct method dispatcher sample")
+    print("Press Ctrl-C to exit")
+    while True:
+        try:
+            print("Connecting to IoT Hub...")
+            async with IoTHubSession.from_connection_string(CONNECTION_STRING) as session:
+                print("Connected to IoT Hub")
+                print("Waiting to receive direct method requests...")
+                await dispatcher.run(session)
+
+        except MQTTError:
+            # Connection has been lost. Reconnect on next pass of loop.
+            print("Dropped connection. Reconnecting in 1 second")
+            await asyncio.sleep(1)
+        except MQTTConnectionFailedError:
+            # Connection failed to be established. Retry on next pass of loop.
+            print("Could not connect. Retrying in 10 seconds")
+            await asyncio.sleep(10)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        # Exit application because user indicated they wish to exit.
+        # This will have cancelled `main()` implicitly.
+        print("User initiated exit. Exiting.")
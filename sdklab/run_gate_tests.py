@@ -35,7 +35,10 @@ def run_test_app(relative_app_name, timeout):
 
 
 if __name__ == "__main__":
-    run_test_app("./simple_stress/simple_send_message_bulk.py", timeout=600)
+    run_test_app(
+        "../benchmarks/e2e_benchmark.py --duration 2 --concurrency 1,100 --payload-sizes 256",
+        timeout=600,
+    )
     run_test_app("./regressions/regression_pr_1023_infinite_get_twin.py", timeout=600)
     run_test_app("./regressions/regression_issue_990_exception_after_publish.py", timeout=600)
     run_test_app("./fuzzing/fuzz_send_message.py 1", timeout=600)
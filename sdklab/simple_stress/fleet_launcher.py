@@ -0,0 +1,379 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import base64
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import hmac
+import json
+import logging
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from azure.iot.device import ProvisioningSession, SessionHost
+from dev_utils import mqtt_broker
+
+logging.basicConfig(level=logging.WARNING)
+
+"""
+This app simulates a large fleet of devices by splitting the device identities across a pool of
+processes. Each worker process runs its own event loop, hosting its share of the devices as
+IoTHubSessions in a SessionHost, and each device sends telemetry for the duration of the run.
+The parent process aggregates throughput, latency and error statistics from all workers.
+
+Device identities can be provided in one of three ways:
+    --connection-strings FILE: A file containing one device connection string per line.
+    --dps: Devices are provisioned from a symmetric key group enrollment, using the
+        PROVISIONING_HOST, PROVISIONING_IDSCOPE and PROVISIONING_GROUP_KEY environment
+        variables. Registration ids are "<--registration-id-prefix><n>".
+    --local-broker: Fake identities connect to a local MQTT broker (dev_utils.mqtt_broker) on
+        localhost:8883 instead of an IoT Hub, so no cloud resources are required. Broker
+        processes share the port, so that the broker does not become the bottleneck.
+
+With --scale, the run is repeated with 1, 2, 4... processes (up to --processes), and the
+throughput of each run is reported relative to that of a single process.
+
+Usage: python fleet_launcher.py (--connection-strings FILE | --dps | --local-broker)
+    [--devices N] [--processes N] [--duration SECONDS] [--rate N] [--scale] [--json]
+"""
+
+LOCAL_HOSTNAME = "localhost"
+LOCAL_PORT = 8883
+FAKE_SHARED_ACCESS_KEY = "Zm9vYmFy"
+
+# Latencies are recorded in a histogram with buckets of 1/LATENCY_BUCKETS_PER_DOUBLING of a
+# power of 2 (in microseconds), so that workers do not need to send every sample to the parent.
+LATENCY_BUCKETS_PER_DOUBLING = 8
+
+
+class Stats(object):
+    """Statistics for a shard of devices, which can be merged with those of other shards"""
+
+    def __init__(self):
+        self.devices = 0
+        self.connected = 0
+        self.sent = 0
+        self.errors = collections.Counter()
+        self.latency_buckets = collections.Counter()
+        self.start = None
+        self.end = None
+
+    def record_latency(self, seconds):
+        bucket = int(math.log2(max(seconds * 1000000, 1)) * LATENCY_BUCKETS_PER_DOUBLING)
+        self.latency_buckets[bucket] += 1
+
+    def record_error(self, operation, error):
+        self.errors["{}: {}".format(operation, type(error).__name__)] += 1
+
+    def merge(self, other):
+        self.devices += other.devices
+        self.connected += other.connected
+        self.sent += other.sent
+        self.errors.update(other.errors)
+        self.latency_buckets.update(other.latency_buckets)
+        if other.start is not None:
+            self.start = other.start if self.start is None else min(self.start, other.start)
+            self.end = other.end if self.end is None else max(self.end, other.end)
+
+    def latency_percentile(self, percentile):
+        """Return the latency (in milliseconds) below which the given percentile falls"""
+        total = sum(self.latency_buckets.values())
+        if not total:
+            return None
+        threshold = total * percentile / 100
+        count = 0
+        for bucket in sorted(self.latency_buckets):
+            count += self.latency_buckets[bucket]
+            if count >= threshold:
+                # Upper bound of the bucket
+                return 2 ** ((bucket + 1) / LATENCY_BUCKETS_PER_DOUBLING) / 1000
+
+    def summary(self):
+        elapsed = (self.end - self.start) if self.start is not None else 0
+        return {
+            "devices": self.devices,
+            "connected": self.connected,
+            "sent": self.sent,
+            "seconds": round(elapsed, 2),
+            "messages_per_second": round(self.sent / elapsed, 1) if elapsed else 0,
+            "latency_ms_p50": _round(self.latency_percentile(50)),
+            "latency_ms_p99": _round(self.latency_percentile(99)),
+            "errors": dict(self.errors),
+        }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def raise_fd_limit():
+    """Raise the soft limit on open file descriptors to the hard limit"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def derive_device_key(group_key, registration_id):
+    """Derive the symmetric key of a device from the key of its group enrollment"""
+    signature = hmac.HMAC(
+        base64.b64decode(group_key), registration_id.encode("utf-8"), hashlib.sha256
+    )
+    return base64.b64encode(signature.digest()).decode("utf-8")
+
+
+def load_identities(args):
+    """Return a list of device identities, each a dict of IoTHubSession or provisioning args"""
+    if args.connection_strings:
+        with open(args.connection_strings) as f:
+            lines = [line.strip() for line in f if line.strip()]
+        return [{"connection_string": line} for line in lines[: args.devices or None]]
+    elif args.dps:
+        group_key = os.environ["PROVISIONING_GROUP_KEY"]
+        identities = []
+        for i in range(args.devices):
+            registration_id = "{}{}".format(args.registration_id_prefix, i)
+            identities.append(
+                {
+                    "provisioning_host": os.environ["PROVISIONING_HOST"],
+                    "id_scope": os.environ["PROVISIONING_IDSCOPE"],
+                    "registration_id": registration_id,
+                    "shared_access_key": derive_device_key(group_key, registration_id),
+                }
+            )
+        return identities
+    else:
+        return [
+            {
+                "hostname": LOCAL_HOSTNAME,
+                "device_id": "fleet-device-{}".format(i),
+                "shared_access_key": FAKE_SHARED_ACCESS_KEY,
+            }
+            for i in range(args.devices)
+        ]
+
+
+async def provision(identity):
+    """Provision a device, returning the IoTHubSession args for the assigned IoT Hub"""
+    async with ProvisioningSession(
+        provisioning_host=identity["provisioning_host"],
+        id_scope=identity["id_scope"],
+        registration_id=identity["registration_id"],
+        shared_access_key=identity["shared_access_key"],
+    ) as session:
+        result = await session.register()
+    state = result["registrationState"]
+    return {
+        "hostname": state["assignedHub"],
+        "device_id": state["deviceId"],
+        "shared_access_key": identity["shared_access_key"],
+    }
+
+
+def create_session(host, identity, ssl_context):
+    if "connection_string" in identity:
+        return host.create_session_from_connection_string(
+            identity["connection_string"], ssl_context=ssl_context
+        )
+    return host.create_session(ssl_context=ssl_context, **identity)
+
+
+async def run_device(session, stats, start, end, interval, payload):
+    """Send messages from a device until the end time"""
+    await asyncio.sleep(max(0, start - time.time()))
+    next_send = start
+    while time.time() < end:
+        send_start = time.perf_counter()
+        try:
+            await session.send_message(payload)
+        except Exception as e:
+            stats.record_error("send_message", e)
+            if not session.connected:
+                return
+            continue
+        stats.sent += 1
+        stats.record_latency(time.perf_counter() - send_start)
+        if interval:
+            next_send += interval
+            await asyncio.sleep(max(0, next_send - time.time()))
+
+
+async def run_shard_async(identities, options):
+    stats = Stats()
+    stats.devices = len(identities)
+    ssl_context = None
+    if options["cert_pem"]:
+        ssl_context = mqtt_broker.create_client_ssl_context(options["cert_pem"])
+    semaphore = asyncio.Semaphore(options["batch_size"])
+
+    async with contextlib.AsyncExitStack() as stack:
+        host = await stack.enter_async_context(SessionHost())
+
+        async def connect(identity):
+            async with semaphore:
+                try:
+                    if "registration_id" in identity:
+                        identity = await provision(identity)
+                    session = create_session(host, identity, ssl_context)
+                    await stack.enter_async_context(session)
+                except Exception as e:
+                    stats.record_error("connect", e)
+                    return None
+                return session
+
+        sessions = [s for s in await asyncio.gather(*map(connect, identities)) if s]
+        stats.connected = len(sessions)
+
+        # All shards start sending at the same time, once all shards have had time to connect
+        stats.start = options["start"]
+        stats.end = stats.start + options["duration"]
+        interval = 1 / options["rate"] if options["rate"] else 0
+        payload = "x" * options["payload_size"]
+        await asyncio.gather(
+            *[
+                run_device(session, stats, stats.start, stats.end, interval, payload)
+                for session in sessions
+            ]
+        )
+        stats.end = max(stats.end, time.time())
+    return stats
+
+
+def run_shard(identities, options):
+    """Entry point of a worker process"""
+    raise_fd_limit()
+    return asyncio.run(run_shard_async(identities, options))
+
+
+def run_fleet(identities, processes, options):
+    """Run the fleet split across a pool of processes, returning the aggregated Stats"""
+    shards = [identities[i::processes] for i in range(processes)]
+    # NOTE: Connecting is given a fixed amount of time, so that sending starts at the same time
+    # in all processes, and throughput is measured over the same window.
+    options = dict(options, start=time.time() + options["connect_time"])
+    total = Stats()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        for stats in executor.map(run_shard, shards, [options] * processes):
+            total.merge(stats)
+    return total
+
+
+@contextlib.contextmanager
+def local_brokers(num_processes):
+    """Run broker processes sharing localhost:8883, yielding the certificate they use"""
+    cert_pem, key_pem = mqtt_broker.generate_self_signed_certificate(LOCAL_HOSTNAME)
+    with tempfile.TemporaryDirectory() as directory:
+        cert_file = os.path.join(directory, "cert.pem")
+        key_file = os.path.join(directory, "key.pem")
+        with open(cert_file, "wb") as f:
+            f.write(cert_pem)
+        with open(key_file, "wb") as f:
+            f.write(key_pem)
+        brokers = []
+        try:
+            for _ in range(num_processes):
+                broker = subprocess.Popen(
+                    [sys.executable, "-m", "dev_utils.mqtt_broker", "--port", str(LOCAL_PORT)]
+                    + ["--cert", cert_file, "--key", key_file, "--reuse-port"],
+                    stdout=subprocess.PIPE,
+                )
+                brokers.append(broker)
+                # Wait for the broker to start listening
+                broker.stdout.readline()
+            yield cert_pem
+        finally:
+            for broker in brokers:
+                broker.terminate()
+                broker.wait()
+
+
+def print_summary(processes, summary, baseline=None):
+    line = (
+        "processes={} devices={connected}/{devices} sent={sent} seconds={seconds} "
+        "throughput={messages_per_second}/s p50={latency_ms_p50}ms p99={latency_ms_p99}ms".format(
+            processes, **summary
+        )
+    )
+    if baseline:
+        line += " speedup={:.2f}x".format(summary["messages_per_second"] / baseline)
+    print(line)
+    for error, count in summary["errors"].items():
+        print("    {} x{}".format(count, error))
+
+
+def main(args):
+    raise_fd_limit()
+    identities = load_identities(args)
+    options = {
+        "duration": args.duration,
+        "rate": args.rate,
+        "payload_size": args.payload_size,
+        "batch_size": args.batch_size,
+        "connect_time": args.connect_time,
+        "cert_pem": None,
+    }
+    if args.scale:
+        process_counts = [2**i for i in range(int(math.log2(args.processes)) + 1)]
+        if process_counts[-1] != args.processes:
+            process_counts.append(args.processes)
+    else:
+        process_counts = [args.processes]
+
+    results = []
+    with contextlib.ExitStack() as stack:
+        if args.local_broker:
+            options["cert_pem"] = stack.enter_context(local_brokers(args.broker_processes))
+        for processes in process_counts:
+            summary = run_fleet(identities, processes, options).summary()
+            summary["processes"] = processes
+            results.append(summary)
+            print_summary(processes, summary, results[0]["messages_per_second"])
+
+    if args.json:
+        print(json.dumps(results))
+    # Succeed only if every device connected and sent without error
+    return all(r["connected"] == r["devices"] and not r["errors"] for r in results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-process simulated device fleet")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--connection-strings", help="file with one connection string per line")
+    source.add_argument("--dps", action="store_true", help="provision from a group enrollment")
+    source.add_argument("--local-broker", action="store_true", help="use a local MQTT broker")
+    parser.add_argument("--devices", type=int, default=1000, help="number of devices")
+    parser.add_argument(
+        "--processes", type=int, default=os.cpu_count(), help="number of worker processes"
+    )
+    parser.add_argument("--duration", type=float, default=30, help="seconds to send for")
+    parser.add_argument(
+        "--rate", type=float, default=0, help="messages per second per device (0 for max)"
+    )
+    parser.add_argument("--payload-size", type=int, default=256, help="message size in bytes")
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="devices to connect concurrently per process"
+    )
+    parser.add_argument(
+        "--connect-time", type=float, default=30, help="seconds allowed for connecting"
+    )
+    parser.add_argument("--scale", action="store_true", help="measure 1, 2, 4... processes")
+    parser.add_argument(
+        "--broker-processes",
+        type=int,
+        default=os.cpu_count(),
+        help="local broker processes (with --local-broker)",
+    )
+    parser.add_argument("--registration-id-prefix", default="fleet-device-", help="for --dps")
+    parser.add_argument("--json", action="store_true", help="also print results as JSON")
+    success = main(parser.parse_args())
+    sys.exit(0 if success else 1)
@@ -0,0 +1,153 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import json
+import logging
+import ssl
+import sys
+import time
+import paho.mqtt.client as mqtt
+from azure.iot.device import config
+from azure.iot.device import iothub_mqtt_client
+from azure.iot.device import mqtt_topic_iothub as mqtt_topic
+
+logging.basicConfig(level=logging.WARNING)
+
+"""
+This app stresses the request/response infrastructure (the `RequestLedger`) by issuing thousands
+of concurrent `get_twin` requests against an `IoTHubMQTTClient` whose network layer is replaced
+with a fake that echoes a twin response for every twin request it receives.
+
+No IoTHub (or network) is required. Since the transport is fake, the numbers reported are the
+overhead of the client itself - request tracking, topic formatting, and response matching.
+
+Usage: python get_twin_stress.py [--requests N] [--rounds N] [--drop-every N] [--timeout SECS]
+
+With `--drop-every N`, every Nth request never receives a response. Unless `--timeout` is provided,
+those requests remain outstanding in the ledger, and are reported as hung at the end of each round.
+With `--timeout`, they instead expire, and are reported as timed out.
+"""
+
+FAKE_TWIN = {"desired": {"$version": 1}, "reported": {"$version": 1}}
+
+
+def create_client():
+    client_config = config.IoTHubClientConfig(
+        device_id="stress-device",
+        hostname="fake.azure-devices.net",
+        ssl_context=ssl.create_default_context(),
+    )
+    return iothub_mqtt_client.IoTHubMQTTClient(client_config)
+
+
+def hook_fake_transport(client, drop_every):
+    """Replace the network operations of the client's MQTTClient with fakes that echo a twin
+    response for every twin request published"""
+    mqtt_client = client._mqtt_client
+    response_topic = mqtt_topic.get_twin_response_topic_for_subscribe()
+    response_queue = mqtt_client._incoming_filtered_messages[response_topic]
+    payload = json.dumps(FAKE_TWIN).encode("utf-8")
+    publish_count = 0
+
+    async def fake_subscribe(topic):
+        pass
+
+    async def fake_publish(topic, _payload, timeout=None):
+        nonlocal publish_count
+        publish_count += 1
+        if drop_every and publish_count % drop_every == 0:
+            return
+        request_id = topic.split("$rid=")[1]
+        message = mqtt.MQTTMessage(
+            topic="$iothub/twin/res/200/?$rid={}".format(request_id).encode("utf-8")
+        )
+        message.payload = payload
+        response_queue.put_nowait(message)
+
+    mqtt_client.subscribe = fake_subscribe
+    mqtt_client.publish = fake_publish
+
+
+async def run_round(client, num_requests, timeout):
+    latencies = []
+    timed_out = 0
+
+    async def timed_get_twin():
+        nonlocal timed_out
+        start = time.perf_counter()
+        try:
+            await client.get_twin(timeout=timeout)
+        except asyncio.TimeoutError:
+            timed_out += 1
+        else:
+            latencies.append(time.perf_counter() - start)
+
+    tasks = [asyncio.create_task(timed_get_twin()) for _ in range(num_requests)]
+    start = time.perf_counter()
+    # Dropped requests will never complete, so don't wait forever for them
+    done, pending = await asyncio.wait(tasks, timeout=5)
+    elapsed = time.perf_counter() - start
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    failures = [t for t in done if t.exception() is not None]
+    return elapsed, sorted(latencies), len(pending), timed_out, len(failures)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+async def main(args):
+    client = create_client()
+    hook_fake_transport(client, args.drop_every)
+    await client.start()
+    success = True
+    try:
+        for round_number in range(1, args.rounds + 1):
+            elapsed, latencies, hung, timed_out, failures = await run_round(
+                client, args.requests, args.timeout
+            )
+            print(
+                "round={} requests={} completed={} hung={} timed_out={} failed={} elapsed={:.3f}s rate={:.0f}/s p50={:.2f}ms p99={:.2f}ms".format(
+                    round_number,
+                    args.requests,
+                    len(latencies),
+                    hung,
+                    timed_out,
+                    failures,
+                    elapsed,
+                    len(latencies) / elapsed,
+                    percentile(latencies, 50) * 1000,
+                    percentile(latencies, 99) * 1000,
+                )
+            )
+            if failures or (not args.drop_every and hung):
+                success = False
+        print("ledger stats: {}".format(client._request_ledger.stats))
+        if len(client._request_ledger):
+            print("ledger still tracking {} requests".format(len(client._request_ledger)))
+            success = False
+    finally:
+        await client.stop()
+    return success
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent get_twin stress test")
+    parser.add_argument("--requests", type=int, default=5000, help="concurrent requests per round")
+    parser.add_argument("--rounds", type=int, default=5, help="number of rounds")
+    parser.add_argument(
+        "--drop-every", type=int, default=0, help="drop the response to every Nth request"
+    )
+    parser.add_argument("--timeout", type=float, default=None, help="timeout for each request")
+    success = asyncio.run(main(parser.parse_args()))
+    sys.exit(0 if success else 1)
@@ -0,0 +1,431 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from azure.iot.device import IoTHubSession
+from dev_utils import iothub_emulator, leak_tracker, mqtt_broker
+
+logging.basicConfig(level=logging.WARNING)
+
+"""
+This app is a soak test for the memory behavior of an IoTHubSession. It connects to a local IoT
+Hub emulator (dev_utils.iothub_emulator) on localhost:8883, so no IoTHub is required, and then
+sends telemetry and receives C2D messages at a steady rate for the duration of the run (hours,
+by default), because leaks of pending futures or queue entries are too small to notice in a
+short test.
+
+Before the soak begins, the allocation cost of a message is measured with tracemalloc:
+    - sent: The peak memory used by a burst of concurrent send_message() calls, per message.
+    - received: The peak memory used by a burst of C2D messages received through .messages(),
+        per message.
+
+During the soak, a sample is taken every `--sample-interval` seconds (after a full garbage
+collection) of:
+    - The memory traced by tracemalloc, and the RSS of the process.
+    - The number of objects of each type implemented in azure.iot.device (counted with
+        dev_utils.leak_tracker), and the number of pending asyncio futures and queued items.
+
+The first sample after `--warmup` seconds is the baseline. At the end of the run, the growth of
+traced memory since the baseline is reported, in total, per message, and per hour (as the slope
+of all samples since the baseline), along with the allocations and types that grew the most.
+The run fails if traced memory grew by more than `--budget` bytes, or the count of any type grew
+by more than `--object-budget`.
+
+Usage: python memory_soak.py [--duration SECONDS] [--rate N] [--c2d-rate N] [--budget BYTES]
+"""
+
+HOSTNAME = "localhost"
+PORT = 8883
+DEVICE_ID = "memory-soak-device"
+SHARED_ACCESS_KEY = "Zm9vYmFy"
+OPERATION_TIMEOUT = 60
+TOP_DIFFERENCES = 10
+# Allocations made by the soak test itself (e.g. its samples) are not counted
+HARNESS_FILTERS = [
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, leak_tracker.__file__),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+]
+
+
+def random_payload(size):
+    return "".join(random.choice(string.ascii_letters) for _ in range(size))
+
+
+def rss_kib():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+# Fake Service (runs in the emulator process) #
+
+
+async def run_service(args):
+    """Run the IoT Hub emulator, sending C2D messages when a "c2d <count> <size>" command is
+    received on stdin"""
+    with open(args.cert, "rb") as f:
+        cert_pem = f.read()
+    with open(args.key, "rb") as f:
+        key_pem = f.read()
+    emulator = iothub_emulator.IoTHubEmulator(
+        hostname=HOSTNAME,
+        port=PORT,
+        ssl_context=mqtt_broker.create_server_ssl_context(cert_pem, key_pem),
+    )
+    emulator.add_device(DEVICE_ID, SHARED_ACCESS_KEY)
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    async with emulator:
+        print(
+            "IoT Hub emulator listening on {}:{}".format(emulator.host, emulator.port), flush=True
+        )
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            _, count, size = line.decode("utf-8").split()
+            payload = random_payload(int(size))
+            for i in range(int(count)):
+                emulator.send_c2d_message(DEVICE_ID, payload)
+                if i % 100 == 0:
+                    await asyncio.sleep(0)
+
+
+def request_c2d(service, count, size):
+    service.stdin.write("c2d {} {}\n".format(count, size).encode())
+    service.stdin.flush()
+
+
+# Measurements #
+
+
+class Counters(object):
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.errors = {}
+
+    def add_error(self, e):
+        name = type(e).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def peak_bytes_per_message(base, count):
+    """Return the peak traced memory since the last reset_peak(), above base, per message"""
+    _, peak = tracemalloc.get_traced_memory()
+    return round((peak - base) / count)
+
+
+def reset_peak():
+    gc.collect()
+    # NOTE: reset_peak() was added in Python 3.9. Before that, the peak can only be reset by
+    # restarting tracemalloc, which also forgets every allocation traced so far.
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    else:
+        frames = tracemalloc.get_traceback_limit()
+        tracemalloc.stop()
+        tracemalloc.start(frames)
+    current, _ = tracemalloc.get_traced_memory()
+    return current
+
+
+async def measure_allocations(session, service, args):
+    """Measure the peak memory per message of a burst of sent and of received messages"""
+    payload = random_payload(args.payload_size)
+    # Warm up the code paths so that one-off allocations (e.g. imports and caches) aren't counted
+    await asyncio.gather(*[session.send_message(payload) for _ in range(10)])
+
+    base = reset_peak()
+    await asyncio.gather(*[session.send_message(payload) for _ in range(args.burst_size)])
+    sent = peak_bytes_per_message(base, args.burst_size)
+
+    async with session.messages() as messages:
+        request_c2d(service, 10, args.payload_size)
+        for _ in range(10):
+            await asyncio.wait_for(messages.__anext__(), OPERATION_TIMEOUT)
+
+        base = reset_peak()
+        request_c2d(service, args.burst_size, args.payload_size)
+        for _ in range(args.burst_size):
+            await asyncio.wait_for(messages.__anext__(), OPERATION_TIMEOUT)
+        received = peak_bytes_per_message(base, args.burst_size)
+    return {"peak_bytes_per_sent_message": sent, "peak_bytes_per_received_message": received}
+
+
+def count_pending():
+    """Return (pending asyncio futures, items in asyncio queues)"""
+    futures = 0
+    queued = 0
+    for obj in gc.get_objects():
+        if isinstance(obj, asyncio.Future):
+            if not obj.done():
+                futures += 1
+        elif isinstance(obj, asyncio.Queue):
+            queued += obj.qsize()
+    return futures, queued
+
+
+def take_sample(tracker, counters, start):
+    gc.collect()
+    futures, queued = count_pending()
+    snapshot = tracemalloc.take_snapshot().filter_traces(HARNESS_FILTERS)
+    sample = {
+        "elapsed": round(time.monotonic() - start, 1),
+        "sent": counters.sent,
+        "received": counters.received,
+        "traced_bytes": sum(trace.size for trace in snapshot.traces),
+        "rss_kib": rss_kib(),
+        "pending_futures": futures,
+        "queued_items": queued,
+        "object_counts": tracker.get_object_counts(),
+    }
+    return sample, snapshot
+
+
+def slope_per_hour(samples):
+    """Return the least squares slope of traced memory over time, in bytes per hour"""
+    if len(samples) < 2:
+        return 0
+    xs = [sample["elapsed"] for sample in samples]
+    ys = [sample["traced_bytes"] for sample in samples]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    if not variance:
+        return 0
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    return round(covariance / variance * 3600)
+
+
+def object_growth(baseline, sample):
+    """Return a list of (type name, growth) for types with more objects than at the baseline"""
+    growth = []
+    for name, count in sample["object_counts"].items():
+        difference = count - baseline["object_counts"].get(name, 0)
+        if difference > 0:
+            growth.append((name, difference))
+    return sorted(growth, key=lambda item: item[1], reverse=True)
+
+
+def print_sample(sample, baseline):
+    line = (
+        "{elapsed:>9.0f}s sent={sent} received={received} traced={traced_kib}KiB "
+        "rss={rss_kib}KiB futures={pending_futures} queued={queued_items}".format(
+            traced_kib=round(sample["traced_bytes"] / 1024), **sample
+        )
+    )
+    if baseline:
+        line += " growth={:+}B".format(sample["traced_bytes"] - baseline["traced_bytes"])
+    print(line, flush=True)
+
+
+# Soak #
+
+
+async def send_loop(session, counters, args, end):
+    payload = random_payload(args.payload_size)
+    loop = asyncio.get_running_loop()
+    interval = 1 / args.rate
+    next_send = loop.time()
+    while loop.time() < end:
+        try:
+            await session.send_message(payload)
+            counters.sent += 1
+        except Exception as e:
+            counters.add_error(e)
+        next_send += interval
+        delay = next_send - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def c2d_loop(service, args, end):
+    # NOTE: C2D messages are requested in batches once a second, so that the service isn't
+    # instructed for every message
+    loop = asyncio.get_running_loop()
+    while loop.time() < end:
+        request_c2d(service, args.c2d_rate, args.payload_size)
+        await asyncio.sleep(1)
+
+
+async def receive_loop(messages, counters):
+    async for _ in messages:
+        counters.received += 1
+
+
+async def soak(session, service, tracker, args):
+    counters = Counters()
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+    end = loop.time() + args.duration
+    samples = []
+    baseline = None
+    baseline_snapshot = snapshot = None
+
+    async with session.messages() as messages:
+        tasks = [
+            asyncio.ensure_future(send_loop(session, counters, args, end)),
+            asyncio.ensure_future(receive_loop(messages, counters)),
+        ]
+        if args.c2d_rate:
+            tasks.append(asyncio.ensure_future(c2d_loop(service, args, end)))
+        try:
+            while loop.time() < end:
+                await asyncio.sleep(min(args.sample_interval, max(end - loop.time(), 0)))
+                sample, snapshot = take_sample(tracker, counters, start)
+                if not baseline and sample["elapsed"] >= args.warmup:
+                    baseline, baseline_snapshot = sample, snapshot
+                if baseline:
+                    samples.append(sample)
+                print_sample(sample, baseline)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    if not baseline:
+        # The run was shorter than the warmup, so the only sample is the baseline
+        baseline, baseline_snapshot = sample, snapshot
+        samples.append(sample)
+    return counters, samples, baseline_snapshot, snapshot
+
+
+def report(counters, samples, baseline_snapshot, snapshot, allocations, args):
+    baseline = samples[0]
+    final = samples[-1]
+    growth = final["traced_bytes"] - baseline["traced_bytes"]
+    messages = (final["sent"] - baseline["sent"]) + (final["received"] - baseline["received"])
+    types_grown = object_growth(baseline, final)
+    result = dict(
+        allocations,
+        sent=counters.sent,
+        received=counters.received,
+        errors=counters.errors,
+        growth_bytes=growth,
+        growth_bytes_per_message=round(growth / messages, 3) if messages else None,
+        growth_bytes_per_hour=slope_per_hour(samples),
+        pending_futures=final["pending_futures"],
+        queued_items=final["queued_items"],
+        object_growth=dict(types_grown),
+    )
+
+    over_budget = growth > args.budget
+    objects_over_budget = [(name, n) for name, n in types_grown if n > args.object_budget]
+    print(
+        "sent={sent} received={received} errors={errors}\n"
+        "peak bytes per sent message: {peak_bytes_per_sent_message}\n"
+        "peak bytes per received message: {peak_bytes_per_received_message}\n"
+        "growth since baseline: {growth_bytes}B ({growth_bytes_per_message}B per message, "
+        "{growth_bytes_per_hour}B per hour)".format(**result)
+    )
+    if over_budget or objects_over_budget or args.verbose:
+        print("Top allocations by growth since baseline:")
+        for stat in snapshot.compare_to(baseline_snapshot, "lineno")[:TOP_DIFFERENCES]:
+            print("    {}".format(stat))
+        print("Types by growth since baseline:")
+        for name, difference in types_grown[:TOP_DIFFERENCES]:
+            print("    {}: {:+}".format(name, difference))
+    if over_budget:
+        print("FAILED: traced memory grew by {}B (budget {}B)".format(growth, args.budget))
+    for name, difference in objects_over_budget:
+        print(
+            "FAILED: {} grew by {} objects (budget {})".format(name, difference, args.object_budget)
+        )
+    return result, not (over_budget or objects_over_budget or counters.errors)
+
+
+async def run_soak(args, cert_pem, service):
+    tracker = leak_tracker.LeakTracker()
+    tracker.track_module("azure.iot.device")
+    tracemalloc.start(args.frames)
+    async with IoTHubSession(
+        hostname=HOSTNAME,
+        device_id=DEVICE_ID,
+        shared_access_key=SHARED_ACCESS_KEY,
+        ssl_context=mqtt_broker.create_client_ssl_context(cert_pem),
+    ) as session:
+        allocations = await measure_allocations(session, service, args)
+        counters, samples, baseline_snapshot, snapshot = await soak(session, service, tracker, args)
+    return report(counters, samples, baseline_snapshot, snapshot, allocations, args)
+
+
+def main(args):
+    cert_pem, key_pem = mqtt_broker.generate_self_signed_certificate(HOSTNAME)
+    with tempfile.TemporaryDirectory() as directory:
+        cert_file = os.path.join(directory, "cert.pem")
+        key_file = os.path.join(directory, "key.pem")
+        with open(cert_file, "wb") as f:
+            f.write(cert_pem)
+        with open(key_file, "wb") as f:
+            f.write(key_pem)
+
+        service = subprocess.Popen(
+            [sys.executable, __file__, "--service", "--cert", cert_file, "--key", key_file],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+        try:
+            # Wait for the emulator to start listening
+            service.stdout.readline()
+            result, success = asyncio.run(run_soak(args, cert_pem, service))
+        finally:
+            service.stdin.close()
+            service.terminate()
+            service.wait()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    return success
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IoTHubSession memory soak test")
+    parser.add_argument("--duration", type=float, default=4 * 3600, help="seconds to soak for")
+    parser.add_argument("--warmup", type=float, default=300, help="seconds before the baseline")
+    parser.add_argument("--sample-interval", type=float, default=60, help="seconds per sample")
+    parser.add_argument("--rate", type=float, default=100, help="messages sent per second")
+    parser.add_argument("--c2d-rate", type=int, default=10, help="C2D messages per second")
+    parser.add_argument("--payload-size", type=int, default=256, help="payload size (bytes)")
+    parser.add_argument(
+        "--burst-size", type=int, default=1000, help="messages per allocation measurement"
+    )
+    parser.add_argument(
+        "--budget", type=int, default=1024 * 1024, help="allowed growth of traced memory (bytes)"
+    )
+    parser.add_argument(
+        "--object-budget", type=int, default=100, help="allowed growth of objects of any type"
+    )
+    parser.add_argument("--frames", type=int, default=1, help="traceback frames to trace")
+    parser.add_argument("--verbose", action="store_true", help="always report top growth")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--service", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--cert", help=argparse.SUPPRESS)
+    parser.add_argument("--key", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.service:
+        asyncio.run(run_service(args))
+    else:
+        success = main(args)
+        sys.exit(0 if success else 1)
@@ -0,0 +1,145 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import logging
+import ssl
+import sys
+import time
+import paho.mqtt.client as mqtt
+from azure.iot.device import IoTHubSession
+from azure.iot.device import mqtt_topic_iothub as mqtt_topic
+
+logging.basicConfig(level=logging.WARNING)
+
+"""
+This app measures the per-message overhead of receiving C2D messages through
+`IoTHubSession.messages()`, compared to reading the same MQTTMessages directly off the
+MQTTClient's incoming message queue.
+
+The network layer of the session is replaced with a fake, and C2D MQTTMessages are loaded
+directly into the MQTTClient's filtered message queue, so no IoTHub (or network) is required.
+The difference between the two measurements is the cost of the session and IoTHubMQTTClient
+layers - converting the MQTTMessage to a Message, and checking for disconnection.
+
+At the end of the run, the session is disconnected while a receive is pending, to verify that
+the pending receive is woken up with the expected CancelledError.
+
+Usage: python receive_stress.py [--messages N] [--rounds N]
+"""
+
+DEVICE_ID = "stress-device"
+
+
+def create_session():
+    return IoTHubSession(
+        hostname="fake.azure-devices.net",
+        device_id=DEVICE_ID,
+        ssl_context=ssl.create_default_context(),
+    )
+
+
+def hook_fake_transport(session):
+    """Replace the network operations of the session's MQTTClient with fakes"""
+    mqtt_client = session._mqtt_client._mqtt_client
+    connected = False
+
+    async def fake_connect():
+        nonlocal connected
+        connected = True
+
+    async def fake_disconnect():
+        nonlocal connected
+        connected = False
+        async with mqtt_client.disconnected_cond:
+            mqtt_client.disconnected_cond.notify_all()
+
+    async def fake_subscribe(topic):
+        pass
+
+    async def fake_unsubscribe(topic):
+        pass
+
+    mqtt_client.connect = fake_connect
+    mqtt_client.disconnect = fake_disconnect
+    mqtt_client.subscribe = fake_subscribe
+    mqtt_client.unsubscribe = fake_unsubscribe
+    mqtt_client.is_connected = lambda: connected
+    mqtt_client.previous_disconnection_cause = lambda: None
+
+
+def load_messages(queue, num_messages):
+    receive_topic = mqtt_topic.get_c2d_topic_for_subscribe(DEVICE_ID).rstrip("#")
+    for i in range(num_messages):
+        message = mqtt.MQTTMessage(mid=i, topic=receive_topic.encode("utf-8"))
+        message.payload = b"payload"
+        queue.put_nowait(message)
+
+
+async def measure_raw(queue, num_messages):
+    load_messages(queue, num_messages)
+    start = time.perf_counter()
+    for _ in range(num_messages):
+        await queue.get()
+    return time.perf_counter() - start
+
+
+async def measure_session(messages, queue, num_messages):
+    load_messages(queue, num_messages)
+    start = time.perf_counter()
+    for _ in range(num_messages):
+        await messages.__anext__()
+    return time.perf_counter() - start
+
+
+async def verify_disconnect_interrupt(session, messages):
+    receive = asyncio.create_task(messages.__anext__())
+    await asyncio.sleep(0.1)
+    await session._mqtt_client.disconnect()
+    try:
+        await asyncio.wait_for(receive, timeout=1)
+    except asyncio.CancelledError:
+        return True
+    except Exception:
+        pass
+    return False
+
+
+async def main(args):
+    session = create_session()
+    hook_fake_transport(session)
+    c2d_topic = mqtt_topic.get_c2d_topic_for_subscribe(DEVICE_ID)
+    success = True
+    async with session:
+        async with session.messages() as messages:
+            queue = session._mqtt_client._mqtt_client._incoming_filtered_messages[c2d_topic]
+            for round_number in range(1, args.rounds + 1):
+                raw_elapsed = await measure_raw(queue, args.messages)
+                session_elapsed = await measure_session(messages, queue, args.messages)
+                print(
+                    "round={} messages={} raw={:.0f}/s session={:.0f}/s overhead={:.2f}us/message".format(
+                        round_number,
+                        args.messages,
+                        args.messages / raw_elapsed,
+                        args.messages / session_elapsed,
+                        (session_elapsed - raw_elapsed) / args.messages * 1000000,
+                    )
+                )
+            if await verify_disconnect_interrupt(session, messages):
+                print("pending receive interrupted by disconnect")
+            else:
+                print("pending receive was NOT interrupted by disconnect")
+                success = False
+    return success
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="C2D message receive overhead benchmark")
+    parser.add_argument("--messages", type=int, default=100000, help="messages per round")
+    parser.add_argument("--rounds", type=int, default=5, help="number of rounds")
+    success = asyncio.run(main(parser.parse_args()))
+    sys.exit(0 if success else 1)
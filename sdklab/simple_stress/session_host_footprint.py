@@ -0,0 +1,228 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from azure.iot.device import IoTHubSession, SessionHost
+from dev_utils import mqtt_broker
+
+logging.basicConfig(level=logging.WARNING)
+
+"""
+This app measures the memory, thread and file descriptor footprint of many connected
+IoTHubSessions, when hosted by a SessionHost, compared to standalone IoTHubSessions that each
+have resources of their own.
+
+A local MQTT broker (dev_utils.mqtt_broker) with a self-signed certificate is run in a child
+process on localhost:8883, standing in for IoT Hub, so no IoTHub is required. Credentials are
+not validated by the broker, so fake shared access keys are used.
+
+Each mode is measured in a fresh process, so that one measurement does not skew the other:
+    - host: All sessions are created from a single SessionHost.
+    - standalone: Each session runs its own Paho network loop in the default executor, which
+        is enlarged to fit them (otherwise the network loops exhaust it), and creates its own
+        SSLContext, as it would if none was provided.
+
+Once all sessions are connected, each sends a message to verify that it is functional, and then
+the footprint of the process is compared to that before the sessions were created.
+
+Usage: python session_host_footprint.py [--devices N] [--standalone-devices N]
+"""
+
+HOSTNAME = "localhost"
+PORT = 8883
+FAKE_SHARED_ACCESS_KEY = "Zm9vYmFy"
+
+
+def raise_fd_limit():
+    """Raise the soft limit on open file descriptors to the hard limit"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def footprint():
+    """Return the current (RSS in KiB, thread count, open file descriptor count)"""
+    rss = 0
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1])
+    return rss, threading.active_count(), len(os.listdir("/proc/self/fd"))
+
+
+def device_id(i):
+    return "footprint-device-{}".format(i)
+
+
+async def connect_all(stack, sessions, batch_size):
+    """Connect sessions, at most `batch_size` at a time"""
+    for i in range(0, len(sessions), batch_size):
+        await asyncio.gather(
+            *[stack.enter_async_context(session) for session in sessions[i : i + batch_size]]
+        )
+
+
+async def measure(mode, num_devices, cert_pem, batch_size):
+    base_rss, base_threads, base_fds = footprint()
+    async with contextlib.AsyncExitStack() as stack:
+        if mode == "host":
+            host = await stack.enter_async_context(SessionHost())
+            ssl_context = mqtt_broker.create_client_ssl_context(cert_pem)
+            sessions = [
+                host.create_session(
+                    hostname=HOSTNAME,
+                    device_id=device_id(i),
+                    shared_access_key=FAKE_SHARED_ACCESS_KEY,
+                    ssl_context=ssl_context,
+                )
+                for i in range(num_devices)
+            ]
+        else:
+            # NOTE: Each standalone session occupies an executor thread with its network loop
+            asyncio.get_running_loop().set_default_executor(
+                concurrent.futures.ThreadPoolExecutor(max_workers=num_devices + batch_size)
+            )
+            sessions = [
+                IoTHubSession(
+                    hostname=HOSTNAME,
+                    device_id=device_id(i),
+                    shared_access_key=FAKE_SHARED_ACCESS_KEY,
+                    ssl_context=mqtt_broker.create_client_ssl_context(cert_pem),
+                )
+                for i in range(num_devices)
+            ]
+
+        start = time.perf_counter()
+        await connect_all(stack, sessions, batch_size)
+        connect_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*[session.send_message("footprint") for session in sessions])
+        send_elapsed = time.perf_counter() - start
+
+        rss, threads, fds = footprint()
+    return {
+        "mode": mode,
+        "devices": num_devices,
+        "connect_seconds": round(connect_elapsed, 2),
+        "send_seconds": round(send_elapsed, 2),
+        "rss_kib_per_device": round((rss - base_rss) / num_devices, 1),
+        "threads": threads,
+        "threads_per_device": round((threads - base_threads) / num_devices, 3),
+        "fds_per_device": round((fds - base_fds) / num_devices, 2),
+    }
+
+
+def run_worker(args):
+    raise_fd_limit()
+    with open(args.cert, "rb") as f:
+        cert_pem = f.read()
+    result = asyncio.run(measure(args.worker, args.devices, cert_pem, args.batch_size))
+    print(json.dumps(result), flush=True)
+
+
+def run_mode(mode, num_devices, cert_file, batch_size):
+    """Measure a mode in a fresh process, returning the result"""
+    output = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--worker",
+            mode,
+            "--devices",
+            str(num_devices),
+            "--cert",
+            cert_file,
+            "--batch-size",
+            str(batch_size),
+        ],
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def main(args):
+    raise_fd_limit()
+    cert_pem, key_pem = mqtt_broker.generate_self_signed_certificate(HOSTNAME)
+    with tempfile.TemporaryDirectory() as directory:
+        cert_file = os.path.join(directory, "cert.pem")
+        key_file = os.path.join(directory, "key.pem")
+        with open(cert_file, "wb") as f:
+            f.write(cert_pem)
+        with open(key_file, "wb") as f:
+            f.write(key_pem)
+
+        broker = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "dev_utils.mqtt_broker",
+                "--port",
+                str(PORT),
+                "--cert",
+                cert_file,
+                "--key",
+                key_file,
+            ],
+            stdout=subprocess.PIPE,
+        )
+        try:
+            # Wait for the broker to start listening
+            broker.stdout.readline()
+            results = [run_mode("host", args.devices, cert_file, args.batch_size)]
+            if args.standalone_devices:
+                results.append(
+                    run_mode("standalone", args.standalone_devices, cert_file, args.batch_size)
+                )
+        finally:
+            broker.terminate()
+            broker.wait()
+
+    for result in results:
+        print(
+            "mode={mode} devices={devices} connect={connect_seconds}s send={send_seconds}s "
+            "rss/device={rss_kib_per_device}KiB threads={threads} "
+            "threads/device={threads_per_device} fds/device={fds_per_device}".format(**result)
+        )
+    if args.json:
+        print(json.dumps(results))
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SessionHost footprint benchmark")
+    parser.add_argument("--devices", type=int, default=5000, help="sessions in a SessionHost")
+    parser.add_argument(
+        "--standalone-devices",
+        type=int,
+        default=200,
+        help="standalone sessions to compare against (0 to skip)",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="sessions to connect concurrently"
+    )
+    parser.add_argument("--json", action="store_true", help="also print results as JSON")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--cert", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args)
+    else:
+        success = main(args)
+        sys.exit(0 if success else 1)
@@ -72,19 +72,10 @@ setup(
         "Programming Language :: Python :: 3.11",
     ],
     install_requires=[
-        # Define sub-dependencies due to pip dependency resolution bug
-        # https://github.com/pypa/pip/issues/988
-        # ---requests dependencies---
-        # requests 2.22+ does not support urllib3 1.25.0 or 1.25.1 (https://github.com/psf/requests/pull/5092)
-        # Security issue below 1.26.5
-        "urllib3>=1.26.5,<1.27",
-        # Actual project dependencies
         "paho-mqtt>=1.6.1,<2.0.0",
-        "requests-unixsocket>=0.1.5,<1.0.0",
         "typing-extensions>=4.4.0,<5.0",
         "PySocks",
-        # This dependency is needed by some modules, but none that are actually used
-        # in current IoTHubSession design. This can be removed once we settle on a direction.
+        # Used for HTTP requests to IoT Hub and to the IoT Edge workload API
         "aiohttp",
     ],
     python_requires=">=3.7, <4",
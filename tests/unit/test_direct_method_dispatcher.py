@@ -0,0 +1,314 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import asyncio
+import contextlib
+import pytest
+from azure.iot.device import direct_method_dispatcher as dmd
+from azure.iot.device import models
+from azure.iot.device import mqtt_client as mqtt
+from azure.iot.device.direct_method_dispatcher import DirectMethodDispatcher
+from azure.iot.device.iothub_session import IoTHubSession
+
+FAKE_METHOD_NAME = "fake_method"
+
+
+def make_request(name=FAKE_METHOD_NAME, request_id="1", payload=None):
+    return models.DirectMethodRequest(request_id=request_id, name=name, payload=payload)
+
+
+@pytest.fixture
+def incoming_requests():
+    return asyncio.Queue()
+
+
+@pytest.fixture
+def session(mocker, incoming_requests):
+    session = mocker.MagicMock(spec=IoTHubSession)
+
+    @contextlib.asynccontextmanager
+    async def direct_method_requests():
+        async def generator():
+            while True:
+                item = await incoming_requests.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+
+        yield generator()
+
+    session.direct_method_requests.side_effect = direct_method_requests
+    session.send_direct_method_response = mocker.AsyncMock()
+    return session
+
+
+@pytest.fixture
+def dispatcher():
+    return DirectMethodDispatcher(handler_timeout=1)
+
+
+@pytest.fixture
+async def run_task(dispatcher, session):
+    task = asyncio.create_task(dispatcher.run(session))
+    yield task
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+async def wait_for_responses(session, count):
+    while session.send_direct_method_response.await_count < count:
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.describe("DirectMethodDispatcher -- Instantiation")
+class TestDirectMethodDispatcherInstantiation:
+    @pytest.mark.it("Raises ValueError if instantiated with an invalid `max_concurrency`")
+    @pytest.mark.parametrize("max_concurrency", [0, -1])
+    async def test_invalid_max_concurrency(self, max_concurrency):
+        with pytest.raises(ValueError):
+            DirectMethodDispatcher(max_concurrency=max_concurrency)
+
+    @pytest.mark.it("Raises ValueError if instantiated with an invalid `handler_timeout`")
+    @pytest.mark.parametrize("handler_timeout", [0, -1])
+    async def test_invalid_handler_timeout(self, handler_timeout):
+        with pytest.raises(ValueError):
+            DirectMethodDispatcher(handler_timeout=handler_timeout)
+
+    @pytest.mark.it("Uses default values if no `max_concurrency` or `handler_timeout` are provided")
+    async def test_defaults(self):
+        dispatcher = DirectMethodDispatcher()
+        assert dispatcher._max_concurrency == dmd.DEFAULT_MAX_CONCURRENCY
+        assert dispatcher._handler_timeout == dmd.DEFAULT_HANDLER_TIMEOUT
+        assert dispatcher.in_flight == 0
+
+
+@pytest.mark.describe("DirectMethodDispatcher - .register() / .unregister()")
+class TestDirectMethodDispatcherRegistration:
+    @pytest.mark.it("Replaces any existing handler when registering a handler for a method")
+    async def test_register_replaces(self, mocker, dispatcher):
+        handler1 = mocker.AsyncMock()
+        handler2 = mocker.AsyncMock()
+        dispatcher.register(FAKE_METHOD_NAME, handler1)
+        dispatcher.register(FAKE_METHOD_NAME, handler2)
+        assert dispatcher._handlers[FAKE_METHOD_NAME] is handler2
+
+    @pytest.mark.it("Removes the handler for a method when unregistering")
+    async def test_unregister(self, mocker, dispatcher):
+        dispatcher.register(FAKE_METHOD_NAME, mocker.AsyncMock())
+        dispatcher.unregister(FAKE_METHOD_NAME)
+        assert FAKE_METHOD_NAME not in dispatcher._handlers
+
+    @pytest.mark.it("Raises KeyError when unregistering a method that has no handler")
+    async def test_unregister_unknown(self, dispatcher):
+        with pytest.raises(KeyError):
+            dispatcher.unregister(FAKE_METHOD_NAME)
+
+
+@pytest.mark.describe("DirectMethodDispatcher - .run()")
+class TestDirectMethodDispatcherRun:
+    @pytest.mark.it(
+        "Invokes the handler registered for the method of a received request, sending the returned value as the payload of a response with status 200"
+    )
+    async def test_dispatch_payload(self, mocker, dispatcher, session, incoming_requests, run_task):
+        handler = mocker.AsyncMock(return_value={"result": "value"})
+        dispatcher.register(FAKE_METHOD_NAME, handler)
+        request = make_request(payload={"input": 1})
+
+        await incoming_requests.put(request)
+        await wait_for_responses(session, 1)
+
+        assert handler.await_count == 1
+        assert handler.await_args == mocker.call(request)
+        response = session.send_direct_method_response.await_args[0][0]
+        assert isinstance(response, models.DirectMethodResponse)
+        assert response.request_id == request.request_id
+        assert response.status == 200
+        assert response.payload == {"result": "value"}
+
+    @pytest.mark.it("Sends a DirectMethodResponse returned by the handler as-is")
+    async def test_dispatch_response(
+        self, mocker, dispatcher, session, incoming_requests, run_task
+    ):
+        request = make_request()
+        method_response = models.DirectMethodResponse.create_from_method_request(
+            request, 201, "created"
+        )
+        dispatcher.register(FAKE_METHOD_NAME, mocker.AsyncMock(return_value=method_response))
+
+        await incoming_requests.put(request)
+        await wait_for_responses(session, 1)
+
+        assert session.send_direct_method_response.await_args == mocker.call(method_response)
+
+    @pytest.mark.it("Sends a response with status 404 if no handler is registered for the method")
+    async def test_no_handler(self, session, incoming_requests, run_task):
+        await incoming_requests.put(make_request(name="unknown"))
+        await wait_for_responses(session, 1)
+
+        response = session.send_direct_method_response.await_args[0][0]
+        assert response.status == dmd.STATUS_NOT_FOUND
+
+    @pytest.mark.it("Sends a response with status 500 if the handler raises an exception")
+    async def test_handler_raises(
+        self, mocker, dispatcher, session, incoming_requests, run_task, arbitrary_exception
+    ):
+        dispatcher.register(FAKE_METHOD_NAME, mocker.AsyncMock(side_effect=arbitrary_exception))
+
+        await incoming_requests.put(make_request())
+        await wait_for_responses(session, 1)
+
+        response = session.send_direct_method_response.await_args[0][0]
+        assert response.status == dmd.STATUS_HANDLER_ERROR
+        assert not run_task.done()
+
+    @pytest.mark.it(
+        "Cancels the handler and sends a response with status 504 if the handler does not finish within the handler timeout"
+    )
+    async def test_handler_timeout(self, session, incoming_requests):
+        dispatcher = DirectMethodDispatcher(handler_timeout=0.1)
+        handler_cancelled = False
+
+        async def handler(request):
+            nonlocal handler_cancelled
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                handler_cancelled = True
+                raise
+
+        dispatcher.register(FAKE_METHOD_NAME, handler)
+        run_task = asyncio.create_task(dispatcher.run(session))
+
+        await incoming_requests.put(make_request())
+        await asyncio.sleep(0.05)
+        assert session.send_direct_method_response.await_count == 0
+        await wait_for_responses(session, 1)
+
+        assert handler_cancelled
+        response = session.send_direct_method_response.await_args[0][0]
+        assert response.status == dmd.STATUS_TIMEOUT
+
+        run_task.cancel()
+        await asyncio.gather(run_task, return_exceptions=True)
+
+    @pytest.mark.it("Runs handlers concurrently, so that a slow handler does not block others")
+    async def test_concurrent(self, mocker, dispatcher, session, incoming_requests, run_task):
+        slow_handler_finish = asyncio.Event()
+
+        async def slow_handler(request):
+            await slow_handler_finish.wait()
+            return "slow"
+
+        dispatcher.register("slow", slow_handler)
+        dispatcher.register("fast", mocker.AsyncMock(return_value="fast"))
+
+        await incoming_requests.put(make_request(name="slow", request_id="1"))
+        await incoming_requests.put(make_request(name="fast", request_id="2"))
+        await wait_for_responses(session, 1)
+        assert session.send_direct_method_response.await_args[0][0].request_id == "2"
+        assert dispatcher.in_flight == 1
+
+        slow_handler_finish.set()
+        await wait_for_responses(session, 2)
+        assert session.send_direct_method_response.await_args[0][0].request_id == "1"
+        assert dispatcher.in_flight == 0
+
+    @pytest.mark.it("Does not run more handlers at the same time than the `max_concurrency`")
+    async def test_max_concurrency(self, session, incoming_requests):
+        dispatcher = DirectMethodDispatcher(max_concurrency=2)
+        running = 0
+        peak_running = 0
+        finish = asyncio.Event()
+
+        async def handler(request):
+            nonlocal running, peak_running
+            running += 1
+            peak_running = max(peak_running, running)
+            await finish.wait()
+            running -= 1
+
+        dispatcher.register(FAKE_METHOD_NAME, handler)
+        run_task = asyncio.create_task(dispatcher.run(session))
+
+        for i in range(5):
+            await incoming_requests.put(make_request(request_id=str(i)))
+        await asyncio.sleep(0.1)
+        assert running == 2
+        assert dispatcher.in_flight == 2
+        # Requests that cannot yet be handled remain in the queue
+        assert incoming_requests.qsize() == 3
+
+        finish.set()
+        await wait_for_responses(session, 5)
+        assert peak_running == 2
+
+        run_task.cancel()
+        await asyncio.gather(run_task, return_exceptions=True)
+
+    @pytest.mark.it(
+        "Continues dispatching requests if sending a response raises an exception, dropping the response"
+    )
+    async def test_send_response_raises(
+        self, mocker, dispatcher, session, incoming_requests, run_task
+    ):
+        session.send_direct_method_response.side_effect = mqtt.MQTTError(rc=4)
+        dispatcher.register(FAKE_METHOD_NAME, mocker.AsyncMock(return_value=None))
+
+        await incoming_requests.put(make_request(request_id="1"))
+        await incoming_requests.put(make_request(request_id="2"))
+        await wait_for_responses(session, 2)
+        assert not run_task.done()
+
+    @pytest.mark.it(
+        "Allows any exception raised while receiving requests to propagate, cancelling any running handlers"
+    )
+    async def test_receive_raises(self, dispatcher, session, incoming_requests):
+        handler_cancelled = False
+
+        async def handler(request):
+            nonlocal handler_cancelled
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                handler_cancelled = True
+                raise
+
+        dispatcher.register(FAKE_METHOD_NAME, handler)
+        run_task = asyncio.create_task(dispatcher.run(session))
+        await incoming_requests.put(make_request())
+        await asyncio.sleep(0.05)
+        assert dispatcher.in_flight == 1
+
+        error = mqtt.MQTTError(rc=7)
+        await incoming_requests.put(error)
+        with pytest.raises(mqtt.MQTTError) as e_info:
+            await run_task
+        assert e_info.value is error
+        assert handler_cancelled
+        assert dispatcher.in_flight == 0
+        assert session.send_direct_method_response.await_count == 0
+
+    @pytest.mark.it("Cancels any running handlers if cancelled")
+    async def test_cancel(self, dispatcher, session, incoming_requests):
+        handler_cancelled = False
+
+        async def handler(request):
+            nonlocal handler_cancelled
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                handler_cancelled = True
+                raise
+
+        dispatcher.register(FAKE_METHOD_NAME, handler)
+        run_task = asyncio.create_task(dispatcher.run(session))
+        await incoming_requests.put(make_request())
+        await asyncio.sleep(0.05)
+
+        run_task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run_task
+        assert handler_cancelled
+        assert dispatcher.in_flight == 0
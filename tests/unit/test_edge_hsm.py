@@ -3,24 +3,15 @@
 # Licensed under the MIT License. See License.txt in the project root for
 # license information.
 # --------------------------------------------------------------------------
+import aiohttp
+import asyncio
 import base64
-import json
 import pytest
-import requests
 import urllib.parse
 from azure.iot.device.edge_hsm import IoTEdgeHsm
 from azure.iot.device.iot_exceptions import IoTEdgeError
 from azure.iot.device import user_agent
-
-
-@pytest.fixture
-def edge_hsm():
-    return IoTEdgeHsm(
-        module_id="my_module_id",
-        generation_id="module_generation_id",
-        workload_uri="unix:///var/run/iotedge/workload.sock",
-        api_version="my_api_version",
-    )
+from dev_utils.edge_workload_server import EdgeWorkloadServer
 
 
 @pytest.mark.describe("IoTEdgeHsm - Instantiation")
@@ -42,20 +33,37 @@ class TestIoTEdgeHsmInstantiation(object):
         assert edge_hsm.module_id == urllib.parse.quote(module_id, safe="")
 
     @pytest.mark.it(
-        "Formats the provided workload_uri parameter for use with the requests library and sets it as an attribute"
+        "Parses the provided workload_uri parameter into a socket path and a base URL, and sets them as attributes"
     )
     @pytest.mark.parametrize(
-        "workload_uri, expected_formatted_uri",
+        "workload_uri, expected_socket_path, expected_formatted_uri",
         [
             pytest.param(
                 "unix:///var/run/iotedge/workload.sock",
-                "http+unix://%2Fvar%2Frun%2Fiotedge%2Fworkload.sock/",
+                "/var/run/iotedge/workload.sock",
+                "http://localhost/",
                 id="Domain Socket URI",
             ),
-            pytest.param("http://127.0.0.1:15580", "http://127.0.0.1:15580/", id="IP Address URI"),
+            pytest.param(
+                "unix:///var/run/iotedge/workload.sock/",
+                "/var/run/iotedge/workload.sock",
+                "http://localhost/",
+                id="Domain Socket URI (trailing slash)",
+            ),
+            pytest.param(
+                "http://127.0.0.1:15580", None, "http://127.0.0.1:15580/", id="IP Address URI"
+            ),
+            pytest.param(
+                "http://127.0.0.1:15580/",
+                None,
+                "http://127.0.0.1:15580/",
+                id="IP Address URI (trailing slash)",
+            ),
         ],
     )
-    def test_workload_uri_formatting(self, workload_uri, expected_formatted_uri):
+    def test_workload_uri_formatting(
+        self, workload_uri, expected_socket_path, expected_formatted_uri
+    ):
         module_id = "my_module_id"
         generation_id = "my_generation_id"
         api_version = "my_api_version"
@@ -67,8 +75,20 @@ class TestIoTEdgeHsmInstantiation(object):
             api_version=api_version,
         )
 
+        assert edge_hsm.socket_path == expected_socket_path
         assert edge_hsm.workload_uri == expected_formatted_uri
 
+    @pytest.mark.it("Does not create an HTTP session until a request is made")
+    def test_no_session(self):
+        edge_hsm = IoTEdgeHsm(
+            module_id="my_module_id",
+            generation_id="my_generation_id",
+            workload_uri="unix:///var/run/iotedge/workload.sock",
+            api_version="my_api_version",
+        )
+
+        assert edge_hsm._session is None
+
     @pytest.mark.it("Sets the provided generation_id parameter as an attribute")
     def test_set_generation_id(self):
         module_id = "my_module_id"
@@ -102,62 +122,109 @@ class TestIoTEdgeHsmInstantiation(object):
         assert edge_hsm.api_version == api_version
 
 
+@pytest.fixture
+async def server():
+    async with EdgeWorkloadServer() as server:
+        yield server
+
+
+@pytest.fixture
+async def edge_hsm(server):
+    edge_hsm = IoTEdgeHsm(
+        module_id="my module/id",
+        generation_id="module_generation_id",
+        workload_uri=server.workload_uri,
+        api_version="my_api_version",
+    )
+    yield edge_hsm
+    await edge_hsm.shutdown()
+
+
 @pytest.mark.describe("IoTEdgeHsm - .get_certificate()")
 class TestIoTEdgeHsmGetCertificate(object):
-    @pytest.fixture(autouse=True)
-    def mock_requests_get(self, mocker):
-        return mocker.patch.object(requests, "get")
-
-    @pytest.mark.it("Sends an HTTP GET request to retrieve the trust bundle from Edge")
-    async def test_requests_trust_bundle(self, mocker, edge_hsm, mock_requests_get):
-        expected_url = edge_hsm.workload_uri + "trust-bundle"
-        expected_params = {"api-version": edge_hsm.api_version}
-        expected_headers = {
-            "User-Agent": urllib.parse.quote_plus(user_agent.get_iothub_user_agent())
-        }
-
+    @pytest.mark.it(
+        "Sends an HTTP GET request over the workload socket to retrieve the trust bundle from Edge"
+    )
+    async def test_requests_trust_bundle(self, server, edge_hsm):
         await edge_hsm.get_certificate()
 
-        assert mock_requests_get.call_count == 1
-        assert mock_requests_get.call_args == mocker.call(
-            expected_url, params=expected_params, headers=expected_headers
+        assert len(server.requests) == 1
+        request = server.requests[0]
+        assert request["method"] == "GET"
+        assert request["path"] == "/trust-bundle"
+        assert request["query"] == {"api-version": edge_hsm.api_version}
+        assert request["headers"]["User-Agent"] == urllib.parse.quote_plus(
+            user_agent.get_iothub_user_agent()
         )
 
     @pytest.mark.it("Returns the certificate from the trust bundle received from Edge")
-    async def test_returns_certificate(self, edge_hsm, mock_requests_get):
-        mock_response = mock_requests_get.return_value
-        certificate = "my certificate"
-        mock_response.json.return_value = {"certificate": certificate}
+    async def test_returns_certificate(self, server, edge_hsm):
+        server.certificate = "my certificate"
 
         returned_cert = await edge_hsm.get_certificate()
 
-        assert returned_cert is certificate
+        assert returned_cert == "my certificate"
 
-    @pytest.mark.it("Raises IoTEdgeError if a bad request is made to Edge")
-    async def test_bad_request(self, edge_hsm, mock_requests_get):
-        mock_response = mock_requests_get.return_value
-        error = requests.exceptions.HTTPError()
-        mock_response.raise_for_status.side_effect = error
+    @pytest.mark.it(
+        "Returns the cached certificate upon subsequent invocations, without sending a request"
+    )
+    async def test_cached(self, server, edge_hsm):
+        server.certificate = "my certificate"
+        await edge_hsm.get_certificate()
+        server.certificate = "my new certificate"
+
+        returned_cert = await edge_hsm.get_certificate()
+
+        assert returned_cert == "my certificate"
+        assert len(server.requests) == 1
+
+    @pytest.mark.it("Raises IoTEdgeError if Edge responds with an error status")
+    async def test_bad_request(self, server, edge_hsm):
+        server.status = 500
 
         with pytest.raises(IoTEdgeError) as e_info:
             await edge_hsm.get_certificate()
-        assert e_info.value.__cause__ is error
+        assert isinstance(e_info.value.__cause__, aiohttp.ClientResponseError)
+        assert e_info.value.__cause__.status == 500
+
+    @pytest.mark.it("Does not cache the certificate if unable to retrieve it")
+    async def test_failure_not_cached(self, server, edge_hsm):
+        server.status = 500
+        with pytest.raises(IoTEdgeError):
+            await edge_hsm.get_certificate()
+        server.status = None
+
+        assert await edge_hsm.get_certificate() == server.certificate
+        assert len(server.requests) == 2
+
+    @pytest.mark.it("Raises IoTEdgeError if unable to connect to Edge")
+    async def test_no_connection(self):
+        edge_hsm = IoTEdgeHsm(
+            module_id="my_module_id",
+            generation_id="module_generation_id",
+            workload_uri="unix:///nonexistent/workload.sock",
+            api_version="my_api_version",
+        )
+
+        with pytest.raises(IoTEdgeError) as e_info:
+            await edge_hsm.get_certificate()
+        assert isinstance(e_info.value.__cause__, aiohttp.ClientConnectionError)
+
+        await edge_hsm.shutdown()
 
     @pytest.mark.it("Raises IoTEdgeError if there is an error in json decoding the trust bundle")
-    async def test_bad_json(self, edge_hsm, mock_requests_get):
-        mock_response = mock_requests_get.return_value
+    async def test_bad_json(self, mocker, server, edge_hsm):
         error = ValueError()
-        mock_response.json.side_effect = error
+        mocker.patch.object(aiohttp.ClientResponse, "json", side_effect=error)
 
         with pytest.raises(IoTEdgeError) as e_info:
             await edge_hsm.get_certificate()
         assert e_info.value.__cause__ is error
 
     @pytest.mark.it("Raises IoTEdgeError if the certificate is missing from the trust bundle")
-    async def test_bad_trust_bundle(self, edge_hsm, mock_requests_get):
-        mock_response = mock_requests_get.return_value
+    async def test_bad_trust_bundle(self, mocker, server, edge_hsm):
         # Return an empty json dict with no 'certificate' key
-        mock_response.json.return_value = {}
+        mocker.patch.object(aiohttp.ClientResponse, "json", return_value={})
 
         with pytest.raises(IoTEdgeError):
             await edge_hsm.get_certificate()
@@ -165,58 +232,47 @@ class TestIoTEdgeHsmGetCertificate(object):
 
 @pytest.mark.describe("IoTEdgeHsm - .sign()")
 class TestIoTEdgeHsmSign(object):
-    @pytest.fixture(autouse=True)
-    def mock_requests_post(self, mocker):
-        return mocker.patch.object(requests, "post")
-
     @pytest.mark.it(
-        "Makes an HTTP request to Edge to sign a piece of string data using the HMAC-SHA256 algorithm"
+        "Makes an HTTP request over the workload socket to Edge to sign a piece of string data using the HMAC-SHA256 algorithm"
     )
-    async def test_requests_data_signing(self, mocker, edge_hsm, mock_requests_post):
+    async def test_requests_data_signing(self, server, edge_hsm):
         data_str = "somedata"
         data_str_b64 = "c29tZWRhdGE="
-        mock_requests_post.return_value.json.return_value = {"digest": "somedigest"}
-        expected_url = "{workload_uri}modules/{module_id}/genid/{generation_id}/sign".format(
-            workload_uri=edge_hsm.workload_uri,
-            module_id=edge_hsm.module_id,
-            generation_id=edge_hsm.generation_id,
-        )
-        expected_params = {"api-version": edge_hsm.api_version}
-        expected_headers = {
-            "User-Agent": urllib.parse.quote(user_agent.get_iothub_user_agent(), safe="")
-        }
-        expected_json = json.dumps({"keyId": "primary", "algo": "HMACSHA256", "data": data_str_b64})
 
         await edge_hsm.sign(data_str)
 
-        assert mock_requests_post.call_count == 1
-        assert mock_requests_post.call_args == mocker.call(
-            url=expected_url, params=expected_params, headers=expected_headers, data=expected_json
+        assert len(server.requests) == 1
+        request = server.requests[0]
+        assert request["method"] == "POST"
+        assert request["path"] == "/modules/{module_id}/genid/{generation_id}/sign".format(
+            module_id="my module/id", generation_id=edge_hsm.generation_id
+        )
+        assert request["query"] == {"api-version": edge_hsm.api_version}
+        assert request["headers"]["User-Agent"] == urllib.parse.quote(
+            user_agent.get_iothub_user_agent(), safe=""
         )
+        assert request["headers"]["Content-Type"] == "application/json"
+        assert request["body"] == {"keyId": "primary", "algo": "HMACSHA256", "data": data_str_b64}
 
     @pytest.mark.it("Base64 encodes the string data in the request")
-    async def test_b64_encodes_data(self, edge_hsm, mock_requests_post):
+    async def test_b64_encodes_data(self, server, edge_hsm):
         # This test is actually implicitly tested in the first test, but it's
         # important to have an explicit test for it since it's a requirement
         data_str = "somedata"
         data_str_b64 = base64.b64encode(data_str.encode("utf-8")).decode()
-        mock_requests_post.return_value.json.return_value = {"digest": "somedigest"}
 
         await edge_hsm.sign(data_str)
 
-        sent_data = json.loads(mock_requests_post.call_args[1]["data"])["data"]
+        sent_data = server.requests[0]["body"]["data"]
 
         assert data_str != data_str_b64
         assert sent_data == data_str_b64
 
     @pytest.mark.it("Returns the signed data received from Edge")
-    async def test_returns_signed_data(self, edge_hsm, mock_requests_post):
-        expected_digest = "somedigest"
-        mock_requests_post.return_value.json.return_value = {"digest": expected_digest}
-
+    async def test_returns_signed_data(self, server, edge_hsm):
         signed_data = await edge_hsm.sign("somedata")
 
-        assert signed_data == expected_digest
+        assert signed_data == server.sign(b"somedata")
 
     @pytest.mark.it("Supports data strings in both string and byte formats")
     @pytest.mark.parametrize(
@@ -226,38 +282,105 @@ class TestIoTEdgeHsmSign(object):
             pytest.param(b"sign this message", "c2lnbiB0aGlzIG1lc3NhZ2U=", id="Bytes"),
         ],
     )
-    async def test_supported_types(
-        self, edge_hsm, data_string, expected_request_data, mock_requests_post
-    ):
-        mock_requests_post.return_value.json.return_value = {"digest": "somedigest"}
+    async def test_supported_types(self, server, edge_hsm, data_string, expected_request_data):
         await edge_hsm.sign(data_string)
-        sent_data = json.loads(mock_requests_post.call_args[1]["data"])["data"]
+        sent_data = server.requests[0]["body"]["data"]
 
         assert sent_data == expected_request_data
 
-    @pytest.mark.it("Raises IoTEdgeError if a bad request is made to EdgeHub")
-    async def test_bad_request(self, edge_hsm, mock_requests_post):
-        mock_response = mock_requests_post.return_value
-        error = requests.exceptions.HTTPError()
-        mock_response.raise_for_status.side_effect = error
+    @pytest.mark.it("Raises IoTEdgeError if Edge responds with an error status")
+    async def test_bad_request(self, server, edge_hsm):
+        server.status = 400
 
         with pytest.raises(IoTEdgeError) as e_info:
             await edge_hsm.sign("somedata")
-        assert e_info.value.__cause__ is error
+        assert isinstance(e_info.value.__cause__, aiohttp.ClientResponseError)
+        assert e_info.value.__cause__.status == 400
+
+    @pytest.mark.it("Raises IoTEdgeError if unable to connect to Edge")
+    async def test_no_connection(self):
+        edge_hsm = IoTEdgeHsm(
+            module_id="my_module_id",
+            generation_id="module_generation_id",
+            workload_uri="unix:///nonexistent/workload.sock",
+            api_version="my_api_version",
+        )
+
+        with pytest.raises(IoTEdgeError) as e_info:
+            await edge_hsm.sign("somedata")
+        assert isinstance(e_info.value.__cause__, aiohttp.ClientConnectionError)
+
+        await edge_hsm.shutdown()
 
     @pytest.mark.it("Raises IoTEdgeError if there is an error in json decoding the signed response")
-    async def test_bad_json(self, edge_hsm, mock_requests_post):
-        mock_response = mock_requests_post.return_value
+    async def test_bad_json(self, mocker, server, edge_hsm):
         error = ValueError()
-        mock_response.json.side_effect = error
+        mocker.patch.object(aiohttp.ClientResponse, "json", side_effect=error)
+
         with pytest.raises(IoTEdgeError) as e_info:
             await edge_hsm.sign("somedata")
         assert e_info.value.__cause__ is error
 
     @pytest.mark.it("Raises IoTEdgeError if the signed data is missing from the response")
-    async def test_bad_response(self, edge_hsm, mock_requests_post):
-        mock_response = mock_requests_post.return_value
-        mock_response.json.return_value = {}
+    async def test_bad_response(self, mocker, server, edge_hsm):
+        mocker.patch.object(aiohttp.ClientResponse, "json", return_value={})
 
         with pytest.raises(IoTEdgeError):
             await edge_hsm.sign("somedata")
+
+    @pytest.mark.it("Reuses the same connection to Edge for subsequent requests")
+    async def test_connection_reuse(self, server, edge_hsm):
+        await edge_hsm.get_certificate()
+        for _ in range(5):
+            await edge_hsm.sign("somedata")
+
+        assert len(server.requests) == 6
+        assert server.connection_count == 1
+
+    @pytest.mark.it("Does not block the event loop while waiting for Edge to respond")
+    async def test_non_blocking(self, server, edge_hsm):
+        server.latency = 0.2
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        try:
+            await asyncio.gather(*[edge_hsm.sign("somedata") for _ in range(3)])
+        finally:
+            ticker.cancel()
+
+        # The ticker kept running while waiting for the responses
+        assert ticks >= 10
+        assert len(server.requests) == 3
+
+
+@pytest.mark.describe("IoTEdgeHsm - .shutdown()")
+class TestIoTEdgeHsmShutdown(object):
+    @pytest.mark.it("Closes the HTTP session and its connections to Edge")
+    async def test_closes_session(self, server, edge_hsm):
+        await edge_hsm.sign("somedata")
+        session = edge_hsm._session
+
+        await edge_hsm.shutdown()
+
+        assert session.closed
+        assert edge_hsm._session is None
+
+    @pytest.mark.it("Does nothing if no request has been made")
+    async def test_no_session(self, edge_hsm):
+        await edge_hsm.shutdown()
+
+        assert edge_hsm._session is None
+
+    @pytest.mark.it("Opens a new HTTP session if a request is made after shutdown")
+    async def test_request_after_shutdown(self, server, edge_hsm):
+        await edge_hsm.sign("somedata")
+        await edge_hsm.shutdown()
+
+        assert await edge_hsm.sign("somedata") == server.sign(b"somedata")
+        assert server.connection_count == 2
@@ -119,3 +119,31 @@ class TestGetNotifyBlobUploadStatusPath(object):
     def test_path(self, device_id, expected_path):
         path = http_path_iothub.get_notify_blob_upload_status_path(device_id)
         assert path == expected_path
+
+
+@pytest.mark.describe(".get_telemetry_path()")
+class TestGetTelemetryPath(object):
+    @pytest.mark.it("Returns the relative telemetry HTTP path")
+    @pytest.mark.parametrize(
+        "device_id, expected_path",
+        [
+            pytest.param(
+                "my_device",
+                "/devices/my_device/messages/events",
+                id="'my_device' ==> '/devices/my_device/messages/events'",
+            ),
+            pytest.param(
+                "my/device",
+                "/devices/my%2Fdevice/messages/events",
+                id="'my/device' ==> '/devices/my%2Fdevice/messages/events'",
+            ),
+            pytest.param(
+                "my+device",
+                "/devices/my%2Bdevice/messages/events",
+                id="'my+device' ==> '/devices/my%2Bdevice/messages/events'",
+            ),
+        ],
+    )
+    def test_path(self, device_id, expected_path):
+        path = http_path_iothub.get_telemetry_path(device_id)
+        assert path == expected_path
@@ -5,17 +5,24 @@
 # --------------------------------------------------------------------------
 import aiohttp
 import asyncio
+import base64
+import json
+import mmap
+import os
 import pytest
 import ssl
 import time
+import types
+import unittest.mock
 import urllib.parse
 from pytest_lazyfixture import lazy_fixture
-from dev_utils import custom_mock
-from azure.iot.device import config, constant, user_agent
+from dev_utils import custom_mock, iothub_http_emulator, mqtt_broker
+from azure.iot.device import config, constant, models, user_agent
 from azure.iot.device import http_path_iothub as http_path
 from azure.iot.device import sastoken as st
 from azure.iot.device.iot_exceptions import IoTHubClientError, IoTHubError, IoTEdgeError
-from azure.iot.device.iothub_http_client import IoTHubHTTPClient
+from azure.iot.device import iothub_http_client
+from azure.iot.device.iothub_http_client import HTTPConnectionPool, IoTHubHTTPClient
 
 FAKE_DEVICE_ID = "fake_device_id"
 FAKE_MODULE_ID = "fake_module_id"
@@ -89,6 +96,34 @@ async def client(mocker, client_config, mock_session):
     await client.shutdown()
 
 
+@pytest.fixture(scope="module")
+def certificate():
+    return mqtt_broker.generate_self_signed_certificate("localhost")
+
+
+@pytest.fixture
+async def emulator(certificate):
+    cert_pem, key_pem = certificate
+    emulator = iothub_http_emulator.IoTHubHTTPEmulator(
+        host="localhost", ssl_context=mqtt_broker.create_server_ssl_context(cert_pem, key_pem)
+    )
+    async with emulator:
+        yield emulator
+
+
+@pytest.fixture
+async def emulator_client(certificate, emulator):
+    """Device client making real requests to the IoT Hub HTTP emulator"""
+    client_config = config.IoTHubClientConfig(
+        device_id=FAKE_DEVICE_ID,
+        hostname=emulator.hostname,
+        ssl_context=mqtt_broker.create_client_ssl_context(certificate[0]),
+    )
+    client = IoTHubHTTPClient(client_config)
+    yield client
+    await client.shutdown()
+
+
 # ~~~~~ Saved Parametrizations ~~~~~
 failed_status_codes = [
     pytest.param(300, id="Status Code: 300"),
@@ -219,7 +254,7 @@ class TestIoTHubHTTPClientInstantiation:
         await client.shutdown()
 
     @pytest.mark.it(
-        "Creates a aiohttp ClientSession configured for accessing a URL based on the IoTHubClientConfig's `hostname`, with a timeout of 10 seconds"
+        "Creates a aiohttp ClientSession configured for accessing a URL based on the IoTHubClientConfig's `hostname`, with a timeout of 10 seconds, over the connections of its HTTPConnectionPool"
     )
     @pytest.mark.parametrize("device_id, module_id", configurations)
     async def test_client_session(self, mocker, client_config, device_id, module_id):
@@ -233,7 +268,11 @@ class TestIoTHubHTTPClientInstantiation:
         client = IoTHubHTTPClient(client_config)
         assert spy_session_init.call_count == 1
         assert spy_session_init.call_args == mocker.call(
-            base_url=expected_base_url, timeout=mocker.ANY
+            base_url=expected_base_url,
+            timeout=mocker.ANY,
+            connector=client._connection_pool.connector,
+            connector_owner=False,
+            trace_configs=[client._connection_pool.trace_config],
         )
         timeout_obj = spy_session_init.call_args[1]["timeout"]
         assert isinstance(timeout_obj, aiohttp.ClientTimeout)
@@ -242,6 +281,39 @@ class TestIoTHubHTTPClientInstantiation:
 
         await client.shutdown()
 
+    @pytest.mark.it(
+        "Uses the `http_connection_pool` from the IoTHubClientConfig as its HTTPConnectionPool, if present"
+    )
+    @pytest.mark.parametrize("device_id, module_id", configurations)
+    async def test_shared_connection_pool(self, client_config, device_id, module_id):
+        client_config.device_id = device_id
+        client_config.module_id = module_id
+        pool = HTTPConnectionPool()
+        client_config.http_connection_pool = pool
+
+        client = IoTHubHTTPClient(client_config)
+        assert client._connection_pool is pool
+        assert client._owns_connection_pool is False
+
+        await client.shutdown()
+        await pool.close()
+
+    @pytest.mark.it(
+        "Creates a HTTPConnectionPool with default settings, if the IoTHubClientConfig does not have an `http_connection_pool`"
+    )
+    @pytest.mark.parametrize("device_id, module_id", configurations)
+    async def test_own_connection_pool(self, client_config, device_id, module_id):
+        client_config.device_id = device_id
+        client_config.module_id = module_id
+        assert client_config.http_connection_pool is None
+
+        client = IoTHubHTTPClient(client_config)
+        assert isinstance(client._connection_pool, HTTPConnectionPool)
+        assert client._connection_pool.limit == iothub_http_client.DEFAULT_POOL_LIMIT
+        assert client._owns_connection_pool is True
+
+        await client.shutdown()
+
     @pytest.mark.it("Stores the `ssl_context` from the IoTHubClientConfig as an attribute")
     @pytest.mark.parametrize("device_id, module_id", configurations)
     async def test_ssl_context(self, client_config, device_id, module_id):
@@ -289,8 +361,46 @@ class TestIoTHubHTTPClientShutdown:
         assert client._session.close.await_count == 1
         assert client._session.close.await_args == mocker.call()
 
-    @pytest.mark.it("Waits 250ms to allow for proper SSL cleanup")
+    @pytest.mark.it("Closes the Azure Storage aiohttp ClientSession, if one was created")
+    async def test_close_storage_session(self, mocker, client):
+        client._storage_session = mocker.MagicMock(spec=aiohttp.ClientSession)
+
+        await client.shutdown()
+
+        assert client._storage_session.close.await_count == 1
+
+    @pytest.mark.it("Closes the HTTPConnectionPool, if it was created by the client")
+    async def test_close_own_pool(self, mocker, client):
+        spy_pool_close = mocker.spy(client._connection_pool, "close")
+
+        await client.shutdown()
+
+        assert spy_pool_close.await_count == 1
+        assert client._connection_pool.closed
+
+    @pytest.mark.it(
+        "Does not close the HTTPConnectionPool, if it was provided in the IoTHubClientConfig"
+    )
+    async def test_no_close_shared_pool(self, mocker, client_config, mock_session):
+        pool = HTTPConnectionPool()
+        client_config.http_connection_pool = pool
+        client = IoTHubHTTPClient(client_config)
+        await client._session.close()
+        client._session = mock_session
+        spy_pool_close = mocker.spy(pool, "close")
+
+        await client.shutdown()
+
+        assert spy_pool_close.await_count == 0
+        assert not pool.closed
+
+        await pool.close()
+
+    @pytest.mark.it(
+        "Waits 250ms to allow for proper SSL cleanup, if the HTTPConnectionPool it created opened any connections"
+    )
     async def test_wait(self, mocker, client, mock_asyncio_sleep):
+        client._connection_pool._stats["connections_created"] = 1
         assert mock_asyncio_sleep.await_count == 0
 
         await client.shutdown()
@@ -298,6 +408,12 @@ class TestIoTHubHTTPClientShutdown:
         assert mock_asyncio_sleep.await_count == 1
         assert mock_asyncio_sleep.await_args == mocker.call(0.25)
 
+    @pytest.mark.it("Does not wait if the HTTPConnectionPool it created never opened a connection")
+    async def test_no_wait(self, client, mock_asyncio_sleep):
+        await client.shutdown()
+
+        assert mock_asyncio_sleep.await_count == 0
+
     @pytest.mark.it("Does not return a value")
     async def test_return_value(self, client):
         retval = await client.shutdown()
@@ -325,6 +441,7 @@ class TestIoTHubHTTPClientShutdown:
 
     @pytest.mark.it("Can be cancelled while waiting for SSL cleanup")
     async def test_cancel_during_wait(self, client):
+        client._connection_pool._stats["connections_created"] = 1
         original_sleep = asyncio.sleep
         asyncio.sleep = custom_mock.HangingAsyncMock()
         try:
@@ -638,6 +755,676 @@ class TestIoTHubHTTPClientInvokeDirectMethod:
             await t
 
 
+class FakeDirectMethodPost:
+    """Fake of aiohttp ClientSession.post for direct method invocations, responding after a
+    per-target delay, and tracking how many requests are in flight at once"""
+
+    def __init__(self, delays=None, failures=None):
+        self.delays = delays or {}
+        self.failures = failures or {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = []
+        self.cancelled = []
+
+    def __call__(self, *, url, json, params, headers, ssl):
+        self.calls.append({"url": url, "json": json, "headers": headers})
+        fake = self
+
+        class ContextManager:
+            async def __aenter__(self):
+                fake.in_flight += 1
+                fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+                try:
+                    await asyncio.sleep(fake.delays.get(url, 0))
+                except asyncio.CancelledError:
+                    fake.cancelled.append(url)
+                    raise
+                finally:
+                    fake.in_flight -= 1
+                if url in fake.failures:
+                    raise fake.failures[url]
+                response = unittest.mock.MagicMock()
+                response.status = 200
+                response.json = unittest.mock.AsyncMock(
+                    return_value={"status": 200, "payload": url}
+                )
+                return response
+
+            async def __aexit__(self, *args):
+                pass
+
+        return ContextManager()
+
+
+@pytest.mark.describe("IoTHubHTTPClient - .invoke_direct_method_many()")
+class TestIoTHubHTTPClientInvokeDirectMethodMany:
+    @pytest.fixture(autouse=True)
+    def modify_client_config(self, client_config):
+        """Modify the client config to always be an Edge Module"""
+        client_config.device_id = FAKE_DEVICE_ID
+        client_config.module_id = FAKE_MODULE_ID
+
+    @pytest.fixture
+    def method_params(self):
+        return {
+            "methodName": "fake method",
+            "payload": {"fake": "payload"},
+            "connectTimeoutInSeconds": 47,
+            "responseTimeoutInSeconds": 42,
+        }
+
+    @pytest.fixture
+    def fake_post(self, client):
+        fake_post = FakeDirectMethodPost()
+        client._session.post = fake_post
+        return fake_post
+
+    async def collect(self, outcomes):
+        return [outcome async for outcome in outcomes]
+
+    @pytest.mark.it(
+        "Invokes the direct method on each target with a POST request to its 'direct method invoke' path, and yields the outcome of each"
+    )
+    async def test_targets(self, client, fake_post, method_params):
+        targets = ["device1", ("device2", None), ("device3", "module3")]
+
+        outcomes = await self.collect(
+            client.invoke_direct_method_many(targets=targets, method_params=method_params)
+        )
+
+        assert len(fake_post.calls) == 3
+        for call in fake_post.calls:
+            assert call["json"] == method_params
+        assert sorted((o.device_id, o.module_id) for o in outcomes) == [
+            ("device1", None),
+            ("device2", None),
+            ("device3", "module3"),
+        ]
+        for outcome in outcomes:
+            path = http_path.get_direct_method_invoke_path(outcome.device_id, outcome.module_id)
+            assert outcome.result == {"status": 200, "payload": path}
+            assert outcome.error is None
+
+    @pytest.mark.it(
+        "Derives the headers (including the SAS authorization, if any) for each invocation, using the SAS token current at the time"
+    )
+    async def test_headers(self, client, fake_post, mock_sastoken_provider, method_params):
+        client._sastoken_provider = mock_sastoken_provider
+        tokens = ["fake token {}".format(i) for i in range(5)]
+        mock_sastoken_provider.get_current_sastoken.side_effect = tokens
+
+        await self.collect(
+            client.invoke_direct_method_many(
+                targets=["device{}".format(i) for i in range(5)],
+                method_params=method_params,
+                concurrency=1,
+            )
+        )
+
+        assert mock_sastoken_provider.get_current_sastoken.call_count == 5
+        assert [call["headers"]["Authorization"] for call in fake_post.calls] == tokens
+        for call in fake_post.calls:
+            assert call["headers"]["x-ms-edge-moduleId"] == client._edge_module_id
+
+    @pytest.mark.it(
+        "Yields each outcome as soon as its invocation completes, with the whole fan-out taking about as long as the slowest invocation"
+    )
+    async def test_streams(self, client, fake_post, method_params):
+        fake_post.delays = {
+            http_path.get_direct_method_invoke_path("slow", None): 0.3,
+            http_path.get_direct_method_invoke_path("medium", None): 0.1,
+        }
+        targets = ["slow", "medium"] + ["fast{}".format(i) for i in range(10)]
+
+        start = time.perf_counter()
+        device_ids = [
+            outcome.device_id
+            async for outcome in client.invoke_direct_method_many(
+                targets=targets, method_params=method_params
+            )
+        ]
+        elapsed = time.perf_counter() - start
+
+        assert device_ids[-2:] == ["medium", "slow"]
+        # Not the sum of the invocations (0.4s)
+        assert elapsed < 0.38
+
+    @pytest.mark.it("Has at most `concurrency` invocations in progress at once")
+    @pytest.mark.parametrize("concurrency", [1, 3, 20])
+    async def test_concurrency(self, client, fake_post, method_params, concurrency):
+        targets = ["device{}".format(i) for i in range(10)]
+        fake_post.delays = {http_path.get_direct_method_invoke_path(t, None): 0.01 for t in targets}
+
+        outcomes = await self.collect(
+            client.invoke_direct_method_many(
+                targets=targets, method_params=method_params, concurrency=concurrency
+            )
+        )
+
+        assert len(outcomes) == 10
+        assert fake_post.max_in_flight == min(concurrency, 10)
+
+    @pytest.mark.it(
+        "Yields the exception raised by a failed invocation as the error of its outcome, without stopping other invocations"
+    )
+    async def test_failure(self, client, fake_post, method_params, arbitrary_exception):
+        failed_path = http_path.get_direct_method_invoke_path("device1", None)
+        fake_post.failures = {failed_path: arbitrary_exception}
+
+        outcomes = await self.collect(
+            client.invoke_direct_method_many(
+                targets=["device0", "device1", "device2"], method_params=method_params
+            )
+        )
+
+        assert len(outcomes) == 3
+        (failed,) = [o for o in outcomes if o.device_id == "device1"]
+        assert failed.error is arbitrary_exception
+        assert failed.result is None
+        assert all(o.error is None for o in outcomes if o is not failed)
+
+    @pytest.mark.it(
+        "Yields an IoTEdgeError as the error of the outcome of an invocation that receives a failed status code"
+    )
+    @pytest.mark.parametrize("failed_status", failed_status_codes)
+    async def test_failed_status(self, client, method_params, failed_status):
+        mock_response = client._session.post.return_value.__aenter__.return_value
+        mock_response.status = failed_status
+
+        outcomes = await self.collect(
+            client.invoke_direct_method_many(targets=["device0"], method_params=method_params)
+        )
+
+        assert isinstance(outcomes[0].error, IoTEdgeError)
+
+    @pytest.mark.it(
+        "Yields an asyncio.TimeoutError as the error of the outcome of an invocation that takes longer than `timeout`"
+    )
+    async def test_timeout(self, client, fake_post, method_params):
+        slow_path = http_path.get_direct_method_invoke_path("slow", None)
+        fake_post.delays = {slow_path: 10}
+
+        outcomes = await self.collect(
+            client.invoke_direct_method_many(
+                targets=["slow", "fast"], method_params=method_params, timeout=0.05
+            )
+        )
+
+        (slow,) = [o for o in outcomes if o.device_id == "slow"]
+        assert isinstance(slow.error, asyncio.TimeoutError)
+        assert slow_path in fake_post.cancelled
+        (fast,) = [o for o in outcomes if o.device_id == "fast"]
+        assert fast.error is None
+
+    @pytest.mark.it("Cancels the invocations in progress if iteration is stopped early")
+    async def test_break(self, client, fake_post, method_params):
+        slow_path = http_path.get_direct_method_invoke_path("slow", None)
+        fake_post.delays = {slow_path: 10}
+        outcomes = client.invoke_direct_method_many(
+            targets=["slow", "fast"], method_params=method_params
+        )
+
+        async for outcome in outcomes:
+            assert outcome.device_id == "fast"
+            break
+        await outcomes.aclose()
+
+        assert fake_post.cancelled == [slow_path]
+        assert fake_post.in_flight == 0
+
+    @pytest.mark.it("Cancels the invocations in progress if cancelled while iterating")
+    async def test_cancel(self, client, fake_post, method_params):
+        fake_post.delays = {http_path.get_direct_method_invoke_path("slow", None): 10}
+
+        t = asyncio.create_task(
+            self.collect(
+                client.invoke_direct_method_many(targets=["slow"], method_params=method_params)
+            )
+        )
+        while not fake_post.in_flight:
+            await asyncio.sleep(0)
+        t.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await t
+
+        assert fake_post.in_flight == 0
+
+    @pytest.mark.it(
+        "Raises the exception, rather than waiting forever, if an invocation raises an exception that does not derive from Exception"
+    )
+    async def test_base_exception(self, client, fake_post, method_params):
+        class FakeBaseException(BaseException):
+            pass
+
+        error = FakeBaseException()
+        fake_post.failures = {http_path.get_direct_method_invoke_path("device1", None): error}
+        fake_post.delays = {http_path.get_direct_method_invoke_path("device2", None): 10}
+
+        with pytest.raises(FakeBaseException) as e_info:
+            await asyncio.wait_for(
+                self.collect(
+                    client.invoke_direct_method_many(
+                        targets=["device0", "device1", "device2"], method_params=method_params
+                    )
+                ),
+                1,
+            )
+
+        assert e_info.value is error
+        assert fake_post.in_flight == 0
+
+    @pytest.mark.it("Yields nothing if there are no targets")
+    async def test_no_targets(self, client, fake_post, method_params):
+        outcomes = await self.collect(
+            client.invoke_direct_method_many(targets=[], method_params=method_params)
+        )
+
+        assert outcomes == []
+        assert fake_post.calls == []
+
+    @pytest.mark.it("Raises IoTHubClientError upon invocation if not configured as a Module")
+    async def test_not_edge(self, client, method_params):
+        client._module_id = None
+        client._edge_module_id = None
+
+        with pytest.raises(IoTHubClientError):
+            client.invoke_direct_method_many(targets=["device0"], method_params=method_params)
+
+    @pytest.mark.it("Raises ValueError upon invocation if a target is invalid")
+    @pytest.mark.parametrize(
+        "target",
+        [
+            pytest.param(("device", "module", "extra"), id="Too many values"),
+            pytest.param(123, id="Not a string or tuple"),
+            pytest.param((123, None), id="Invalid device ID"),
+        ],
+    )
+    async def test_invalid_target(self, client, fake_post, method_params, target):
+        with pytest.raises(ValueError):
+            client.invoke_direct_method_many(
+                targets=["device0", target], method_params=method_params
+            )
+        assert fake_post.calls == []
+
+    @pytest.mark.it("Raises ValueError upon invocation if the concurrency is not positive")
+    async def test_invalid_concurrency(self, client, method_params):
+        with pytest.raises(ValueError):
+            client.invoke_direct_method_many(
+                targets=["device0"], method_params=method_params, concurrency=0
+            )
+
+
+@pytest.fixture
+def message():
+    message = models.Message({"temperature": 21.5}, content_type="application/json")
+    message.message_id = "fake_message_id"
+    message.correlation_id = "fake_correlation_id"
+    message.custom_properties = {"prop1": "value1", "prop2": "value2"}
+    return message
+
+
+@pytest.mark.describe("IoTHubHTTPClient - .send_message()")
+class TestIoTHubHTTPClientSendMessage:
+    @pytest.fixture(autouse=True)
+    def modify_client_config(self, client_config):
+        """Modify the client config to always be a Device"""
+        client_config.device_id = FAKE_DEVICE_ID
+        client_config.module_id = None
+
+    @pytest.mark.it(
+        "Does an asynchronous POST request operation to the relative 'telemetry' path using the aiohttp ClientSession and the stored SSL context"
+    )
+    async def test_http_post(self, mocker, client, message):
+        post_ctx_manager = client._session.post.return_value
+        expected_path = http_path.get_telemetry_path(client._device_id)
+
+        await client.send_message(message)
+
+        assert client._session.post.call_count == 1
+        assert client._session.post.call_args == mocker.call(
+            url=expected_path,
+            data=mocker.ANY,
+            params=mocker.ANY,
+            headers=mocker.ANY,
+            ssl=client._ssl_context,
+        )
+        assert post_ctx_manager.__aenter__.await_count == 1
+
+    @pytest.mark.it(
+        "Sends the payload of the Message, encoded according to its content type and encoding, as the body of the POST request"
+    )
+    @pytest.mark.parametrize(
+        "payload, content_type, content_encoding, expected_data",
+        [
+            pytest.param({"a": 1}, "application/json", "utf-8", b'{"a": 1}', id="JSON (utf-8)"),
+            pytest.param("some text", "text/plain", "utf-8", b"some text", id="Text (utf-8)"),
+            pytest.param(
+                "some text",
+                "text/plain",
+                "utf-16",
+                "some text".encode("utf-16"),
+                id="Text (utf-16)",
+            ),
+        ],
+    )
+    async def test_post_data(
+        self, mocker, client, payload, content_type, content_encoding, expected_data
+    ):
+        message = models.Message(
+            payload, content_type=content_type, content_encoding=content_encoding
+        )
+
+        await client.send_message(message)
+
+        assert client._session.post.call_args[1]["data"] == expected_data
+
+    @pytest.mark.it("Sends the API version with the POST request as a query parameter")
+    async def test_post_query_params(self, client, message):
+        await client.send_message(message)
+
+        params = client._session.post.call_args[1]["params"]
+        assert params == {"api-version": constant.IOTHUB_API_VERSION}
+
+    @pytest.mark.it(
+        "Sets the system and custom properties of the Message as 'iothub-' HTTP headers on the POST request"
+    )
+    async def test_post_property_headers(self, client, message):
+        await client.send_message(message)
+
+        headers = client._session.post.call_args[1]["headers"]
+        assert headers["iothub-messageid"] == "fake_message_id"
+        assert headers["iothub-correlationid"] == "fake_correlation_id"
+        assert headers["iothub-contenttype"] == "application/json"
+        assert headers["iothub-contentencoding"] == "utf-8"
+        assert headers["iothub-app-prop1"] == "value1"
+        assert headers["iothub-app-prop2"] == "value2"
+
+    @pytest.mark.it(
+        "Sets the 'User-Agent' HTTP header on the POST request to the URL-encoded `user_agent` value stored on the client"
+    )
+    async def test_post_user_agent_header(self, client, message):
+        await client.send_message(message)
+
+        headers = client._session.post.call_args[1]["headers"]
+        assert headers["User-Agent"] == urllib.parse.quote_plus(client._user_agent_string)
+
+    @pytest.mark.it(
+        "Sets the 'Authorization' HTTP header on the POST request to the current SAS Token string from the SasTokenProvider stored on the client, if it exists"
+    )
+    async def test_post_authorization_header_sas(self, client, mock_sastoken_provider, message):
+        client._sastoken_provider = mock_sastoken_provider
+
+        await client.send_message(message)
+
+        headers = client._session.post.call_args[1]["headers"]
+        assert headers["Authorization"] == str(
+            mock_sastoken_provider.get_current_sastoken.return_value
+        )
+
+    @pytest.mark.it(
+        "Does not include an 'Authorization' HTTP header on the POST request if not using SAS Token authentication"
+    )
+    async def test_post_authorization_header_no_sas(self, client, message):
+        await client.send_message(message)
+
+        headers = client._session.post.call_args[1]["headers"]
+        assert "Authorization" not in headers
+
+    @pytest.mark.it(
+        "Raises an IoTHubError if a HTTP response is received with a failed status code"
+    )
+    @pytest.mark.parametrize("failed_status", failed_status_codes)
+    async def test_failed_response(self, client, message, failed_status):
+        mock_response = client._session.post.return_value.__aenter__.return_value
+        mock_response.status = failed_status
+
+        with pytest.raises(IoTHubError):
+            await client.send_message(message)
+
+    @pytest.mark.it("Raises ValueError without sending if the Message is a security message")
+    async def test_security_message(self, client, message):
+        message.set_as_security_message()
+
+        with pytest.raises(ValueError):
+            await client.send_message(message)
+        assert client._session.post.call_count == 0
+
+    @pytest.mark.it("Raises ValueError without sending if the Message payload is too large")
+    async def test_too_large(self, client):
+        message = models.Message("a" * (constant.TELEMETRY_MESSAGE_SIZE_LIMIT + 1))
+
+        with pytest.raises(ValueError):
+            await client.send_message(message)
+        assert client._session.post.call_count == 0
+
+    @pytest.mark.it("Raises IoTHubClientError if not configured as a Device")
+    async def test_not_device(self, client, message):
+        client._module_id = FAKE_MODULE_ID
+
+        with pytest.raises(IoTHubClientError):
+            await client.send_message(message)
+
+    @pytest.mark.it("Allows any exceptions raised by the POST request to propagate")
+    @pytest.mark.parametrize("exception", http_post_exceptions)
+    async def test_http_post_raises(self, client, message, exception):
+        client._session.post.side_effect = exception
+
+        with pytest.raises(type(exception)) as e_info:
+            await client.send_message(message)
+        assert e_info.value is exception
+
+    @pytest.mark.it("Can be cancelled while waiting for the HTTP response")
+    async def test_cancel_during_request(self, client, message):
+        post_ctx_manager = client._session.post.return_value
+        post_ctx_manager.__aenter__ = custom_mock.HangingAsyncMock()
+
+        t = asyncio.create_task(client.send_message(message))
+
+        # Hanging, waiting for response
+        await post_ctx_manager.__aenter__.wait_for_hang()
+        assert not t.done()
+
+        # Cancel
+        t.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await t
+
+    @pytest.mark.it("Sends the Message to IoTHub, with its properties")
+    async def test_emulator(self, emulator, emulator_client, message):
+        await emulator_client.send_message(message)
+
+        assert emulator.request_counts["telemetry"] == 1
+        ((payload, properties),) = emulator.messages
+        assert json.loads(payload) == message.payload
+        assert properties["iothub-messageid"] == "fake_message_id"
+        assert properties["iothub-app-prop1"] == "value1"
+
+
+@pytest.mark.describe("IoTHubHTTPClient - .send_message_batch()")
+class TestIoTHubHTTPClientSendMessageBatch:
+    @pytest.fixture(autouse=True)
+    def modify_client_config(self, client_config):
+        """Modify the client config to always be a Device"""
+        client_config.device_id = FAKE_DEVICE_ID
+        client_config.module_id = None
+
+    @pytest.fixture
+    def messages(self, message):
+        return [message] + [models.Message("message {}".format(i)) for i in range(4)]
+
+    def sent_batches(self, client):
+        return [json.loads(c[1]["data"]) for c in client._session.post.call_args_list]
+
+    @pytest.mark.it(
+        "Does a single asynchronous POST request operation to the relative 'telemetry' path using the aiohttp ClientSession and the stored SSL context, if all the Messages fit in one request"
+    )
+    async def test_http_post(self, mocker, client, messages):
+        expected_path = http_path.get_telemetry_path(client._device_id)
+
+        await client.send_message_batch(messages)
+
+        assert client._session.post.call_count == 1
+        assert client._session.post.call_args == mocker.call(
+            url=expected_path,
+            data=mocker.ANY,
+            params={"api-version": constant.IOTHUB_API_VERSION},
+            headers=mocker.ANY,
+            ssl=client._ssl_context,
+        )
+
+    @pytest.mark.it(
+        "Sends the Messages, in order, in the IoTHub batch JSON format, with base64 encoded payloads and 'iothub-' properties"
+    )
+    async def test_batch_format(self, client, messages):
+        await client.send_message_batch(messages)
+
+        (batch,) = self.sent_batches(client)
+        assert len(batch) == len(messages)
+        assert batch[0] == {
+            "body": base64.b64encode(b'{"temperature": 21.5}').decode(),
+            "base64Encoded": True,
+            "properties": {
+                "iothub-app-prop1": "value1",
+                "iothub-app-prop2": "value2",
+                "iothub-messageid": "fake_message_id",
+                "iothub-correlationid": "fake_correlation_id",
+                "iothub-contenttype": "application/json",
+                "iothub-contentencoding": "utf-8",
+            },
+        }
+        for i, entry in enumerate(batch[1:]):
+            assert base64.b64decode(entry["body"]) == "message {}".format(i).encode()
+
+    @pytest.mark.it(
+        "Sets the 'Content-Type' HTTP header on the POST request to the IoTHub batch JSON content type"
+    )
+    async def test_content_type_header(self, client, messages):
+        await client.send_message_batch(messages)
+
+        headers = client._session.post.call_args[1]["headers"]
+        assert headers["Content-Type"] == "application/vnd.microsoft.iothub.json"
+
+    @pytest.mark.it(
+        "Sets the 'User-Agent' and 'Authorization' HTTP headers, deriving the 'Authorization' header only once"
+    )
+    async def test_headers(self, mocker, client, mock_sastoken_provider):
+        client._sastoken_provider = mock_sastoken_provider
+        mocker.patch.object(constant, "TELEMETRY_MESSAGE_SIZE_LIMIT", 200)
+        messages = [models.Message("a" * 50) for _ in range(5)]
+
+        await client.send_message_batch(messages)
+
+        assert client._session.post.call_count > 1
+        assert mock_sastoken_provider.get_current_sastoken.call_count == 1
+        for c in client._session.post.call_args_list:
+            assert c[1]["headers"]["User-Agent"] == urllib.parse.quote_plus(
+                client._user_agent_string
+            )
+            assert c[1]["headers"]["Authorization"] == str(
+                mock_sastoken_provider.get_current_sastoken.return_value
+            )
+
+    @pytest.mark.it(
+        "Splits the Messages across as few POST requests as possible, in order, if they do not fit in the telemetry size limit"
+    )
+    @pytest.mark.parametrize("limit", [150, 200, 500])
+    async def test_split(self, mocker, client, limit):
+        mocker.patch.object(constant, "TELEMETRY_MESSAGE_SIZE_LIMIT", limit)
+        messages = [models.Message("message {}".format(i)) for i in range(20)]
+
+        await client.send_message_batch(messages)
+
+        batches = self.sent_batches(client)
+        assert len(batches) > 1
+        # In order
+        sent = [base64.b64decode(entry["body"]).decode() for batch in batches for entry in batch]
+        assert sent == [m.payload for m in messages]
+        for i, c in enumerate(client._session.post.call_args_list):
+            # Within the limit
+            assert len(c[1]["data"]) <= limit
+            # As full as possible (the first entry of the next request did not fit)
+            if i < len(batches) - 1:
+                next_entry = json.dumps(batches[i + 1][0])
+                assert len(c[1]["data"]) + 1 + len(next_entry) > limit
+
+    @pytest.mark.it(
+        "Raises ValueError without sending any Messages if a Message is too large to be sent in a batch"
+    )
+    async def test_too_large(self, client, messages):
+        messages.append(models.Message("a" * constant.TELEMETRY_MESSAGE_SIZE_LIMIT))
+
+        with pytest.raises(ValueError):
+            await client.send_message_batch(messages)
+        assert client._session.post.call_count == 0
+
+    @pytest.mark.it(
+        "Raises ValueError without sending any Messages if a Message is a security message"
+    )
+    async def test_security_message(self, client, messages):
+        security_message = models.Message("security event")
+        security_message.set_as_security_message()
+        messages.append(security_message)
+
+        with pytest.raises(ValueError):
+            await client.send_message_batch(messages)
+        assert client._session.post.call_count == 0
+
+    @pytest.mark.it("Does not send any requests if there are no Messages")
+    async def test_no_messages(self, client):
+        await client.send_message_batch([])
+
+        assert client._session.post.call_count == 0
+
+    @pytest.mark.it(
+        "Raises an IoTHubError without sending the remaining requests if a HTTP response is received with a failed status code"
+    )
+    @pytest.mark.parametrize("failed_status", failed_status_codes)
+    async def test_failed_response(self, mocker, client, failed_status):
+        mocker.patch.object(constant, "TELEMETRY_MESSAGE_SIZE_LIMIT", 200)
+        messages = [models.Message("a" * 50) for _ in range(5)]
+        mock_response = client._session.post.return_value.__aenter__.return_value
+        mock_response.status = failed_status
+
+        with pytest.raises(IoTHubError):
+            await client.send_message_batch(messages)
+        assert client._session.post.call_count == 1
+
+    @pytest.mark.it("Raises IoTHubClientError if not configured as a Device")
+    async def test_not_device(self, client, messages):
+        client._module_id = FAKE_MODULE_ID
+
+        with pytest.raises(IoTHubClientError):
+            await client.send_message_batch(messages)
+
+    @pytest.mark.it("Allows any exceptions raised by the POST request to propagate")
+    @pytest.mark.parametrize("exception", http_post_exceptions)
+    async def test_http_post_raises(self, client, messages, exception):
+        client._session.post.side_effect = exception
+
+        with pytest.raises(type(exception)) as e_info:
+            await client.send_message_batch(messages)
+        assert e_info.value is exception
+
+    @pytest.mark.it(
+        "Sends all the Messages to IoTHub over a single connection, with their properties"
+    )
+    async def test_emulator(self, emulator, emulator_client, messages):
+        messages = messages * 100
+
+        await emulator_client.send_message_batch(messages)
+
+        assert emulator.connection_count == 1
+        assert emulator.request_counts["telemetry_batch"] == 1
+        assert len(emulator.messages) == len(messages)
+        payload, properties = emulator.messages[0]
+        assert json.loads(payload) == messages[0].payload
+        assert properties["iothub-app-prop2"] == "value2"
+        assert [p for p, _ in emulator.messages[1:5]] == [
+            "message {}".format(i).encode() for i in range(4)
+        ]
+
+
 @pytest.mark.describe("IoTHubHTTPClient - .get_storage_info_for_blob")
 class TestIoTHubHTTPClientGetStorageInfoForBlob:
     @pytest.fixture(autouse=True)
@@ -1030,3 +1817,353 @@ class TestIoTHubHTTPClientNotifyBlobUploadStatus:
         t.cancel()
         with pytest.raises(asyncio.CancelledError):
             await t
+
+
+@pytest.mark.describe("IoTHubHTTPClient - .upload_file()")
+class TestIoTHubHTTPClientUploadFile:
+    @pytest.fixture
+    def client(self, emulator_client):
+        return emulator_client
+
+    @pytest.fixture(autouse=True)
+    def no_retry_backoff(self, mocker):
+        mocker.patch.object(iothub_http_client, "UPLOAD_RETRY_BACKOFF", 0)
+
+    @pytest.fixture
+    def file_data(self):
+        # Not a multiple of the block size used in tests, so the last block is shorter
+        return os.urandom(10 * 1024 + 123)
+
+    @pytest.fixture
+    def file_path(self, tmp_path, file_data):
+        path = tmp_path / "upload.bin"
+        path.write_bytes(file_data)
+        return str(path)
+
+    def uploaded_blob(self, emulator, blob_name):
+        return emulator.blobs["{}/{}".format(FAKE_DEVICE_ID, blob_name)]
+
+    @pytest.mark.it(
+        "Uploads the contents of the file as blocks of `block_size`, and commits them as the blob named in the storage info requested from IoTHub"
+    )
+    async def test_upload(self, mocker, client, emulator, file_path, file_data):
+        spy_storage_info = mocker.spy(client, "get_storage_info_for_blob")
+
+        await client.upload_file(file_path=file_path, blob_name="fake_blob", block_size=1024)
+
+        assert spy_storage_info.await_count == 1
+        assert spy_storage_info.await_args == mocker.call(blob_name="fake_blob")
+        assert emulator.request_counts["put_block"] == 11
+        assert emulator.request_counts["put_block_list"] == 1
+        assert self.uploaded_blob(emulator, "fake_blob") == file_data
+
+    @pytest.mark.it("Uses the name of the file as the blob name, if none is provided")
+    async def test_default_blob_name(self, client, emulator, file_path, file_data):
+        await client.upload_file(file_path=file_path)
+
+        assert self.uploaded_blob(emulator, "upload.bin") == file_data
+
+    @pytest.mark.it("Supports blob names that require URL encoding")
+    async def test_blob_name_encoding(self, client, emulator, file_path, file_data):
+        await client.upload_file(file_path=file_path, blob_name="logs/some file+1.bin")
+
+        assert self.uploaded_blob(emulator, "logs/some file+1.bin") == file_data
+
+    @pytest.mark.it("Commits an empty blob if the file is empty")
+    async def test_empty_file(self, client, emulator, tmp_path):
+        path = tmp_path / "empty.bin"
+        path.write_bytes(b"")
+
+        await client.upload_file(file_path=str(path))
+
+        assert emulator.request_counts["put_block"] == 0
+        assert self.uploaded_blob(emulator, "empty.bin") == b""
+
+    @pytest.mark.it("Reads the file through a read-only memory map")
+    async def test_mmap(self, mocker, client, file_path):
+        spy_mmap = mocker.spy(iothub_http_client.mmap, "mmap")
+
+        await client.upload_file(file_path=file_path, block_size=1024)
+
+        assert spy_mmap.call_count == 1
+        assert spy_mmap.call_args == mocker.call(mocker.ANY, 0, access=mmap.ACCESS_READ)
+
+    @pytest.mark.it("Has at most `concurrency` blocks uploading at once")
+    @pytest.mark.parametrize("concurrency", [1, 3])
+    async def test_concurrency(self, client, emulator, file_path, file_data, concurrency):
+        emulator.latency = 0.01
+
+        await client.upload_file(file_path=file_path, block_size=1024, concurrency=concurrency)
+
+        assert emulator.max_blocks_in_flight == concurrency
+        assert self.uploaded_blob(emulator, "upload.bin") == file_data
+
+    @pytest.mark.it("Makes Azure Storage requests over the client's HTTPConnectionPool")
+    async def test_pool(self, client, emulator, file_path):
+        await client.upload_file(file_path=file_path, block_size=1024, concurrency=2)
+
+        stats = client._connection_pool.get_stats()
+        # Storage info, 11 blocks, block list, notification
+        assert stats["requests_sent"] == 14
+        assert stats["connections_created"] == emulator.connection_count
+
+    @pytest.mark.it(
+        "Notifies IoTHub of the successful upload, with the correlation ID from the storage info"
+    )
+    async def test_notify_success(self, mocker, client, file_path, file_data):
+        spy_storage_info = mocker.spy(client, "get_storage_info_for_blob")
+        spy_notify = mocker.spy(client, "notify_blob_upload_status")
+
+        await client.upload_file(file_path=file_path)
+
+        assert spy_notify.await_count == 1
+        assert spy_notify.await_args == mocker.call(
+            correlation_id=spy_storage_info.spy_return["correlationId"],
+            is_success=True,
+            status_code=200,
+            status_description="Uploaded {} bytes".format(len(file_data)),
+        )
+
+    @pytest.mark.it("Retries block uploads that fail, up to `max_retries` times")
+    async def test_retry(self, client, emulator, file_path, file_data):
+        emulator.block_failures = 3
+
+        await client.upload_file(file_path=file_path, block_size=1024, max_retries=3)
+
+        assert emulator.request_counts["put_block"] == 11 + 3
+        assert self.uploaded_blob(emulator, "upload.bin") == file_data
+
+    @pytest.mark.it(
+        "Raises IoTHubError and notifies IoTHub of the failed upload if a block still fails after `max_retries` retries"
+    )
+    async def test_retries_exhausted(self, mocker, client, emulator, file_path):
+        emulator.block_failures = 100
+        spy_notify = mocker.spy(client, "notify_blob_upload_status")
+
+        with pytest.raises(IoTHubError):
+            await client.upload_file(
+                file_path=file_path, block_size=1024, concurrency=1, max_retries=2
+            )
+
+        assert emulator.request_counts["put_block"] == 3
+        assert emulator.request_counts["put_block_list"] == 0
+        assert spy_notify.await_count == 1
+        assert spy_notify.await_args.kwargs["is_success"] is False
+        assert spy_notify.await_args.kwargs["status_code"] == 500
+
+    @pytest.mark.it("Raises the original error if notifying IoTHub of the failed upload also fails")
+    async def test_notify_failure_fails(self, mocker, client, emulator, file_path):
+        emulator.block_failures = 100
+        mocker.patch.object(
+            client, "notify_blob_upload_status", side_effect=IoTHubClientError("fake")
+        )
+
+        with pytest.raises(IoTHubError):
+            await client.upload_file(file_path=file_path, max_retries=0)
+
+    @pytest.mark.it("Does not retry a request that Azure Storage rejects with a client error")
+    async def test_no_retry_client_error(self, mocker, client, file_path):
+        mock_response = mocker.MagicMock(status=403, reason="Forbidden")
+        mock_session = mocker.MagicMock(spec=aiohttp.ClientSession)
+        mock_session.put.return_value.__aenter__.return_value = mock_response
+        client._storage_session = mock_session
+
+        with pytest.raises(IoTHubError):
+            await client.upload_file(file_path=file_path, concurrency=1, max_retries=3)
+
+        assert mock_session.put.call_count == 1
+
+    @pytest.mark.it("Retries requests that fail with a connection error")
+    async def test_retry_connection_error(self, mocker, client, emulator, file_path, file_data):
+        original_put = aiohttp.ClientSession.put
+        failures = []
+
+        def put(session, url, **kwargs):
+            if not failures:
+                failures.append(url)
+                raise aiohttp.ClientConnectionError("fake")
+            return original_put(session, url, **kwargs)
+
+        mocker.patch.object(aiohttp.ClientSession, "put", put)
+
+        await client.upload_file(file_path=file_path, block_size=1024, max_retries=1)
+
+        assert len(failures) == 1
+        assert self.uploaded_blob(emulator, "upload.bin") == file_data
+
+    @pytest.mark.it("Raises IoTHubClientError if not configured as a Device")
+    async def test_not_device(self, client, emulator, file_path):
+        client._module_id = FAKE_MODULE_ID
+
+        with pytest.raises(IoTHubClientError):
+            await client.upload_file(file_path=file_path)
+        assert emulator.request_counts["storage_info"] == 0
+
+    @pytest.mark.it("Raises ValueError if the block size, concurrency or max retries are invalid")
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            pytest.param({"block_size": 0}, id="Block size too small"),
+            pytest.param(
+                {"block_size": iothub_http_client.MAX_BLOCK_SIZE + 1}, id="Block size too large"
+            ),
+            pytest.param({"concurrency": 0}, id="Concurrency too small"),
+            pytest.param({"max_retries": -1}, id="Negative max retries"),
+        ],
+    )
+    async def test_invalid_args(self, client, emulator, file_path, kwargs):
+        with pytest.raises(ValueError):
+            await client.upload_file(file_path=file_path, **kwargs)
+        assert emulator.request_counts["storage_info"] == 0
+
+    @pytest.mark.it("Raises ValueError if the file has too many blocks for the block size")
+    async def test_too_many_blocks(self, mocker, client, emulator, file_path):
+        mocker.patch.object(iothub_http_client, "MAX_BLOCK_COUNT", 10)
+
+        with pytest.raises(ValueError):
+            await client.upload_file(file_path=file_path, block_size=1024)
+        assert emulator.request_counts["storage_info"] == 0
+
+    @pytest.mark.it("Raises OSError without requesting storage info if the file cannot be opened")
+    async def test_no_file(self, client, emulator, tmp_path):
+        with pytest.raises(OSError):
+            await client.upload_file(file_path=str(tmp_path / "nonexistent"))
+        assert emulator.request_counts["storage_info"] == 0
+
+
+@pytest.mark.describe("HTTPConnectionPool")
+class TestHTTPConnectionPool:
+    @pytest.fixture
+    async def server(self):
+        from aiohttp import web
+
+        server = types.SimpleNamespace(latency=0, url=None)
+
+        async def handler(request):
+            await asyncio.sleep(server.latency)
+            return web.json_response({})
+
+        app = web.Application()
+        app.router.add_get("/", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        server.url = "http://127.0.0.1:{}/".format(runner.addresses[0][1])
+        yield server
+        await runner.cleanup()
+
+    @pytest.fixture
+    async def pool(self):
+        pool = HTTPConnectionPool()
+        yield pool
+        await pool.close()
+
+    async def get(self, pool, url, count=1):
+        async with aiohttp.ClientSession(
+            connector=pool.connector, connector_owner=False, trace_configs=[pool.trace_config]
+        ) as session:
+
+            async def get_one():
+                async with session.get(url) as response:
+                    await response.read()
+
+            await asyncio.gather(*[get_one() for _ in range(count)])
+
+    @pytest.mark.it("Uses default settings, if not provided")
+    async def test_defaults(self, pool):
+        assert pool.limit == iothub_http_client.DEFAULT_POOL_LIMIT
+        assert pool.limit_per_host == iothub_http_client.DEFAULT_POOL_LIMIT_PER_HOST
+        assert pool.keepalive_timeout == iothub_http_client.DEFAULT_KEEPALIVE_TIMEOUT
+        assert pool.dns_cache_ttl == iothub_http_client.DEFAULT_DNS_CACHE_TTL
+
+    @pytest.mark.it("Creates an aiohttp TCPConnector with the provided settings upon first use")
+    @pytest.mark.parametrize(
+        "dns_cache_ttl, expected_use_dns_cache",
+        [
+            pytest.param(30, True, id="DNS cache with TTL"),
+            pytest.param(None, True, id="DNS cache without TTL"),
+            pytest.param(0, False, id="No DNS cache"),
+        ],
+    )
+    async def test_connector(self, mocker, dns_cache_ttl, expected_use_dns_cache):
+        spy_connector_init = mocker.spy(aiohttp, "TCPConnector")
+        pool = HTTPConnectionPool(
+            limit=10, limit_per_host=5, keepalive_timeout=30.0, dns_cache_ttl=dns_cache_ttl
+        )
+        assert spy_connector_init.call_count == 0
+
+        connector = pool.connector
+
+        assert spy_connector_init.call_count == 1
+        assert spy_connector_init.call_args == mocker.call(
+            limit=10,
+            limit_per_host=5,
+            keepalive_timeout=30.0,
+            use_dns_cache=expected_use_dns_cache,
+            ttl_dns_cache=dns_cache_ttl,
+        )
+        assert connector is spy_connector_init.spy_return
+        assert pool.connector is connector
+
+        await pool.close()
+
+    @pytest.mark.it("Reuses open connections for subsequent requests, across ClientSessions")
+    async def test_reuse(self, server, pool):
+        for _ in range(3):
+            await self.get(pool, server.url)
+
+        stats = pool.get_stats()
+        assert stats["requests_sent"] == 3
+        assert stats["connections_created"] == 1
+        assert stats["connections_reused"] == 2
+        assert stats["requests_in_flight"] == 0
+
+    @pytest.mark.it(
+        "Queues requests beyond the connection limit until a connection becomes available"
+    )
+    async def test_limit(self, server):
+        server.latency = 0.05
+        pool = HTTPConnectionPool(limit=2)
+
+        await self.get(pool, server.url, count=6)
+
+        stats = pool.get_stats()
+        assert stats["requests_sent"] == 6
+        assert stats["connections_created"] == 2
+        assert stats["requests_queued"] == 4
+        assert stats["queue_wait_seconds"] > 0
+
+        await pool.close()
+
+    @pytest.mark.it("Counts requests that raise an exception as failed")
+    async def test_failed(self, pool):
+        with pytest.raises(aiohttp.ClientConnectionError):
+            # Nothing is listening on this port
+            await self.get(pool, "http://127.0.0.1:1/")
+
+        stats = pool.get_stats()
+        assert stats["requests_sent"] == 1
+        assert stats["requests_failed"] == 1
+        assert stats["requests_in_flight"] == 0
+
+    @pytest.mark.it("Returns a copy of the statistics, which includes every statistic")
+    async def test_get_stats(self, pool):
+        stats = pool.get_stats()
+        stats["requests_sent"] = 100
+
+        assert set(pool.get_stats()) == set(iothub_http_client.POOL_STATS)
+        assert pool.get_stats()["requests_sent"] == 0
+
+    @pytest.mark.it("Closes the connector upon .close(), and does nothing if never used")
+    async def test_close(self, server):
+        unused_pool = HTTPConnectionPool()
+        await unused_pool.close()
+        assert unused_pool._connector is None
+
+        pool = HTTPConnectionPool()
+        await self.get(pool, server.url)
+        await pool.close()
+        assert pool.closed
+        # Closing again does nothing
+        await pool.close()
@@ -17,9 +17,10 @@ from dev_utils import custom_mock
 from azure.iot.device.iothub_mqtt_client import (
     IoTHubMQTTClient,
     DEFAULT_RECONNECT_INTERVAL,
+    MAX_DIRECT_METHOD_RESPONSE_TIMEOUT,
 )
 from azure.iot.device.iot_exceptions import IoTHubClientError, IoTHubError
-from azure.iot.device import config, constant, models, user_agent
+from azure.iot.device import config, constant, metrics, models, tracing, user_agent
 from azure.iot.device import mqtt_client as mqtt
 from azure.iot.device import request_response as rr
 from azure.iot.device import mqtt_topic_iothub as mqtt_topic
@@ -113,6 +114,7 @@ async def client(mocker, client_config):
     client._mqtt_client.subscribe = mocker.AsyncMock()
     client._mqtt_client.unsubscribe = mocker.AsyncMock()
     client._mqtt_client.publish = mocker.AsyncMock()
+    client._mqtt_client.reconnect = mocker.AsyncMock()
     # Also mock other methods relevant to tests
     client._mqtt_client.set_credentials = mocker.MagicMock()
     client._mqtt_client.is_connected = mocker.MagicMock()
@@ -311,6 +313,8 @@ class TestIoTHubMQTTClientInstantiation:
             ssl_context=client_config.ssl_context,
             websockets_path=expected_ws_path,
             proxy_options=client_config.proxy_options,
+            network_loop=client_config.network_loop,
+            executor=client_config.executor,
         )
         assert client._mqtt_client is mock_constructor.return_value
 
@@ -617,6 +621,40 @@ class TestIoTHubMQTTClientStart:
         # Cleanup
         await client.stop()
 
+    # NOTE: For testing the functionality of this task, see the corresponding test suite (TestIoTHubMQTTClientKeepCredentialsFresh)
+    @pytest.mark.it(
+        "Begins running the ._keep_credentials_fresh() coroutine method as a background task, storing it as an attribute, when using SAS authentication"
+    )
+    async def test_keep_credentials_fresh_bg_task(self, client, mock_sastoken_provider):
+        client._sastoken_provider = mock_sastoken_provider
+        assert client._keep_credentials_fresh_bg_task is None
+
+        await client.start()
+
+        assert isinstance(client._keep_credentials_fresh_bg_task, asyncio.Task)
+        assert not client._keep_credentials_fresh_bg_task.done()
+        if sys.version_info > (3, 8):
+            # NOTE: There isn't a way to validate the contents of a task until 3.8
+            # as far as I can tell.
+            task_coro = client._keep_credentials_fresh_bg_task.get_coro()
+            assert task_coro.__qualname__ == "IoTHubMQTTClient._keep_credentials_fresh"
+
+        # Cleanup
+        await client.stop()
+
+    @pytest.mark.it(
+        "Does not begin running the ._keep_credentials_fresh() coroutine method as a background task, when not using SAS authentication"
+    )
+    async def test_keep_credentials_fresh_bg_task_no_sas(self, client):
+        assert client._sastoken_provider is None
+
+        await client.start()
+
+        assert client._keep_credentials_fresh_bg_task is None
+
+        # Cleanup
+        await client.stop()
+
     @pytest.mark.it(
         "Does not alter any background tasks if already started, but does reset the credentials with the same values"
     )
@@ -636,6 +674,7 @@ class TestIoTHubMQTTClientStart:
 
         # Current tasks
         current_process_twin_responses_task = client._process_twin_responses_bg_task
+        current_keep_credentials_fresh_task = client._keep_credentials_fresh_bg_task
         # Credentials set
         assert client._mqtt_client.set_credentials.call_count == 1
         credential_args = client._mqtt_client.set_credentials.call_args
@@ -645,6 +684,7 @@ class TestIoTHubMQTTClientStart:
 
         # Tasks unchanged
         assert client._process_twin_responses_bg_task is current_process_twin_responses_task
+        assert client._keep_credentials_fresh_bg_task is current_keep_credentials_fresh_task
         # Credentials set again (the same values as before)
         assert client._mqtt_client.set_credentials.call_count == 2
         assert client._mqtt_client.set_credentials.call_args == credential_args
@@ -703,6 +743,30 @@ class TestIoTHubMQTTClientStop:
         await client.stop()
         # No AttributeError means success!
 
+    @pytest.mark.it(
+        "Cancels the 'keep_credentials_fresh' background task and removes it, if it exists"
+    )
+    async def test_keep_credentials_fresh_bg_task(self, client):
+        assert isinstance(client._keep_credentials_fresh_bg_task, asyncio.Task)
+        t = client._keep_credentials_fresh_bg_task
+        assert not t.done()
+
+        await client.stop()
+
+        assert t.done()
+        assert t.cancelled()
+        assert client._keep_credentials_fresh_bg_task is None
+
+    @pytest.mark.it("Handles the case where no 'keep_credentials_fresh' background task exists")
+    async def test_keep_credentials_fresh_bg_task_no_exist(self, client):
+        # The task is already running, so cancel and remove it
+        assert isinstance(client._keep_credentials_fresh_bg_task, asyncio.Task)
+        client._keep_credentials_fresh_bg_task.cancel()
+        client._keep_credentials_fresh_bg_task = None
+
+        await client.stop()
+        # No AttributeError means success!
+
     @pytest.mark.it(
         "Allows any exception raised during MQTTClient disconnect to propagate, but only after cancelling background tasks"
     )
@@ -1017,7 +1081,7 @@ class TestIoTHubMQTTClientSendMessage:
 
         assert client._mqtt_client.publish.await_count == 1
         assert client._mqtt_client.publish.await_args == mocker.call(
-            expected_topic, expected_payload
+            expected_topic, expected_payload, timeout=None
         )
         assert isinstance(expected_payload, bytes)
 
@@ -1069,7 +1133,7 @@ class TestIoTHubMQTTClientSendMessage:
 
         assert client._mqtt_client.publish.await_count == 1
         assert client._mqtt_client.publish.await_args == mocker.call(
-            expected_topic, expected_byte_payload
+            expected_topic, expected_byte_payload, timeout=None
         )
 
     @pytest.mark.it("Supports any string-convertible payload when using text/plain content type")
@@ -1109,7 +1173,7 @@ class TestIoTHubMQTTClientSendMessage:
 
         assert client._mqtt_client.publish.await_count == 1
         assert client._mqtt_client.publish.await_args == mocker.call(
-            expected_topic, expected_byte_payload
+            expected_topic, expected_byte_payload, timeout=None
         )
 
     @pytest.mark.it(
@@ -1151,7 +1215,7 @@ class TestIoTHubMQTTClientSendMessage:
 
         assert client._mqtt_client.publish.await_count == 1
         assert client._mqtt_client.publish.await_args == mocker.call(
-            expected_topic, expected_byte_payload
+            expected_topic, expected_byte_payload, timeout=None
         )
 
     @pytest.mark.it("Inserts any Message properties in the telemetry topic")
@@ -1192,7 +1256,9 @@ class TestIoTHubMQTTClientSendMessage:
         await client.send_message(message)
 
         assert client._mqtt_client.publish.await_count == 1
-        assert client._mqtt_client.publish.await_args == mocker.call(expected_topic, mocker.ANY)
+        assert client._mqtt_client.publish.await_args == mocker.call(
+            expected_topic, mocker.ANY, timeout=None
+        )
 
     @pytest.mark.it("Allows any exceptions raised from the MQTTClient publish to propagate")
     @pytest.mark.parametrize("exception", mqtt_publish_exceptions)
@@ -1218,6 +1284,15 @@ class TestIoTHubMQTTClientSendMessage:
         with pytest.raises(asyncio.CancelledError):
             await t
 
+    @pytest.mark.it("Passes the provided timeout to the MQTTClient publish")
+    async def test_timeout(self, mocker, client, message):
+        await client.send_message(message, timeout=5)
+
+        assert client._mqtt_client.publish.await_count == 1
+        assert client._mqtt_client.publish.await_args == mocker.call(
+            mocker.ANY, mocker.ANY, timeout=5
+        )
+
 
 @pytest.mark.describe("IoTHubMQTTClient - .send_direct_method_response()")
 class TestIoTHubMQTTClientSendDirectMethodResponse:
@@ -1244,7 +1319,7 @@ class TestIoTHubMQTTClientSendDirectMethodResponse:
 
         assert client._mqtt_client.publish.await_count == 1
         assert client._mqtt_client.publish.await_args == mocker.call(
-            expected_topic, expected_payload
+            expected_topic, expected_payload, timeout=None
         )
 
     @pytest.mark.it("Allows any exceptions raised from the MQTTClient publish to propagate")
@@ -1271,6 +1346,15 @@ class TestIoTHubMQTTClientSendDirectMethodResponse:
         with pytest.raises(asyncio.CancelledError):
             await t
 
+    @pytest.mark.it("Passes the provided timeout to the MQTTClient publish")
+    async def test_timeout(self, mocker, client, method_response):
+        await client.send_direct_method_response(method_response, timeout=5)
+
+        assert client._mqtt_client.publish.await_count == 1
+        assert client._mqtt_client.publish.await_args == mocker.call(
+            mocker.ANY, mocker.ANY, timeout=5
+        )
+
 
 @pytest.mark.describe("IoTHubMQTTClient - .send_twin_patch()")
 class TestIoTHubMQTTClientSendTwinPatch:
@@ -1286,7 +1370,7 @@ class TestIoTHubMQTTClientSendTwinPatch:
         # override the publish behavior.
         #
         # To see tests regarding how this actually works in practice, see the relevant test suite
-        async def fake_publish(topic, payload):
+        async def fake_publish(topic, payload, timeout=None):
             rid = topic[topic.rfind("$rid=") :].split("=")[1]
             response = rr.Response(rid, 200, "body")
             await client._request_ledger.match_response(response)
@@ -1362,7 +1446,7 @@ class TestIoTHubMQTTClientSendTwinPatch:
 
         assert client._mqtt_client.publish.await_count == 1
         assert client._mqtt_client.publish.await_args == mocker.call(
-            expected_topic, expected_payload
+            expected_topic, expected_payload, timeout=None
         )
 
     @pytest.mark.it("Awaits a received Response to the Request")
@@ -1532,7 +1616,7 @@ class TestIoTHubMQTTClientSendTwinPatch:
 
         # The Request that was created was also deleted
         assert spy_create_request.await_count == 1
-        assert spy_create_request.await_args == mocker.call()
+        assert spy_create_request.await_args == mocker.call(timeout=None)
         assert spy_delete_request.await_count == 1
         assert spy_delete_request.await_args == mocker.call(
             spy_create_request.spy_return.request_id
@@ -1554,7 +1638,7 @@ class TestIoTHubMQTTClientSendTwinPatch:
 
         # Request was created, but not yet deleted
         assert spy_create_request.await_count == 1
-        assert spy_create_request.await_args == mocker.call()
+        assert spy_create_request.await_args == mocker.call(timeout=None)
         assert spy_delete_request.await_count == 0
 
         # Cancel
@@ -1591,7 +1675,7 @@ class TestIoTHubMQTTClientSendTwinPatch:
 
         # Request was created, but not yet deleted
         assert spy_create_request.await_count == 1
-        assert spy_create_request.await_args == mocker.call()
+        assert spy_create_request.await_args == mocker.call(timeout=None)
         assert spy_delete_request.await_count == 0
 
         # Cancel
@@ -1603,6 +1687,66 @@ class TestIoTHubMQTTClientSendTwinPatch:
         assert spy_delete_request.await_count == 1
         assert spy_delete_request.await_args == mocker.call(request.request_id)
 
+    @pytest.mark.it(
+        "Creates the Request and performs the MQTTClient publish with the time remaining before the provided timeout elapses"
+    )
+    async def test_timeout_passed_down(self, mocker, client):
+        spy_create_request = mocker.spy(client._request_ledger, "create_request")
+
+        await client.send_twin_patch({"foo": "bar"}, timeout=5)
+
+        assert spy_create_request.await_count == 1
+        request_timeout = spy_create_request.await_args.kwargs["timeout"]
+        assert 0 < request_timeout <= 5
+        assert client._mqtt_client.publish.await_count == 1
+        publish_timeout = client._mqtt_client.publish.await_args.kwargs["timeout"]
+        assert 0 < publish_timeout <= request_timeout
+
+    @pytest.mark.it(
+        "Raises asyncio.TimeoutError and removes the Request from the RequestLedger if no Response is received before the provided timeout elapses"
+    )
+    async def test_timeout_waiting_response(self, mocker, client):
+        # Override autocompletion behavior on publish (we don't want it here)
+        client._mqtt_client.publish = mocker.AsyncMock()
+        spy_create_request = mocker.spy(client._request_ledger, "create_request")
+
+        with pytest.raises(asyncio.TimeoutError):
+            await client.send_twin_patch({"foo": "bar"}, timeout=0.1)
+
+        request = spy_create_request.spy_return
+        assert request.request_id not in client._request_ledger
+        assert len(client._request_ledger) == 0
+
+    @pytest.mark.it(
+        "Allows an asyncio.TimeoutError raised by the MQTTClient publish to propagate, removing the Request from the RequestLedger"
+    )
+    async def test_timeout_publish(self, mocker, client):
+        client._mqtt_client.publish.side_effect = asyncio.TimeoutError()
+        spy_create_request = mocker.spy(client._request_ledger, "create_request")
+
+        with pytest.raises(asyncio.TimeoutError):
+            await client.send_twin_patch({"foo": "bar"}, timeout=0.1)
+
+        request = spy_create_request.spy_return
+        assert request.request_id not in client._request_ledger
+
+    @pytest.mark.it(
+        "Raises asyncio.TimeoutError without creating a Request if the MQTTClient subscribe to enable twin responses does not complete before the provided timeout elapses"
+    )
+    async def test_timeout_subscribe(self, mocker, client):
+        assert client._twin_responses_enabled is False
+        # The SUBACK never arrives
+        client._mqtt_client.subscribe = custom_mock.HangingAsyncMock()
+        spy_create_request = mocker.spy(client._request_ledger, "create_request")
+
+        with pytest.raises(asyncio.TimeoutError):
+            await client.send_twin_patch({"foo": "bar"}, timeout=0.1)
+
+        assert client._mqtt_client.subscribe.await_count == 1
+        assert client._twin_responses_enabled is False
+        assert spy_create_request.await_count == 0
+        assert client._mqtt_client.publish.await_count == 0
+
 
 @pytest.mark.describe("IoTHubMQTTClient - .get_twin()")
 class TestIoTHubMQTTClientGetTwin:
@@ -1614,7 +1758,7 @@ class TestIoTHubMQTTClientGetTwin:
         # override the publish behavior.
         #
         # To see tests regarding how this actually works in practice, see the relevant test suite
-        async def fake_publish(topic, payload):
+        async def fake_publish(topic, payload, timeout=None):
             rid = topic[topic.rfind("$rid=") :].split("=")[1]
             response = rr.Response(rid, 200, '{"json": "in", "a": {"string": "format"}}')
             await client._request_ledger.match_response(response)
@@ -1688,7 +1832,7 @@ class TestIoTHubMQTTClientGetTwin:
 
         assert client._mqtt_client.publish.await_count == 1
         assert client._mqtt_client.publish.await_args == mocker.call(
-            expected_topic, expected_payload
+            expected_topic, expected_payload, timeout=None
         )
 
     @pytest.mark.it("Awaits a received Response to the Request")
@@ -1859,7 +2003,7 @@ class TestIoTHubMQTTClientGetTwin:
             await client.get_twin()
 
         assert spy_create_request.await_count == 1
-        assert spy_create_request.await_args == mocker.call()
+        assert spy_create_request.await_args == mocker.call(timeout=None)
         assert spy_delete_request.await_count == 1
         assert spy_delete_request.await_args == mocker.call(
             spy_create_request.spy_return.request_id
@@ -1881,7 +2025,7 @@ class TestIoTHubMQTTClientGetTwin:
 
         # Request was created, but not yet deleted
         assert spy_create_request.await_count == 1
-        assert spy_create_request.await_args == mocker.call()
+        assert spy_create_request.await_args == mocker.call(timeout=None)
         assert spy_delete_request.await_count == 0
 
         # Cancel
@@ -1918,7 +2062,7 @@ class TestIoTHubMQTTClientGetTwin:
 
         # Request was created, but not yet deleted
         assert spy_create_request.await_count == 1
-        assert spy_create_request.await_args == mocker.call()
+        assert spy_create_request.await_args == mocker.call(timeout=None)
         assert spy_delete_request.await_count == 0
 
         # Cancel
@@ -1930,6 +2074,66 @@ class TestIoTHubMQTTClientGetTwin:
         assert spy_delete_request.await_count == 1
         assert spy_delete_request.await_args == mocker.call(request.request_id)
 
+    @pytest.mark.it(
+        "Creates the Request and performs the MQTTClient publish with the time remaining before the provided timeout elapses"
+    )
+    async def test_timeout_passed_down(self, mocker, client):
+        spy_create_request = mocker.spy(client._request_ledger, "create_request")
+
+        await client.get_twin(timeout=5)
+
+        assert spy_create_request.await_count == 1
+        request_timeout = spy_create_request.await_args.kwargs["timeout"]
+        assert 0 < request_timeout <= 5
+        assert client._mqtt_client.publish.await_count == 1
+        publish_timeout = client._mqtt_client.publish.await_args.kwargs["timeout"]
+        assert 0 < publish_timeout <= request_timeout
+
+    @pytest.mark.it(
+        "Raises asyncio.TimeoutError and removes the Request from the RequestLedger if no Response is received before the provided timeout elapses"
+    )
+    async def test_timeout_waiting_response(self, mocker, client):
+        # Override autocompletion behavior on publish (we don't want it here)
+        client._mqtt_client.publish = mocker.AsyncMock()
+        spy_create_request = mocker.spy(client._request_ledger, "create_request")
+
+        with pytest.raises(asyncio.TimeoutError):
+            await client.get_twin(timeout=0.1)
+
+        request = spy_create_request.spy_return
+        assert request.request_id not in client._request_ledger
+        assert len(client._request_ledger) == 0
+
+    @pytest.mark.it(
+        "Allows an asyncio.TimeoutError raised by the MQTTClient publish to propagate, removing the Request from the RequestLedger"
+    )
+    async def test_timeout_publish(self, mocker, client):
+        client._mqtt_client.publish.side_effect = asyncio.TimeoutError()
+        spy_create_request = mocker.spy(client._request_ledger, "create_request")
+
+        with pytest.raises(asyncio.TimeoutError):
+            await client.get_twin(timeout=0.1)
+
+        request = spy_create_request.spy_return
+        assert request.request_id not in client._request_ledger
+
+    @pytest.mark.it(
+        "Raises asyncio.TimeoutError without creating a Request if the MQTTClient subscribe to enable twin responses does not complete before the provided timeout elapses"
+    )
+    async def test_timeout_subscribe(self, mocker, client):
+        assert client._twin_responses_enabled is False
+        # The SUBACK never arrives
+        client._mqtt_client.subscribe = custom_mock.HangingAsyncMock()
+        spy_create_request = mocker.spy(client._request_ledger, "create_request")
+
+        with pytest.raises(asyncio.TimeoutError):
+            await client.get_twin(timeout=0.1)
+
+        assert client._mqtt_client.subscribe.await_count == 1
+        assert client._twin_responses_enabled is False
+        assert spy_create_request.await_count == 0
+        assert client._mqtt_client.publish.await_count == 0
+
 
 class IoTHubMQTTClientEnableReceiveTest(abc.ABC):
     """Base class for the .enable_x() methods"""
@@ -1966,6 +2170,41 @@ class IoTHubMQTTClientEnableReceiveTest(abc.ABC):
             await method()
         assert e_info.value is exception
 
+    @pytest.mark.it(
+        "Tracks the topic as subscribed (for resubscribing upon a reconnect with new credentials), if the subscribe succeeds"
+    )
+    async def test_tracks_subscription(self, client, method_name, expected_topic):
+        assert expected_topic not in client._subscribed_topics
+
+        method = getattr(client, method_name)
+        await method()
+
+        assert expected_topic in client._subscribed_topics
+
+    @pytest.mark.it("Does not track the topic as subscribed if the subscribe fails")
+    @pytest.mark.parametrize("exception", mqtt_subscribe_exceptions)
+    async def test_tracks_subscription_fails(self, client, method_name, expected_topic, exception):
+        client._mqtt_client.subscribe.side_effect = exception
+
+        with pytest.raises(type(exception)):
+            method = getattr(client, method_name)
+            await method()
+
+        assert expected_topic not in client._subscribed_topics
+
+    @pytest.mark.it("Waits for any reconnect with new credentials to finish before subscribing")
+    async def test_waits_for_reconnect(self, client, method_name):
+        await client._subscription_lock.acquire()
+
+        method = getattr(client, method_name)
+        t = asyncio.create_task(method())
+        await asyncio.sleep(0.1)
+        assert client._mqtt_client.subscribe.await_count == 0
+
+        client._subscription_lock.release()
+        await t
+        assert client._mqtt_client.subscribe.await_count == 1
+
     @pytest.mark.it("Can be cancelled while waiting for the MQTTClient subscribe to finish")
     async def test_cancel(self, client, method_name):
         client._mqtt_client.subscribe = custom_mock.HangingAsyncMock()
@@ -2019,6 +2258,24 @@ class IoTHubMQTTClientDisableReceiveTest(abc.ABC):
             await method()
         assert e_info.value is exception
 
+    @pytest.mark.it("Stops tracking the topic as subscribed, even if the unsubscribe fails")
+    @pytest.mark.parametrize(
+        "exception",
+        [pytest.param(None, id="Unsubscribe succeeds")] + mqtt_unsubscribe_exceptions,
+    )
+    async def test_tracks_subscription(self, client, method_name, expected_topic, exception):
+        client._subscribed_topics.add(expected_topic)
+        client._mqtt_client.unsubscribe.side_effect = exception
+
+        method = getattr(client, method_name)
+        if exception:
+            with pytest.raises(type(exception)):
+                await method()
+        else:
+            await method()
+
+        assert expected_topic not in client._subscribed_topics
+
     @pytest.mark.it("Can be cancelled while waiting for the MQTTClient unsubscribe to finish")
     async def test_cancel(self, client, method_name):
         client._mqtt_client.unsubscribe = custom_mock.HangingAsyncMock()
@@ -2157,6 +2414,58 @@ class TestIoTHubMQTTClientDisableTwinPatchReceive(IoTHubMQTTClientDisableReceive
         return mqtt_topic.get_twin_patch_topic_for_subscribe()
 
 
+@pytest.mark.describe("IoTHubMQTTClient - .interrupt_incoming_data()")
+class TestIoTHubMQTTClientInterruptIncomingData:
+    @pytest.mark.it(
+        "Causes each incoming data generator to yield INCOMING_MESSAGE_INTERRUPT, if using a Device Configuration"
+    )
+    async def test_device(self, client):
+        assert client._module_id is None
+        client.interrupt_incoming_data()
+
+        result = await client.incoming_c2d_messages.__anext__()
+        assert result is mqtt.INCOMING_MESSAGE_INTERRUPT
+        result = await client.incoming_direct_method_requests.__anext__()
+        assert result is mqtt.INCOMING_MESSAGE_INTERRUPT
+        result = await client.incoming_twin_patches.__anext__()
+        assert result is mqtt.INCOMING_MESSAGE_INTERRUPT
+
+    @pytest.mark.it(
+        "Causes each incoming data generator to yield INCOMING_MESSAGE_INTERRUPT, if using a Module Configuration"
+    )
+    async def test_module(self, client_config):
+        client_config.module_id = FAKE_MODULE_ID
+        client = IoTHubMQTTClient(client_config)
+        client.interrupt_incoming_data()
+
+        result = await client.incoming_input_messages.__anext__()
+        assert result is mqtt.INCOMING_MESSAGE_INTERRUPT
+        result = await client.incoming_direct_method_requests.__anext__()
+        assert result is mqtt.INCOMING_MESSAGE_INTERRUPT
+        result = await client.incoming_twin_patches.__anext__()
+        assert result is mqtt.INCOMING_MESSAGE_INTERRUPT
+
+    @pytest.mark.it("Yields the INCOMING_MESSAGE_INTERRUPT after any data already received")
+    async def test_after_received_data(self, client):
+        sub_topic = mqtt_topic.get_c2d_topic_for_subscribe(client._device_id)
+        receive_topic = sub_topic.rstrip("#")
+        mqtt_msg = mqtt.MQTTMessage(mid=1, topic=receive_topic.encode("utf-8"))
+        await client._mqtt_client._incoming_filtered_messages[sub_topic].put(mqtt_msg)
+
+        client.interrupt_incoming_data()
+
+        result = await client.incoming_c2d_messages.__anext__()
+        assert isinstance(result, models.Message)
+        result = await client.incoming_c2d_messages.__anext__()
+        assert result is mqtt.INCOMING_MESSAGE_INTERRUPT
+
+    @pytest.mark.it("Does not interrupt the processing of twin responses")
+    async def test_twin_responses(self, client):
+        twin_response_topic = mqtt_topic.get_twin_response_topic_for_subscribe()
+        client.interrupt_incoming_data()
+        assert client._mqtt_client._incoming_filtered_messages[twin_response_topic].empty()
+
+
 @pytest.mark.describe("IoTHubMQTTClient - PROPERTY: .incoming_c2d_messages")
 class TestIoTHubMQTTClientIncomingC2DMessages:
     @pytest.fixture(autouse=True)
@@ -3326,6 +3635,300 @@ class TestIoTHubMQTTClientConnected:
         assert client._mqtt_client.is_connected.call_args == mocker.call()
         assert result is client._mqtt_client.is_connected.return_value
 
+    @pytest.mark.it("Returns True while the MQTTClient is reconnecting, even if not connected")
+    def test_reconnecting(self, mocker, client):
+        client._mqtt_client.is_connected.return_value = False
+        client._mqtt_client.is_reconnecting = mocker.MagicMock(return_value=True)
+
+        assert client.connected is True
+
+        client._mqtt_client.is_reconnecting.return_value = False
+
+        assert client.connected is False
+
+
+@pytest.mark.describe("IoTHubMQTTClient - PROPERTY: .stats")
+class TestIoTHubMQTTClientStats:
+    def direct_method_request_message(self, request_id):
+        topic = mqtt_topic.get_direct_method_request_topic_for_subscribe().rstrip("#")
+        topic += "some_method/?$rid={}".format(request_id)
+        mqtt_message = mqtt.MQTTMessage(mid=1, topic=topic.encode("utf-8"))
+        mqtt_message.payload = b'{"json": "payload"}'
+        return mqtt_message
+
+    @pytest.mark.it("Includes the stats of the MQTTClient")
+    async def test_mqtt_client_stats(self, client):
+        client._mqtt_client.publish_count = 7
+        client._mqtt_client.bytes_received = 1024
+
+        stats = client.stats
+        assert stats["publishes_sent"] == 7
+        assert stats["bytes_received"] == 1024
+        for name in client._mqtt_client.stats:
+            assert name in stats
+
+    @pytest.mark.it(
+        "Includes a count and queue depth for each kind of incoming data relevant to the client configuration"
+    )
+    @pytest.mark.parametrize(
+        "module_id", [pytest.param(None, id="Device"), pytest.param(FAKE_MODULE_ID, id="Module")]
+    )
+    async def test_keys(self, client_config, module_id):
+        client_config.module_id = module_id
+        client = IoTHubMQTTClient(client_config)
+
+        stats = client.stats
+        # NOTE: Token metrics are reported by the SasTokenProvider
+        expected_names = set(metrics.COUNTERS) | set(metrics.GAUGES)
+        expected_names -= {"token_refreshes", "token_refresh_failures"}
+        assert set(stats) == expected_names
+        assert all(value == 0 for value in stats.values())
+
+    @pytest.mark.it("Counts telemetry messages sent, acknowledged and failed")
+    async def test_messages(self, client, arbitrary_exception):
+        await client.send_message(models.Message("some payload"))
+        await client.send_message(models.Message("some payload"))
+        client._mqtt_client.publish.side_effect = arbitrary_exception
+        with pytest.raises(type(arbitrary_exception)):
+            await client.send_message(models.Message("some payload"))
+
+        stats = client.stats
+        assert stats["messages_sent"] == 3
+        assert stats["messages_acked"] == 2
+        assert stats["messages_failed"] == 1
+
+    @pytest.mark.it(
+        "Counts items yielded by an incoming data generator, and reports items not yet yielded as the queue depth"
+    )
+    async def test_received(self, client):
+        topic = mqtt_topic.get_direct_method_request_topic_for_subscribe()
+        queue = client._mqtt_client._incoming_filtered_messages[topic]
+        for i in range(3):
+            await queue.put(self.direct_method_request_message(str(i)))
+
+        await client.incoming_direct_method_requests.__anext__()
+
+        stats = client.stats
+        assert stats["direct_method_requests_received"] == 1
+        assert stats["direct_method_queue_depth"] == 2
+        assert stats["messages_received"] == 0
+
+    @pytest.mark.it("Reports the number of twin requests awaiting a response")
+    async def test_pending_requests(self, client):
+        await client._request_ledger.create_request()
+        await client._request_ledger.create_request()
+
+        assert client.stats["pending_requests"] == 2
+
+
+@pytest.mark.describe("IoTHubMQTTClient - Round Trip Times")
+class TestIoTHubMQTTClientRoundTripTimes:
+    @pytest.fixture
+    def mock_metrics_provider(self, mocker):
+        return mocker.MagicMock(spec=metrics.MetricsProvider)
+
+    @pytest.fixture
+    def client_config(self, client_config, mock_metrics_provider):
+        client_config.module_id = FAKE_MODULE_ID
+        client_config.metrics_provider = mock_metrics_provider
+        return client_config
+
+    @pytest.fixture(autouse=True)
+    def modify_publish(self, client):
+        # Complete the pending request for the request id of any twin publish
+        async def fake_publish(topic, payload, timeout=None):
+            if topic.startswith("$iothub/twin/"):
+                rid = topic[topic.rfind("$rid=") :].split("=")[1]
+                response = rr.Response(rid, 200, '{"desired": {}, "reported": {}}')
+                await client._request_ledger.match_response(response)
+
+        client._mqtt_client.publish.side_effect = fake_publish
+
+    async def receive_direct_method_request(self, client, request_id):
+        topic = mqtt_topic.get_direct_method_request_topic_for_subscribe()
+        mqtt_message = mqtt.MQTTMessage(
+            mid=1, topic="{}some_method/?$rid={}".format(topic.rstrip("#"), request_id).encode()
+        )
+        mqtt_message.payload = b'{"json": "payload"}'
+        await client._mqtt_client._incoming_filtered_messages[topic].put(mqtt_message)
+        return await client.incoming_direct_method_requests.__anext__()
+
+    @pytest.mark.it(
+        "Records the round trip time of a twin request with the MetricsProvider, along with the device and module ids"
+    )
+    async def test_get_twin(self, mocker, client, mock_metrics_provider):
+        await client.get_twin()
+
+        assert mock_metrics_provider.record_round_trip_time.call_count == 1
+        assert mock_metrics_provider.record_round_trip_time.call_args == mocker.call(
+            "twin_get", mocker.ANY, {"device_id": FAKE_DEVICE_ID, "module_id": FAKE_MODULE_ID}
+        )
+        assert mock_metrics_provider.record_round_trip_time.call_args[0][1] >= 0
+
+    @pytest.mark.it("Records the round trip time of a twin patch with the MetricsProvider")
+    async def test_twin_patch(self, mocker, client, mock_metrics_provider):
+        await client.send_twin_patch({"property": "value"})
+
+        assert mock_metrics_provider.record_round_trip_time.call_count == 1
+        assert mock_metrics_provider.record_round_trip_time.call_args == mocker.call(
+            "twin_patch", mocker.ANY, {"device_id": FAKE_DEVICE_ID, "module_id": FAKE_MODULE_ID}
+        )
+
+    @pytest.mark.it(
+        "Records the time from receiving a direct method request until its response is sent with the MetricsProvider"
+    )
+    async def test_direct_method(self, mocker, client, mock_metrics_provider):
+        request = await self.receive_direct_method_request(client, "12")
+        await asyncio.sleep(0.1)
+
+        await client.send_direct_method_response(
+            models.DirectMethodResponse.create_from_method_request(request, 200)
+        )
+
+        assert mock_metrics_provider.record_round_trip_time.call_count == 1
+        assert mock_metrics_provider.record_round_trip_time.call_args == mocker.call(
+            "direct_method",
+            mocker.ANY,
+            {"device_id": FAKE_DEVICE_ID, "module_id": FAKE_MODULE_ID},
+        )
+        assert mock_metrics_provider.record_round_trip_time.call_args[0][1] >= 0.1
+        assert len(client._direct_method_receive_times) == 0
+
+    @pytest.mark.it(
+        "Does not record a round trip time for a direct method response that does not match a received request"
+    )
+    async def test_direct_method_unmatched(self, client, mock_metrics_provider):
+        await client.send_direct_method_response(
+            models.DirectMethodResponse(request_id="12", status=200)
+        )
+
+        assert mock_metrics_provider.record_round_trip_time.call_count == 0
+
+    @pytest.mark.it(
+        "Forgets direct method requests that have not been responded to within the maximum response timeout"
+    )
+    async def test_direct_method_pruned(self, mocker, client):
+        await self.receive_direct_method_request(client, "1")
+        await self.receive_direct_method_request(client, "2")
+        assert list(client._direct_method_receive_times) == ["1", "2"]
+
+        later = time.monotonic() + MAX_DIRECT_METHOD_RESPONSE_TIMEOUT
+        mocker.patch.object(time, "monotonic", return_value=later)
+        await self.receive_direct_method_request(client, "3")
+
+        assert list(client._direct_method_receive_times) == ["3"]
+
+    @pytest.mark.it("Does not track direct method requests if there is no MetricsProvider")
+    async def test_no_metrics_provider(self, client_config):
+        client_config.metrics_provider = None
+        client = IoTHubMQTTClient(client_config)
+
+        await self.receive_direct_method_request(client, "12")
+
+        assert len(client._direct_method_receive_times) == 0
+
+
+@pytest.mark.describe("IoTHubMQTTClient - Tracing")
+class TestIoTHubMQTTClientTracing:
+    @pytest.fixture
+    def span(self, mocker):
+        span = mocker.MagicMock(spec=tracing.Span)
+        with tracing.use_span(span):
+            yield span
+
+    @pytest.fixture(autouse=True)
+    def modify_publish(self, client):
+        # Complete the pending request for the request id of any twin publish
+        async def fake_publish(topic, payload, timeout=None):
+            if topic.startswith("$iothub/twin/"):
+                rid = topic[topic.rfind("$rid=") :].split("=")[1]
+                response = rr.Response(rid, 200, '{"desired": {}, "reported": {}}')
+                await client._request_ledger.match_response(response)
+
+        client._mqtt_client.publish.side_effect = fake_publish
+
+    @pytest.mark.it("Sets the topic class of each operation on the current span")
+    @pytest.mark.parametrize(
+        "operation, expected_topic_class",
+        [
+            pytest.param(
+                lambda client: client.send_message(models.Message("some payload")),
+                tracing.TOPIC_CLASS_TELEMETRY,
+                id="send_message()",
+            ),
+            pytest.param(
+                lambda client: client.send_direct_method_response(
+                    models.DirectMethodResponse(request_id="12", status=200)
+                ),
+                tracing.TOPIC_CLASS_DIRECT_METHOD_RESPONSE,
+                id="send_direct_method_response()",
+            ),
+            pytest.param(
+                lambda client: client.send_twin_patch({"property": "value"}),
+                tracing.TOPIC_CLASS_TWIN_PATCH,
+                id="send_twin_patch()",
+            ),
+            pytest.param(
+                lambda client: client.get_twin(),
+                tracing.TOPIC_CLASS_TWIN_REQUEST,
+                id="get_twin()",
+            ),
+        ],
+    )
+    async def test_topic_class(self, mocker, client, span, operation, expected_topic_class):
+        await operation(client)
+
+        assert (
+            mocker.call(tracing.ATTRIBUTE_TOPIC_CLASS, expected_topic_class)
+            in span.set_attribute.call_args_list
+        )
+
+    @pytest.mark.it("Sets the request id of a direct method response on the current span")
+    async def test_direct_method_request_id(self, mocker, client, span):
+        await client.send_direct_method_response(
+            models.DirectMethodResponse(request_id="12", status=200)
+        )
+
+        assert mocker.call(tracing.ATTRIBUTE_REQUEST_ID, "12") in span.set_attribute.call_args_list
+
+    @pytest.mark.it(
+        "Injects the trace context of the current span into the custom properties sent with a Message, without modifying the Message"
+    )
+    async def test_inject(self, mocker, client, span):
+        def inject(carrier):
+            carrier["traceparent"] = "fake_traceparent"
+
+        span.inject.side_effect = inject
+        message = models.Message("some payload")
+        message.custom_properties["custom_property"] = "value"
+        expected_topic = mqtt_topic.insert_message_properties_in_topic(
+            topic=mqtt_topic.get_telemetry_topic_for_publish(FAKE_DEVICE_ID, None),
+            system_properties=message.get_system_properties_dict(),
+            custom_properties={"custom_property": "value", "traceparent": "fake_traceparent"},
+        )
+
+        await client.send_message(message)
+
+        assert client._mqtt_client.publish.await_args == mocker.call(
+            expected_topic, mocker.ANY, timeout=None
+        )
+        assert message.custom_properties == {"custom_property": "value"}
+
+    @pytest.mark.it("Does not modify the custom properties sent if there is no current span")
+    async def test_no_span(self, mocker, client):
+        message = models.Message("some payload")
+        expected_topic = mqtt_topic.insert_message_properties_in_topic(
+            topic=mqtt_topic.get_telemetry_topic_for_publish(FAKE_DEVICE_ID, None),
+            system_properties=message.get_system_properties_dict(),
+            custom_properties={},
+        )
+
+        await client.send_message(message)
+
+        assert client._mqtt_client.publish.await_args == mocker.call(
+            expected_topic, mocker.ANY, timeout=None
+        )
+
 
 @pytest.mark.describe("IoTHubMQTTClient - BG TASK: ._process_twin_responses")
 class TestIoTHubMQTTClientProcessTwinResponses:
@@ -3410,6 +4013,25 @@ class TestIoTHubMQTTClientProcessTwinResponses:
 
         t.cancel()
 
+    @pytest.mark.it("Skips any INCOMING_MESSAGE_INTERRUPT yielded by the MQTTClient")
+    async def test_skips_interrupt(self, mocker, client):
+        mock_ledger = mocker.patch.object(client, "_request_ledger", spec=rr.RequestLedger)
+        generic_topic = mqtt_topic.get_twin_response_topic_for_subscribe()
+        topic = generic_topic.rstrip("#") + "{}/?$rid={}".format(200, "some rid")
+        mqtt_msg = mqtt.MQTTMessage(mid=1, topic=topic.encode("utf-8"))
+        mqtt_msg.payload = " ".encode("utf-8")
+
+        t = asyncio.create_task(client._process_twin_responses())
+        client._mqtt_client.interrupt_incoming_message_generator(generic_topic)
+        await client._mqtt_client._incoming_filtered_messages[generic_topic].put(mqtt_msg)
+        await asyncio.sleep(0.1)
+
+        # Only the MQTTMessage resulted in a Response being matched
+        assert mock_ledger.match_response.call_count == 1
+        assert not t.done()
+
+        t.cancel()
+
     @pytest.mark.it("Indefinitely repeats")
     async def test_repeat(self, mocker, client):
         mock_ledger = mocker.patch.object(client, "_request_ledger", spec=rr.RequestLedger)
@@ -3751,3 +4373,158 @@ class TestIoTHubMQTTClientProcessTwinResponses:
         t.cancel()
         with pytest.raises(asyncio.CancelledError):
             await t
+
+
+@pytest.mark.describe("IoTHubMQTTClient - BG TASK: ._keep_credentials_fresh")
+class TestIoTHubMQTTClientKeepCredentialsFresh:
+    @pytest.fixture(autouse=True)
+    async def modify_client(self, client, mock_sastoken_provider):
+        client._sastoken_provider = mock_sastoken_provider
+        client._mqtt_client.is_connected.return_value = True
+        await client.start()
+        await mock_sastoken_provider.wait_for_new_sastoken.wait_for_hang()
+        client._mqtt_client.set_credentials.reset_mock()
+        yield
+        await client.stop()
+
+    @pytest.fixture
+    def new_sastoken(self, mock_sastoken_provider):
+        sastoken_str = "SharedAccessSignature sr={resource}&sig={signature}&se={expiry}".format(
+            resource=FAKE_URI, signature="new_signature", expiry=int(FAKE_EXPIRY) + 3600
+        )
+        sastoken = st.SasToken(sastoken_str)
+        mock_sastoken_provider.wait_for_new_sastoken.return_value = sastoken
+        return sastoken
+
+    async def provide_new_sastoken(self, mock_sastoken_provider):
+        """Return the new SasToken from the hanging .wait_for_new_sastoken(), and wait for the
+        task to handle it"""
+        mock_sastoken_provider.wait_for_new_sastoken.stop_hanging()
+        await mock_sastoken_provider.wait_for_new_sastoken.wait_for_hang()
+
+    @pytest.mark.it(
+        "Sets the credentials on the MQTTClient, using the stored `username` as the username and the string-converted new SasToken as the password, each time a new SasToken is available"
+    )
+    async def test_set_credentials(self, mocker, client, mock_sastoken_provider, new_sastoken):
+        await self.provide_new_sastoken(mock_sastoken_provider)
+
+        assert client._mqtt_client.set_credentials.call_count == 1
+        assert client._mqtt_client.set_credentials.call_args == mocker.call(
+            client._username, str(new_sastoken)
+        )
+
+        await self.provide_new_sastoken(mock_sastoken_provider)
+
+        assert client._mqtt_client.set_credentials.call_count == 2
+
+    @pytest.mark.it(
+        "Reconnects the MQTTClient after setting the credentials, and subscribes again to all subscribed topics, if connected"
+    )
+    async def test_reconnect(self, mocker, client, mock_sastoken_provider, new_sastoken):
+        await client.enable_twin_patch_receive()
+        await client.enable_direct_method_request_receive()
+        calls = mocker.MagicMock()
+        calls.attach_mock(client._mqtt_client.set_credentials, "set_credentials")
+        calls.attach_mock(client._mqtt_client.reconnect, "reconnect")
+        client._mqtt_client.subscribe.reset_mock()
+
+        await self.provide_new_sastoken(mock_sastoken_provider)
+
+        assert calls.mock_calls == [
+            mocker.call.set_credentials(client._username, str(new_sastoken)),
+            mocker.call.reconnect(),
+        ]
+        assert client._mqtt_client.subscribe.await_count == 2
+        resubscribed_topics = {c.args[0] for c in client._mqtt_client.subscribe.await_args_list}
+        assert resubscribed_topics == {
+            mqtt_topic.get_twin_patch_topic_for_subscribe(),
+            mqtt_topic.get_direct_method_request_topic_for_subscribe(),
+        }
+
+    @pytest.mark.it("Does not subscribe again to topics that have since been unsubscribed from")
+    async def test_reconnect_unsubscribed(self, client, mock_sastoken_provider, new_sastoken):
+        await client.enable_twin_patch_receive()
+        await client.disable_twin_patch_receive()
+        client._mqtt_client.subscribe.reset_mock()
+
+        await self.provide_new_sastoken(mock_sastoken_provider)
+
+        assert client._mqtt_client.reconnect.await_count == 1
+        assert client._mqtt_client.subscribe.await_count == 0
+
+    @pytest.mark.it("Does not reconnect the MQTTClient if not connected")
+    async def test_not_connected(self, client, mock_sastoken_provider, new_sastoken):
+        client._mqtt_client.is_connected.return_value = False
+        await client.enable_twin_patch_receive()
+        client._mqtt_client.subscribe.reset_mock()
+
+        await self.provide_new_sastoken(mock_sastoken_provider)
+
+        assert client._mqtt_client.set_credentials.call_count == 1
+        assert client._mqtt_client.reconnect.await_count == 0
+        assert client._mqtt_client.subscribe.await_count == 0
+
+    @pytest.mark.it(
+        "Does not subscribe again, but continues running, if the MQTTClient reconnect fails"
+    )
+    async def test_reconnect_fails(self, client, mock_sastoken_provider, new_sastoken):
+        await client.enable_twin_patch_receive()
+        client._mqtt_client.subscribe.reset_mock()
+        client._mqtt_client.reconnect.side_effect = mqtt.MQTTConnectionFailedError(rc=5)
+
+        await self.provide_new_sastoken(mock_sastoken_provider)
+
+        assert client._mqtt_client.subscribe.await_count == 0
+        assert not client._keep_credentials_fresh_bg_task.done()
+
+        client._mqtt_client.reconnect.side_effect = None
+        await self.provide_new_sastoken(mock_sastoken_provider)
+
+        assert client._mqtt_client.reconnect.await_count == 2
+        assert client._mqtt_client.subscribe.await_count == 1
+
+    @pytest.mark.it(
+        "Continues subscribing again to the other topics, and continues running, if a subscribe fails"
+    )
+    @pytest.mark.parametrize("exception", mqtt_subscribe_exceptions)
+    async def test_subscribe_fails(self, client, mock_sastoken_provider, new_sastoken, exception):
+        await client.enable_twin_patch_receive()
+        await client.enable_direct_method_request_receive()
+        client._mqtt_client.subscribe.reset_mock()
+        client._mqtt_client.subscribe.side_effect = [exception, None]
+
+        await self.provide_new_sastoken(mock_sastoken_provider)
+
+        assert client._mqtt_client.subscribe.await_count == 2
+        assert not client._keep_credentials_fresh_bg_task.done()
+
+    @pytest.mark.it("Prevents subscribes and unsubscribes until it has subscribed again")
+    async def test_subscription_lock(self, client, mock_sastoken_provider, new_sastoken):
+        await client.enable_twin_patch_receive()
+        client._mqtt_client.subscribe = custom_mock.HangingAsyncMock()
+
+        # Reconnected, hanging on the resubscribe
+        mock_sastoken_provider.wait_for_new_sastoken.stop_hanging()
+        await client._mqtt_client.subscribe.wait_for_hang()
+        assert client._mqtt_client.subscribe.await_count == 1
+        disable_task = asyncio.create_task(client.disable_twin_patch_receive())
+        await asyncio.sleep(0.1)
+        assert client._mqtt_client.unsubscribe.await_count == 0
+
+        client._mqtt_client.subscribe.stop_hanging()
+        await disable_task
+        assert client._mqtt_client.unsubscribe.await_count == 1
+
+    @pytest.mark.it("Can be cancelled while waiting for the MQTTClient reconnect to finish")
+    async def test_cancel(self, client, mock_sastoken_provider, new_sastoken):
+        client._mqtt_client.reconnect = custom_mock.HangingAsyncMock()
+
+        mock_sastoken_provider.wait_for_new_sastoken.stop_hanging()
+        await client._mqtt_client.reconnect.wait_for_hang()
+        t = client._keep_credentials_fresh_bg_task
+        t.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await t
+        # Subscribes and unsubscribes are possible again
+        assert not client._subscription_lock.locked()
@@ -12,11 +12,13 @@ import typing
 from dev_utils import custom_mock
 from pytest_lazyfixture import lazy_fixture
 from azure.iot.device.iothub_session import IoTHubSession
-from azure.iot.device import config, models, iot_exceptions
+from azure.iot.device.session_host import SessionHost
+from azure.iot.device import config, models, iot_exceptions, metrics, tracing
 from azure.iot.device import connection_string as cs
 from azure.iot.device import iothub_mqtt_client as mqtt
 from azure.iot.device import sastoken as st
 from azure.iot.device import signing_mechanism as sm
+from azure.iot.device import twin as twin_module
 
 FAKE_DEVICE_ID = "fake_device_id"
 FAKE_MODULE_ID = "fake_module_id"
@@ -44,6 +46,18 @@ def get_expected_uri(hostname, device_id, module_id):
         return "{hostname}/devices/{device_id}".format(hostname=hostname, device_id=device_id)
 
 
+def hanging_generator_mock(mocker, mqtt_client):
+    """Mock an incoming data generator of the IoTHubMQTTClient that does not yield anything
+    until it is interrupted by the IoTHubMQTTClient's `.interrupt_incoming_data()` method"""
+    incoming = asyncio.Queue()
+    mock_gen = mocker.AsyncMock()
+    mock_gen.__anext__.side_effect = incoming.get
+    mqtt_client.interrupt_incoming_data.side_effect = lambda: incoming.put_nowait(
+        mqtt.INCOMING_MESSAGE_INTERRUPT
+    )
+    return mock_gen
+
+
 # ~~~~~ Fixtures ~~~~~~
 
 # Mock out the underlying client in order to not do network operations
@@ -69,6 +83,13 @@ def custom_ssl_context():
     return ssl.SSLContext()
 
 
+@pytest.fixture
+async def session_host():
+    session_host = SessionHost()
+    yield session_host
+    await session_host.shutdown()
+
+
 @pytest.fixture(params=["Default SSLContext", "Custom SSLContext"])
 def optional_ssl_context(request, custom_ssl_context):
     """Sometimes tests need to show something works with or without an SSLContext"""
@@ -207,7 +228,9 @@ class TestIoTHubSessionInstantiation:
         )
         # SasTokenProvider was created from the InternalSasTokenGenerator
         assert spy_st_provider_cls.call_count == 1
-        assert spy_st_provider_cls.call_args == mocker.call(spy_st_generator_cls.spy_return)
+        assert spy_st_provider_cls.call_args == mocker.call(
+            spy_st_generator_cls.spy_return, None, None
+        )
         # SasTokenProvider was set on the Session
         assert session._sastoken_provider is spy_st_provider_cls.spy_return
 
@@ -238,10 +261,66 @@ class TestIoTHubSessionInstantiation:
         assert spy_st_generator_cls.call_args == mocker.call(sastoken_fn)
         # SasTokenProvider was created from the ExternalSasTokenGenerator
         assert spy_st_provider_cls.call_count == 1
-        assert spy_st_provider_cls.call_args == mocker.call(spy_st_generator_cls.spy_return)
+        assert spy_st_provider_cls.call_args == mocker.call(
+            spy_st_generator_cls.spy_return, None, None
+        )
         # SasTokenProvider was set on the Session
         assert session._sastoken_provider is spy_st_provider_cls.spy_return
 
+    @pytest.mark.it(
+        "Creates a SasTokenCache in the `sastoken_cache_dir` for the SasTokenProvider, keyed by the SAS URI and the `shared_access_key`, if `sastoken_cache_dir` and `shared_access_key` are provided"
+    )
+    @pytest.mark.parametrize("shared_access_key, sastoken_fn, ssl_context", create_auth_params_sak)
+    @pytest.mark.parametrize("device_id, module_id", create_id_params)
+    async def test_sak_auth_cache(
+        self, mocker, tmp_path, device_id, module_id, shared_access_key, sastoken_fn, ssl_context
+    ):
+        spy_st_cache_cls = mocker.spy(st, "SasTokenCache")
+        spy_st_provider_cls = mocker.spy(st, "SasTokenProvider")
+        expected_uri = get_expected_uri(FAKE_HOSTNAME, device_id, module_id)
+
+        IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=device_id,
+            module_id=module_id,
+            shared_access_key=shared_access_key,
+            ssl_context=ssl_context,
+            sastoken_cache_dir=str(tmp_path),
+        )
+
+        assert spy_st_cache_cls.call_count == 1
+        assert spy_st_cache_cls.call_args == mocker.call(
+            str(tmp_path), expected_uri, identity=shared_access_key
+        )
+        assert spy_st_provider_cls.call_args[0][2] is spy_st_cache_cls.spy_return
+
+    @pytest.mark.it(
+        "Creates a SasTokenCache in the `sastoken_cache_dir` for the SasTokenProvider, keyed by the SAS URI, if `sastoken_cache_dir` and `sastoken_fn` are provided"
+    )
+    @pytest.mark.parametrize(
+        "shared_access_key, sastoken_fn, ssl_context", create_auth_params_token_cb
+    )
+    @pytest.mark.parametrize("device_id, module_id", create_id_params)
+    async def test_token_callback_auth_cache(
+        self, mocker, tmp_path, device_id, module_id, shared_access_key, sastoken_fn, ssl_context
+    ):
+        spy_st_cache_cls = mocker.spy(st, "SasTokenCache")
+        spy_st_provider_cls = mocker.spy(st, "SasTokenProvider")
+        expected_uri = get_expected_uri(FAKE_HOSTNAME, device_id, module_id)
+
+        IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=device_id,
+            module_id=module_id,
+            sastoken_fn=sastoken_fn,
+            ssl_context=ssl_context,
+            sastoken_cache_dir=str(tmp_path),
+        )
+
+        assert spy_st_cache_cls.call_count == 1
+        assert spy_st_cache_cls.call_args == mocker.call(str(tmp_path), expected_uri)
+        assert spy_st_provider_cls.call_args[0][2] is spy_st_cache_cls.spy_return
+
     @pytest.mark.it(
         "Does not instantiate or store any SasTokenProvider if neither `shared_access_key` nor `sastoken_fn` are provided"
     )
@@ -425,6 +504,49 @@ class TestIoTHubSessionInstantiation:
         cfg = spy_mqtt_cls.call_args[0][0]
         assert cfg.sastoken_provider is session._sastoken_provider
 
+    @pytest.mark.it(
+        "Stores the provided `metrics_provider` and sets it on the IoTHubClientConfig used to create the IoTHubMQTTClient"
+    )
+    @pytest.mark.parametrize("shared_access_key, sastoken_fn, ssl_context", create_auth_params)
+    @pytest.mark.parametrize("device_id, module_id", create_id_params)
+    async def test_metrics_provider_cfg(
+        self, mocker, device_id, module_id, shared_access_key, sastoken_fn, ssl_context
+    ):
+        spy_mqtt_cls = mocker.spy(mqtt, "IoTHubMQTTClient")
+        metrics_provider = metrics.MetricsProvider()
+
+        session = IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=device_id,
+            module_id=module_id,
+            shared_access_key=shared_access_key,
+            sastoken_fn=sastoken_fn,
+            ssl_context=ssl_context,
+            metrics_provider=metrics_provider,
+        )
+
+        cfg = spy_mqtt_cls.call_args[0][0]
+        assert cfg.metrics_provider is metrics_provider
+        assert session._metrics_provider is metrics_provider
+
+    @pytest.mark.it("Stores the provided `tracer`")
+    @pytest.mark.parametrize("shared_access_key, sastoken_fn, ssl_context", create_auth_params)
+    @pytest.mark.parametrize("device_id, module_id", create_id_params)
+    async def test_tracer(self, device_id, module_id, shared_access_key, sastoken_fn, ssl_context):
+        tracer = tracing.Tracer()
+
+        session = IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=device_id,
+            module_id=module_id,
+            shared_access_key=shared_access_key,
+            sastoken_fn=sastoken_fn,
+            ssl_context=ssl_context,
+            tracer=tracer,
+        )
+
+        assert session._tracer is tracer
+
     @pytest.mark.it(
         "Sets `auto_reconnect` to False on the IoTHubClientConfig used to create the IoTHubMQTTClient"
     )
@@ -447,6 +569,97 @@ class TestIoTHubSessionInstantiation:
         cfg = spy_mqtt_cls.call_args[0][0]
         assert cfg.auto_reconnect is False
 
+    @pytest.mark.it(
+        "Uses the SasTokenRefreshScheduler of the provided SessionHost for the SasTokenProvider, if a SessionHost is provided"
+    )
+    @pytest.mark.parametrize(
+        "shared_access_key, sastoken_fn, ssl_context",
+        create_auth_params_sak + create_auth_params_token_cb,
+    )
+    async def test_host_refresh_scheduler(
+        self, mocker, session_host, shared_access_key, sastoken_fn, ssl_context
+    ):
+        spy_st_provider_cls = mocker.spy(st, "SasTokenProvider")
+
+        IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=FAKE_DEVICE_ID,
+            shared_access_key=shared_access_key,
+            sastoken_fn=sastoken_fn,
+            ssl_context=ssl_context,
+            host=session_host,
+        )
+
+        assert spy_st_provider_cls.call_count == 1
+        assert spy_st_provider_cls.call_args[0][1] is session_host.refresh_scheduler
+
+    @pytest.mark.it(
+        "Sets the default SSLContext of the provided SessionHost on the IoTHubClientConfig used to create the IoTHubMQTTClient, if a SessionHost is provided and `ssl_context` is not provided"
+    )
+    @pytest.mark.parametrize(
+        "shared_access_key, sastoken_fn, ssl_context", create_auth_params_default_ssl
+    )
+    async def test_host_default_ssl_context(
+        self, mocker, session_host, shared_access_key, sastoken_fn, ssl_context
+    ):
+        assert ssl_context is None
+        spy_mqtt_cls = mocker.spy(mqtt, "IoTHubMQTTClient")
+
+        for _ in range(2):
+            IoTHubSession(
+                hostname=FAKE_HOSTNAME,
+                device_id=FAKE_DEVICE_ID,
+                shared_access_key=shared_access_key,
+                sastoken_fn=sastoken_fn,
+                host=session_host,
+            )
+
+        # The same SSLContext is shared between Sessions
+        assert spy_mqtt_cls.call_count == 2
+        for call in spy_mqtt_cls.call_args_list:
+            assert call[0][0].ssl_context is session_host.default_ssl_context()
+
+    @pytest.mark.it(
+        "Sets the network loop and executor of the provided SessionHost on the IoTHubClientConfig used to create the IoTHubMQTTClient, if a SessionHost is provided"
+    )
+    @pytest.mark.parametrize("shared_access_key, sastoken_fn, ssl_context", create_auth_params)
+    async def test_host_cfg(
+        self, mocker, session_host, shared_access_key, sastoken_fn, ssl_context
+    ):
+        spy_mqtt_cls = mocker.spy(mqtt, "IoTHubMQTTClient")
+
+        IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=FAKE_DEVICE_ID,
+            shared_access_key=shared_access_key,
+            sastoken_fn=sastoken_fn,
+            ssl_context=ssl_context,
+            host=session_host,
+        )
+
+        cfg = spy_mqtt_cls.call_args[0][0]
+        assert cfg.network_loop is session_host.network_loop
+        assert cfg.executor is session_host.executor
+
+    @pytest.mark.it(
+        "Does not set a network loop or executor on the IoTHubClientConfig used to create the IoTHubMQTTClient, if no SessionHost is provided"
+    )
+    @pytest.mark.parametrize("shared_access_key, sastoken_fn, ssl_context", create_auth_params)
+    async def test_no_host_cfg(self, mocker, shared_access_key, sastoken_fn, ssl_context):
+        spy_mqtt_cls = mocker.spy(mqtt, "IoTHubMQTTClient")
+
+        IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=FAKE_DEVICE_ID,
+            shared_access_key=shared_access_key,
+            sastoken_fn=sastoken_fn,
+            ssl_context=ssl_context,
+        )
+
+        cfg = spy_mqtt_cls.call_args[0][0]
+        assert cfg.network_loop is None
+        assert cfg.executor is None
+
     @pytest.mark.it(
         "Sets any provided optional keyword arguments on the IoTHubClientConfig used to create the IoTHubMQTTClient"
     )
@@ -979,6 +1192,104 @@ class TestIoTHubSessionContextManager:
 
         # If nothing raises here, the test passes
 
+    @pytest.mark.it(
+        "Adds the Session as a source of the MetricsProvider upon entry into the context manager, and removes it upon exit, if one exists"
+    )
+    @pytest.mark.parametrize(
+        "module_id, expected_attributes",
+        [
+            pytest.param(None, {"device_id": FAKE_DEVICE_ID}, id="Device"),
+            pytest.param(
+                FAKE_MODULE_ID,
+                {"device_id": FAKE_DEVICE_ID, "module_id": FAKE_MODULE_ID},
+                id="Module",
+            ),
+        ],
+    )
+    @pytest.mark.parametrize("graceful_exit", graceful_exit_params)
+    async def test_metrics_provider_source(
+        self, mocker, custom_ssl_context, module_id, expected_attributes, graceful_exit
+    ):
+        mock_metrics_provider = mocker.MagicMock(spec=metrics.MetricsProvider)
+        session = IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=FAKE_DEVICE_ID,
+            module_id=module_id,
+            ssl_context=custom_ssl_context,
+            metrics_provider=mock_metrics_provider,
+        )
+
+        try:
+            async with session as session:
+                assert mock_metrics_provider.add_source.call_count == 1
+                assert mock_metrics_provider.add_source.call_args == mocker.call(
+                    expected_attributes, session.get_metrics
+                )
+                assert mock_metrics_provider.remove_source.call_count == 0
+                if not graceful_exit:
+                    raise RuntimeError()
+        except RuntimeError:
+            pass
+
+        assert mock_metrics_provider.add_source.call_count == 1
+        assert mock_metrics_provider.remove_source.call_count == 1
+        assert mock_metrics_provider.remove_source.call_args == mocker.call(session.get_metrics)
+
+    @pytest.mark.it(
+        "Does not count the metrics of the Session twice if the context manager is exited and entered again"
+    )
+    async def test_metrics_provider_reentry(self, mocker, custom_ssl_context):
+        class AggregatingMetricsProvider(metrics.MetricsProvider):
+            def __init__(self):
+                super().__init__()
+                self.sources = metrics._SourceAggregator(per_session=False)
+
+            def add_source(self, attributes, collect_fn):
+                self.sources.add(attributes, collect_fn)
+
+            def remove_source(self, collect_fn):
+                self.sources.remove(collect_fn)
+
+        metrics_provider = AggregatingMetricsProvider()
+        session = IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=FAKE_DEVICE_ID,
+            ssl_context=custom_ssl_context,
+            metrics_provider=metrics_provider,
+        )
+        # The counters of the client are never reset
+        stats = {"messages_sent": 0}
+        type(session._mqtt_client).stats = mocker.PropertyMock(side_effect=lambda: dict(stats))
+
+        for _ in range(2):
+            async with session:
+                stats["messages_sent"] += 5
+
+        assert metrics_provider.sources.collect() == {(): {"messages_sent": 10}}
+
+    @pytest.mark.it(
+        "Removes the Session as a source of the MetricsProvider if connecting fails upon entry into the context manager"
+    )
+    async def test_metrics_provider_source_connect_failure(
+        self, mocker, custom_ssl_context, arbitrary_exception
+    ):
+        mock_metrics_provider = mocker.MagicMock(spec=metrics.MetricsProvider)
+        session = IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=FAKE_DEVICE_ID,
+            ssl_context=custom_ssl_context,
+            metrics_provider=mock_metrics_provider,
+        )
+        session._mqtt_client.connect.side_effect = arbitrary_exception
+
+        with pytest.raises(type(arbitrary_exception)):
+            async with session:
+                pass
+
+        assert mock_metrics_provider.add_source.call_count == 1
+        assert mock_metrics_provider.remove_source.call_count == 1
+        assert mock_metrics_provider.remove_source.call_args == mocker.call(session.get_metrics)
+
     @pytest.mark.it(
         "Creates a Task from the MQTTClient's .wait_for_disconnect() coroutine method and stores it as the `wait_for_disconnect_task` attribute upon entry into the context manager, and cancels and clears the Task upon exit"
     )
@@ -1450,7 +1761,15 @@ class TestIoTHubSessionSendMessage:
         await session.send_message(m)
 
         assert session._mqtt_client.send_message.await_count == 1
-        assert session._mqtt_client.send_message.await_args == mocker.call(m)
+        assert session._mqtt_client.send_message.await_args == mocker.call(m, timeout=None)
+
+    @pytest.mark.it("Passes the provided `timeout` to .send_message() on the IoTHubMQTTClient")
+    async def test_timeout(self, mocker, session):
+        m = models.Message("hi")
+        await session.send_message(m, timeout=5)
+
+        assert session._mqtt_client.send_message.await_count == 1
+        assert session._mqtt_client.send_message.await_args == mocker.call(m, timeout=5)
 
     @pytest.mark.it(
         "Invokes .send_message() on the IoTHubMQTTClient, passing a new Message object with `message` as the payload, if `message` is a string"
@@ -1576,7 +1895,18 @@ class TestIoTHubSessionSendDirectMethodResponse:
 
         assert session._mqtt_client.send_direct_method_response.await_count == 1
         assert session._mqtt_client.send_direct_method_response.await_args == mocker.call(
-            direct_method_response
+            direct_method_response, timeout=None
+        )
+
+    @pytest.mark.it(
+        "Passes the provided `timeout` to .send_direct_method_response() on the IoTHubMQTTClient"
+    )
+    async def test_timeout(self, mocker, session, direct_method_response):
+        await session.send_direct_method_response(direct_method_response, timeout=5)
+
+        assert session._mqtt_client.send_direct_method_response.await_count == 1
+        assert session._mqtt_client.send_direct_method_response.await_args == mocker.call(
+            direct_method_response, timeout=5
         )
 
     @pytest.mark.it("Allows any exceptions raised by the IoTHubMQTTClient to propagate")
@@ -1688,7 +2018,14 @@ class TestIoTHubSessionUpdateReportedProperties:
         await session.update_reported_properties(patch)
 
         assert session._mqtt_client.send_twin_patch.await_count == 1
-        assert session._mqtt_client.send_twin_patch.await_args == mocker.call(patch)
+        assert session._mqtt_client.send_twin_patch.await_args == mocker.call(patch, timeout=None)
+
+    @pytest.mark.it("Passes the provided `timeout` to .send_twin_patch() on the IoTHubMQTTClient")
+    async def test_timeout(self, mocker, session, patch):
+        await session.update_reported_properties(patch, timeout=5)
+
+        assert session._mqtt_client.send_twin_patch.await_count == 1
+        assert session._mqtt_client.send_twin_patch.await_args == mocker.call(patch, timeout=5)
 
     @pytest.mark.it("Allows any exceptions raised by the IoTHubMQTTClient to propagate")
     @pytest.mark.parametrize(
@@ -1798,7 +2135,14 @@ class TestIoTHubSessionGetTwin:
         await session.get_twin()
 
         assert session._mqtt_client.get_twin.await_count == 1
-        assert session._mqtt_client.get_twin.await_args == mocker.call()
+        assert session._mqtt_client.get_twin.await_args == mocker.call(timeout=None)
+
+    @pytest.mark.it("Passes the provided `timeout` to .get_twin() on the IoTHubMQTTClient")
+    async def test_timeout(self, mocker, session):
+        await session.get_twin(timeout=5)
+
+        assert session._mqtt_client.get_twin.await_count == 1
+        assert session._mqtt_client.get_twin.await_args == mocker.call(timeout=5)
 
     @pytest.mark.it("Allows any exceptions raised by the IoTHubMQTTClient to propagate")
     @pytest.mark.parametrize(
@@ -1898,6 +2242,252 @@ class TestIoTHubSessionGetTwin:
             await t
 
 
+@pytest.mark.describe("IoTHubSession - .get_metrics()")
+class TestIoTHubSessionGetMetrics:
+    @pytest.mark.it("Returns the stats of the IoTHubMQTTClient")
+    async def test_mqtt_client_stats(self, disconnected_session):
+        disconnected_session._mqtt_client.stats = {"messages_sent": 3, "pending_publishes": 1}
+
+        assert disconnected_session.get_metrics() == {"messages_sent": 3, "pending_publishes": 1}
+
+    @pytest.mark.it("Includes the stats of the SasTokenProvider, if one exists")
+    async def test_sastoken_provider_stats(self, disconnected_session, mock_sastoken_provider):
+        disconnected_session._sastoken_provider = mock_sastoken_provider
+        disconnected_session._mqtt_client.stats = {"messages_sent": 3}
+        mock_sastoken_provider.stats = {"token_refreshes": 2, "token_refresh_failures": 1}
+
+        assert disconnected_session.get_metrics() == {
+            "messages_sent": 3,
+            "token_refreshes": 2,
+            "token_refresh_failures": 1,
+        }
+
+    @pytest.mark.it("Can be invoked whether or not the Session is connected")
+    async def test_connected(self, session):
+        session._mqtt_client.stats = {"messages_sent": 3}
+
+        assert session.get_metrics() == {"messages_sent": 3}
+
+
+@pytest.mark.describe("IoTHubSession - Pending Operations")
+class TestIoTHubSessionPendingOperations:
+    # Operations that are performed by the IoTHubMQTTClient, and can therefore be interrupted
+    # by a disconnect
+    operations = [
+        pytest.param("send_message", "send_message", ("hi",), id="send_message"),
+        pytest.param(
+            "send_direct_method_response",
+            "send_direct_method_response",
+            (models.DirectMethodResponse(request_id="id", status=200, payload=None),),
+            id="send_direct_method_response",
+        ),
+        pytest.param(
+            "update_reported_properties",
+            "send_twin_patch",
+            ({"key": "value"},),
+            id="update_reported_properties",
+        ),
+        pytest.param("get_twin", "get_twin", (), id="get_twin"),
+    ]
+
+    @pytest.mark.it(
+        "Invokes the IoTHubMQTTClient operation within the calling Task, rather than creating a new Task"
+    )
+    @pytest.mark.parametrize("session_method, client_method, args", operations)
+    async def test_no_additional_task(self, session, session_method, client_method, args):
+        operation_task = None
+
+        async def fake_operation(*args, **kwargs):
+            nonlocal operation_task
+            operation_task = asyncio.current_task()
+
+        getattr(session._mqtt_client, client_method).side_effect = fake_operation
+
+        t = asyncio.create_task(getattr(session, session_method)(*args))
+        await t
+        assert operation_task is t
+
+    @pytest.mark.it(
+        "Tracks the calling Task as a pending operation only while the operation is in progress"
+    )
+    @pytest.mark.parametrize("session_method, client_method, args", operations)
+    async def test_tracking(self, session, session_method, client_method, args):
+        mock_operation = custom_mock.HangingAsyncMock()
+        setattr(session._mqtt_client, client_method, mock_operation)
+        assert len(session._pending_operations) == 0
+
+        t = asyncio.create_task(getattr(session, session_method)(*args))
+        await mock_operation.wait_for_hang()
+        assert session._pending_operations == {t}
+
+        mock_operation.stop_hanging()
+        await t
+        assert len(session._pending_operations) == 0
+
+    @pytest.mark.it(
+        "Raises the error corresponding to a disconnect in every operation that is pending when the disconnect occurs"
+    )
+    @pytest.mark.parametrize(
+        "cause",
+        [
+            pytest.param(mqtt.MQTTError(rc=7), id="Unexpected disconnect"),
+            pytest.param(None, id="Expected disconnect"),
+        ],
+    )
+    async def test_disconnect_fails_all_pending(self, session, cause):
+        session._mqtt_client.send_message = custom_mock.HangingAsyncMock()
+        session._mqtt_client.get_twin = custom_mock.HangingAsyncMock()
+        send_tasks = [asyncio.create_task(session.send_message("hi")) for _ in range(3)]
+        get_twin_task = asyncio.create_task(session.get_twin())
+        await session._mqtt_client.send_message.wait_for_hang()
+        await session._mqtt_client.get_twin.wait_for_hang()
+        await asyncio.sleep(0.1)
+        assert len(session._pending_operations) == 4
+
+        session._mqtt_client.wait_for_disconnect.return_value = cause
+        session._mqtt_client.wait_for_disconnect.stop_hanging()
+
+        results = await asyncio.gather(*send_tasks, get_twin_task, return_exceptions=True)
+        for result in results:
+            if cause:
+                assert result is cause
+            else:
+                assert isinstance(result, asyncio.CancelledError)
+        assert len(session._pending_operations) == 0
+        assert len(session._interrupted_operations) == 0
+
+    @pytest.mark.it(
+        "Does not affect other pending operations when one pending operation is cancelled"
+    )
+    async def test_cancel_one(self, session):
+        session._mqtt_client.send_message = custom_mock.HangingAsyncMock()
+        t1 = asyncio.create_task(session.send_message("1"))
+        t2 = asyncio.create_task(session.send_message("2"))
+        await session._mqtt_client.send_message.wait_for_hang()
+        await asyncio.sleep(0.1)
+
+        t1.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await t1
+        assert session._pending_operations == {t2}
+        assert not t2.done()
+
+        # Remaining operation still fails upon disconnect
+        cause = mqtt.MQTTError(rc=7)
+        session._mqtt_client.wait_for_disconnect.return_value = cause
+        session._mqtt_client.wait_for_disconnect.stop_hanging()
+        with pytest.raises(mqtt.MQTTError) as e_info:
+            await t2
+        assert e_info.value is cause
+
+    @pytest.mark.it(
+        "Raises CancelledError in every operation that is pending upon exit from the context manager"
+    )
+    async def test_exit(self, disconnected_session):
+        session = disconnected_session
+        session._mqtt_client.send_message = custom_mock.HangingAsyncMock()
+        async with session:
+            t = asyncio.create_task(session.send_message("hi"))
+            await session._mqtt_client.send_message.wait_for_hang()
+        with pytest.raises(asyncio.CancelledError):
+            await t
+        assert len(session._pending_operations) == 0
+        assert len(session._interrupted_operations) == 0
+
+
+@pytest.mark.describe("IoTHubSession - Tracing")
+class TestIoTHubSessionTracing:
+    operations = TestIoTHubSessionPendingOperations.operations
+
+    @pytest.fixture
+    def mock_tracer(self, mocker):
+        tracer = mocker.MagicMock(spec=tracing.Tracer)
+        tracer.start_span.return_value = mocker.MagicMock(spec=tracing.Span)
+        return tracer
+
+    @pytest.fixture
+    async def session(self, custom_ssl_context, mock_tracer):
+        async with IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=FAKE_DEVICE_ID,
+            module_id=FAKE_MODULE_ID,
+            ssl_context=custom_ssl_context,
+            tracer=mock_tracer,
+        ) as session:
+            yield session
+
+    @pytest.mark.it(
+        "Starts a span named for the operation, with the device and module ids, which is current while the IoTHubMQTTClient operation is in progress, and ended upon completion"
+    )
+    @pytest.mark.parametrize("session_method, client_method, args", operations)
+    async def test_span(self, mocker, session, mock_tracer, session_method, client_method, args):
+        span = mock_tracer.start_span.return_value
+        spans_during_operation = []
+
+        async def fake_operation(*args, **kwargs):
+            spans_during_operation.append(tracing.current_span())
+            assert span.end.call_count == 0
+
+        getattr(session._mqtt_client, client_method).side_effect = fake_operation
+
+        await getattr(session, session_method)(*args)
+
+        assert mock_tracer.start_span.call_args == mocker.call(
+            "IoTHubSession." + session_method,
+            {
+                tracing.ATTRIBUTE_DEVICE_ID: FAKE_DEVICE_ID,
+                tracing.ATTRIBUTE_MODULE_ID: FAKE_MODULE_ID,
+            },
+        )
+        assert spans_during_operation == [span]
+        assert span.end.call_count == 1
+        assert tracing.current_span() is None
+
+    @pytest.mark.it("Records an exception raised by the operation on the span")
+    @pytest.mark.parametrize("session_method, client_method, args", operations)
+    async def test_exception(
+        self, session, mock_tracer, session_method, client_method, args, arbitrary_exception
+    ):
+        span = mock_tracer.start_span.return_value
+        getattr(session._mqtt_client, client_method).side_effect = arbitrary_exception
+
+        with pytest.raises(type(arbitrary_exception)):
+            await getattr(session, session_method)(*args)
+
+        assert span.record_exception.call_args[0][0] is arbitrary_exception
+        assert span.end.call_count == 1
+
+    @pytest.mark.it("Ends the span if the operation is interrupted by a disconnect")
+    async def test_disconnect(self, session, mock_tracer):
+        span = mock_tracer.start_span.return_value
+        session._mqtt_client.send_message = custom_mock.HangingAsyncMock()
+        t = asyncio.create_task(session.send_message("hi"))
+        await session._mqtt_client.send_message.wait_for_hang()
+
+        cause = mqtt.MQTTError(rc=7)
+        session._mqtt_client.wait_for_disconnect.return_value = cause
+        session._mqtt_client.wait_for_disconnect.stop_hanging()
+        with pytest.raises(mqtt.MQTTError):
+            await t
+
+        assert span.record_exception.call_count == 1
+        assert span.end.call_count == 1
+
+    @pytest.mark.it("Does not start a span if the Session has no tracer")
+    @pytest.mark.parametrize("session_method, client_method, args", operations)
+    async def test_no_tracer(self, disconnected_session, session_method, client_method, args):
+        spans_during_operation = []
+
+        async def fake_operation(*args, **kwargs):
+            spans_during_operation.append(tracing.current_span())
+
+        async with disconnected_session as session:
+            getattr(session._mqtt_client, client_method).side_effect = fake_operation
+            await getattr(session, session_method)(*args)
+
+        assert spans_during_operation == [None]
+
+
 @pytest.mark.describe("IoTHubSession - .messages()")
 class TestIoTHubSessionMessages:
     @pytest.mark.it(
@@ -1988,8 +2578,7 @@ class TestIoTHubSessionMessages:
     )
     async def test_generator_raise_unexpected_disconnect(self, mocker, session):
         # Mock IoTHubMQTTClient C2D generator to not yield anything yet
-        mock_c2d_gen = mocker.AsyncMock()
-        mock_c2d_gen.__anext__ = custom_mock.HangingAsyncMock()
+        mock_c2d_gen = hanging_generator_mock(mocker, session._mqtt_client)
         # Set it to be returned by PropertyMock
         c2d_gen_property_mock = mocker.PropertyMock(return_value=mock_c2d_gen)
         type(session._mqtt_client).incoming_c2d_messages = c2d_gen_property_mock
@@ -2020,8 +2609,7 @@ class TestIoTHubSessionMessages:
     )
     async def test_generator_raise_expected_disconnect(self, mocker, session):
         # Mock IoTHubMQTTClient C2D generator to not yield anything yet
-        mock_c2d_gen = mocker.AsyncMock()
-        mock_c2d_gen.__anext__ = custom_mock.HangingAsyncMock()
+        mock_c2d_gen = hanging_generator_mock(mocker, session._mqtt_client)
         # Set it to be returned by PropertyMock
         c2d_gen_property_mock = mocker.PropertyMock(return_value=mock_c2d_gen)
         type(session._mqtt_client).incoming_c2d_messages = c2d_gen_property_mock
@@ -2046,6 +2634,42 @@ class TestIoTHubSessionMessages:
             assert t.done()
             assert t.cancelled()
 
+    @pytest.mark.it(
+        "Interrupts the IoTHubMQTTClient's incoming data generators upon disconnect, rather than cancelling them"
+    )
+    async def test_generator_interrupted_on_disconnect(self, mocker, session):
+        mock_c2d_gen = hanging_generator_mock(mocker, session._mqtt_client)
+        c2d_gen_property_mock = mocker.PropertyMock(return_value=mock_c2d_gen)
+        type(session._mqtt_client).incoming_c2d_messages = c2d_gen_property_mock
+
+        async with session.messages() as messages:
+            t = asyncio.create_task(messages.__anext__())
+            await asyncio.sleep(0.1)
+            assert session._mqtt_client.interrupt_incoming_data.call_count == 0
+
+            session._mqtt_client.wait_for_disconnect.return_value = mqtt.MQTTError(rc=7)
+            session._mqtt_client.wait_for_disconnect.stop_hanging()
+            await asyncio.sleep(0.1)
+
+            assert session._mqtt_client.interrupt_incoming_data.call_count == 1
+            assert t.done()
+            assert mock_c2d_gen.aclose.await_count == 0
+
+    @pytest.mark.it(
+        "Skips any interrupts left over from a previous disconnect that are yielded by the IoTHubMQTTClient's incoming C2D message generator"
+    )
+    async def test_generator_skips_stale_interrupt(self, mocker, session):
+        message = models.Message("1")
+        mock_c2d_gen = mocker.AsyncMock()
+        mock_c2d_gen.__anext__.side_effect = [mqtt.INCOMING_MESSAGE_INTERRUPT, message]
+        c2d_gen_property_mock = mocker.PropertyMock(return_value=mock_c2d_gen)
+        type(session._mqtt_client).incoming_c2d_messages = c2d_gen_property_mock
+
+        async with session.messages() as messages:
+            val = await messages.__anext__()
+            assert val is message
+            assert mock_c2d_gen.__anext__.await_count == 2
+
     @pytest.mark.it(
         "Allows any errors raised while attempting to enable C2D message receive to propagate"
     )
@@ -2183,8 +2807,7 @@ class TestIoTHubSessionDirectMethodRequests:
     )
     async def test_generator_raise_unexpected_disconnect(self, mocker, session):
         # Mock IoTHubMQTTClient direct method request generator to not yield anything yet
-        mock_dm_gen = mocker.AsyncMock()
-        mock_dm_gen.__anext__ = custom_mock.HangingAsyncMock()
+        mock_dm_gen = hanging_generator_mock(mocker, session._mqtt_client)
         # Set it to be returned by PropertyMock
         dm_gen_property_mock = mocker.PropertyMock(return_value=mock_dm_gen)
         type(session._mqtt_client).incoming_direct_method_requests = dm_gen_property_mock
@@ -2215,8 +2838,7 @@ class TestIoTHubSessionDirectMethodRequests:
     )
     async def test_generator_raise_expected_disconnect(self, mocker, session):
         # Mock IoTHubMQTTClient direct method request generator to not yield anything yet
-        mock_dm_gen = mocker.AsyncMock()
-        mock_dm_gen.__anext__ = custom_mock.HangingAsyncMock()
+        mock_dm_gen = hanging_generator_mock(mocker, session._mqtt_client)
         # Set it to be returned by PropertyMock
         dm_gen_property_mock = mocker.PropertyMock(return_value=mock_dm_gen)
         type(session._mqtt_client).incoming_direct_method_requests = dm_gen_property_mock
@@ -2376,8 +2998,7 @@ class TestIoTHubSessionDesiredPropertyUpdates:
     )
     async def test_generator_raise_unexpected_disconnect(self, mocker, session):
         # Mock IoTHubMQTTClient twin patch generator to not yield anything yet
-        mock_twin_patch_gen = mocker.AsyncMock()
-        mock_twin_patch_gen.__anext__ = custom_mock.HangingAsyncMock()
+        mock_twin_patch_gen = hanging_generator_mock(mocker, session._mqtt_client)
         # Set it to be returned by PropertyMock
         twin_patch_property_mock = mocker.PropertyMock(return_value=mock_twin_patch_gen)
         type(session._mqtt_client).incoming_twin_patches = twin_patch_property_mock
@@ -2408,8 +3029,7 @@ class TestIoTHubSessionDesiredPropertyUpdates:
     )
     async def test_generator_raise_expected_disconnect(self, mocker, session):
         # Mock IoTHubMQTTClient twin patch generator to not yield anything yet
-        mock_twin_patch_gen = mocker.AsyncMock()
-        mock_twin_patch_gen.__anext__ = custom_mock.HangingAsyncMock()
+        mock_twin_patch_gen = hanging_generator_mock(mocker, session._mqtt_client)
         # Set it to be returned by PropertyMock
         twin_patch_property_mock = mocker.PropertyMock(return_value=mock_twin_patch_gen)
         type(session._mqtt_client).incoming_twin_patches = twin_patch_property_mock
@@ -2475,3 +3095,186 @@ class TestIoTHubSessionDesiredPropertyUpdates:
                 pass
         assert e_info.value is arbitrary_exception
         assert session._mqtt_client.disable_twin_patch_receive.call_count == 1
+
+
+@pytest.mark.describe("IoTHubSession - Twin Cache")
+class TestIoTHubSessionTwinCache:
+    @pytest.fixture
+    def twin(self):
+        return {"desired": {"foo": 1, "$version": 1}, "reported": {"bar": 2, "$version": 1}}
+
+    @pytest.fixture
+    def incoming_twin_patches(self, mocker, mock_mqtt_iothub_client):
+        """Queue feeding the IoTHubMQTTClient's incoming twin patch generator"""
+        queue = asyncio.Queue()
+
+        async def twin_patch_generator():
+            while True:
+                yield await queue.get()
+
+        twin_patch_property_mock = mocker.PropertyMock(return_value=twin_patch_generator())
+        type(mock_mqtt_iothub_client).incoming_twin_patches = twin_patch_property_mock
+        return queue
+
+    @pytest.fixture
+    async def cache_session(self, mock_mqtt_iothub_client, incoming_twin_patches, twin):
+        mock_mqtt_iothub_client.get_twin.return_value = twin
+        async with IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=FAKE_DEVICE_ID,
+            ssl_context=ssl.SSLContext(),
+            twin_cache=True,
+        ) as session:
+            yield session
+
+    @pytest.mark.it("Does not use a Twin cache by default")
+    async def test_default(self, session):
+        assert session._twin_cache is None
+        assert session._twin_cache_bg_task is None
+        assert session._mqtt_client.get_twin.await_count == 0
+        assert session._mqtt_client.enable_twin_patch_receive.await_count == 0
+
+    @pytest.mark.it(
+        "Enables twin patch receive and populates the Twin cache from the IoTHubMQTTClient upon entry into the context manager, if `twin_cache` is True"
+    )
+    async def test_populate_on_entry(self, cache_session, twin):
+        assert isinstance(cache_session._twin_cache, twin_module.TwinCache)
+        assert cache_session._mqtt_client.enable_twin_patch_receive.await_count == 1
+        assert cache_session._mqtt_client.get_twin.await_count == 1
+        assert cache_session._twin_cache.get_twin() == twin
+        assert isinstance(cache_session._twin_cache_bg_task, asyncio.Task)
+        assert not cache_session._twin_cache_bg_task.done()
+
+    @pytest.mark.it("Cancels the background task maintaining the Twin cache upon exit")
+    async def test_cancel_on_exit(self, cache_session):
+        task = cache_session._twin_cache_bg_task
+        await cache_session.__aexit__(None, None, None)
+        assert task.cancelled()
+        assert cache_session._twin_cache_bg_task is None
+
+    @pytest.mark.it(
+        "Stops the IoTHubMQTTClient and allows the error to propagate if populating the Twin cache fails upon entry"
+    )
+    async def test_populate_fails(self, mock_mqtt_iothub_client, arbitrary_exception):
+        mock_mqtt_iothub_client.get_twin.side_effect = arbitrary_exception
+        session = IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=FAKE_DEVICE_ID,
+            ssl_context=ssl.SSLContext(),
+            twin_cache=True,
+        )
+        with pytest.raises(type(arbitrary_exception)):
+            async with session:
+                pass
+        assert mock_mqtt_iothub_client.stop.await_count == 1
+        assert session._twin_cache_bg_task is None
+
+    @pytest.mark.it(
+        "Returns the cached Twin from .get_twin() without involving the IoTHubMQTTClient"
+    )
+    async def test_get_twin(self, cache_session, twin):
+        assert cache_session._mqtt_client.get_twin.await_count == 1
+        assert await cache_session.get_twin() == twin
+        assert cache_session._mqtt_client.get_twin.await_count == 1
+
+    @pytest.mark.it("Applies incoming desired property patches to the Twin cache")
+    async def test_apply_desired_patch(self, cache_session, incoming_twin_patches):
+        incoming_twin_patches.put_nowait({"foo": 5, "$version": 2})
+        await asyncio.sleep(0.1)
+
+        twin = await cache_session.get_twin()
+        assert twin["desired"] == {"foo": 5, "$version": 2}
+        assert cache_session._mqtt_client.get_twin.await_count == 1
+
+    @pytest.mark.it(
+        "Applies reported property patches to the Twin cache once they have been sent successfully"
+    )
+    async def test_apply_reported_patch(self, cache_session, arbitrary_exception):
+        await cache_session.update_reported_properties({"bar": 3})
+        twin = await cache_session.get_twin()
+        assert twin["reported"]["bar"] == 3
+
+        cache_session._mqtt_client.send_twin_patch.side_effect = arbitrary_exception
+        with pytest.raises(type(arbitrary_exception)):
+            await cache_session.update_reported_properties({"bar": 4})
+        twin = await cache_session.get_twin()
+        assert twin["reported"]["bar"] == 3
+
+    @pytest.mark.it(
+        "Yields desired property patches from .desired_property_updates() once they have been applied to the Twin cache, without enabling or disabling twin patch receive again"
+    )
+    async def test_desired_property_updates(self, cache_session, incoming_twin_patches):
+        async with cache_session.desired_property_updates() as patches:
+            patch = {"foo": 5, "$version": 2}
+            incoming_twin_patches.put_nowait(patch)
+            assert await patches.__anext__() is patch
+            assert (await cache_session.get_twin())["desired"]["foo"] == 5
+
+        assert cache_session._mqtt_client.enable_twin_patch_receive.await_count == 1
+        assert cache_session._mqtt_client.disable_twin_patch_receive.await_count == 0
+        assert cache_session._twin_cache_patches is None
+
+
+@pytest.mark.describe("IoTHubSession - Reported Property Coalescing")
+class TestIoTHubSessionReportedPropertyCoalescing:
+    @pytest.fixture
+    async def coalescing_session(self, custom_ssl_context):
+        async with IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=FAKE_DEVICE_ID,
+            ssl_context=custom_ssl_context,
+            reported_properties_linger=0.05,
+        ) as session:
+            yield session
+
+    @pytest.mark.it("Does not coalesce reported property updates by default")
+    async def test_default(self, session):
+        assert session._reported_properties_coalescer is None
+
+    @pytest.mark.it(
+        "Instantiates a ReportedPropertiesCoalescer using the provided `reported_properties_linger` and `reported_properties_batch_size`"
+    )
+    @pytest.mark.parametrize(
+        "batch_size_kwargs, expected_batch_size",
+        [
+            pytest.param({}, twin_module.DEFAULT_COALESCE_MAX_SIZE, id="Default batch size"),
+            pytest.param({"reported_properties_batch_size": 100}, 100, id="Custom batch size"),
+        ],
+    )
+    async def test_instantiation(
+        self, mocker, custom_ssl_context, batch_size_kwargs, expected_batch_size
+    ):
+        spy_coalescer_cls = mocker.spy(twin_module, "ReportedPropertiesCoalescer")
+        session = IoTHubSession(
+            hostname=FAKE_HOSTNAME,
+            device_id=FAKE_DEVICE_ID,
+            ssl_context=custom_ssl_context,
+            reported_properties_linger=0.5,
+            **batch_size_kwargs
+        )
+        assert spy_coalescer_cls.call_count == 1
+        assert spy_coalescer_cls.call_args == mocker.call(
+            send_patch_fn=session._mqtt_client.send_twin_patch,
+            linger=0.5,
+            max_size=expected_batch_size,
+        )
+        assert session._reported_properties_coalescer is spy_coalescer_cls.spy_return
+
+    @pytest.mark.it(
+        "Sends reported property updates requested within the linger time as a single merged patch via the IoTHubMQTTClient"
+    )
+    async def test_coalesce(self, mocker, coalescing_session):
+        await asyncio.gather(
+            coalescing_session.update_reported_properties({"a": 1}),
+            coalescing_session.update_reported_properties({"b": 2}),
+        )
+        assert coalescing_session._mqtt_client.send_twin_patch.await_count == 1
+        assert coalescing_session._mqtt_client.send_twin_patch.await_args == mocker.call(
+            {"a": 1, "b": 2}
+        )
+
+    @pytest.mark.it("Stops the ReportedPropertiesCoalescer upon exit")
+    async def test_stop_on_exit(self, mocker, coalescing_session):
+        spy_stop = mocker.spy(coalescing_session._reported_properties_coalescer, "stop")
+        await coalescing_session.__aexit__(None, None, None)
+        assert spy_stop.await_count == 1
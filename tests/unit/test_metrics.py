@@ -0,0 +1,293 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import pytest
+import threading
+from azure.iot.device import metrics
+
+FAKE_DEVICE_ATTRIBUTES = {"device_id": "fake_device_id"}
+FAKE_MODULE_ATTRIBUTES = {"device_id": "fake_device_id", "module_id": "fake_module_id"}
+
+
+class FakeSource:
+    """A Session's collect function, with values that can be changed by the test"""
+
+    def __init__(self, **values):
+        self.values = values
+
+    def __call__(self):
+        return dict(self.values)
+
+
+@pytest.mark.describe("MetricsProvider")
+class TestMetricsProvider:
+    @pytest.mark.it("Accepts sources and round trip times, and discards them")
+    def test_no_op(self):
+        provider = metrics.MetricsProvider()
+        source = FakeSource(messages_sent=1)
+
+        provider.add_source(FAKE_DEVICE_ATTRIBUTES, source)
+        provider.record_round_trip_time("twin_get", 0.5, FAKE_DEVICE_ATTRIBUTES)
+        provider.remove_source(source)
+
+        # If nothing raises here, the test passes
+
+
+@pytest.mark.describe("Metric Definitions")
+class TestMetricDefinitions:
+    @pytest.mark.it("Does not define any metric as both a counter and a gauge")
+    def test_disjoint(self):
+        assert not set(metrics.COUNTERS) & set(metrics.GAUGES)
+
+    @pytest.mark.it("Describes each metric")
+    def test_descriptions(self):
+        for definitions in (metrics.COUNTERS, metrics.GAUGES, metrics.ROUND_TRIP_OPERATIONS):
+            for description in definitions.values():
+                assert description
+
+
+@pytest.mark.describe("_SourceAggregator")
+class TestSourceAggregator:
+    @pytest.mark.it("Collects the metrics of each source, keyed by the values of its attributes")
+    def test_per_session(self):
+        aggregator = metrics._SourceAggregator(per_session=True)
+        device_source = FakeSource(messages_sent=0, pending_publishes=1)
+        module_source = FakeSource(messages_sent=0, pending_publishes=0)
+
+        aggregator.add(FAKE_DEVICE_ATTRIBUTES, device_source)
+        aggregator.add(FAKE_MODULE_ATTRIBUTES, module_source)
+        device_source.values["messages_sent"] = 3
+        module_source.values["messages_sent"] = 5
+
+        assert aggregator.label_names == metrics.ATTRIBUTE_NAMES
+        assert aggregator.collect() == {
+            ("fake_device_id", "", ""): {"messages_sent": 3, "pending_publishes": 1},
+            ("fake_device_id", "fake_module_id", ""): {"messages_sent": 5, "pending_publishes": 0},
+        }
+
+    @pytest.mark.it("Collects the totals of all sources under a single key if not per-session")
+    def test_not_per_session(self):
+        aggregator = metrics._SourceAggregator(per_session=False)
+        source1 = FakeSource(messages_sent=0, pending_publishes=1)
+        source2 = FakeSource(messages_sent=0, pending_publishes=2)
+
+        aggregator.add(FAKE_DEVICE_ATTRIBUTES, source1)
+        aggregator.add(FAKE_MODULE_ATTRIBUTES, source2)
+        source1.values["messages_sent"] = 3
+        source2.values["messages_sent"] = 5
+
+        assert aggregator.label_names == ()
+        assert aggregator.collect() == {(): {"messages_sent": 8, "pending_publishes": 3}}
+
+    @pytest.mark.it("Invokes the collect function of each source each time metrics are collected")
+    def test_collects_current_values(self):
+        aggregator = metrics._SourceAggregator(per_session=True)
+        source = FakeSource(messages_sent=0, pending_publishes=0)
+        aggregator.add(FAKE_DEVICE_ATTRIBUTES, source)
+        source.values["messages_sent"] = 1
+        assert aggregator.collect()[("fake_device_id", "", "")]["messages_sent"] == 1
+
+        source.values["messages_sent"] = 2
+        source.values["pending_publishes"] = 4
+
+        assert aggregator.collect()[("fake_device_id", "", "")] == {
+            "messages_sent": 2,
+            "pending_publishes": 4,
+        }
+
+    @pytest.mark.it(
+        "Counts the counters (but not the gauges) of a source from their values when it was added"
+    )
+    def test_counters_since_added(self):
+        aggregator = metrics._SourceAggregator(per_session=True)
+        source = FakeSource(messages_sent=7, pending_publishes=2)
+
+        aggregator.add(FAKE_DEVICE_ATTRIBUTES, source)
+
+        assert aggregator.collect() == {
+            ("fake_device_id", "", ""): {"messages_sent": 0, "pending_publishes": 2}
+        }
+        source.values["messages_sent"] = 10
+        assert aggregator.collect()[("fake_device_id", "", "")]["messages_sent"] == 3
+
+    @pytest.mark.it(
+        "Retains the counters (but not the gauges) of a removed source, so that counters do not decrease"
+    )
+    def test_remove_retains_counters(self):
+        aggregator = metrics._SourceAggregator(per_session=False)
+        source1 = FakeSource(messages_sent=0, pending_publishes=1)
+        source2 = FakeSource(messages_sent=0, pending_publishes=2)
+        aggregator.add(FAKE_DEVICE_ATTRIBUTES, source1)
+        aggregator.add(FAKE_MODULE_ATTRIBUTES, source2)
+        source1.values["messages_sent"] = 3
+        source2.values["messages_sent"] = 5
+
+        aggregator.remove(source1)
+
+        assert aggregator.collect() == {(): {"messages_sent": 8, "pending_publishes": 2}}
+
+    @pytest.mark.it(
+        "Continues the counters of a removed source if a source with the same attributes is added"
+    )
+    def test_readd(self):
+        aggregator = metrics._SourceAggregator(per_session=True)
+        source1 = FakeSource(messages_sent=0)
+        aggregator.add(FAKE_DEVICE_ATTRIBUTES, source1)
+        source1.values["messages_sent"] = 3
+        aggregator.remove(source1)
+
+        source2 = FakeSource(messages_sent=0)
+        aggregator.add(FAKE_DEVICE_ATTRIBUTES, source2)
+        source2.values["messages_sent"] = 1
+
+        assert aggregator.collect() == {("fake_device_id", "", ""): {"messages_sent": 4}}
+
+    @pytest.mark.it(
+        "Does not count the counters of a source twice if the same source is removed and added again"
+    )
+    def test_readd_same_source(self):
+        aggregator = metrics._SourceAggregator(per_session=True)
+        source = FakeSource(messages_sent=0)
+        # e.g. a Session exited and entered again, with the same client
+        aggregator.add(FAKE_DEVICE_ATTRIBUTES, source)
+        source.values["messages_sent"] = 5
+        aggregator.remove(source)
+        assert aggregator.collect() == {("fake_device_id", "", ""): {"messages_sent": 5}}
+
+        aggregator.add(FAKE_DEVICE_ATTRIBUTES, source)
+        assert aggregator.collect() == {("fake_device_id", "", ""): {"messages_sent": 5}}
+        source.values["messages_sent"] = 10
+        assert aggregator.collect() == {("fake_device_id", "", ""): {"messages_sent": 10}}
+
+        aggregator.remove(source)
+        assert aggregator.collect() == {("fake_device_id", "", ""): {"messages_sent": 10}}
+
+    @pytest.mark.it("Ignores the removal of a source that was not added")
+    def test_remove_unknown(self):
+        aggregator = metrics._SourceAggregator(per_session=True)
+
+        aggregator.remove(FakeSource(messages_sent=3))
+
+        assert aggregator.collect() == {}
+
+    @pytest.mark.it("Can collect metrics from another thread while sources are added and removed")
+    def test_threads(self):
+        aggregator = metrics._SourceAggregator(per_session=False)
+        stop = threading.Event()
+        errors = []
+
+        def collect():
+            while not stop.is_set():
+                try:
+                    aggregator.collect()
+                except Exception as e:
+                    errors.append(e)
+
+        collector = threading.Thread(target=collect)
+        collector.start()
+        try:
+            for _ in range(1000):
+                source = FakeSource(messages_sent=0)
+                aggregator.add(FAKE_DEVICE_ATTRIBUTES, source)
+                source.values["messages_sent"] = 1
+                aggregator.remove(source)
+        finally:
+            stop.set()
+            collector.join()
+
+        assert not errors
+        assert aggregator.collect() == {(): {"messages_sent": 1000}}
+
+
+@pytest.mark.describe("OpenTelemetryMetricsProvider")
+class TestOpenTelemetryMetricsProvider:
+    @pytest.fixture
+    def reader(self):
+        sdk_metrics = pytest.importorskip("opentelemetry.sdk.metrics")
+        export = pytest.importorskip("opentelemetry.sdk.metrics.export")
+        reader = export.InMemoryMetricReader()
+        reader.meter_provider = sdk_metrics.MeterProvider(metric_readers=[reader])
+        return reader
+
+    @pytest.fixture
+    def provider(self, reader):
+        return metrics.OpenTelemetryMetricsProvider(reader.meter_provider.get_meter("test"))
+
+    def get_points(self, reader):
+        points = {}
+        for resource_metrics in reader.get_metrics_data().resource_metrics:
+            for scope_metrics in resource_metrics.scope_metrics:
+                for metric in scope_metrics.metrics:
+                    points[metric.name] = list(metric.data.data_points)
+        return points
+
+    @pytest.mark.it("Reports the counters and gauges of each source, with the source's attributes")
+    def test_observable(self, reader, provider):
+        source = FakeSource(messages_sent=0, pending_publishes=1)
+        provider.add_source(FAKE_DEVICE_ATTRIBUTES, source)
+        source.values["messages_sent"] = 3
+
+        points = self.get_points(reader)
+
+        (messages_sent,) = points["azure_iot.messages_sent"]
+        assert messages_sent.value == 3
+        assert messages_sent.attributes["device_id"] == "fake_device_id"
+        (pending_publishes,) = points["azure_iot.pending_publishes"]
+        assert pending_publishes.value == 1
+
+    @pytest.mark.it("Records round trip times in a histogram for the operation")
+    def test_round_trip_time(self, reader, provider):
+        provider.record_round_trip_time("twin_get", 0.25, FAKE_DEVICE_ATTRIBUTES)
+        provider.record_round_trip_time("twin_get", 0.75, FAKE_DEVICE_ATTRIBUTES)
+
+        points = self.get_points(reader)
+
+        (twin_get,) = points["azure_iot.twin_get.round_trip_time"]
+        assert twin_get.count == 2
+        assert twin_get.sum == 1.0
+
+
+@pytest.mark.describe("PrometheusMetricsProvider")
+class TestPrometheusMetricsProvider:
+    @pytest.fixture
+    def registry(self):
+        prometheus_client = pytest.importorskip("prometheus_client")
+        return prometheus_client.CollectorRegistry()
+
+    @pytest.fixture
+    def provider(self, registry):
+        return metrics.PrometheusMetricsProvider(registry)
+
+    @pytest.mark.it("Exposes the counters and gauges of each source, labelled with its attributes")
+    def test_collect(self, registry, provider):
+        source = FakeSource(messages_sent=0, pending_publishes=1)
+        provider.add_source(FAKE_MODULE_ATTRIBUTES, source)
+        source.values["messages_sent"] = 3
+        labels = {
+            "device_id": "fake_device_id",
+            "module_id": "fake_module_id",
+            "registration_id": "",
+        }
+
+        assert registry.get_sample_value("azure_iot_messages_sent_total", labels) == 3
+        assert registry.get_sample_value("azure_iot_pending_publishes", labels) == 1
+
+    @pytest.mark.it("Does not expose metrics that no source provides")
+    def test_no_sources(self, registry, provider):
+        assert registry.get_sample_value("azure_iot_messages_sent_total", {}) is None
+
+    @pytest.mark.it("Observes round trip times in a histogram for the operation")
+    def test_round_trip_time(self, registry, provider):
+        provider.record_round_trip_time("registration", 0.5, {"registration_id": "fake_reg_id"})
+        labels = {"device_id": "", "module_id": "", "registration_id": "fake_reg_id"}
+
+        assert (
+            registry.get_sample_value("azure_iot_registration_round_trip_seconds_count", labels)
+            == 1
+        )
+        assert (
+            registry.get_sample_value("azure_iot_registration_round_trip_seconds_sum", labels)
+            == 0.5
+        )
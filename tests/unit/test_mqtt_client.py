@@ -12,8 +12,11 @@ from azure.iot.device.mqtt_client import (
     expected_publish_rc,
     expected_on_connect_rc,
     expected_on_disconnect_rc,
+    INCOMING_MESSAGE_INTERRUPT,
 )
 from azure.iot.device.config import ProxyOptions
+from azure.iot.device.network_loop import SharedNetworkLoop
+from azure.iot.device import tracing
 import paho.mqtt.client as mqtt
 import asyncio
 import pytest
@@ -474,6 +477,31 @@ class TestInstantiation:
         )
         assert client._reconnect_interval == my_interval
 
+    @pytest.mark.it("Stores the provided network_loop value (if provided)")
+    async def test_shared_network_loop(self, mocker):
+        mocker.patch.object(mqtt, "Client")
+        network_loop = SharedNetworkLoop()
+        client = MQTTClient(
+            client_id=fake_device_id,
+            hostname=fake_hostname,
+            port=fake_port,
+            network_loop=network_loop,
+        )
+        assert client._shared_network_loop is network_loop
+
+    @pytest.mark.it("Stores the provided executor value (if provided)")
+    async def test_executor(self, mocker):
+        mocker.patch.object(mqtt, "Client")
+        executor = ThreadPoolExecutor(max_workers=1)
+        client = MQTTClient(
+            client_id=fake_device_id,
+            hostname=fake_hostname,
+            port=fake_port,
+            executor=executor,
+        )
+        assert client._executor is executor
+        executor.shutdown()
+
     @pytest.mark.it("Creates and stores an instance of the Paho MQTT Client")
     async def test_instantiates_mqtt_client(self, mocker, transport):
         mock_paho_constructor = mocker.patch.object(mqtt, "Client")
@@ -892,6 +920,65 @@ class TestGetIncomingMessageGenerator:
             client.get_incoming_message_generator(fake_topic)
 
 
+@pytest.mark.describe("MQTTClient - .interrupt_incoming_message_generator()")
+class TestInterruptIncomingMessageGenerator:
+    @pytest.mark.it(
+        "Causes the generator for the default incoming message queue to yield INCOMING_MESSAGE_INTERRUPT after any items already queued, if no filter topic is provided"
+    )
+    async def test_default_generator(self, client):
+        incoming_messages = client.get_incoming_message_generator()
+        item = mqtt.MQTTMessage(mid=1)
+        await client._incoming_messages.put(item)
+
+        client.interrupt_incoming_message_generator()
+
+        result = await incoming_messages.__anext__()
+        assert result is item
+        result = await incoming_messages.__anext__()
+        assert result is INCOMING_MESSAGE_INTERRUPT
+
+    @pytest.mark.it(
+        "Causes the generator for a filtered incoming message queue to yield INCOMING_MESSAGE_INTERRUPT after any items already queued, if a filter topic is provided"
+    )
+    async def test_filtered_generator(self, client):
+        client.add_incoming_message_filter(fake_topic)
+        incoming_messages = client.get_incoming_message_generator(fake_topic)
+        item = mqtt.MQTTMessage(mid=1)
+        await client._incoming_filtered_messages[fake_topic].put(item)
+
+        client.interrupt_incoming_message_generator(fake_topic)
+
+        result = await incoming_messages.__anext__()
+        assert result is item
+        result = await incoming_messages.__anext__()
+        assert result is INCOMING_MESSAGE_INTERRUPT
+
+    @pytest.mark.it("Wakes a generator that is waiting for an item, without closing it")
+    async def test_wakes_waiting_generator(self, client):
+        incoming_messages = client.get_incoming_message_generator()
+        t = asyncio.create_task(incoming_messages.__anext__())
+        await asyncio.sleep(0.1)
+        assert not t.done()
+
+        client.interrupt_incoming_message_generator()
+        await asyncio.sleep(0.1)
+
+        assert t.done()
+        assert t.result() is INCOMING_MESSAGE_INTERRUPT
+        # Generator can still be used
+        item = mqtt.MQTTMessage(mid=1)
+        await client._incoming_messages.put(item)
+        result = await incoming_messages.__anext__()
+        assert result is item
+
+    @pytest.mark.it("Raises a ValueError if a filter has not been added for the given filter topic")
+    async def test_no_filter_added(self, client):
+        assert fake_topic not in client._incoming_filtered_messages
+
+        with pytest.raises(ValueError):
+            client.interrupt_incoming_message_generator(fake_topic)
+
+
 # NOTE: Because clients in Disconnected, Connection Dropped, and Fresh states have the same
 # behaviors during a connect, define a parent class that can be subclassed so tests don't have
 # to be written twice.
@@ -1025,6 +1112,45 @@ class ConnectWithClientNotConnectedTests:
         assert not client._network_loop.done()
         assert mock_paho.loop_forever.call_count == 1  # Same as it was before
 
+    @pytest.mark.it(
+        "Adds the Paho client to the shared network loop instead of starting a Paho network loop, if a shared network loop was provided"
+    )
+    async def test_shared_network_loop(self, mocker, client, mock_paho):
+        mock_network_loop = mocker.MagicMock(spec=SharedNetworkLoop)
+        mock_network_loop.run_client.return_value = asyncio.get_running_loop().create_future()
+        client._shared_network_loop = mock_network_loop
+
+        await client.connect()
+
+        assert mock_network_loop.run_client.call_count == 1
+        assert mock_network_loop.run_client.call_args == mocker.call(mock_paho)
+        assert client._network_loop is mock_network_loop.run_client.return_value
+        assert mock_paho.loop_forever.call_count == 0
+
+        # Complete the network loop Future so the client can be disconnected during cleanup
+        client._network_loop.set_result(None)
+
+    @pytest.mark.it("Invokes the Paho connect in the provided executor (if provided)")
+    async def test_executor(self, mocker, client, mock_paho):
+        # NOTE: The Paho network loop also runs in the executor, occupying one of the workers
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="test-executor")
+        client._executor = executor
+        thread_names = []
+        original_connect = mock_paho.connect.side_effect
+
+        def connect(*args, **kwargs):
+            thread_names.append(threading.current_thread().name)
+            return original_connect(*args, **kwargs)
+
+        mock_paho.connect.side_effect = connect
+
+        await client.connect()
+
+        assert len(thread_names) == 1
+        assert thread_names[0].startswith("test-executor")
+        await client.disconnect()
+        executor.shutdown()
+
     @pytest.mark.it(
         "Waits to return until Paho receives a success response if the connect invocation succeeded"
     )
@@ -2117,6 +2243,170 @@ class TestDisconnectWithClientFresh(DisconnectWithClientFullyDisconnectedTests):
         return fresh_client
 
 
+@pytest.mark.describe("MQTTClient - .reconnect() -- Client Connected")
+class TestReconnectWithClientConnected:
+    @pytest.fixture
+    async def client(self, fresh_client):
+        client = fresh_client
+        client_set_connected(client)
+        return client
+
+    @pytest.fixture
+    async def disconnect_waiter(self, client):
+        async def wait_for_disconnect():
+            async with client.disconnected_cond:
+                await client.disconnected_cond.wait_for(lambda: not client.is_connected())
+
+        t = asyncio.create_task(wait_for_disconnect())
+        await asyncio.sleep(0.1)
+        assert not t.done()
+        yield t
+        t.cancel()
+
+    @pytest.mark.it("Invokes an MQTT disconnect via Paho, followed by an MQTT connect via Paho")
+    async def test_paho_invocation(self, mocker, client, mock_paho):
+        calls = mocker.MagicMock()
+        calls.attach_mock(mock_paho.disconnect, "disconnect")
+        calls.attach_mock(mock_paho.connect, "connect")
+
+        await client.reconnect()
+
+        assert calls.mock_calls == [
+            mocker.call.disconnect(),
+            mocker.call.connect(
+                host=client._hostname, port=client._port, keepalive=client._keep_alive
+            ),
+        ]
+
+    @pytest.mark.it(
+        "Waits for the disconnect to complete before connecting, and returns once connected"
+    )
+    async def test_waits_for_completion(self, client, mock_paho):
+        # Require manual completion
+        mock_paho._manual_mode = True
+
+        reconnect_task = asyncio.create_task(client.reconnect())
+        await asyncio.sleep(0.1)
+        assert mock_paho.disconnect.call_count == 1
+        assert mock_paho.connect.call_count == 0
+        assert client.is_reconnecting()
+
+        mock_paho.trigger_on_disconnect(rc=mqtt.MQTT_ERR_SUCCESS)
+        await asyncio.sleep(0.1)
+        assert mock_paho.connect.call_count == 1
+        assert not reconnect_task.done()
+        assert not client.is_connected()
+        assert client.is_reconnecting()
+
+        mock_paho.trigger_on_connect(rc=mqtt.CONNACK_ACCEPTED)
+        await reconnect_task
+        assert client.is_connected()
+        assert not client.is_reconnecting()
+        assert client.connect_count == 1
+
+    @pytest.mark.it("Does not notify tasks waiting on disconnect")
+    async def test_no_notification(self, client, disconnect_waiter):
+        await client.reconnect()
+        await asyncio.sleep(0.1)
+
+        assert not disconnect_waiter.done()
+        assert client.previous_disconnection_cause() is None
+
+    @pytest.mark.it(
+        "Cancels pending subscribes and unsubscribes, but does not cancel pending publishes"
+    )
+    async def test_pending_operations(self, client):
+        sub = asyncio.get_running_loop().create_future()
+        unsub = asyncio.get_running_loop().create_future()
+        pub = asyncio.get_running_loop().create_future()
+        client._pending_subs[1] = sub
+        client._pending_unsubs[2] = unsub
+        client._pending_pubs[3] = pub
+
+        await client.reconnect()
+        await asyncio.sleep(0.1)
+
+        assert sub.cancelled()
+        assert unsub.cancelled()
+        assert not pub.done()
+        assert client._pending_pubs[3] is pub
+
+    @pytest.mark.it(
+        "Notifies tasks waiting on disconnect, and allows the MQTTConnectionFailedError to propagate, if the connect fails"
+    )
+    async def test_connect_fails(self, client, mock_paho, disconnect_waiter):
+        # Require manual completion
+        mock_paho._manual_mode = True
+
+        reconnect_task = asyncio.create_task(client.reconnect())
+        await asyncio.sleep(0.1)
+        mock_paho.trigger_on_disconnect(rc=mqtt.MQTT_ERR_SUCCESS)
+        await asyncio.sleep(0.1)
+        assert not disconnect_waiter.done()
+        mock_paho.trigger_on_connect(rc=mqtt.CONNACK_REFUSED_NOT_AUTHORIZED)
+        # Any CONNACK failure also results in a ERR_CONN_REFUSED to on_disconnect
+        mock_paho.trigger_on_disconnect(rc=mqtt.MQTT_ERR_CONN_REFUSED)
+
+        with pytest.raises(MQTTConnectionFailedError):
+            await reconnect_task
+        await asyncio.sleep(0.1)
+
+        assert disconnect_waiter.done()
+        assert not client.is_connected()
+        assert not client.is_reconnecting()
+        assert isinstance(client.previous_disconnection_cause(), MQTTError)
+
+    @pytest.mark.it("Notifies tasks waiting on disconnect if cancelled while connecting")
+    async def test_cancel(self, client, mock_paho, disconnect_waiter):
+        # Require manual completion
+        mock_paho._manual_mode = True
+
+        reconnect_task = asyncio.create_task(client.reconnect())
+        await asyncio.sleep(0.1)
+        mock_paho.trigger_on_disconnect(rc=mqtt.MQTT_ERR_SUCCESS)
+        await asyncio.sleep(0.1)
+        reconnect_task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await reconnect_task
+        await asyncio.sleep(0.1)
+
+        assert disconnect_waiter.done()
+        assert not client.is_reconnecting()
+
+    @pytest.mark.it("Notifies tasks waiting on disconnect of a disconnect occurring after it")
+    async def test_later_disconnect(self, client, mock_paho, disconnect_waiter):
+        await client.reconnect()
+
+        mock_paho.trigger_on_disconnect(rc=mqtt.MQTT_ERR_CONN_LOST)
+        await asyncio.sleep(0.1)
+
+        assert disconnect_waiter.done()
+
+
+@pytest.mark.describe("MQTTClient - .reconnect() -- Client Not Connected")
+class TestReconnectWithClientNotConnected:
+    @pytest.fixture(
+        params=[
+            pytest.param(client_set_fresh, id="Fresh"),
+            pytest.param(client_set_disconnected, id="Disconnected"),
+            pytest.param(client_set_connection_dropped, id="Connection Dropped"),
+        ]
+    )
+    async def client(self, request, fresh_client):
+        client = fresh_client
+        request.param(client)
+        return client
+
+    @pytest.mark.it("Does not invoke an MQTT disconnect or connect via Paho")
+    async def test_paho_invocation(self, client, mock_paho):
+        await client.reconnect()
+
+        assert mock_paho.disconnect.call_count == 0
+        assert mock_paho.connect.call_count == 0
+        assert not client.is_connected()
+
+
 @pytest.mark.describe("MQTTClient - OCCURRENCE: Unexpected Disconnect")
 class TestUnexpectedDisconnect:
     @pytest.fixture
@@ -3316,6 +3606,203 @@ class TestPublish:
 
         # No failure, no problem
 
+    @pytest.mark.it(
+        "Raises asyncio.TimeoutError if a response is not received before the provided timeout elapses"
+    )
+    async def test_timeout(self, client, mock_paho):
+        # Require manual completion
+        mock_paho._manual_mode = True
+
+        publish_task = asyncio.create_task(client.publish(fake_topic, fake_payload, timeout=0.2))
+        await asyncio.sleep(0.1)
+        assert not publish_task.done()
+        await asyncio.sleep(0.2)
+        assert publish_task.done()
+        with pytest.raises(asyncio.TimeoutError):
+            await publish_task
+
+    @pytest.mark.it("Clears pending publish tracking information if the timeout elapses")
+    async def test_pending_timeout(self, client, mock_paho):
+        # Require manual completion
+        mock_paho._manual_mode = True
+
+        publish_task = asyncio.create_task(client.publish(fake_topic, fake_payload, timeout=0.2))
+        await asyncio.sleep(0.1)
+        mid = mock_paho._last_mid
+        assert mid in client._pending_pubs
+
+        with pytest.raises(asyncio.TimeoutError):
+            await publish_task
+        assert mid not in client._pending_pubs
+
+        # Trigger publish response after timeout
+        mock_paho.trigger_on_publish(mid)
+        await asyncio.sleep(0.1)
+
+        # No failure, no problem
+
+    @pytest.mark.it(
+        "Does not raise asyncio.TimeoutError if a response is received before the provided timeout elapses"
+    )
+    async def test_response_before_timeout(self, client, mock_paho):
+        # Require manual completion
+        mock_paho._manual_mode = True
+
+        publish_task = asyncio.create_task(client.publish(fake_topic, fake_payload, timeout=0.3))
+        await asyncio.sleep(0.1)
+        mock_paho.trigger_on_publish(mock_paho._last_mid)
+        await publish_task
+        # Timer does not fire after completion
+        await asyncio.sleep(0.3)
+
+
+@pytest.mark.describe("MQTTClient - .publish() - Tracing")
+class TestPublishTracing:
+    @pytest.fixture
+    def span(self, mocker):
+        span = mocker.MagicMock(spec=tracing.Span)
+        with tracing.use_span(span):
+            yield span
+
+    @pytest.mark.it(
+        "Sets the MQTT message id and payload size on the current span, and adds events marking the publish"
+    )
+    async def test_attributes(self, mocker, client, mock_paho, span):
+        mock_paho._manual_mode = True
+        payload = "héllo"
+
+        publish_task = asyncio.create_task(client.publish(fake_topic, payload))
+        await asyncio.sleep(0.1)
+
+        mid = mock_paho._last_mid
+        assert span.set_attribute.call_args_list == [
+            mocker.call(tracing.ATTRIBUTE_MID, mid),
+            mocker.call(tracing.ATTRIBUTE_PAYLOAD_SIZE, len(payload.encode("utf-8"))),
+        ]
+        assert [c[0][0] for c in span.add_event.call_args_list] == [
+            tracing.EVENT_PUBLISH,
+            tracing.EVENT_PUBLISHED,
+        ]
+
+        mock_paho.trigger_on_publish(mid)
+        await publish_task
+
+    @pytest.mark.it(
+        "Adds an event to the current span when the PUBACK is received, with the time of receipt"
+    )
+    async def test_puback(self, client, mock_paho, span):
+        mock_paho._manual_mode = True
+
+        publish_task = asyncio.create_task(client.publish(fake_topic, fake_payload))
+        await asyncio.sleep(0.1)
+        assert span.add_event.call_count == 2
+        before = time.time_ns()
+        mock_paho.trigger_on_publish(mock_paho._last_mid)
+        await publish_task
+        after = time.time_ns()
+
+        assert span.add_event.call_count == 3
+        assert span.add_event.call_args[0][0] == tracing.EVENT_PUBACK
+        assert before <= span.add_event.call_args[1]["timestamp"] <= after
+        assert client._pending_pub_spans == {}
+
+    @pytest.mark.it("Does not retain the span if the publish fails")
+    async def test_failure(self, client, mock_paho, span):
+        mock_paho._manual_mode = True
+
+        with pytest.raises(asyncio.TimeoutError):
+            await client.publish(fake_topic, fake_payload, timeout=0.1)
+
+        assert client._pending_pub_spans == {}
+        assert span.end.call_count == 0
+
+    @pytest.mark.it("Does not track spans if there is no current span")
+    async def test_no_span(self, client, mock_paho):
+        mock_paho._manual_mode = True
+
+        publish_task = asyncio.create_task(client.publish(fake_topic, fake_payload))
+        await asyncio.sleep(0.1)
+
+        assert client._pending_pub_spans == {}
+        mock_paho.trigger_on_publish(mock_paho._last_mid)
+        await publish_task
+
+
+@pytest.mark.describe("MQTTClient - .stats")
+class TestStats:
+    @pytest.mark.it("Returns zeroed counters and gauges for a fresh client")
+    async def test_fresh(self, client):
+        assert client.stats == {
+            "publishes_sent": 0,
+            "publishes_acked": 0,
+            "publishes_failed": 0,
+            "pending_publishes": 0,
+            "bytes_sent": 0,
+            "bytes_received": 0,
+            "reconnects": 0,
+        }
+
+    @pytest.mark.it(
+        "Counts publishes sent, acknowledged and pending, and the bytes of topic and payload sent"
+    )
+    async def test_publishes(self, client, mock_paho):
+        mock_paho._manual_mode = True
+        payload = "héllo"
+
+        publish_task = asyncio.create_task(client.publish(fake_topic, payload))
+        await asyncio.sleep(0.1)
+
+        stats = client.stats
+        assert stats["publishes_sent"] == 1
+        assert stats["publishes_acked"] == 0
+        assert stats["pending_publishes"] == 1
+        assert stats["bytes_sent"] == len(fake_topic) + len(payload.encode("utf-8"))
+
+        mock_paho.trigger_on_publish(mock_paho._last_mid)
+        await publish_task
+
+        stats = client.stats
+        assert stats["publishes_sent"] == 1
+        assert stats["publishes_acked"] == 1
+        assert stats["publishes_failed"] == 0
+        assert stats["pending_publishes"] == 0
+
+    @pytest.mark.it("Counts publishes that fail")
+    async def test_publish_failures(self, client, mock_paho, arbitrary_exception):
+        mock_paho._manual_mode = True
+        with pytest.raises(asyncio.TimeoutError):
+            await client.publish(fake_topic, fake_payload, timeout=0.1)
+        mock_paho.publish.side_effect = arbitrary_exception
+        with pytest.raises(type(arbitrary_exception)):
+            await client.publish(fake_topic, fake_payload)
+
+        assert client.stats["publishes_failed"] == 2
+        assert client.stats["publishes_acked"] == 0
+
+    @pytest.mark.it("Counts the bytes of topic and payload received, with or without a filter")
+    async def test_bytes_received(self, client, mock_paho):
+        client.add_incoming_message_filter("filtered/topic")
+        filter_callback = mock_paho.message_callback_add.call_args[0][1]
+        message1 = mqtt.MQTTMessage(mid=1, topic=b"unfiltered/topic")
+        message1.payload = b"12345"
+        message2 = mqtt.MQTTMessage(mid=2, topic=b"filtered/topic")
+        message2.payload = b"123"
+
+        client._mqtt_client.on_message(client, None, message1)
+        filter_callback(client, None, message2)
+        await asyncio.sleep(0.1)
+
+        assert (
+            client.stats["bytes_received"]
+            == len("unfiltered/topic") + 5 + len("filtered/topic") + 3
+        )
+
+    @pytest.mark.it("Counts connections established after the first as reconnects")
+    @pytest.mark.parametrize("connect_count, expected_reconnects", [(0, 0), (1, 0), (2, 1), (5, 4)])
+    async def test_reconnects(self, client, connect_count, expected_reconnects):
+        client.connect_count = connect_count
+        assert client.stats["reconnects"] == expected_reconnects
+
 
 # NOTE: Because so much of the logic of message receives is internal to Paho, to test more detail
 # would really just be testing mocks. So we're just going to test the handlers/callbacks provided
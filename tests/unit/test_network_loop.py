@@ -0,0 +1,356 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import asyncio
+import os
+import paho.mqtt.client as mqtt
+import pytest
+import threading
+from azure.iot.device.network_loop import SharedNetworkLoop
+from dev_utils import mqtt_broker
+
+FAKE_TOPIC = "fake/topic"
+FAKE_PAYLOAD = b"fake payload"
+
+
+@pytest.fixture
+async def broker():
+    broker = mqtt_broker.MQTTBroker()
+    await broker.start()
+    yield broker
+    await broker.stop()
+
+
+@pytest.fixture
+def network_loop():
+    network_loop = SharedNetworkLoop()
+    yield network_loop
+    network_loop.close()
+
+
+class ClientConnector:
+    """Creates Paho clients connected to a broker, with their handlers forwarding to the event
+    loop, as they would be in the MQTTClient"""
+
+    def __init__(self, port, ssl_context=None):
+        self.port = port
+        self.ssl_context = ssl_context
+        self.clients = []
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        client = mqtt.Client()
+        if self.ssl_context:
+            client.tls_set_context(self.ssl_context)
+        client.connected = loop.create_future()
+        client.received = asyncio.Queue()
+        client.on_connect = lambda c, userdata, flags, rc: loop.call_soon_threadsafe(
+            _set_result, c.connected, rc
+        )
+        client.on_message = lambda c, userdata, message: loop.call_soon_threadsafe(
+            c.received.put_nowait, message.payload
+        )
+        host = "localhost" if self.ssl_context else "127.0.0.1"
+        await loop.run_in_executor(None, client.connect, host, self.port)
+        self.clients.append(client)
+        return client
+
+
+async def _run_client(network_loop, client):
+    return network_loop.run_client(client)
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+@pytest.fixture
+async def connector(broker):
+    connector = ClientConnector(broker.port)
+    yield connector
+    for client in connector.clients:
+        client.disconnect()
+
+
+@pytest.mark.describe("SharedNetworkLoop - Instantiation")
+class TestSharedNetworkLoopInstantiation:
+    @pytest.mark.it("Is not running")
+    async def test_not_running(self):
+        network_loop = SharedNetworkLoop()
+        assert not network_loop.running
+        assert len(network_loop) == 0
+
+
+@pytest.mark.describe("SharedNetworkLoop - .run_client()")
+class TestSharedNetworkLoopRunClient:
+    @pytest.mark.it("Starts the network loop thread, if not already running")
+    async def test_starts(self, network_loop, connector):
+        client = await connector.connect()
+        thread_count = threading.active_count()
+
+        network_loop.run_client(client)
+
+        assert network_loop.running
+        assert threading.active_count() == thread_count + 1
+
+    @pytest.mark.it("Services the network I/O of the client")
+    async def test_services_client(self, network_loop, connector):
+        client = await connector.connect()
+
+        network_loop.run_client(client)
+
+        assert await asyncio.wait_for(client.connected, 2) == mqtt.CONNACK_ACCEPTED
+        client.subscribe(FAKE_TOPIC, qos=1)
+        await asyncio.sleep(0.1)
+        client.publish(FAKE_TOPIC, FAKE_PAYLOAD, qos=1)
+        assert await asyncio.wait_for(client.received.get(), 2) == FAKE_PAYLOAD
+
+    @pytest.mark.it("Services many clients using a single thread")
+    async def test_many_clients(self, network_loop, connector):
+        clients = [await connector.connect() for _ in range(20)]
+        thread_count = threading.active_count()
+
+        for client in clients:
+            network_loop.run_client(client)
+            client.subscribe(FAKE_TOPIC, qos=1)
+        await asyncio.wait_for(asyncio.gather(*[c.connected for c in clients]), 2)
+        await asyncio.sleep(0.1)
+
+        assert len(network_loop) == len(clients)
+        assert threading.active_count() == thread_count + 1
+        clients[0].publish(FAKE_TOPIC, FAKE_PAYLOAD, qos=1)
+        for client in clients:
+            assert await asyncio.wait_for(client.received.get(), 2) == FAKE_PAYLOAD
+
+    @pytest.mark.it("Services clients connected using TLS")
+    async def test_tls(self, network_loop, broker):
+        cert_pem, key_pem = mqtt_broker.generate_self_signed_certificate("localhost")
+        tls_broker = mqtt_broker.MQTTBroker(
+            ssl_context=mqtt_broker.create_server_ssl_context(cert_pem, key_pem)
+        )
+        await tls_broker.start()
+        connector = ClientConnector(
+            tls_broker.port, mqtt_broker.create_client_ssl_context(cert_pem)
+        )
+        client = await connector.connect()
+
+        network_loop.run_client(client)
+
+        assert await asyncio.wait_for(client.connected, 2) == mqtt.CONNACK_ACCEPTED
+        client.subscribe(FAKE_TOPIC, qos=1)
+        await asyncio.sleep(0.1)
+        client.publish(FAKE_TOPIC, FAKE_PAYLOAD, qos=1)
+        assert await asyncio.wait_for(client.received.get(), 2) == FAKE_PAYLOAD
+
+        client.disconnect()
+        await tls_broker.stop()
+
+    @pytest.mark.it(
+        "Returns a Future that completes when the client disconnects, and stops servicing the client"
+    )
+    async def test_disconnect(self, network_loop, connector):
+        client = await connector.connect()
+        done = network_loop.run_client(client)
+        await asyncio.wait_for(client.connected, 2)
+        assert not done.done()
+
+        # NOTE: Invoked on another thread, as it is in the MQTTClient
+        await asyncio.get_running_loop().run_in_executor(None, client.disconnect)
+
+        await asyncio.wait_for(done, 2)
+        assert len(network_loop) == 0
+
+    @pytest.mark.it(
+        "Returns a Future that completes when the connection is dropped, and stops servicing the client"
+    )
+    async def test_connection_drop(self, network_loop, broker, connector):
+        client = await connector.connect()
+        done = network_loop.run_client(client)
+        await asyncio.wait_for(client.connected, 2)
+
+        await broker.stop()
+
+        await asyncio.wait_for(done, 2)
+        assert len(network_loop) == 0
+
+    @pytest.mark.it("Returns a completed Future if the client is not connected")
+    async def test_not_connected(self, network_loop):
+        done = network_loop.run_client(mqtt.Client())
+
+        await asyncio.wait_for(done, 2)
+        assert len(network_loop) == 0
+
+    @pytest.mark.it(
+        "Fails the Future with the error and stops servicing the client if servicing it raises, while continuing to service other clients"
+    )
+    async def test_client_error(self, mocker, network_loop, connector):
+        failing_client = await connector.connect()
+        client = await connector.connect()
+        error = ValueError("fake error")
+        mocker.patch.object(failing_client, "loop_misc", side_effect=error)
+        failing_done = network_loop.run_client(failing_client)
+        done = network_loop.run_client(client)
+
+        with pytest.raises(ValueError) as e_info:
+            await asyncio.wait_for(failing_done, 3)
+        assert e_info.value is error
+
+        assert network_loop.running
+        assert len(network_loop) == 1
+        assert not done.done()
+        assert await asyncio.wait_for(client.connected, 2) == mqtt.CONNACK_ACCEPTED
+        client.subscribe(FAKE_TOPIC, qos=1)
+        await asyncio.sleep(0.1)
+        client.publish(FAKE_TOPIC, FAKE_PAYLOAD, qos=1)
+        assert await asyncio.wait_for(client.received.get(), 2) == FAKE_PAYLOAD
+
+    @pytest.mark.it(
+        "Continues servicing other clients if the event loop of a client is closed when its Future completes"
+    )
+    async def test_event_loop_closed(self, network_loop, connector):
+        other_client = await connector.connect()
+
+        def run_client_on_other_loop():
+            # NOTE: The other event loop is closed once the client has been added
+            other_loop = asyncio.new_event_loop()
+            other_done = other_loop.run_until_complete(_run_client(network_loop, other_client))
+            other_loop.close()
+            return other_done
+
+        other_done = await asyncio.get_running_loop().run_in_executor(
+            None, run_client_on_other_loop
+        )
+        client = await connector.connect()
+        network_loop.run_client(client)
+        await asyncio.wait_for(client.connected, 2)
+
+        await asyncio.get_running_loop().run_in_executor(None, other_client.disconnect)
+        await asyncio.sleep(0.1)
+
+        assert not other_done.done()
+        assert network_loop.running
+        assert len(network_loop) == 1
+        client.subscribe(FAKE_TOPIC, qos=1)
+        await asyncio.sleep(0.1)
+        client.publish(FAKE_TOPIC, FAKE_PAYLOAD, qos=1)
+        assert await asyncio.wait_for(client.received.get(), 2) == FAKE_PAYLOAD
+
+    @pytest.mark.it(
+        "Cancels the Futures of all clients if the network loop thread exits unexpectedly"
+    )
+    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+    async def test_thread_exits(self, mocker, network_loop, connector):
+        client = await connector.connect()
+        done = network_loop.run_client(client)
+        await asyncio.wait_for(client.connected, 2)
+
+        mocker.patch.object(network_loop, "_process_requests", side_effect=MemoryError)
+        network_loop._request("fake request")
+        await asyncio.sleep(0.1)
+
+        assert not network_loop.running
+        assert done.cancelled()
+        assert len(network_loop) == 0
+
+    @pytest.mark.it("Sends keep alive pings on behalf of the client")
+    async def test_keep_alive(self, mocker, network_loop, broker):
+        loop = asyncio.get_running_loop()
+        client = mqtt.Client()
+        pinged = asyncio.Event()
+        original_handle = broker._handle_packet
+
+        def handle_packet(broker_client, header, body):
+            if header >> 4 == mqtt_broker.PINGREQ:
+                loop.call_soon(pinged.set)
+            return original_handle(broker_client, header, body)
+
+        mocker.patch.object(broker, "_handle_packet", side_effect=handle_packet)
+        await loop.run_in_executor(None, client.connect, "127.0.0.1", broker.port, 1)
+
+        network_loop.run_client(client)
+
+        await asyncio.wait_for(pinged.wait(), 3)
+        client.disconnect()
+
+
+@pytest.mark.describe("SharedNetworkLoop - .stop()")
+class TestSharedNetworkLoopStop:
+    @pytest.mark.it("Stops the network loop thread")
+    async def test_stops(self, network_loop, connector):
+        client = await connector.connect()
+        network_loop.run_client(client)
+        assert network_loop.running
+
+        network_loop.stop()
+
+        assert not network_loop.running
+
+    @pytest.mark.it("Cancels the Futures of clients still being serviced")
+    async def test_cancels(self, network_loop, connector):
+        client = await connector.connect()
+        done = network_loop.run_client(client)
+        await asyncio.wait_for(client.connected, 2)
+
+        network_loop.stop()
+        await asyncio.sleep(0.1)
+
+        assert done.cancelled()
+        assert len(network_loop) == 0
+
+    @pytest.mark.it("Can be restarted by servicing another client")
+    async def test_restart(self, network_loop, connector):
+        network_loop.run_client(await connector.connect())
+        network_loop.stop()
+
+        client = await connector.connect()
+        network_loop.run_client(client)
+
+        assert network_loop.running
+        assert await asyncio.wait_for(client.connected, 2) == mqtt.CONNACK_ACCEPTED
+
+    @pytest.mark.it("Does nothing if not running")
+    async def test_not_running(self, network_loop):
+        network_loop.stop()
+        assert not network_loop.running
+
+
+@pytest.mark.describe("SharedNetworkLoop - .close()")
+class TestSharedNetworkLoopClose:
+    @pytest.mark.it("Stops the network loop thread")
+    async def test_stops(self, network_loop, connector):
+        network_loop.run_client(await connector.connect())
+        assert network_loop.running
+
+        network_loop.close()
+
+        assert not network_loop.running
+
+    @pytest.mark.it("Releases the file descriptors used by the network loop")
+    async def test_releases_fds(self):
+        fds = set(os.listdir("/proc/self/fd"))
+        network_loop = SharedNetworkLoop()
+        network_loop.start()
+        network_loop.stop()
+        assert set(os.listdir("/proc/self/fd")) != fds
+
+        network_loop.close()
+
+        assert set(os.listdir("/proc/self/fd")) == fds
+
+    @pytest.mark.it("Prevents the network loop from being started again")
+    async def test_no_restart(self, network_loop, connector):
+        network_loop.close()
+
+        with pytest.raises(RuntimeError):
+            network_loop.start()
+        with pytest.raises(RuntimeError):
+            network_loop.run_client(await connector.connect())
+
+    @pytest.mark.it("Does nothing if already closed")
+    async def test_already_closed(self, network_loop):
+        network_loop.close()
+        network_loop.close()
+        assert not network_loop.running
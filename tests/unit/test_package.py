@@ -0,0 +1,118 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import pytest
+import subprocess
+import sys
+import azure.iot.device
+from azure.iot.device import (
+    iothub_session,
+    direct_method_dispatcher,
+    session_host,
+    iot_exceptions,
+    provisioning_session,
+    provisioning_exceptions,
+    mqtt_client,
+    models,
+)
+
+exports = [
+    pytest.param("IoTHubSession", iothub_session.IoTHubSession, id="IoTHubSession"),
+    pytest.param(
+        "DirectMethodDispatcher",
+        direct_method_dispatcher.DirectMethodDispatcher,
+        id="DirectMethodDispatcher",
+    ),
+    pytest.param("SessionHost", session_host.SessionHost, id="SessionHost"),
+    pytest.param("IoTHubError", iot_exceptions.IoTHubError, id="IoTHubError"),
+    pytest.param(
+        "ProvisioningSession", provisioning_session.ProvisioningSession, id="ProvisioningSession"
+    ),
+    pytest.param(
+        "ProvisioningServiceError",
+        provisioning_exceptions.ProvisioningServiceError,
+        id="ProvisioningServiceError",
+    ),
+    pytest.param("MQTTError", mqtt_client.MQTTError, id="MQTTError"),
+    pytest.param(
+        "MQTTConnectionFailedError",
+        mqtt_client.MQTTConnectionFailedError,
+        id="MQTTConnectionFailedError",
+    ),
+    pytest.param("Message", models.Message, id="Message"),
+    pytest.param("DirectMethodRequest", models.DirectMethodRequest, id="DirectMethodRequest"),
+    pytest.param("DirectMethodResponse", models.DirectMethodResponse, id="DirectMethodResponse"),
+    pytest.param("models", models, id="models"),
+]
+
+
+def modules_imported_by(statement):
+    """Return the modules imported by a statement in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", statement + "; import sys; print(' '.join(sys.modules))"],
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+    return output.decode("utf-8").split()
+
+
+@pytest.mark.describe("azure.iot.device - Package")
+class TestPackage:
+    @pytest.mark.it("Exposes the public API of the library as attributes")
+    @pytest.mark.parametrize("name, expected", exports)
+    def test_exports(self, name, expected):
+        assert getattr(azure.iot.device, name) is expected
+
+    @pytest.mark.it("Supports importing the public API of the library from the package")
+    @pytest.mark.parametrize("name, expected", exports)
+    def test_from_import(self, name, expected):
+        namespace = {}
+        exec("from azure.iot.device import {}".format(name), namespace)
+        assert namespace[name] is expected
+
+    @pytest.mark.it("Lists the public API of the library in __all__ and dir()")
+    @pytest.mark.parametrize("name, expected", exports)
+    def test_dir(self, name, expected):
+        assert name in azure.iot.device.__all__
+        assert name in dir(azure.iot.device)
+
+    @pytest.mark.it(
+        "Lists only the public API of the library in dir(), once each, whether or not it has been accessed"
+    )
+    def test_dir_public_only(self):
+        # Access (and thereby cache) some attributes, but not others
+        azure.iot.device.IoTHubSession
+        azure.iot.device.Message
+
+        names = dir(azure.iot.device)
+
+        assert len(names) == len(set(names))
+        assert [name for name in names if not name.startswith("__")] == sorted(
+            azure.iot.device.__all__
+        )
+        assert "__name__" in names
+
+    @pytest.mark.it("Raises AttributeError when accessing an attribute that does not exist")
+    def test_missing_attribute(self):
+        with pytest.raises(AttributeError):
+            azure.iot.device.NotARealAttribute
+
+    @pytest.mark.it("Does not import the library or its transports until they are accessed")
+    def test_lazy(self):
+        modules = modules_imported_by("import azure.iot.device")
+        assert "azure.iot.device" in modules
+        assert "azure.iot.device.iothub_session" not in modules
+        assert "azure.iot.device.provisioning_session" not in modules
+        assert "paho.mqtt.client" not in modules
+
+    @pytest.mark.it("Only imports the modules required by the attribute being accessed")
+    def test_lazy_partial(self):
+        modules = modules_imported_by("from azure.iot.device import ProvisioningSession")
+        assert "azure.iot.device.provisioning_session" in modules
+        assert "azure.iot.device.iothub_session" not in modules
+
+        modules = modules_imported_by("from azure.iot.device import Message, IoTHubError")
+        assert "azure.iot.device.models" in modules
+        assert "paho.mqtt.client" not in modules
@@ -24,7 +24,7 @@ from azure.iot.device.provisioning_mqtt_client import (
 )
 
 from azure.iot.device.provisioning_exceptions import ProvisioningServiceError
-from azure.iot.device import config, constant, user_agent
+from azure.iot.device import config, constant, metrics, user_agent
 from azure.iot.device import mqtt_client as mqtt
 from azure.iot.device import request_response as rr
 from azure.iot.device import mqtt_topic_provisioning as mqtt_topic
@@ -218,6 +218,8 @@ class TestProvisioningMQTTClientInstantiation:
             ssl_context=client_config.ssl_context,
             websockets_path=expected_ws_path,
             proxy_options=client_config.proxy_options,
+            network_loop=client_config.network_loop,
+            executor=client_config.executor,
         )
         assert client._mqtt_client is mock_constructor.return_value
 
@@ -1825,6 +1827,84 @@ class TestProvisioningMQTTClientConnected:
         assert result is client._mqtt_client.is_connected.return_value
 
 
+@pytest.mark.describe("ProvisioningMQTTClient - PROPERTY: .stats")
+class TestProvisioningMQTTClientStats:
+    @pytest.mark.it(
+        "Returns the stats of the MQTTClient, along with the number of requests awaiting a response"
+    )
+    async def test_stats(self, client):
+        client._mqtt_client.publish_count = 3
+        await client._request_ledger.create_request()
+
+        stats = client.stats
+        assert stats["publishes_sent"] == 3
+        assert stats["pending_requests"] == 1
+        for name in client._mqtt_client.stats:
+            assert name in stats
+
+
+@pytest.mark.describe("ProvisioningMQTTClient - Round Trip Times")
+class TestProvisioningMQTTClientRoundTripTimes:
+    @pytest.fixture
+    def mock_metrics_provider(self, mocker):
+        return mocker.MagicMock(spec=metrics.MetricsProvider)
+
+    @pytest.fixture
+    def client_config(self, client_config, mock_metrics_provider):
+        client_config.metrics_provider = mock_metrics_provider
+        return client_config
+
+    def respond_with_status(self, client, status):
+        async def fake_publish(topic, payload):
+            rid = topic[topic.rfind("$rid=") :].split("=")[1]
+            response_body_dict = {
+                "operationId": FAKE_OPERATION_ID,
+                "status": status,
+                "registrationState": {"registrationId": FAKE_REGISTRATION_ID},
+            }
+            response = rr.Response(
+                rid, 200 if status != "assigning" else 202, json.dumps(response_body_dict)
+            )
+            await client._request_ledger.match_response(response)
+
+        client._mqtt_client.publish.side_effect = fake_publish
+
+    @pytest.mark.it(
+        "Records the round trip time of a registration with the MetricsProvider, along with the registration id, once a result is received"
+    )
+    @pytest.mark.parametrize("status", ["assigned", "failed"])
+    async def test_register(self, mocker, client, mock_metrics_provider, status):
+        self.respond_with_status(client, status)
+
+        await client.send_register()
+
+        assert mock_metrics_provider.record_round_trip_time.call_count == 1
+        assert mock_metrics_provider.record_round_trip_time.call_args == mocker.call(
+            "registration", mocker.ANY, {"registration_id": FAKE_REGISTRATION_ID}
+        )
+        assert mock_metrics_provider.record_round_trip_time.call_args[0][1] >= 0
+
+    @pytest.mark.it(
+        "Includes the time spent polling in the round trip time of a registration that requires polling"
+    )
+    async def test_register_polling(self, mocker, client, mock_metrics_provider):
+        self.respond_with_status(client, "assigning")
+
+        async def fake_send_polling(operation_id):
+            # NOTE: No round trip time has been recorded before polling completes
+            assert mock_metrics_provider.record_round_trip_time.call_count == 0
+            await asyncio.sleep(0.1)
+            return {"status": "assigned"}
+
+        mocker.patch.object(client, "send_polling", side_effect=fake_send_polling)
+
+        await client.send_register()
+
+        assert mock_metrics_provider.record_round_trip_time.call_count == 1
+        assert mock_metrics_provider.record_round_trip_time.call_args[0][0] == "registration"
+        assert mock_metrics_provider.record_round_trip_time.call_args[0][1] >= 0.1
+
+
 @pytest.mark.describe("ProvisioningMQTTClient - BG TASK: ._process_dps_responses")
 class TestProvisioningMQTTClientProcessDPSResponses:
     response_payloads = [
@@ -5,7 +5,7 @@ import time
 from dev_utils import custom_mock
 from pytest_lazyfixture import lazy_fixture
 from azure.iot.device.provisioning_session import ProvisioningSession
-from azure.iot.device import config, provisioning_exceptions
+from azure.iot.device import config, metrics, provisioning_exceptions
 from azure.iot.device import provisioning_mqtt_client as mqtt
 from azure.iot.device import sastoken as st
 from azure.iot.device import signing_mechanism as sm
@@ -384,6 +384,28 @@ class TestProvisioningSessionInstantiation:
         cfg = spy_mqtt_cls.call_args[0][0]
         assert cfg.sastoken_provider is session._sastoken_provider
 
+    @pytest.mark.it(
+        "Stores the provided `metrics_provider` and sets it on the ProvisioningClientConfig used to create the ProvisioningMQTTClient"
+    )
+    @pytest.mark.parametrize("shared_access_key, sastoken_fn, ssl_context", create_auth_params)
+    async def test_metrics_provider_cfg(self, mocker, shared_access_key, sastoken_fn, ssl_context):
+        spy_mqtt_cls = mocker.spy(mqtt, "ProvisioningMQTTClient")
+        metrics_provider = metrics.MetricsProvider()
+
+        session = ProvisioningSession(
+            provisioning_host=FAKE_HOSTNAME,
+            registration_id=FAKE_REGISTRATION_ID,
+            id_scope=FAKE_ID_SCOPE,
+            shared_access_key=shared_access_key,
+            sastoken_fn=sastoken_fn,
+            ssl_context=ssl_context,
+            metrics_provider=metrics_provider,
+        )
+
+        cfg = spy_mqtt_cls.call_args[0][0]
+        assert cfg.metrics_provider is metrics_provider
+        assert session._metrics_provider is metrics_provider
+
     @pytest.mark.it(
         "Sets `auto_reconnect` to False on the ProvisioningClientConfig used to create the ProvisioningMQTTClient"
     )
@@ -623,6 +645,29 @@ class TestProvisioningSessionContextManager:
 
         # If nothing raises here, the test passes
 
+    @pytest.mark.it(
+        "Adds the Session as a source of the MetricsProvider upon entry into the context manager, and removes it upon exit, if one exists"
+    )
+    async def test_metrics_provider_source(self, mocker, custom_ssl_context):
+        mock_metrics_provider = mocker.MagicMock(spec=metrics.MetricsProvider)
+        session = ProvisioningSession(
+            provisioning_host=FAKE_HOSTNAME,
+            registration_id=FAKE_REGISTRATION_ID,
+            id_scope=FAKE_ID_SCOPE,
+            ssl_context=custom_ssl_context,
+            metrics_provider=mock_metrics_provider,
+        )
+
+        async with session as session:
+            assert mock_metrics_provider.add_source.call_count == 1
+            assert mock_metrics_provider.add_source.call_args == mocker.call(
+                {"registration_id": FAKE_REGISTRATION_ID}, session.get_metrics
+            )
+            assert mock_metrics_provider.remove_source.call_count == 0
+
+        assert mock_metrics_provider.remove_source.call_count == 1
+        assert mock_metrics_provider.remove_source.call_args == mocker.call(session.get_metrics)
+
     @pytest.mark.it(
         "Creates a Task from the MQTTClient's .wait_for_disconnect() coroutine method and stores it as the `wait_for_disconnect_task` attribute upon entry into the context manager, and cancels and clears the Task upon exit"
     )
@@ -1236,3 +1281,61 @@ class TestProvisioningSessionRegister:
         t.cancel()
         with pytest.raises(asyncio.CancelledError):
             await t
+
+    @pytest.mark.it(
+        "Invokes .send_register() on the ProvisioningMQTTClient within the calling Task, rather than creating a new Task"
+    )
+    async def test_no_additional_task(self, session):
+        operation_task = None
+
+        async def fake_send_register(payload):
+            nonlocal operation_task
+            operation_task = asyncio.current_task()
+
+        session._mqtt_client.send_register.side_effect = fake_send_register
+
+        t = asyncio.create_task(session.register())
+        await t
+        assert operation_task is t
+        assert len(session._pending_operations) == 0
+
+    @pytest.mark.it(
+        "Raises the error corresponding to a disconnect in every registration that is pending when the disconnect occurs"
+    )
+    async def test_disconnect_fails_all_pending(self, session):
+        session._mqtt_client.send_register = custom_mock.HangingAsyncMock()
+
+        tasks = [asyncio.create_task(session.register()) for _ in range(3)]
+        await session._mqtt_client.send_register.wait_for_hang()
+        await asyncio.sleep(0.1)
+        assert len(session._pending_operations) == 3
+
+        cause = mqtt.MQTTError(rc=7)
+        session._mqtt_client.wait_for_disconnect.return_value = cause
+        session._mqtt_client.wait_for_disconnect.stop_hanging()
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(result is cause for result in results)
+        assert len(session._pending_operations) == 0
+        assert len(session._interrupted_operations) == 0
+
+
+@pytest.mark.describe("ProvisioningSession - .get_metrics()")
+class TestProvisioningSessionGetMetrics:
+    @pytest.mark.it("Returns the stats of the ProvisioningMQTTClient")
+    async def test_mqtt_client_stats(self, disconnected_session):
+        disconnected_session._mqtt_client.stats = {"publishes_sent": 2, "pending_requests": 1}
+
+        assert disconnected_session.get_metrics() == {"publishes_sent": 2, "pending_requests": 1}
+
+    @pytest.mark.it("Includes the stats of the SasTokenProvider, if one exists")
+    async def test_sastoken_provider_stats(self, disconnected_session, mock_sastoken_provider):
+        disconnected_session._sastoken_provider = mock_sastoken_provider
+        disconnected_session._mqtt_client.stats = {"publishes_sent": 2}
+        mock_sastoken_provider.stats = {"token_refreshes": 0, "token_refresh_failures": 0}
+
+        assert disconnected_session.get_metrics() == {
+            "publishes_sent": 2,
+            "token_refreshes": 0,
+            "token_refresh_failures": 0,
+        }
@@ -7,6 +7,7 @@ import asyncio
 import pytest
 import uuid
 from azure.iot.device.request_response import Request, Response, RequestLedger
+from azure.iot.device import tracing
 
 fake_request_id = str(uuid.uuid4())
 fake_status = 200
@@ -256,3 +257,158 @@ class TestRequestLedger:
         await ledger.delete_request(req2.request_id)
         assert len(ledger) == 0
         assert req2.request_id not in ledger
+
+    @pytest.mark.it(
+        "Does not expire a Request created without a timeout via an invocation of .create_request()"
+    )
+    async def test_create_request_no_timeout(self, ledger):
+        req = await ledger.create_request()
+        assert ledger._expiry_timer is None
+        await asyncio.sleep(0.1)
+        assert req.request_id in ledger
+        assert not req.response_future.done()
+
+    @pytest.mark.it(
+        "Removes a Request created with a timeout from the ledger and sets an asyncio.TimeoutError on its response future once the timeout elapses"
+    )
+    async def test_create_request_timeout(self, ledger):
+        req = await ledger.create_request(timeout=0.05)
+        assert req.request_id in ledger
+        gr_task = asyncio.create_task(req.get_response())
+        await asyncio.sleep(0.1)
+        assert req.request_id not in ledger
+        assert gr_task.done()
+        with pytest.raises(asyncio.TimeoutError):
+            await gr_task
+        assert ledger.expired_count == 1
+
+    @pytest.mark.it(
+        "Expires multiple Requests in order of their deadlines, regardless of creation order"
+    )
+    async def test_expiry_order(self, ledger):
+        req1 = await ledger.create_request(timeout=0.3)
+        req2 = await ledger.create_request(timeout=0.05)
+        req3 = await ledger.create_request()
+        await asyncio.sleep(0.15)
+        assert req1.request_id in ledger
+        assert req2.request_id not in ledger
+        assert req3.request_id in ledger
+        await asyncio.sleep(0.25)
+        assert req1.request_id not in ledger
+        assert req3.request_id in ledger
+        assert isinstance(req1.response_future.exception(), asyncio.TimeoutError)
+        assert isinstance(req2.response_future.exception(), asyncio.TimeoutError)
+        assert ledger._expiry_timer is None
+
+    @pytest.mark.it(
+        "Does not expire a Request that was matched with a Response before its timeout elapsed"
+    )
+    async def test_matched_before_timeout(self, ledger):
+        req = await ledger.create_request(timeout=0.05)
+        resp = Response(request_id=req.request_id, status=fake_status, body=fake_body)
+        await ledger.match_response(resp)
+        await asyncio.sleep(0.1)
+        assert await req.get_response() is resp
+        assert ledger.expired_count == 0
+
+    @pytest.mark.it(
+        "Does not expire a new Request that reuses the request id of a deleted Request that had a timeout"
+    )
+    async def test_reused_request_id(self, ledger):
+        req_id = "3226c2f7-3d30-425c-b83b-0c34335f8220"
+        req1 = await ledger.create_request(request_id=req_id, timeout=0.05)
+        await ledger.delete_request(req1.request_id)
+        req2 = await ledger.create_request(request_id=req_id)
+        await asyncio.sleep(0.1)
+        assert req2.request_id in ledger
+        assert not req2.response_future.done()
+        assert ledger.expired_count == 0
+
+    @pytest.mark.it(
+        "Uses a single timer for expiry, rescheduling it only when a new Request has an earlier deadline"
+    )
+    async def test_single_timer(self, ledger):
+        await ledger.create_request(timeout=10)
+        timer1 = ledger._expiry_timer
+        assert timer1 is not None
+        await ledger.create_request(timeout=20)
+        assert ledger._expiry_timer is timer1
+        await ledger.create_request(timeout=5)
+        timer2 = ledger._expiry_timer
+        assert timer2 is not timer1
+        assert timer1.cancelled()
+        assert not timer2.cancelled()
+        timer2.cancel()
+
+    @pytest.mark.it(
+        "Discards deadlines of Requests that are no longer in the ledger once they outnumber the pending Requests"
+    )
+    async def test_deadline_compaction(self, ledger):
+        for _ in range(500):
+            req = await ledger.create_request(timeout=10)
+            await ledger.delete_request(req.request_id)
+        assert len(ledger) == 0
+        assert len(ledger._deadlines) <= 2 * len(ledger) + 65
+        ledger._expiry_timer.cancel()
+
+    @pytest.mark.it("Tracks metrics about the Requests in the ledger")
+    async def test_stats(self, ledger):
+        req1 = await ledger.create_request()
+        await ledger.create_request()
+        await ledger.create_request(timeout=0.05)
+        assert ledger.stats["outstanding"] == 3
+        assert ledger.stats["peak_outstanding"] == 3
+
+        await ledger.match_response(
+            Response(request_id=req1.request_id, status=fake_status, body=fake_body)
+        )
+        await asyncio.sleep(0.1)
+        assert ledger.stats == {
+            "outstanding": 1,
+            "peak_outstanding": 3,
+            "created": 3,
+            "matched": 1,
+            "expired": 1,
+        }
+
+    @pytest.mark.it(
+        "Sets the request id on the current span when creating a Request, and adds an event with the status when its Response is matched"
+    )
+    async def test_tracing(self, mocker, ledger):
+        span = mocker.MagicMock(spec=tracing.Span)
+        with tracing.use_span(span):
+            req = await ledger.create_request()
+        assert span.set_attribute.call_args == mocker.call(
+            tracing.ATTRIBUTE_REQUEST_ID, req.request_id
+        )
+        assert span.add_event.call_count == 0
+
+        # The span is not current where the response is received
+        await ledger.match_response(
+            Response(request_id=req.request_id, status=fake_status, body=fake_body)
+        )
+
+        assert span.add_event.call_args == mocker.call(
+            tracing.EVENT_RESPONSE, {tracing.ATTRIBUTE_RESPONSE_STATUS: fake_status}
+        )
+        assert ledger._spans == {}
+
+    @pytest.mark.it("Does not retain the span of a Request that is deleted or expires")
+    async def test_tracing_cleanup(self, mocker, ledger):
+        span = mocker.MagicMock(spec=tracing.Span)
+        with tracing.use_span(span):
+            req1 = await ledger.create_request()
+            await ledger.create_request(timeout=0.05)
+        assert len(ledger._spans) == 2
+
+        await ledger.delete_request(req1.request_id)
+        await asyncio.sleep(0.1)
+
+        assert ledger._spans == {}
+        assert span.add_event.call_count == 0
+
+    @pytest.mark.it("Does not track spans if there is no current span")
+    async def test_tracing_no_span(self, ledger):
+        await ledger.create_request()
+
+        assert ledger._spans == {}
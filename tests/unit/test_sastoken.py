@@ -6,8 +6,8 @@
 
 import asyncio
 import logging
+import os
 import pytest
-import sys
 import time
 import urllib.parse
 from pytest_lazyfixture import lazy_fixture
@@ -15,10 +15,14 @@ from azure.iot.device.sastoken import (
     SasToken,
     InternalSasTokenGenerator,
     ExternalSasTokenGenerator,
+    SasTokenCache,
     SasTokenProvider,
+    SasTokenRefreshScheduler,
     SasTokenError,
     TOKEN_FORMAT,
     DEFAULT_TOKEN_UPDATE_MARGIN,
+    MAX_TIMER_DELAY,
+    MIN_UPDATE_INTERVAL,
 )
 from azure.iot.device import sastoken as st
 
@@ -326,6 +330,116 @@ class TestExternalSasTokenGeneratorGenerateSasToken:
         assert isinstance(e_info.value.__cause__, ValueError)
 
 
+@pytest.mark.describe("SasTokenCache")
+class TestSasTokenCache:
+    @pytest.fixture
+    def cache_dir(self, tmp_path):
+        return str(tmp_path / "cache")
+
+    @pytest.fixture
+    def cache(self, cache_dir):
+        return SasTokenCache(cache_dir, FAKE_URI, identity="fake_identity")
+
+    @pytest.mark.it("Returns None upon load if no SasToken has been stored")
+    def test_load_empty(self, cache):
+        assert cache.load(min_expiry_time=time.time()) is None
+
+    @pytest.mark.it("Returns the stored SasToken upon load, including from another SasTokenCache")
+    def test_round_trip(self, cache, cache_dir, sastoken):
+        cache.store(sastoken)
+
+        loaded = SasTokenCache(cache_dir, FAKE_URI, identity="fake_identity").load(
+            min_expiry_time=time.time()
+        )
+
+        assert isinstance(loaded, SasToken)
+        assert str(loaded) == str(sastoken)
+
+    @pytest.mark.it("Replaces the stored SasToken upon each store")
+    def test_replace(self, cache):
+        for signature in (FAKE_SIGNED_DATA, FAKE_SIGNED_DATA2):
+            cache.store(
+                SasToken(
+                    TOKEN_FORMAT.format(
+                        resource=urllib.parse.quote(FAKE_URI, safe=""),
+                        signature=urllib.parse.quote(signature, safe=""),
+                        expiry=get_expiry_time(),
+                    )
+                )
+            )
+
+        assert cache.load(min_expiry_time=time.time()).signature == FAKE_SIGNED_DATA2
+
+    @pytest.mark.it("Returns None upon load if the stored SasToken expires before the given time")
+    def test_load_expiry(self, cache, sastoken):
+        cache.store(sastoken)
+
+        assert cache.load(min_expiry_time=sastoken.expiry_time) is not None
+        assert cache.load(min_expiry_time=sastoken.expiry_time + 1) is None
+
+    @pytest.mark.it(
+        "Keys the stored SasToken by resource URI and identity, without revealing either in the file name"
+    )
+    def test_key(self, cache, cache_dir, sastoken):
+        cache.store(sastoken)
+
+        other_identity = SasTokenCache(cache_dir, FAKE_URI, identity="other_identity")
+        other_uri = SasTokenCache(cache_dir, "other/resource", identity="fake_identity")
+        assert other_identity.load(min_expiry_time=time.time()) is None
+        assert other_uri.load(min_expiry_time=time.time()) is None
+        assert len({cache.path, other_identity.path, other_uri.path}) == 3
+        (filename,) = os.listdir(cache_dir)
+        assert "resource" not in filename
+        assert "fake_identity" not in filename
+
+    @pytest.mark.it(
+        "Returns None upon load if the stored SasToken is for a different resource URI than the SasTokenCache"
+    )
+    def test_load_wrong_uri(self, cache_dir, sastoken):
+        SasTokenCache(cache_dir, "other/resource").store(sastoken)
+
+        assert SasTokenCache(cache_dir, "other/resource").load(min_expiry_time=time.time()) is None
+
+    @pytest.mark.it(
+        "Creates the directory (accessible only by its owner) and stores the SasToken in a file accessible only by its owner"
+    )
+    @pytest.mark.skipif(os.name != "posix", reason="Requires POSIX permissions")
+    def test_permissions(self, cache, cache_dir, sastoken):
+        cache.store(sastoken)
+
+        assert os.stat(cache_dir).st_mode & 0o777 == 0o700
+        assert os.stat(cache.path).st_mode & 0o777 == 0o600
+        # No temporary file left behind
+        assert os.listdir(cache_dir) == [os.path.basename(cache.path)]
+
+    @pytest.mark.it("Returns None upon load if the file can be accessed by other users")
+    @pytest.mark.skipif(os.name != "posix", reason="Requires POSIX permissions")
+    def test_load_permissions(self, cache, sastoken):
+        cache.store(sastoken)
+        os.chmod(cache.path, 0o644)
+
+        assert cache.load(min_expiry_time=time.time()) is None
+
+    @pytest.mark.it("Returns None upon load if the file does not contain a valid SasToken")
+    def test_load_invalid(self, cache, cache_dir, sastoken):
+        cache.store(sastoken)
+        with open(cache.path, "w") as f:
+            f.write("not a sastoken")
+
+        assert cache.load(min_expiry_time=time.time()) is None
+
+    @pytest.mark.it("Does not raise if the SasToken cannot be stored")
+    def test_store_fails(self, tmp_path, sastoken):
+        # The directory cannot be created, since a file is in the way
+        blocker = tmp_path / "blocker"
+        blocker.write_text("")
+        cache = SasTokenCache(str(blocker / "cache"), FAKE_URI)
+
+        cache.store(sastoken)
+
+        assert cache.load(min_expiry_time=time.time()) is None
+
+
 @pytest.mark.describe("SasTokenProvider -- Instantiation")
 class TestSasTokenProviderInstantiation:
     @pytest.mark.it("Stores the provided SasTokenGenerator")
@@ -333,6 +447,18 @@ class TestSasTokenProviderInstantiation:
         provider = SasTokenProvider(sastoken_generator)
         assert provider._generator is sastoken_generator
 
+    @pytest.mark.it("Stores the provided SasTokenRefreshScheduler, if provided")
+    async def test_refresh_scheduler(self, sastoken_generator):
+        scheduler = SasTokenRefreshScheduler()
+        provider = SasTokenProvider(sastoken_generator, refresh_scheduler=scheduler)
+        assert provider._refresh_scheduler is scheduler
+
+    @pytest.mark.it("Stores the provided SasTokenCache, if provided")
+    async def test_cache(self, tmp_path, sastoken_generator):
+        cache = SasTokenCache(str(tmp_path), FAKE_URI)
+        provider = SasTokenProvider(sastoken_generator, cache=cache)
+        assert provider._cache is cache
+
     @pytest.mark.it("Sets the token update margin to the DEFAULT_TOKEN_UPDATE_MARGIN")
     async def test_token_update_margin(self, sastoken, sastoken_generator):
         provider = SasTokenProvider(sastoken_generator)
@@ -343,10 +469,25 @@ class TestSasTokenProviderInstantiation:
         provider = SasTokenProvider(sastoken_generator)
         assert provider._current_token is None
 
-    @pytest.mark.it("Sets the 'keep token fresh' background task attribute to None")
-    async def test_background_task(self, sastoken_generator):
-        provider = SasTokenProvider(sastoken_generator)
-        assert provider._keep_token_fresh_bg_task is None
+    @pytest.mark.it(
+        "Uses the default SasTokenRefreshScheduler of the running event loop, if no SasTokenRefreshScheduler is provided"
+    )
+    async def test_default_refresh_scheduler(self, sastoken_generator):
+        provider1 = SasTokenProvider(sastoken_generator)
+        provider2 = SasTokenProvider(sastoken_generator)
+
+        assert isinstance(provider1._refresh_scheduler, SasTokenRefreshScheduler)
+        assert provider2._refresh_scheduler is provider1._refresh_scheduler
+
+    @pytest.mark.it("Uses a different default SasTokenRefreshScheduler in each event loop")
+    def test_default_refresh_scheduler_per_loop(self, sastoken_generator):
+        async def get_refresh_scheduler():
+            return SasTokenProvider(sastoken_generator)._refresh_scheduler
+
+        scheduler1 = asyncio.run(get_refresh_scheduler())
+        scheduler2 = asyncio.run(get_refresh_scheduler())
+
+        assert scheduler1 is not scheduler2
 
 
 @pytest.mark.describe("SasTokenProvider - .start()")
@@ -408,61 +549,117 @@ class TestSasTokenProviderStart:
         with pytest.raises(SasTokenError):
             await provider.start()
 
-    # NOTE: The contents of this coroutine are tested in a separate test suite below.
-    # See TestSasTokenProviderKeepTokenFresh for more.
-    @pytest.mark.it("Begins running the ._keep_token_fresh() coroutine method, storing the task")
-    async def test_keep_token_fresh_running(self, sastoken_generator):
-        provider = SasTokenProvider(sastoken_generator)
-        assert provider._keep_token_fresh_bg_task is None
+    @pytest.mark.it(
+        "Schedules an update of the SasToken with the SasTokenRefreshScheduler, for the configured update margin number of seconds before the expiry of the SasToken"
+    )
+    async def test_refresh_scheduler(self, mocker, sastoken_generator):
+        scheduler = mocker.MagicMock(spec=SasTokenRefreshScheduler)
+        provider = SasTokenProvider(sastoken_generator, refresh_scheduler=scheduler)
 
         await provider.start()
 
-        assert isinstance(provider._keep_token_fresh_bg_task, asyncio.Task)
-        assert not provider._keep_token_fresh_bg_task.done()
-        if sys.version_info >= (3, 8):
-            # NOTE: There isn't a way to validate the contents of a task until 3.8
-            # as far as I can tell.
-            task_coro = provider._keep_token_fresh_bg_task.get_coro()
-            assert task_coro.__qualname__ == "SasTokenProvider._keep_token_fresh"
+        expected_update_time = provider._current_token.expiry_time - provider._token_update_margin
+        assert scheduler.schedule.call_count == 1
+        assert scheduler.schedule.call_args == mocker.call(provider, expected_update_time)
+
+    @pytest.mark.it(
+        "Uses the SasToken loaded from the SasTokenCache as the current token rather than generating one, if it remains valid for longer than the token update margin"
+    )
+    async def test_cache_hit(self, mocker, sastoken_generator, sastoken):
+        cache = mocker.MagicMock(spec=SasTokenCache)
+        cache.load.return_value = sastoken
+        provider = SasTokenProvider(sastoken_generator, cache=cache)
+        mocker.patch.object(time, "time", return_value=FAKE_CURRENT_TIME)
+
+        await provider.start()
+
+        assert cache.load.call_args == mocker.call(
+            min_expiry_time=FAKE_CURRENT_TIME + provider._token_update_margin
+        )
+        assert sastoken_generator.generate_sastoken.await_count == 0
+        assert provider._current_token is sastoken
+        assert cache.store.call_count == 0
+
+        # Cleanup
+        await provider.stop()
+
+    @pytest.mark.it(
+        "Generates a new SasToken and stores it in the SasTokenCache, if the SasTokenCache has no valid SasToken"
+    )
+    async def test_cache_miss(self, mocker, sastoken_generator):
+        cache = mocker.MagicMock(spec=SasTokenCache)
+        cache.load.return_value = None
+        provider = SasTokenProvider(sastoken_generator, cache=cache)
+
+        await provider.start()
+
+        assert sastoken_generator.generate_sastoken.await_count == 1
+        assert cache.store.call_count == 1
+        assert cache.store.call_args == mocker.call(provider._current_token)
 
         # Cleanup
         await provider.stop()
 
+    @pytest.mark.it(
+        "Reuses the SasToken stored by a previous SasTokenProvider with a SasTokenCache of the same directory, resource URI and identity"
+    )
+    async def test_cache_restart(self, tmp_path, sastoken_generator):
+        provider1 = SasTokenProvider(
+            sastoken_generator, cache=SasTokenCache(str(tmp_path), FAKE_URI, "fake_identity")
+        )
+        await provider1.start()
+        token = provider1.get_current_sastoken()
+        await provider1.stop()
+
+        provider2 = SasTokenProvider(
+            sastoken_generator, cache=SasTokenCache(str(tmp_path), FAKE_URI, "fake_identity")
+        )
+        await provider2.start()
+
+        assert sastoken_generator.generate_sastoken.await_count == 1
+        assert str(provider2.get_current_sastoken()) == str(token)
+
+        # Cleanup
+        await provider2.stop()
+
     @pytest.mark.it("Does nothing if already started")
-    async def test_already_started(self, sastoken_generator):
-        provider = SasTokenProvider(sastoken_generator)
+    async def test_already_started(self, mocker, sastoken_generator):
+        scheduler = mocker.MagicMock(spec=SasTokenRefreshScheduler)
+        provider = SasTokenProvider(sastoken_generator, refresh_scheduler=scheduler)
 
         # Start
         await provider.start()
-
-        # Expected state
-        assert isinstance(provider._keep_token_fresh_bg_task, asyncio.Task)
-        assert not provider._keep_token_fresh_bg_task.done()
-        current_keep_token_fresh_bg_task = provider._keep_token_fresh_bg_task
+        current_token = provider._current_token
+        assert scheduler.schedule.call_count == 1
         assert sastoken_generator.generate_sastoken.await_count == 1
 
         # Start again
         await provider.start()
 
         # No changes
-        assert provider._keep_token_fresh_bg_task is current_keep_token_fresh_bg_task
-        assert not provider._keep_token_fresh_bg_task.done()
+        assert provider._current_token is current_token
+        assert scheduler.schedule.call_count == 1
         assert sastoken_generator.generate_sastoken.await_count == 1
 
 
 @pytest.mark.describe("SasTokenProvider - .stop()")
 class TestSasTokenProviderShutdown:
-    @pytest.mark.it("Cancels the stored ._keep_token_fresh() task and removes it, if it exists")
-    async def test_cancels_keep_token_fresh(self, sastoken_provider):
-        t = sastoken_provider._keep_token_fresh_bg_task
-        assert isinstance(t, asyncio.Task)
-        assert not t.done()
+    @pytest.mark.it("Unschedules updates of the SasToken with the SasTokenRefreshScheduler")
+    async def test_refresh_scheduler(self, mocker, sastoken_generator):
+        scheduler = mocker.MagicMock(spec=SasTokenRefreshScheduler)
+        provider = SasTokenProvider(sastoken_generator, refresh_scheduler=scheduler)
+        await provider.start()
+        assert scheduler.unschedule.await_count == 0
 
-        await sastoken_provider.stop()
+        await provider.stop()
 
-        assert t.done()
-        assert t.cancelled()
-        assert sastoken_provider._keep_token_fresh_bg_task is None
+        assert scheduler.unschedule.await_count == 1
+        assert scheduler.unschedule.await_args == mocker.call(provider)
+        assert provider._current_token is None
+
+        # Stop again does nothing
+        await provider.stop()
+        assert scheduler.unschedule.await_count == 1
 
     @pytest.mark.it("Sets the current token back to None")
     async def test_current_token(self, sastoken_provider):
@@ -473,25 +670,22 @@ class TestSasTokenProviderShutdown:
         assert sastoken_provider._current_token is None
 
     @pytest.mark.it("Does nothing if already stopped")
-    async def test_already_stopped(self, sastoken_provider):
-        # Currently running
-        t = sastoken_provider._keep_token_fresh_bg_task
-        assert not t.done()
+    async def test_already_stopped(self, mocker, sastoken_provider):
+        spy_unschedule = mocker.spy(sastoken_provider._refresh_scheduler, "unschedule")
 
         # Stop
         await sastoken_provider.stop()
 
         # Expected state
-        assert t.done()
-        assert t.cancelled()
-        assert sastoken_provider._keep_token_fresh_bg_task is None
+        assert spy_unschedule.await_count == 1
+        assert sastoken_provider not in sastoken_provider._refresh_scheduler._scheduled_entries
         assert sastoken_provider._current_token is None
 
         # Stop again
         await sastoken_provider.stop()
 
         # No changes
-        assert sastoken_provider._keep_token_fresh_bg_task is None
+        assert spy_unschedule.await_count == 1
         assert sastoken_provider._current_token is None
 
 
@@ -499,7 +693,7 @@ class TestSasTokenProviderShutdown:
 class TestSasTokenGetCurrentSasToken:
     @pytest.mark.it("Returns the current SasToken object, if running")
     def test_returns_current_token(self, sastoken_provider):
-        assert sastoken_provider._keep_token_fresh_bg_task is not None
+        assert sastoken_provider._refresh_scheduled
         current_token = sastoken_provider.get_current_sastoken()
         assert current_token is sastoken_provider._current_token
         new_token_str = TOKEN_FORMAT.format(
@@ -514,7 +708,7 @@ class TestSasTokenGetCurrentSasToken:
     @pytest.mark.it("Raises RuntimeError if not running (i.e. not started)")
     async def test_not_running(self, sastoken_generator):
         provider = SasTokenProvider(sastoken_generator)
-        assert provider._keep_token_fresh_bg_task is None
+        assert not provider._refresh_scheduled
         with pytest.raises(RuntimeError):
             provider.get_current_sastoken()
 
@@ -562,161 +756,54 @@ class TestSasTokenWaitForNewSasToken:
         assert returned_token is sastoken_provider.get_current_sastoken()
 
 
-# NOTE: This test suite assumes the correct implementation of ._wait_until() for critical
-# requirements. Find it tested in a separate suite below (TestWaitUntil)
-@pytest.mark.describe("SasTokenProvider - BG TASK: ._keep_token_fresh")
-class TestSasTokenProviderKeepTokenFresh:
-    @pytest.fixture(autouse=True)
-    def spy_time(self, mocker):
-        """Spy on the time module so that we can find out last time that was returned"""
-        spy_time = mocker.spy(time, "time")
-        return spy_time
-
-    # NOTE: This is an autouse fixture to ensure that it gets called first, since we want to make sure
-    # this mock is running when the SasTokenProvider is created.
-    @pytest.fixture(autouse=True)
-    def mock_wait_until(self, mocker):
-        """Mock out the wait_until function so these tests aren't dependent on real time passing"""
-        mock_wait_until = mocker.patch.object(st, "_wait_until")
-        mock_wait_until._allow_proceed = asyncio.Event()
-
-        # Fake implementation that will wait for an explicit trigger to proceed, rather than the
-        # passage of time
-        async def fake_wait_until(when):
-            await mock_wait_until._allow_proceed.wait()
-
-        mock_wait_until.side_effect = fake_wait_until
-
-        # Define a mechanism that will allow an explicit trigger to let the mocked coroutine return
-        def proceed():
-            mock_wait_until._allow_proceed.set()
-            mock_wait_until._allow_proceed = asyncio.Event()
-
-        mock_wait_until.proceed = proceed
+@pytest.mark.describe("SasTokenProvider - ._update_token()")
+class TestSasTokenProviderUpdateToken:
+    @pytest.mark.it("Generates a new SasToken using the stored SasTokenGenerator")
+    async def test_generate(self, mocker, sastoken_provider):
+        assert sastoken_provider._generator.generate_sastoken.await_count == 0
 
-        return mock_wait_until
+        await sastoken_provider._update_token()
 
-    @pytest.mark.it(
-        "Waits until the configured update margin number of seconds before current SasToken expiry to generate a new SasToken"
-    )
-    async def test_wait_to_generate(self, mocker, mock_wait_until, sastoken_provider):
-        original_token = sastoken_provider.get_current_sastoken()
-        assert sastoken_provider._generator.generate_sastoken.await_count == 0
-        await asyncio.sleep(0.1)
-        # We are waiting the expected amount of time
-        expected_update_time = original_token.expiry_time - sastoken_provider._token_update_margin
-        assert mock_wait_until.await_count == 1
-        assert mock_wait_until.await_args == mocker.call(expected_update_time)
-        # Allow the waiting to end, and a new token to be generated
-        mock_wait_until.proceed()
-        await asyncio.sleep(0.1)
         assert sastoken_provider._generator.generate_sastoken.await_count == 1
         assert sastoken_provider._generator.generate_sastoken.await_args == mocker.call()
 
     @pytest.mark.it(
         "Sets the newly generated SasToken as the new current SasToken and sends notification of its availability"
     )
-    async def test_replace_token_and_notify(self, mocker, sastoken_provider, mock_wait_until):
+    async def test_replace_token_and_notify(self, mocker, sastoken_provider):
         notification_spy = mocker.spy(sastoken_provider._new_sastoken_available, "notify_all")
-        # We have the original token, as we have not yet generated a new one
         original_token = sastoken_provider.get_current_sastoken()
-        assert sastoken_provider._generator.generate_sastoken.await_count == 0
-        assert notification_spy.call_count == 0
-        # Allow waiting to proceed, and a new token to be generated
-        mock_wait_until.proceed()
-        await asyncio.sleep(0.1)
-        # A new token has now been generated
-        assert sastoken_provider._generator.generate_sastoken.await_count == 1
-        # The current token is now the token that was just generated
+
+        await sastoken_provider._update_token()
+
         current_token = sastoken_provider.get_current_sastoken()
         assert current_token is sastoken_provider._generator.generate_sastoken.spy_return
-        # This token is not the same as the original token
         assert current_token is not original_token
-        # A notification was sent about the new token
         assert notification_spy.call_count == 1
 
+    @pytest.mark.it("Stores the newly generated SasToken in the SasTokenCache, if there is one")
+    async def test_cache(self, mocker, sastoken_provider):
+        sastoken_provider._cache = mocker.MagicMock(spec=SasTokenCache)
+
+        await sastoken_provider._update_token()
+
+        assert sastoken_provider._cache.store.call_count == 1
+        assert sastoken_provider._cache.store.call_args == mocker.call(
+            sastoken_provider.get_current_sastoken()
+        )
+
     @pytest.mark.it(
-        "Waits until the configured update margin number of seconds before the NEW current SasToken expiry, after each time a new SasToken is generated, before once again generating a new SasToken"
+        "Returns the time to generate the next SasToken at, which is the configured update margin number of seconds before the expiry of the new SasToken"
     )
-    async def test_wait_to_generate_again_and_again(
-        self, mocker, mock_wait_until, sastoken_provider
-    ):
-        # Current token is the original, we have not yet generated a new one
-        original_token = sastoken_provider.get_current_sastoken()
-        assert sastoken_provider._generator.generate_sastoken.await_count == 0
-        await asyncio.sleep(0.1)
-        # We are waiting based on the original token's expiry time
-        expected_update_time = original_token.expiry_time - sastoken_provider._token_update_margin
-        assert mock_wait_until.await_count == 1
-        assert mock_wait_until.await_args == mocker.call(expected_update_time)
-        # Allow the waiting to end, and a new token to be generated
-        mock_wait_until.proceed()
-        await asyncio.sleep(0.1)
-        assert sastoken_provider._generator.generate_sastoken.await_count == 1
-        assert sastoken_provider._generator.generate_sastoken.await_args == mocker.call()
-        # New token is the one that was just generated
+    async def test_next_generate_time(self, sastoken_provider):
+        generate_time = await sastoken_provider._update_token()
+
         new_token = sastoken_provider.get_current_sastoken()
-        assert new_token is sastoken_provider._generator.generate_sastoken.spy_return
-        assert new_token is not original_token
-        # We are once again waiting, this time based on the new token's expiry time
-        expected_update_time = new_token.expiry_time - sastoken_provider._token_update_margin
-        assert mock_wait_until.await_count == 2
-        assert mock_wait_until.await_args == mocker.call(expected_update_time)
-        # Allow the waiting to end and another new token to be generated
-        mock_wait_until.proceed()
-        await asyncio.sleep(0.1)
-        assert sastoken_provider._generator.generate_sastoken.await_count == 2
-        assert sastoken_provider._generator.generate_sastoken.await_args == mocker.call()
-        # Newest token is the one that was just generated
-        newest_token = sastoken_provider.get_current_sastoken()
-        assert newest_token is sastoken_provider._generator.generate_sastoken.spy_return
-        assert newest_token is not original_token
-        assert newest_token is not new_token
-        # We are once again waiting, this time based on the newest token's expiry time
-        expected_update_time = newest_token.expiry_time - sastoken_provider._token_update_margin
-        assert mock_wait_until.await_count == 3
-        assert mock_wait_until.await_args == mocker.call(expected_update_time)
-        # And so on and so forth to infinity...
+        assert generate_time == new_token.expiry_time - sastoken_provider._token_update_margin
 
     @pytest.mark.it(
-        "Sets the newly generated SasToken as the new current SasToken and sends notification of its availability each time a new token is generated"
+        "Returns a time 10 seconds from now, and keeps the current SasToken, if SasToken generation fails"
     )
-    async def test_replace_token_and_notify_each_time(
-        self, mocker, sastoken_provider, mock_wait_until
-    ):
-        notification_spy = mocker.spy(sastoken_provider._new_sastoken_available, "notify_all")
-        # We have the original token, as we have not yet generated a new one
-        original_token = sastoken_provider.get_current_sastoken()
-        assert sastoken_provider._generator.generate_sastoken.await_count == 0
-        assert notification_spy.call_count == 0
-        # Allow waiting to proceed, and a new token to be generated
-        mock_wait_until.proceed()
-        await asyncio.sleep(0.1)
-        # A new token has now been generated
-        assert sastoken_provider._generator.generate_sastoken.await_count == 1
-        # The current token is now the token that was just generated
-        second_token = sastoken_provider.get_current_sastoken()
-        assert second_token is sastoken_provider._generator.generate_sastoken.spy_return
-        # This token is not the same as the original token
-        assert second_token is not original_token
-        # A notification was sent about the new token
-        assert notification_spy.call_count == 1
-        # Allow waiting to proceed and another new token to be generated
-        mock_wait_until.proceed()
-        await asyncio.sleep(0.1)
-        # Another new token has now been generated
-        assert sastoken_provider._generator.generate_sastoken.await_count == 2
-        # The current token is now the token that was just generated
-        third_token = sastoken_provider.get_current_sastoken()
-        assert third_token is sastoken_provider._generator.generate_sastoken.spy_return
-        # This token is not the same as any previous token
-        assert third_token is not original_token
-        assert third_token is not second_token
-        # A notification was sent about the new token
-        assert notification_spy.call_count == 2
-        # And so on and so forth to infinity...
-
-    @pytest.mark.it("Tries to generate again in 10 seconds if SasToken generation fails")
     @pytest.mark.parametrize(
         "exception",
         [
@@ -724,62 +811,261 @@ class TestSasTokenProviderKeepTokenFresh:
             pytest.param(lazy_fixture("arbitrary_exception"), id="Unexpected Exception"),
         ],
     )
-    async def test_generation_failure(
-        self, mocker, sastoken_provider, exception, mock_wait_until, spy_time
-    ):
-        # Set token generation to raise exception
+    async def test_generation_failure(self, mocker, sastoken_provider, exception):
+        spy_time = mocker.spy(time, "time")
         sastoken_provider._generator.generate_sastoken.side_effect = exception
-        # Token generation has not yet happened
-        assert sastoken_provider._generator.generate_sastoken.await_count == 0
-        # Allow waiting to proceed, and a new token to be generated
-        assert mock_wait_until.await_count == 1
-        mock_wait_until.proceed()
+        original_token = sastoken_provider.get_current_sastoken()
+
+        generate_time = await sastoken_provider._update_token()
+
+        assert generate_time == spy_time.spy_return + 10
+        assert sastoken_provider.get_current_sastoken() is original_token
+
+    @pytest.mark.it("Counts each successful and failed attempt to generate a new SasToken")
+    async def test_stats(self, sastoken_provider, arbitrary_exception):
+        # The initial token does not count as a refresh
+        assert sastoken_provider.stats == {"token_refreshes": 0, "token_refresh_failures": 0}
+        await sastoken_provider._update_token()
+        assert sastoken_provider.stats == {"token_refreshes": 1, "token_refresh_failures": 0}
+        sastoken_provider._generator.generate_sastoken.side_effect = arbitrary_exception
+        await sastoken_provider._update_token()
+        assert sastoken_provider.stats == {"token_refreshes": 1, "token_refresh_failures": 1}
+
+
+@pytest.mark.describe("SasTokenRefreshScheduler")
+class TestSasTokenRefreshScheduler:
+    @pytest.fixture
+    async def scheduler(self):
+        scheduler = SasTokenRefreshScheduler()
+        yield scheduler
+        await scheduler.stop()
+
+    @pytest.fixture
+    async def provider(self, sastoken_generator):
+        return SasTokenProvider(sastoken_generator)
+
+    @pytest.mark.it("Does not set a timer if no updates are scheduled")
+    async def test_no_timer(self, scheduler):
+        assert scheduler._timer is None
+
+    @pytest.mark.it("Sets a single timer for the earliest scheduled update")
+    async def test_timer(self, scheduler, sastoken_generator):
+        loop = asyncio.get_running_loop()
+        scheduler.schedule(SasTokenProvider(sastoken_generator), time.time() + 30)
+        timer = scheduler._timer
+        assert isinstance(timer, asyncio.TimerHandle)
+        assert timer.when() == pytest.approx(loop.time() + 30, abs=0.1)
+
+        # A later update does not replace the timer
+        scheduler.schedule(SasTokenProvider(sastoken_generator), time.time() + 40)
+        assert scheduler._timer is timer
+
+        # An earlier update does
+        scheduler.schedule(SasTokenProvider(sastoken_generator), time.time() + 20)
+        assert timer.cancelled()
+        assert scheduler._timer.when() == pytest.approx(loop.time() + 20, abs=0.1)
+
+    @pytest.mark.it(
+        "Sets the timer for no more than MAX_TIMER_DELAY seconds, even if the update is scheduled later"
+    )
+    async def test_timer_max_delay(self, scheduler, provider):
+        loop = asyncio.get_running_loop()
+
+        scheduler.schedule(provider, time.time() + 3600)
+
+        assert scheduler._timer.when() == pytest.approx(loop.time() + MAX_TIMER_DELAY, abs=0.1)
+
+    @pytest.mark.it("Updates the SasToken of a scheduled SasTokenProvider at the scheduled time")
+    async def test_update(self, mocker, scheduler, provider):
+        notification_spy = mocker.spy(provider._new_sastoken_available, "notify_all")
+        scheduler.schedule(provider, time.time() + 0.1)
+
+        await asyncio.sleep(0.05)
+        assert provider._generator.generate_sastoken.await_count == 0
+        await asyncio.sleep(0.1)
+
+        assert provider._generator.generate_sastoken.await_count == 1
+        assert provider._current_token is provider._generator.generate_sastoken.spy_return
+        assert notification_spy.call_count == 1
+
+    @pytest.mark.it("Does not update the SasToken of a SasTokenProvider before the scheduled time")
+    async def test_not_due(self, scheduler, provider):
+        scheduler.schedule(provider, time.time() + 3600)
+
         await asyncio.sleep(0.1)
-        # Waits 10 seconds past the current time
-        expected_generate_time = spy_time.spy_return + 10
-        assert mock_wait_until.await_count == 2
-        assert mock_wait_until.await_args == mocker.call(expected_generate_time)
 
+        assert provider._generator.generate_sastoken.await_count == 0
 
-# NOTE: We don't normally test convention-private helpers directly, but in this case, the
-# complexity is high enough, and the function is critical enough, that it makes more sense
-# to isolate rather than attempting to indirectly test.
-@pytest.mark.describe("._wait_until()")
-class TestWaitUntil:
     @pytest.mark.it(
-        "Repeatedly does 1 second asyncio sleeps until the current time is greater than the provided 'when' parameter"
+        "Schedules the next update of the SasToken for the configured update margin number of seconds before the expiry of the new SasToken"
     )
-    @pytest.mark.parametrize(
-        "time_from_now",
-        [
-            pytest.param(5, id="5 seconds from now"),
-            pytest.param(60, id="1 minute from now"),
-            pytest.param(3600, id="1 hour from now"),
-        ],
+    async def test_reschedule(self, scheduler, provider):
+        scheduler.schedule(provider, time.time())
+
+        await asyncio.sleep(0.1)
+
+        new_token = provider.get_current_sastoken()
+        expected_update_time = new_token.expiry_time - provider._token_update_margin
+        entry_id = scheduler._scheduled_entries[provider]
+        assert (expected_update_time, entry_id, provider) in scheduler._schedule
+        assert scheduler._timer is not None
+
+    @pytest.mark.it("Schedules the next update for 10 seconds later if the update fails")
+    async def test_update_fails(self, mocker, scheduler, provider, arbitrary_exception):
+        provider._generator.generate_sastoken.side_effect = arbitrary_exception
+        mocker.patch.object(time, "time", return_value=FAKE_CURRENT_TIME)
+        scheduler.schedule(provider, FAKE_CURRENT_TIME)
+
+        await asyncio.sleep(0.1)
+
+        assert provider._generator.generate_sastoken.await_count == 1
+        entry_id = scheduler._scheduled_entries[provider]
+        assert (FAKE_CURRENT_TIME + 10, entry_id, provider) in scheduler._schedule
+
+    @pytest.mark.it("Only updates the SasToken according to the most recent schedule")
+    async def test_reschedule_replaces(self, scheduler, provider):
+        scheduler.schedule(provider, time.time())
+        scheduler.schedule(provider, time.time() + 3600)
+
+        await asyncio.sleep(0.1)
+
+        assert provider._generator.generate_sastoken.await_count == 0
+
+    @pytest.mark.it(
+        "Updates the SasTokens of all SasTokenProviders that are due when the timer fires"
+    )
+    async def test_update_many(self, scheduler, sastoken_generator):
+        providers = [SasTokenProvider(sastoken_generator) for _ in range(10)]
+        now = time.time()
+        for i, provider in enumerate(providers):
+            scheduler.schedule(provider, now - i)
+
+        await asyncio.sleep(0.1)
+
+        assert sastoken_generator.generate_sastoken.await_count == 10
+        assert set(scheduler._scheduled_entries) == set(providers)
+
+    @pytest.mark.it(
+        "Updates the SasToken within MAX_TIMER_DELAY seconds if the wall clock jumps past the scheduled time"
+    )
+    async def test_clock_jumps_forward(self, mocker, scheduler, provider):
+        mocker.patch.object(st, "MAX_TIMER_DELAY", 0.1)
+        scheduler.schedule(provider, time.time() + 3600)
+        await asyncio.sleep(0.15)
+        assert provider._generator.generate_sastoken.await_count == 0
+
+        mocker.patch.object(time, "time", return_value=time.time() + 3600)
+        await asyncio.sleep(0.15)
+
+        assert provider._generator.generate_sastoken.await_count == 1
+
+    @pytest.mark.it(
+        "Sets the timer again, rather than updating early, if the wall clock jumps back before the scheduled time"
+    )
+    async def test_clock_jumps_back(self, mocker, scheduler, provider):
+        scheduler.schedule(provider, time.time() + 0.1)
+
+        mocker.patch.object(time, "time", return_value=time.time() - 3600)
+        await asyncio.sleep(0.2)
+
+        assert provider._generator.generate_sastoken.await_count == 0
+        assert provider in scheduler._scheduled_entries
+        assert scheduler._timer is not None
+
+    @pytest.mark.it(
+        "Schedules the next update for MIN_UPDATE_INTERVAL seconds later if the new SasToken is already due for update"
     )
-    async def test_sleep(self, mocker, time_from_now):
-        # Mock out the sleep coroutine so that we aren't waiting around forever on this test
-        mock_sleep = mocker.patch.object(asyncio, "sleep")
+    async def test_update_due_immediately(self, mocker, scheduler, provider):
+        # The update margin exceeds the lifetime of the new token
+        provider._token_update_margin = 7200
+        mocker.patch.object(time, "time", return_value=FAKE_CURRENT_TIME)
+        scheduler.schedule(provider, FAKE_CURRENT_TIME)
+
+        await asyncio.sleep(0.1)
 
-        # mock out time
-        def fake_time():
-            """Fake time implementation that will return a time float that is 1 larger
-            than the previous time it was called"""
-            fake_time_return = FAKE_CURRENT_TIME
-            while True:
-                yield fake_time_return
-                fake_time_return += 1
+        assert provider._generator.generate_sastoken.await_count == 1
+        entry_id = scheduler._scheduled_entries[provider]
+        assert (FAKE_CURRENT_TIME + MIN_UPDATE_INTERVAL, entry_id, provider) in scheduler._schedule
 
-        fake_time_gen = fake_time()
-        mock_time = mocker.patch.object(time, "time", side_effect=fake_time_gen)
+    @pytest.mark.it("Does not update the SasToken of a SasTokenProvider that has been unscheduled")
+    async def test_unschedule(self, scheduler, provider):
+        scheduler.schedule(provider, time.time())
+        await scheduler.unschedule(provider)
 
-        desired_time = FAKE_CURRENT_TIME + time_from_now
+        await asyncio.sleep(0.1)
+
+        assert provider._generator.generate_sastoken.await_count == 0
+        assert provider not in scheduler._scheduled_entries
+
+    @pytest.mark.it("Cancels the timer once no updates remain scheduled")
+    async def test_unschedule_last(self, scheduler, sastoken_generator):
+        provider1 = SasTokenProvider(sastoken_generator)
+        provider2 = SasTokenProvider(sastoken_generator)
+        scheduler.schedule(provider1, time.time() + 3600)
+        scheduler.schedule(provider2, time.time() + 3600)
+
+        await scheduler.unschedule(provider1)
+        timer = scheduler._timer
+        assert timer is not None
+        await scheduler.unschedule(provider2)
+
+        assert timer.cancelled()
+        assert scheduler._timer is None
+        assert scheduler._schedule == []
+
+    @pytest.mark.it(
+        "Discards invalidated entries from the schedule once they outnumber the scheduled updates"
+    )
+    async def test_compaction(self, scheduler, sastoken_generator):
+        providers = [SasTokenProvider(sastoken_generator) for _ in range(200)]
+        for provider in providers:
+            scheduler.schedule(provider, time.time() + 3600)
+        for provider in providers[1:]:
+            await scheduler.unschedule(provider)
+        # Rescheduling also invalidates entries
+        for _ in range(200):
+            scheduler.schedule(providers[0], time.time() + 3600)
+
+        assert len(scheduler._schedule) <= 2 * len(scheduler._scheduled_entries) + 65
+        assert list(scheduler._scheduled_entries) == [providers[0]]
+
+    @pytest.mark.it("Cancels an update in progress when the SasTokenProvider is unscheduled")
+    async def test_unschedule_in_progress(self, mocker, scheduler, provider):
+        update_started = asyncio.Event()
+
+        async def hanging_update():
+            update_started.set()
+            await asyncio.Future()
+
+        provider._update_token = mocker.MagicMock(side_effect=hanging_update)
+        scheduler.schedule(provider, time.time())
+        await asyncio.wait_for(update_started.wait(), 2)
+        update = scheduler._updates[provider]
+
+        await scheduler.unschedule(provider)
+
+        assert update.cancelled()
+        assert provider not in scheduler._updates
+        assert provider not in scheduler._scheduled_entries
+
+    @pytest.mark.it(
+        "Cancels the timer and any updates in progress, and clears all scheduled updates when stopped"
+    )
+    async def test_stop(self, mocker, scheduler, sastoken_generator):
+        provider1 = SasTokenProvider(sastoken_generator)
+        provider2 = SasTokenProvider(sastoken_generator)
+        provider1._update_token = mocker.MagicMock(side_effect=asyncio.Future)
+        scheduler.schedule(provider1, time.time())
+        scheduler.schedule(provider2, time.time() + 3600)
+        await asyncio.sleep(0.1)
+        update = scheduler._updates[provider1]
+        timer = scheduler._timer
 
-        await st._wait_until(desired_time)
+        await scheduler.stop()
 
-        assert mock_sleep.await_count == time_from_now
-        for call in mock_sleep.await_args_list:
-            assert call == mocker.call(1)
-        assert mock_time.call_count == time_from_now + 1
-        for call in mock_time.call_args_list:
-            assert call == mocker.call()
+        assert update.cancelled()
+        assert timer.cancelled()
+        assert scheduler._timer is None
+        assert scheduler._updates == {}
+        assert scheduler._schedule == []
+        assert scheduler._scheduled_entries == {}
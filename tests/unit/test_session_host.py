@@ -0,0 +1,299 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import concurrent.futures
+import pytest
+import ssl
+from azure.iot.device import metrics, tracing
+from azure.iot.device import session_host as sh
+from azure.iot.device import sastoken as st
+from azure.iot.device.network_loop import SharedNetworkLoop
+from azure.iot.device.session_host import SessionHost, DEFAULT_MAX_WORKERS
+
+FAKE_CONNECTION_STRING = "HostName=fake.hostname;DeviceId=fake_device_id;SharedAccessKey=Zm9vYmFy"
+
+
+@pytest.fixture
+async def host():
+    host = SessionHost()
+    yield host
+    await host.shutdown()
+
+
+@pytest.mark.describe("SessionHost - Instantiation")
+class TestSessionHostInstantiation:
+    @pytest.mark.it("Creates and stores a SharedNetworkLoop")
+    async def test_network_loop(self, host):
+        assert isinstance(host.network_loop, SharedNetworkLoop)
+        assert not host.network_loop.running
+
+    @pytest.mark.it("Creates and stores a ThreadPoolExecutor with the provided `max_workers`")
+    async def test_executor(self):
+        host = SessionHost(max_workers=3)
+        assert isinstance(host.executor, concurrent.futures.ThreadPoolExecutor)
+        assert host.executor._max_workers == 3
+        await host.shutdown()
+
+    @pytest.mark.it("Uses DEFAULT_MAX_WORKERS for the ThreadPoolExecutor if not provided")
+    async def test_executor_default(self, host):
+        assert host.executor._max_workers == DEFAULT_MAX_WORKERS
+
+    @pytest.mark.it("Raises ValueError if `max_workers` is less than 1")
+    @pytest.mark.parametrize("max_workers", [0, -1])
+    async def test_invalid_max_workers(self, max_workers):
+        with pytest.raises(ValueError):
+            SessionHost(max_workers=max_workers)
+
+    @pytest.mark.it("Creates and stores a SasTokenRefreshScheduler")
+    async def test_refresh_scheduler(self, host):
+        assert isinstance(host.refresh_scheduler, st.SasTokenRefreshScheduler)
+
+    @pytest.mark.it("Stores the provided `metrics_provider`, if any")
+    async def test_metrics_provider(self):
+        metrics_provider = metrics.MetricsProvider()
+        host = SessionHost(metrics_provider=metrics_provider)
+        assert host.metrics_provider is metrics_provider
+        await host.shutdown()
+
+    @pytest.mark.it("Sets the `metrics_provider` attribute to None if not provided")
+    async def test_metrics_provider_default(self, host):
+        assert host.metrics_provider is None
+
+    @pytest.mark.it("Stores the provided `tracer`, if any")
+    async def test_tracer(self):
+        tracer = tracing.Tracer()
+        host = SessionHost(tracer=tracer)
+        assert host.tracer is tracer
+        await host.shutdown()
+
+    @pytest.mark.it("Sets the `tracer` attribute to None if not provided")
+    async def test_tracer_default(self, host):
+        assert host.tracer is None
+
+    @pytest.mark.it("Does not create a default SSLContext")
+    async def test_default_ssl_context(self, mocker):
+        spy_default_ssl_context = mocker.spy(sh, "_default_ssl_context")
+        host = SessionHost()
+        assert spy_default_ssl_context.call_count == 0
+        await host.shutdown()
+
+
+@pytest.mark.describe("SessionHost - .default_ssl_context()")
+class TestSessionHostDefaultSSLContext:
+    @pytest.mark.it("Creates and returns a default SSLContext upon first invocation")
+    async def test_creates(self, mocker, host):
+        spy_default_ssl_context = mocker.spy(sh, "_default_ssl_context")
+
+        ssl_context = host.default_ssl_context()
+
+        assert spy_default_ssl_context.call_count == 1
+        assert ssl_context is spy_default_ssl_context.spy_return
+        assert isinstance(ssl_context, ssl.SSLContext)
+
+    @pytest.mark.it("Returns the same SSLContext upon subsequent invocations")
+    async def test_cached(self, mocker, host):
+        spy_default_ssl_context = mocker.spy(sh, "_default_ssl_context")
+
+        ssl_context = host.default_ssl_context()
+        assert host.default_ssl_context() is ssl_context
+        assert host.default_ssl_context() is ssl_context
+
+        assert spy_default_ssl_context.call_count == 1
+
+
+@pytest.mark.describe("SessionHost - .create_session()")
+class TestSessionHostCreateSession:
+    @pytest.mark.it(
+        "Returns a new IoTHubSession created with the provided arguments, using the SessionHost"
+    )
+    async def test_creates(self, mocker, host):
+        mock_session_cls = mocker.patch.object(sh, "IoTHubSession")
+
+        session = host.create_session(
+            hostname="fake.hostname", device_id="fake_device_id", shared_access_key="Zm9vYmFy"
+        )
+
+        assert mock_session_cls.call_count == 1
+        assert mock_session_cls.call_args == mocker.call(
+            host=host,
+            hostname="fake.hostname",
+            device_id="fake_device_id",
+            shared_access_key="Zm9vYmFy",
+        )
+        assert session is mock_session_cls.return_value
+
+    @pytest.mark.it("Returns IoTHubSessions that share the resources of the SessionHost")
+    async def test_shares_resources(self, host):
+        sessions = [
+            host.create_session(
+                hostname="fake.hostname", device_id="device{}".format(i), shared_access_key="Zm9v"
+            )
+            for i in range(3)
+        ]
+        for session in sessions:
+            mqtt_client = session._mqtt_client._mqtt_client
+            assert mqtt_client._shared_network_loop is host.network_loop
+            assert mqtt_client._executor is host.executor
+            assert session._sastoken_provider._refresh_scheduler is host.refresh_scheduler
+
+    @pytest.mark.it(
+        "Provides the `metrics_provider` of the SessionHost (if any) to the IoTHubSession, unless one is provided"
+    )
+    @pytest.mark.parametrize(
+        "provide_metrics_provider",
+        [pytest.param(False, id="Not provided"), pytest.param(True, id="Provided")],
+    )
+    async def test_metrics_provider(self, mocker, provide_metrics_provider):
+        mock_session_cls = mocker.patch.object(sh, "IoTHubSession")
+        host = SessionHost(metrics_provider=metrics.MetricsProvider())
+        kwargs = {}
+        if provide_metrics_provider:
+            kwargs["metrics_provider"] = metrics.MetricsProvider()
+        expected_metrics_provider = kwargs.get("metrics_provider", host.metrics_provider)
+
+        host.create_session(
+            hostname="fake.hostname",
+            device_id="fake_device_id",
+            shared_access_key="Zm9vYmFy",
+            **kwargs
+        )
+
+        assert mock_session_cls.call_args[1]["metrics_provider"] is expected_metrics_provider
+        await host.shutdown()
+
+    @pytest.mark.it(
+        "Provides the `tracer` of the SessionHost (if any) to the IoTHubSession, unless one is provided"
+    )
+    @pytest.mark.parametrize(
+        "provide_tracer",
+        [pytest.param(False, id="Not provided"), pytest.param(True, id="Provided")],
+    )
+    async def test_tracer(self, mocker, provide_tracer):
+        mock_session_cls = mocker.patch.object(sh, "IoTHubSession")
+        host = SessionHost(tracer=tracing.Tracer())
+        kwargs = {}
+        if provide_tracer:
+            kwargs["tracer"] = tracing.Tracer()
+        expected_tracer = kwargs.get("tracer", host.tracer)
+
+        host.create_session(
+            hostname="fake.hostname",
+            device_id="fake_device_id",
+            shared_access_key="Zm9vYmFy",
+            **kwargs
+        )
+
+        assert mock_session_cls.call_args[1]["tracer"] is expected_tracer
+        await host.shutdown()
+
+
+@pytest.mark.describe("SessionHost - .create_session_from_connection_string()")
+class TestSessionHostCreateSessionFromConnectionString:
+    @pytest.mark.it(
+        "Returns a new IoTHubSession created from the connection string with the provided arguments, using the SessionHost"
+    )
+    async def test_creates(self, mocker, host):
+        mock_factory = mocker.patch.object(sh.IoTHubSession, "from_connection_string")
+
+        session = host.create_session_from_connection_string(
+            FAKE_CONNECTION_STRING, sastoken_ttl=60
+        )
+
+        assert mock_factory.call_count == 1
+        assert mock_factory.call_args == mocker.call(
+            FAKE_CONNECTION_STRING, host=host, sastoken_ttl=60
+        )
+        assert session is mock_factory.return_value
+
+    @pytest.mark.it(
+        "Provides the `metrics_provider` of the SessionHost (if any) to the IoTHubSession, unless one is provided"
+    )
+    @pytest.mark.parametrize(
+        "provide_metrics_provider",
+        [pytest.param(False, id="Not provided"), pytest.param(True, id="Provided")],
+    )
+    async def test_metrics_provider(self, mocker, provide_metrics_provider):
+        mock_factory = mocker.patch.object(sh.IoTHubSession, "from_connection_string")
+        host = SessionHost(metrics_provider=metrics.MetricsProvider())
+        kwargs = {}
+        if provide_metrics_provider:
+            kwargs["metrics_provider"] = metrics.MetricsProvider()
+        expected_metrics_provider = kwargs.get("metrics_provider", host.metrics_provider)
+
+        host.create_session_from_connection_string(FAKE_CONNECTION_STRING, **kwargs)
+
+        assert mock_factory.call_args[1]["metrics_provider"] is expected_metrics_provider
+        await host.shutdown()
+
+    @pytest.mark.it(
+        "Provides the `tracer` of the SessionHost (if any) to the IoTHubSession, unless one is provided"
+    )
+    @pytest.mark.parametrize(
+        "provide_tracer",
+        [pytest.param(False, id="Not provided"), pytest.param(True, id="Provided")],
+    )
+    async def test_tracer(self, mocker, provide_tracer):
+        mock_factory = mocker.patch.object(sh.IoTHubSession, "from_connection_string")
+        host = SessionHost(tracer=tracing.Tracer())
+        kwargs = {}
+        if provide_tracer:
+            kwargs["tracer"] = tracing.Tracer()
+        expected_tracer = kwargs.get("tracer", host.tracer)
+
+        host.create_session_from_connection_string(FAKE_CONNECTION_STRING, **kwargs)
+
+        assert mock_factory.call_args[1]["tracer"] is expected_tracer
+        await host.shutdown()
+
+
+@pytest.mark.describe("SessionHost - .shutdown()")
+class TestSessionHostShutdown:
+    @pytest.mark.it("Stops the SasTokenRefreshScheduler")
+    async def test_refresh_scheduler(self, mocker, host):
+        spy_stop = mocker.spy(host.refresh_scheduler, "stop")
+
+        await host.shutdown()
+
+        assert spy_stop.await_count == 1
+
+    @pytest.mark.it("Stops and closes the SharedNetworkLoop")
+    async def test_network_loop(self, mocker, host):
+        host.network_loop.start()
+        assert host.network_loop.running
+
+        await host.shutdown()
+
+        assert not host.network_loop.running
+        with pytest.raises(RuntimeError):
+            host.network_loop.start()
+
+    @pytest.mark.it("Shuts down the executor")
+    async def test_executor(self, mocker, host):
+        spy_shutdown = mocker.spy(host.executor, "shutdown")
+
+        await host.shutdown()
+
+        assert spy_shutdown.call_count == 1
+        with pytest.raises(RuntimeError):
+            host.executor.submit(print)
+
+
+@pytest.mark.describe("SessionHost - OCCURRENCE: Context Manager Exit")
+class TestSessionHostContextManager:
+    @pytest.mark.it("Returns the SessionHost upon entry")
+    async def test_enter(self):
+        host = SessionHost()
+        async with host as entered:
+            assert entered is host
+
+    @pytest.mark.it("Shuts down the SessionHost upon exit")
+    async def test_exit(self, mocker):
+        host = SessionHost()
+        spy_shutdown = mocker.spy(host, "shutdown")
+
+        async with host:
+            assert spy_shutdown.await_count == 0
+
+        assert spy_shutdown.await_count == 1
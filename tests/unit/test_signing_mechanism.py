@@ -5,11 +5,16 @@
 # --------------------------------------------------------------------------
 
 import pytest
+import concurrent.futures
 import hmac
 import hashlib
 import base64
+import threading
 from azure.iot.device.signing_mechanism import SymmetricKeySigningMechanism
 
+FAKE_KEY = "NMgJDvdKTxjLi+xBxxkDDEwDJxEvOE5u8BiT0mVgPeg="
+FAKE_DIGEST = b"\xd2\x06\xf7\x12\xf1\xe9\x95$\x90\xfd\x12\x9a\xb1\xbe\xb4\xf8\xf3\xc4\x1ap\x8a\xab'\x8a.D\xfb\x84\x96\xca\xf3z"
+
 
 @pytest.mark.describe("SymmetricKeySigningMechanism - Instantiation")
 class TestSymmetricKeySigningMechanismInstantiation(object):
@@ -55,6 +60,18 @@ class TestSymmetricKeySigningMechanismInstantiation(object):
         sm = SymmetricKeySigningMechanism(key)
         assert sm._signing_key == expected_signing_key
 
+    @pytest.mark.it(
+        "Creates an HMAC keyed with the signing key, using the HMAC-SHA256 algorithm, to be copied for each signature"
+    )
+    def test_keyed_hmac(self, mocker):
+        hmac_mock = mocker.patch.object(hmac, "HMAC")
+
+        sm = SymmetricKeySigningMechanism(FAKE_KEY)
+
+        assert hmac_mock.call_count == 1
+        assert hmac_mock.call_args == mocker.call(key=sm._signing_key, digestmod=hashlib.sha256)
+        assert sm._hmac is hmac_mock.return_value
+
     @pytest.mark.it("Raises a ValueError if the provided symmetric key is invalid")
     @pytest.mark.parametrize(
         "key",
@@ -69,39 +86,43 @@ class TestSymmetricKeySigningMechanismInstantiation(object):
 class TestSymmetricKeySigningMechanismSign(object):
     @pytest.fixture
     def signing_mechanism(self):
-        return SymmetricKeySigningMechanism("NMgJDvdKTxjLi+xBxxkDDEwDJxEvOE5u8BiT0mVgPeg=")
+        return SymmetricKeySigningMechanism(FAKE_KEY)
 
     @pytest.mark.it(
-        "Generates an HMAC message digest from the signing key and provided data string, using the HMAC-SHA256 algorithm"
+        "Generates an HMAC message digest of the provided data string from a copy of the keyed HMAC"
     )
     async def test_hmac(self, mocker, signing_mechanism):
-        hmac_mock = mocker.patch.object(hmac, "HMAC")
-        hmac_digest_mock = hmac_mock.return_value.digest
-        hmac_digest_mock.return_value = b"\xd2\x06\xf7\x12\xf1\xe9\x95$\x90\xfd\x12\x9a\xb1\xbe\xb4\xf8\xf3\xc4\x1ap\x8a\xab'\x8a.D\xfb\x84\x96\xca\xf3z"
+        hmac_mock = mocker.MagicMock()
+        signing_mechanism._hmac = hmac_mock
+        hmac_copy_mock = hmac_mock.copy.return_value
+        hmac_copy_mock.digest.return_value = FAKE_DIGEST
 
         data_string = "sign this message"
         await signing_mechanism.sign(data_string)
 
-        assert hmac_mock.call_count == 1
-        assert hmac_mock.call_args == mocker.call(
-            key=signing_mechanism._signing_key,
-            msg=data_string.encode("utf-8"),
-            digestmod=hashlib.sha256,
-        )
-        assert hmac_digest_mock.call_count == 1
+        assert hmac_mock.copy.call_count == 1
+        assert hmac_copy_mock.update.call_count == 1
+        assert hmac_copy_mock.update.call_args == mocker.call(data_string.encode("utf-8"))
+        assert hmac_copy_mock.digest.call_count == 1
+        # The keyed HMAC itself is never updated
+        assert hmac_mock.update.call_count == 0
 
     @pytest.mark.it(
         "Returns the base64 encoded HMAC message digest (converted to string) as the signed data"
     )
     async def test_b64encode(self, mocker, signing_mechanism):
-        hmac_mock = mocker.patch.object(hmac, "HMAC")
-        hmac_digest_mock = hmac_mock.return_value.digest
-        hmac_digest_mock.return_value = b"\xd2\x06\xf7\x12\xf1\xe9\x95$\x90\xfd\x12\x9a\xb1\xbe\xb4\xf8\xf3\xc4\x1ap\x8a\xab'\x8a.D\xfb\x84\x96\xca\xf3z"
+        signing_mechanism._hmac = mocker.MagicMock()
+        signing_mechanism._hmac.copy.return_value.digest.return_value = FAKE_DIGEST
 
         data_string = "sign this message"
         signature = await signing_mechanism.sign(data_string)
 
-        assert signature == base64.b64encode(hmac_digest_mock.return_value).decode("utf-8")
+        assert signature == base64.b64encode(FAKE_DIGEST).decode("utf-8")
+
+    @pytest.mark.it("Returns the same signature when signing the same data string repeatedly")
+    async def test_repeated(self, signing_mechanism):
+        signatures = [await signing_mechanism.sign("sign this message") for _ in range(3)]
+        assert signatures == ["8NJRMT83CcplGrAGaUVIUM/md5914KpWVNngSVoF9/M="] * 3
 
     @pytest.mark.it("Supports data strings in both string and byte formats")
     @pytest.mark.parametrize(
@@ -123,3 +144,98 @@ class TestSymmetricKeySigningMechanismSign(object):
     async def test_bad_input(self, signing_mechanism, data_string):
         with pytest.raises(ValueError):
             await signing_mechanism.sign(data_string)
+
+
+@pytest.mark.describe("SymmetricKeySigningMechanism - .sign_many()")
+class TestSymmetricKeySigningMechanismSignMany(object):
+    @pytest.fixture
+    def signing_mechanism(self):
+        return SymmetricKeySigningMechanism(FAKE_KEY)
+
+    @pytest.fixture
+    def data_strings(self):
+        return ["registration-id-{}".format(i) for i in range(25)] + [b"sign this message"]
+
+    @pytest.fixture(
+        params=[
+            pytest.param(None, id="No executor"),
+            pytest.param(concurrent.futures.ThreadPoolExecutor, id="ThreadPoolExecutor"),
+            pytest.param(concurrent.futures.ProcessPoolExecutor, id="ProcessPoolExecutor"),
+        ]
+    )
+    def executor(self, request):
+        if request.param is None:
+            yield None
+        else:
+            executor = request.param(max_workers=2)
+            yield executor
+            executor.shutdown()
+
+    @pytest.mark.it(
+        "Returns the same signatures as .sign() would for each of the provided data strings, in order"
+    )
+    async def test_signatures(self, signing_mechanism, data_strings, executor):
+        expected = [await signing_mechanism.sign(data_string) for data_string in data_strings]
+
+        signatures = await signing_mechanism.sign_many(data_strings, executor, chunk_size=4)
+
+        assert signatures == expected
+        assert signatures[-1] == "8NJRMT83CcplGrAGaUVIUM/md5914KpWVNngSVoF9/M="
+
+    @pytest.mark.it("Accepts any iterable of data strings")
+    async def test_iterable(self, signing_mechanism, data_strings, executor):
+        expected = await signing_mechanism.sign_many(data_strings)
+
+        signatures = await signing_mechanism.sign_many(iter(data_strings), executor, chunk_size=4)
+
+        assert signatures == expected
+
+    @pytest.mark.it("Returns an empty list if no data strings are provided")
+    async def test_empty(self, signing_mechanism, executor):
+        assert await signing_mechanism.sign_many([], executor) == []
+
+    @pytest.mark.it(
+        "Signs the data strings in the provided executor, in jobs of at most the provided chunk size"
+    )
+    async def test_chunks(self, mocker, signing_mechanism, data_strings):
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        submit_spy = mocker.spy(executor, "submit")
+
+        try:
+            await signing_mechanism.sign_many(data_strings, executor, chunk_size=10)
+        finally:
+            executor.shutdown()
+
+        assert submit_spy.call_count == 3
+        chunks = []
+        for call in submit_spy.call_args_list:
+            _, signing_key, chunk = call[0]
+            assert signing_key == signing_mechanism._signing_key
+            chunks.append(chunk)
+        assert [len(chunk) for chunk in chunks] == [10, 10, 6]
+        assert [data for chunk in chunks for data in chunk] == data_strings
+
+    @pytest.mark.it("Signs the data strings on the calling thread if no executor is provided")
+    async def test_no_executor(self, mocker, signing_mechanism, data_strings):
+        sign_threads = set()
+        original_copy = signing_mechanism._hmac.copy
+
+        def copy():
+            sign_threads.add(threading.get_ident())
+            return original_copy()
+
+        signing_mechanism._hmac = mocker.MagicMock(copy=copy)
+
+        await signing_mechanism.sign_many(data_strings)
+
+        assert sign_threads == {threading.get_ident()}
+
+    @pytest.mark.it("Raises a ValueError if unable to sign any of the provided data strings")
+    async def test_bad_input(self, signing_mechanism, executor):
+        with pytest.raises(ValueError):
+            await signing_mechanism.sign_many(["sign this message", 123], executor)
+
+    @pytest.mark.it("Raises a ValueError if the provided chunk size is not a positive integer")
+    async def test_bad_chunk_size(self, signing_mechanism, data_strings):
+        with pytest.raises(ValueError):
+            await signing_mechanism.sign_many(data_strings, chunk_size=0)
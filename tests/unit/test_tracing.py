@@ -0,0 +1,178 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import asyncio
+import pytest
+from azure.iot.device import tracing
+
+FAKE_ATTRIBUTES = {tracing.ATTRIBUTE_DEVICE_ID: "fake_device_id"}
+
+
+@pytest.mark.describe("Tracer")
+class TestTracer:
+    @pytest.mark.it("Starts spans that accept attributes, events and exceptions, and discard them")
+    def test_no_op(self):
+        tracer = tracing.Tracer()
+
+        span = tracer.start_span("fake_operation", FAKE_ATTRIBUTES)
+        span.set_attribute(tracing.ATTRIBUTE_MID, 1)
+        span.add_event(tracing.EVENT_PUBLISH)
+        span.add_event(tracing.EVENT_PUBACK, {"fake_key": "fake_value"}, timestamp=1000)
+        span.record_exception(ValueError())
+        span.end()
+
+        assert isinstance(span, tracing.Span)
+
+    @pytest.mark.it("Starts spans that do not inject anything into a carrier")
+    def test_no_op_inject(self):
+        span = tracing.Tracer().start_span("fake_operation", FAKE_ATTRIBUTES)
+        carrier = {"fake_key": "fake_value"}
+
+        span.inject(carrier)
+
+        assert carrier == {"fake_key": "fake_value"}
+
+
+@pytest.mark.describe("use_span()")
+class TestUseSpan:
+    @pytest.fixture
+    def span(self, mocker):
+        return mocker.MagicMock(spec=tracing.Span)
+
+    @pytest.mark.it("Makes the span current for the duration of the context")
+    def test_current(self, span):
+        assert tracing.current_span() is None
+
+        with tracing.use_span(span) as yielded:
+            assert yielded is span
+            assert tracing.current_span() is span
+
+        assert tracing.current_span() is None
+
+    @pytest.mark.it("Restores the previously current span upon exit")
+    def test_nested(self, span, mocker):
+        inner = mocker.MagicMock(spec=tracing.Span)
+
+        with tracing.use_span(span):
+            with tracing.use_span(inner):
+                assert tracing.current_span() is inner
+            assert tracing.current_span() is span
+
+    @pytest.mark.it("Ends the span upon exit")
+    def test_end(self, span):
+        with tracing.use_span(span):
+            assert span.end.call_count == 0
+
+        assert span.end.call_count == 1
+        assert span.record_exception.call_count == 0
+
+    @pytest.mark.it(
+        "Records any exception raised within the context on the span, ends it, and re-raises"
+    )
+    @pytest.mark.parametrize(
+        "exception",
+        [
+            pytest.param(ValueError(), id="Exception"),
+            pytest.param(asyncio.CancelledError(), id="CancelledError"),
+        ],
+    )
+    def test_exception(self, span, exception):
+        with pytest.raises(type(exception)) as e_info:
+            with tracing.use_span(span):
+                raise exception
+
+        assert e_info.value is exception
+        assert span.record_exception.call_args == [(exception,), {}]
+        assert span.end.call_count == 1
+        assert tracing.current_span() is None
+
+    @pytest.mark.it("Makes the span current in Tasks created within the context")
+    async def test_task(self, span):
+        async def get_current_span():
+            return tracing.current_span()
+
+        with tracing.use_span(span):
+            task = asyncio.create_task(get_current_span())
+        assert tracing.current_span() is None
+
+        assert await task is span
+
+
+@pytest.mark.describe("detach_span()")
+class TestDetachSpan:
+    @pytest.mark.it("Stops the current context from being associated with a span")
+    async def test_detach(self, mocker):
+        span = mocker.MagicMock(spec=tracing.Span)
+
+        async def detach():
+            tracing.detach_span()
+            return tracing.current_span()
+
+        with tracing.use_span(span):
+            task = asyncio.create_task(detach())
+            assert await task is None
+            # Only the context of the Task was detached
+            assert tracing.current_span() is span
+
+
+@pytest.mark.describe("OpenTelemetryTracer")
+class TestOpenTelemetryTracer:
+    @pytest.fixture
+    def exporter(self):
+        pytest.importorskip("opentelemetry.sdk.trace")
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+        exporter = InMemorySpanExporter()
+        exporter.tracer_provider = TracerProvider()
+        exporter.tracer_provider.add_span_processor(SimpleSpanProcessor(exporter))
+        return exporter
+
+    @pytest.fixture
+    def tracer(self, exporter):
+        return tracing.OpenTelemetryTracer(exporter.tracer_provider.get_tracer("test"))
+
+    @pytest.mark.it("Records spans with the given name and attributes, as client spans")
+    def test_span(self, exporter, tracer):
+        from opentelemetry.trace import SpanKind
+
+        span = tracer.start_span("fake_operation", FAKE_ATTRIBUTES)
+        span.set_attribute(tracing.ATTRIBUTE_MID, 1)
+        span.add_event(tracing.EVENT_PUBACK, timestamp=1000)
+        span.end()
+
+        (recorded,) = exporter.get_finished_spans()
+        assert recorded.name == "fake_operation"
+        assert recorded.kind == SpanKind.CLIENT
+        assert recorded.attributes[tracing.ATTRIBUTE_DEVICE_ID] == "fake_device_id"
+        assert recorded.attributes[tracing.ATTRIBUTE_MID] == 1
+        (event,) = recorded.events
+        assert event.name == tracing.EVENT_PUBACK
+        assert event.timestamp == 1000
+
+    @pytest.mark.it("Records exceptions on the span, and sets an error status")
+    def test_exception(self, exporter, tracer):
+        from opentelemetry.trace import StatusCode
+
+        with pytest.raises(ValueError):
+            with tracing.use_span(tracer.start_span("fake_operation", FAKE_ATTRIBUTES)):
+                raise ValueError("fake_error")
+
+        (recorded,) = exporter.get_finished_spans()
+        assert recorded.status.status_code == StatusCode.ERROR
+        assert recorded.events[0].name == "exception"
+
+    @pytest.mark.it("Injects the trace context of the span into a carrier")
+    def test_inject(self, exporter, tracer):
+        span = tracer.start_span("fake_operation", FAKE_ATTRIBUTES)
+        carrier = {}
+
+        span.inject(carrier)
+        span.end()
+
+        (recorded,) = exporter.get_finished_spans()
+        assert "traceparent" in carrier
+        assert format(recorded.context.trace_id, "032x") in carrier["traceparent"]
@@ -0,0 +1,368 @@
+# -------------------------------------------------------------------------
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License. See License.txt in the project root for
+# license information.
+# --------------------------------------------------------------------------
+import asyncio
+import pytest
+from dev_utils import custom_mock
+from azure.iot.device import tracing
+from azure.iot.device.mqtt_client import MQTTError
+from azure.iot.device.twin import ReportedPropertiesCoalescer, TwinCache, merge_patch
+
+
+def make_twin(desired_version=1, reported_version=1):
+    return {
+        "desired": {"foo": 1, "bar": {"baz": "a", "buzz": "b"}, "$version": desired_version},
+        "reported": {"status": "ok", "$version": reported_version},
+    }
+
+
+@pytest.mark.describe("merge_patch()")
+class TestMergePatch:
+    @pytest.mark.it("Adds keys from the patch that are not present in the target")
+    def test_add(self):
+        target = {"a": 1}
+        merge_patch(target, {"b": 2})
+        assert target == {"a": 1, "b": 2}
+
+    @pytest.mark.it("Replaces non-object values in the target with values from the patch")
+    @pytest.mark.parametrize(
+        "original, new",
+        [
+            pytest.param(1, 2, id="int -> int"),
+            pytest.param("a", ["b", "c"], id="str -> list"),
+            pytest.param({"x": 1}, "flat", id="object -> str"),
+        ],
+    )
+    def test_replace(self, original, new):
+        target = {"a": original}
+        merge_patch(target, {"a": new})
+        assert target == {"a": new}
+
+    @pytest.mark.it("Removes keys from the target that have a value of None in the patch")
+    def test_remove(self):
+        target = {"a": 1, "b": {"c": 2, "d": 3}}
+        merge_patch(target, {"a": None, "b": {"c": None}, "missing": None})
+        assert target == {"b": {"d": 3}}
+
+    @pytest.mark.it("Recursively merges nested objects")
+    def test_nested(self):
+        target = {"a": {"b": {"c": 1, "d": 2}}}
+        merge_patch(target, {"a": {"b": {"d": 3, "e": 4}}})
+        assert target == {"a": {"b": {"c": 1, "d": 3, "e": 4}}}
+
+    @pytest.mark.it(
+        "Replaces a non-object value with an object, omitting any None values from the patch"
+    )
+    def test_object_replaces_value(self):
+        target = {"a": 1}
+        merge_patch(target, {"a": {"b": 2, "c": None}})
+        assert target == {"a": {"b": 2}}
+
+    @pytest.mark.it("Does not share mutable values between the patch and the target")
+    def test_no_shared_values(self):
+        patch = {"a": [1, 2], "b": {"c": [3]}}
+        target = {}
+        merge_patch(target, patch)
+        patch["a"].append(5)
+        patch["b"]["c"].append(6)
+        assert target == {"a": [1, 2], "b": {"c": [3]}}
+
+
+@pytest.mark.describe("TwinCache")
+class TestTwinCache:
+    @pytest.fixture
+    def get_twin_fn(self, mocker):
+        return mocker.AsyncMock(return_value=make_twin())
+
+    @pytest.fixture
+    async def cache(self, get_twin_fn):
+        cache = TwinCache(get_twin_fn)
+        await cache.refresh()
+        get_twin_fn.reset_mock()
+        return cache
+
+    @pytest.mark.it(
+        "Retrieves and stores a full Twin using the provided coroutine function upon .refresh()"
+    )
+    async def test_refresh(self, get_twin_fn):
+        cache = TwinCache(get_twin_fn)
+        assert cache.desired_version is None
+        assert get_twin_fn.await_count == 0
+
+        await cache.refresh()
+
+        assert get_twin_fn.await_count == 1
+        assert cache.get_twin() == make_twin()
+        assert cache.desired_version == 1
+
+    @pytest.mark.it("Raises RuntimeError on .get_twin() if the cache has not been populated")
+    async def test_get_twin_unpopulated(self, get_twin_fn):
+        cache = TwinCache(get_twin_fn)
+        with pytest.raises(RuntimeError):
+            cache.get_twin()
+
+    @pytest.mark.it("Returns a copy of the cached Twin on .get_twin()")
+    async def test_get_twin_copy(self, cache):
+        twin = cache.get_twin()
+        twin["desired"]["foo"] = "changed"
+        assert cache.get_twin() == make_twin()
+
+    @pytest.mark.it(
+        "Merges a desired property patch with the next expected $version into the cached desired properties, without retrieving the full Twin"
+    )
+    async def test_apply_next_version(self, cache, get_twin_fn):
+        await cache.apply_desired_patch({"foo": 2, "bar": {"buzz": None}, "$version": 2})
+
+        assert get_twin_fn.await_count == 0
+        assert cache.desired_version == 2
+        expected_twin = make_twin(desired_version=2)
+        expected_twin["desired"]["foo"] = 2
+        del expected_twin["desired"]["bar"]["buzz"]
+        assert cache.get_twin() == expected_twin
+
+    @pytest.mark.it(
+        "Discards a desired property patch with a $version that is not newer than the cached desired properties"
+    )
+    @pytest.mark.parametrize("version", [pytest.param(1, id="Same"), pytest.param(0, id="Older")])
+    async def test_apply_stale_version(self, cache, get_twin_fn, version):
+        await cache.apply_desired_patch({"foo": "stale", "$version": version})
+
+        assert get_twin_fn.await_count == 0
+        assert cache.get_twin() == make_twin()
+
+    @pytest.mark.it(
+        "Retrieves a new full Twin instead of applying a desired property patch if there is a gap in the $version sequence"
+    )
+    async def test_apply_version_gap(self, cache, get_twin_fn):
+        new_twin = make_twin(desired_version=3)
+        get_twin_fn.return_value = new_twin
+
+        await cache.apply_desired_patch({"foo": 3, "$version": 3})
+
+        assert get_twin_fn.await_count == 1
+        assert cache.get_twin() == new_twin
+        assert cache.desired_version == 3
+
+    @pytest.mark.it(
+        "Retrieves a new full Twin instead of applying a desired property patch if the patch has no $version"
+    )
+    async def test_apply_no_version(self, cache, get_twin_fn):
+        await cache.apply_desired_patch({"foo": 3})
+        assert get_twin_fn.await_count == 1
+
+    @pytest.mark.it(
+        "Retrieves a full Twin instead of applying a desired property patch if the cache has not been populated"
+    )
+    async def test_apply_unpopulated(self, get_twin_fn):
+        cache = TwinCache(get_twin_fn)
+        await cache.apply_desired_patch({"foo": 2, "$version": 2})
+        assert get_twin_fn.await_count == 1
+        assert cache.get_twin() == make_twin()
+
+    @pytest.mark.it(
+        "Merges a reported property patch into the cached reported properties, leaving the reported $version unchanged"
+    )
+    async def test_apply_reported(self, cache):
+        cache.apply_reported_patch({"status": "busy", "temp": 22})
+
+        expected_twin = make_twin()
+        expected_twin["reported"]["status"] = "busy"
+        expected_twin["reported"]["temp"] = 22
+        assert cache.get_twin() == expected_twin
+
+    @pytest.mark.it("Ignores reported property patches if the cache has not been populated")
+    async def test_apply_reported_unpopulated(self, get_twin_fn):
+        cache = TwinCache(get_twin_fn)
+        cache.apply_reported_patch({"status": "busy"})
+        with pytest.raises(RuntimeError):
+            cache.get_twin()
+
+
+@pytest.mark.describe("ReportedPropertiesCoalescer")
+class TestReportedPropertiesCoalescer:
+    @pytest.fixture
+    def send_patch_fn(self, mocker):
+        return mocker.AsyncMock()
+
+    @pytest.fixture
+    async def coalescer(self, send_patch_fn):
+        coalescer = ReportedPropertiesCoalescer(send_patch_fn, linger=0.05)
+        yield coalescer
+        await coalescer.stop()
+
+    @pytest.mark.it("Raises ValueError if instantiated with an invalid `linger` or `max_size`")
+    @pytest.mark.parametrize(
+        "linger, max_size",
+        [pytest.param(-1, 100, id="Negative linger"), pytest.param(1, 0, id="Zero max_size")],
+    )
+    async def test_invalid_args(self, send_patch_fn, linger, max_size):
+        with pytest.raises(ValueError):
+            ReportedPropertiesCoalescer(send_patch_fn, linger=linger, max_size=max_size)
+
+    @pytest.mark.it(
+        "Sends all patches added within the linger time as a single merged patch once the linger time expires"
+    )
+    async def test_merge_within_linger(self, coalescer, send_patch_fn):
+        t1 = asyncio.create_task(coalescer.send_patch({"a": 1, "b": {"c": 1}}))
+        t2 = asyncio.create_task(coalescer.send_patch({"b": {"d": 2}, "e": None}))
+        t3 = asyncio.create_task(coalescer.send_patch({"a": 3}))
+        await asyncio.sleep(0.01)
+        assert send_patch_fn.await_count == 0
+
+        await asyncio.gather(t1, t2, t3)
+
+        assert send_patch_fn.await_count == 1
+        assert send_patch_fn.await_args[0][0] == {"a": 3, "b": {"c": 1, "d": 2}, "e": None}
+
+    @pytest.mark.it("Sends patches added after a batch has been sent in a new batch")
+    async def test_new_batch(self, coalescer, send_patch_fn):
+        await coalescer.send_patch({"a": 1})
+        await coalescer.send_patch({"a": 2})
+        assert send_patch_fn.await_count == 2
+        assert send_patch_fn.await_args_list[0][0][0] == {"a": 1}
+        assert send_patch_fn.await_args_list[1][0][0] == {"a": 2}
+
+    @pytest.mark.it(
+        "Sends the batch immediately once the size of the added patches reaches the `max_size`"
+    )
+    async def test_max_size(self, send_patch_fn):
+        coalescer = ReportedPropertiesCoalescer(send_patch_fn, linger=60, max_size=20)
+        t1 = asyncio.create_task(coalescer.send_patch({"a": 1}))
+        await asyncio.sleep(0.01)
+        assert send_patch_fn.await_count == 0
+        t2 = asyncio.create_task(coalescer.send_patch({"b": "0123456789"}))
+        await asyncio.wait_for(asyncio.gather(t1, t2), 1)
+        assert send_patch_fn.await_count == 1
+        assert send_patch_fn.await_args[0][0] == {"a": 1, "b": "0123456789"}
+        await coalescer.stop()
+
+    @pytest.mark.it(
+        "Sends the current batch before adding a patch that replaces a value or removal with an object"
+    )
+    @pytest.mark.parametrize(
+        "first_patch",
+        [
+            pytest.param({"a": None}, id="Removal replaced"),
+            pytest.param({"a": 1}, id="Value replaced"),
+            pytest.param({"x": {"a": None}}, id="Nested removal replaced"),
+        ],
+    )
+    async def test_conflict(self, coalescer, send_patch_fn, first_patch):
+        second_patch = {"a": {"b": 1}}
+        if "x" in first_patch:
+            second_patch = {"x": second_patch}
+        t1 = asyncio.create_task(coalescer.send_patch(first_patch))
+        t2 = asyncio.create_task(coalescer.send_patch(second_patch))
+        await asyncio.gather(t1, t2)
+        assert send_patch_fn.await_count == 2
+        assert send_patch_fn.await_args_list[0][0][0] == first_patch
+        assert send_patch_fn.await_args_list[1][0][0] == second_patch
+
+    @pytest.mark.it("Raises any error raised while sending the batch to all patches in the batch")
+    async def test_send_raises(self, coalescer, send_patch_fn, arbitrary_exception):
+        send_patch_fn.side_effect = arbitrary_exception
+        t1 = asyncio.create_task(coalescer.send_patch({"a": 1}))
+        t2 = asyncio.create_task(coalescer.send_patch({"b": 1}))
+        results = await asyncio.gather(t1, t2, return_exceptions=True)
+        assert results == [arbitrary_exception, arbitrary_exception]
+        assert send_patch_fn.await_count == 1
+
+    @pytest.mark.it("Does not cancel the batch if a single caller is cancelled")
+    async def test_cancel_caller(self, coalescer, send_patch_fn):
+        send_patch_fn.side_effect = None
+        t1 = asyncio.create_task(coalescer.send_patch({"a": 1}))
+        t2 = asyncio.create_task(coalescer.send_patch({"b": 1}))
+        await asyncio.sleep(0.01)
+        t1.cancel()
+        await t2
+        assert t1.cancelled()
+        assert send_patch_fn.await_count == 1
+        assert send_patch_fn.await_args[0][0] == {"a": 1, "b": 1}
+
+    @pytest.mark.it(
+        "Raises asyncio.TimeoutError if the batch is not acknowledged before the provided timeout elapses, without affecting the batch"
+    )
+    async def test_timeout(self, coalescer):
+        send_patch_fn = custom_mock.HangingAsyncMock()
+        coalescer._send_patch = send_patch_fn
+        t1 = asyncio.create_task(coalescer.send_patch({"a": 1}, timeout=0.1))
+        t2 = asyncio.create_task(coalescer.send_patch({"b": 1}))
+        await send_patch_fn.wait_for_hang()
+
+        with pytest.raises(asyncio.TimeoutError):
+            await t1
+        assert not t2.done()
+
+        send_patch_fn.stop_hanging()
+        await t2
+        assert send_patch_fn.call_count == 1
+
+    @pytest.mark.it(
+        "Returns once the batch is acknowledged if the provided timeout has not elapsed"
+    )
+    async def test_timeout_not_elapsed(self, coalescer, send_patch_fn, arbitrary_exception):
+        await coalescer.send_patch({"a": 1}, timeout=1)
+        assert send_patch_fn.await_count == 1
+
+        send_patch_fn.side_effect = arbitrary_exception
+        with pytest.raises(type(arbitrary_exception)):
+            await coalescer.send_patch({"a": 2}, timeout=1)
+
+    @pytest.mark.it("Does not send the batch within the span of the operation that added a patch")
+    async def test_tracing(self, mocker, coalescer, send_patch_fn):
+        span = mocker.MagicMock(spec=tracing.Span)
+        spans_when_sent = []
+        send_patch_fn.side_effect = lambda patch: spans_when_sent.append(tracing.current_span())
+
+        with tracing.use_span(span):
+            await coalescer.send_patch({"a": 1})
+
+        assert spans_when_sent == [None]
+
+    @pytest.mark.it(
+        "Raises MQTTError (without cancelling the caller) for batches that are waiting to be sent or waiting for acknowledgement upon .stop()"
+    )
+    async def test_stop(self, send_patch_fn):
+        send_patch_fn = custom_mock.HangingAsyncMock()
+        coalescer = ReportedPropertiesCoalescer(send_patch_fn, linger=0)
+        t1 = asyncio.create_task(coalescer.send_patch({"a": 1}))
+        await send_patch_fn.wait_for_hang()
+        coalescer._linger = 60
+        t2 = asyncio.create_task(coalescer.send_patch({"b": 1}, timeout=30))
+        await asyncio.sleep(0.01)
+
+        await coalescer.stop()
+        await asyncio.sleep(0.01)
+
+        for t in (t1, t2):
+            assert not t.cancelled()
+            with pytest.raises(MQTTError) as e_info:
+                await t
+            assert e_info.value.rc == 4
+        assert send_patch_fn.call_count == 1
+        assert len(coalescer._in_flight) == 0
+
+    @pytest.mark.it(
+        "Does not cancel the Task of a caller in a TaskGroup when the batch is abandoned upon .stop()"
+    )
+    async def test_stop_task_group(self, send_patch_fn):
+        if not hasattr(asyncio, "TaskGroup"):
+            pytest.skip("asyncio.TaskGroup requires Python 3.11+")
+        send_patch_fn = custom_mock.HangingAsyncMock()
+        coalescer = ReportedPropertiesCoalescer(send_patch_fn, linger=0)
+        errors = []
+
+        async def update():
+            try:
+                await coalescer.send_patch({"a": 1})
+            except MQTTError as e:
+                errors.append(e)
+
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(update())
+            await send_patch_fn.wait_for_hang()
+            await coalescer.stop()
+
+        assert len(errors) == 1